@@ -1,15 +1,13 @@
 import numpy as np
 from analysis.pulse import TAU
-from analysis.spike_tensor import generate_spike_tensor
-from cache import get_spikes
+from analysis.spike_tensor import get_spike_tensors
 
 
 def get_tensors(note, tau=TAU, mockTensors=None):
     if mockTensors is not None:
         return mockTensors
 
-    notes_spikes = get_spikes(note, mode="rng")
-    return [generate_spike_tensor(spikes, tau=tau) for spikes in notes_spikes]
+    return get_spike_tensors(note, tau=tau, mode="rng")
 
 
 # CUMULATIVE
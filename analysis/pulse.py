@@ -6,8 +6,23 @@ TAU = 1e-3  # 1 ms
 MAX = 0.25
 
 
-def generate_pulse_vector(spikes, tau=TAU, duration=MAX):
-    """Generates a pulse vector from a spike 3D array."""
+def samples_per_bin(tau, fs):
+    """
+    Number of samples per time bin of width tau for integer spike indexes
+    at sampling rate fs (`nervegram(spike_time_format='index')`).
+    """
+    step = int(round(tau * fs))
+    assert step > 0 and np.isclose(step, tau * fs), "tau must be a multiple of the sampling period 1/fs"
+    return step
+
+
+def generate_pulse_vector(spikes, tau=TAU, duration=MAX, fs=None):
+    """
+    Generates a pulse vector from a spike 3D array.
+    If fs is not None, spikes are integer sample indexes at fs instead of seconds.
+    """
+    if fs is not None:
+        return generate_pulse_vector_opt(spikes, tau=tau, duration=duration, fs=fs)
     round_factor = len("{:.10f}".format(tau).split('.')[1])
     rounded_spikes = np.round(spikes, round_factor)
 
@@ -22,11 +37,18 @@ def generate_pulse_vector(spikes, tau=TAU, duration=MAX):
     return pulse
 
 
-def generate_pulse_vector_opt(spikes, tau=TAU, duration=MAX):
+def generate_pulse_vector_opt(spikes, tau=TAU, duration=MAX, fs=None):
     """
     Generates a pulse vector from a spike 3D array.
-    Not as accurate but significantly faster.
+    Not as accurate but significantly faster (exact if spikes are
+    integer sample indexes at fs, i.e. fs is not None).
     """
+    if fs is not None:
+        pulse = np.zeros(int(duration / tau))
+        spikes = np.asarray(spikes)
+        indices = spikes[spikes != 0] // samples_per_bin(tau, fs)
+        np.add.at(pulse, indices, 1)
+        return pulse
     round_factor = len("{:.10f}".format(tau).split('.')[1])
     rounded_spikes = np.round(spikes, round_factor)
 
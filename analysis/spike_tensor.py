@@ -1,18 +1,28 @@
 import numpy as np
-from analysis.pulse import TAU, MAX
+from analysis.pulse import TAU, MAX, samples_per_bin
+from cache import SPIKE_TENSOR_CACHE, get_seeds, get_spikes
 
 SNAP_SIZE = 5
 
 
-def generate_spike_tensor(spikes, tau=TAU, duration=MAX):
-    round_factor = len("{:.10f}".format(tau).split('.')[1])
-    rounded_spikes = np.round(spikes, round_factor)
-
+def generate_spike_tensor(spikes, tau=TAU, duration=MAX, fs=None):
+    """
+    Binary [cf, anf, time] tensor of spike times in seconds or, if fs is not
+    None, of integer spike sample indexes at fs (binned by exact integer division).
+    """
+    spikes = np.asarray(spikes)  # Reads lazy (memory-mapped) spikes once
     num_cf, num_anf_per_cf, _ = np.shape(spikes)
     spike_tensor = np.zeros((num_cf, num_anf_per_cf, round(duration / tau)))
 
-    spike_indices = np.round(rounded_spikes / tau) - 1
-    spike_indices = spike_indices.astype(int)
+    if fs is None:
+        round_factor = len("{:.10f}".format(tau).split('.')[1])
+        rounded_spikes = np.round(spikes, round_factor)
+        spike_indices = np.round(rounded_spikes / tau) - 1
+        spike_indices = spike_indices.astype(int)
+    else:
+        # Nearest bin (rounding half up), padding (0) maps to -1
+        step = samples_per_bin(tau, fs)
+        spike_indices = (2 * np.asarray(spikes, dtype=np.int64) + step) // (2 * step) - 1
 
     cf_indices, anf_indices, _ = np.indices(spikes.shape)
 
@@ -23,6 +33,37 @@ def generate_spike_tensor(spikes, tau=TAU, duration=MAX):
     return spike_tensor
 
 
+def get_spike_tensor(note, tau=TAU, duration=MAX, fs=None, mode="regular", instrument="piano", seed=None,
+                     cache=SPIKE_TENSOR_CACHE):
+    """
+    Spike tensor (`generate_spike_tensor`) of the stored spikes of a note, memoized
+    in `cache` by (instrument, note, mode, seed, tau, duration, fs). The returned
+    tensor is read-only and shared with other callers. The "rng" and "corpus" modes
+    hold several seeds: pass the seed, or use `get_spike_tensors` for all of them.
+    """
+    if mode in ["rng", "corpus"] and seed is None:
+        raise ValueError(f"get_spike_tensor needs a seed in {mode!r} mode (see get_spike_tensors)")
+
+    def compute():
+        spikes = get_spikes(note, mode=mode, instrument=instrument, mmap=True, seed=seed)
+        return generate_spike_tensor(spikes, tau=tau, duration=duration, fs=fs)
+
+    if cache is None:
+        return compute()
+    return cache.get_or_compute((instrument, note, mode, seed, tau, duration, fs), compute)
+
+
+def get_spike_tensors(note, tau=TAU, duration=MAX, fs=None, mode="rng", instrument="piano", cache=SPIKE_TENSOR_CACHE):
+    """
+    Memoized spike tensors of all seeds of a note (see `get_spike_tensor`).
+    """
+    return [
+        get_spike_tensor(note, tau=tau, duration=duration, fs=fs, mode=mode, instrument=instrument, seed=seed,
+                         cache=cache)
+        for seed in get_seeds(note, mode=mode, instrument=instrument)
+    ]
+
+
 def generate_snapshot(tensor, expectation, snap_size=SNAP_SIZE):
     snapshot = [[] for i in range(snap_size)]
 
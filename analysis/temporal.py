@@ -18,31 +18,38 @@ to_compare = [
 ]
 
 
-def calc_avg_isi(spike_times):
+def calc_avg_isi(spike_times, fs=None):
     """
     Helper function to get average InterSpike Interval for some spike times.
+    If fs is not None, spike_times are integer sample indexes at fs and the
+    interval is returned in seconds.
     eg
     [1.0,2.0,3.0,0.0,0.0,0.0,] -> 1.0
     """
     # remove all zeros in spike_times
     spike_times = spike_times[spike_times != 0]
+    if fs is not None:
+        spike_times = spike_times.astype(np.int64)
     # Add 0 at beginning
     spike_times = np.insert(spike_times, 0, 0)
     # calculate differences between adjacent elements
     interspike_intervals = np.diff(spike_times)
     # calculate mean of interspike_intervals
     mean_isi = np.mean(interspike_intervals)
+    if fs is not None:
+        mean_isi = mean_isi / fs
     # print(mean_isi)
     return mean_isi
 
 
-def get_avg_isi(spikes):
+def get_avg_isi(spikes, fs=None):
     """
     Helper function to get average InterSpike Intervals for each spike trains for some note.
+    (fs is as defined in `calc_avg_isi`)
     eg
     shape(15, 3500, 200) -> [0.3, 0.4 ....] (len: 15*3500)
     """
-    return np.apply_along_axis(calc_avg_isi, 2, spikes).flatten()
+    return np.apply_along_axis(calc_avg_isi, 2, spikes, fs=fs).flatten()
 
 import numpy as np
 
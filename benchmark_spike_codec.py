@@ -0,0 +1,65 @@
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+from cache import SPIKES_DIR, decode_spikes, encode_spikes
+
+COMPRESSIONS = [None, "zlib", "lzma"]
+
+
+def npy_bytes(spikes):
+    f = io.BytesIO()
+    np.save(f, spikes)
+    return f.getvalue()
+
+
+def timeit(fn):
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def benchmark_file(spikes, repeats=3):
+    # Size (bytes) and best encode / decode time (s) of plain .npy and of each codec compression
+    results = {}
+    data = npy_bytes(spikes)
+    t_load = min(timeit(lambda: np.load(io.BytesIO(data))) for _ in range(repeats))
+    results["npy"] = (len(data), 0.0, t_load)
+    for compression in COMPRESSIONS:
+        data = encode_spikes(spikes, compression=compression)
+        t_encode = min(timeit(lambda: encode_spikes(spikes, compression=compression)) for _ in range(repeats))
+        t_decode = min(timeit(lambda: decode_spikes(data)) for _ in range(repeats))
+        # Decoded times are the 1/fs sample times (equal to the model output up to float rounding)
+        assert np.allclose(decode_spikes(data), spikes, rtol=0, atol=1e-7), "codec is lossy for this file"
+        results[f"spk ({compression})"] = (len(data), t_encode, t_decode)
+    return results
+
+
+def benchmark_dir(spikes_dir):
+    # Compare plain .npy with the spike codec on all .npy spike files under `spikes_dir`
+    totals = {}
+    num_files = 0
+    for root, _, files in os.walk(spikes_dir):
+        for filename in sorted(files):
+            if not filename.endswith(".npy"):
+                continue
+            spikes = np.load(os.path.join(root, filename))
+            for name, (size, t_encode, t_decode) in benchmark_file(spikes).items():
+                total = totals.setdefault(name, [0, 0.0, 0.0])
+                total[0] += size
+                total[1] += t_encode
+                total[2] += t_decode
+            num_files += 1
+    print(f"{num_files} files in {spikes_dir}")
+    print("{:16s} {:>14s} {:>8s} {:>12s} {:>12s}".format("format", "size (bytes)", "ratio", "encode (s)", "decode (s)"))
+    for name, (size, t_encode, t_decode) in totals.items():
+        ratio = totals["npy"][0] / max(size, 1)
+        print("{:16s} {:14d} {:8.1f} {:12.3f} {:12.3f}".format(name, size, ratio, t_encode, t_decode))
+    return totals
+
+
+if __name__ == "__main__":
+    benchmark_dir(sys.argv[1] if len(sys.argv) > 1 else SPIKES_DIR)
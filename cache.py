@@ -1,5 +1,12 @@
+import collections
+import hashlib
+import json
+import lzma
 import numpy as np
 import os
+import struct
+import tempfile
+import zlib
 from scipy.io import wavfile
 
 REPO_PATH = "/home/prab/Documents/bez2018model_valence"
@@ -16,6 +23,21 @@ RNG_SPIKES_DIR = abspath("spikes/piano/rng")
 TONE_SPIKES_DIR = abspath("spikes/tone")
 SNAPSHOT_DIR = abspath("snapshots/posneg")
 EXPECTATION_DIR = abspath("expectations/piano")
+VIHC_CACHE_DIR = abspath("vihcs")
+SPIKE_CACHE_DIR = abspath("spike_cache")
+SPIKE_CORPUS_PATH = abspath("spikes/corpus.h5")
+
+# Bump if the output of the model changes (invalidates all cached spikes)
+SPIKE_CACHE_VERSION = 1
+
+# Spike times are stored as integer sample indexes at the model sampling rate (`pin_fs`)
+SPIKE_CODEC_FS = 100e3
+SPIKE_CODEC_MAGIC = b"SPK1"
+SPIKE_CODEC_COMPRESSORS = {
+    None: (lambda data: data, lambda data: data),
+    "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
 
 
 def save(path, array):
@@ -45,18 +67,200 @@ def sharp_to_flat(sharp_note):
     return sharp_to_flat_map.get(sharp_note, sharp_note)
 
 
-def get_spikes(note, mode="regular", instrument="piano"):
+def encode_spikes(spikes, fs=SPIKE_CODEC_FS, compression="zlib"):
+    # Compact encoding of zero-padded spike times [..., spikes] (seconds, or integer sample indexes
+    # if the dtype is integer): per-fiber spike counts and delta-encoded sample indexes at fs,
+    # each stored with the smallest unsigned dtype, optionally compressed ("zlib" or "lzma")
+    spikes = np.asarray(spikes)
+    fibers = spikes.reshape([-1, spikes.shape[-1]])
+    if np.issubdtype(spikes.dtype, np.integer):
+        fs = None
+        idx = fibers.astype(np.int64)
+    else:
+        # Model spike times lie on the 1/fs grid up to the rounding of their dtype (the spacing
+        # of float32 times is 0.2 samples at 30 s) plus a small margin for the accumulated rounding
+        # of the model (times below half a sample round to 0 and are dropped like padding)
+        idx = np.round(fibers.astype(np.float64) * fs).astype(np.int64)
+        tol = np.spacing(np.abs(fibers)).astype(np.float64) * fs + 1e-2
+        if np.any(tol >= 0.5):
+            raise ValueError(f"{spikes.dtype} spike times are too coarse to resolve 1/fs (fs={fs})")
+        if np.any(np.abs(idx - fibers.astype(np.float64) * fs) > tol):
+            raise ValueError(f"spike times are not multiples of 1/fs (fs={fs}): encoding would be lossy")
+    # Trailing zeros are padding (a leading 0 is a spike in the first sample and is kept)
+    nonzero = idx != 0
+    counts = np.where(nonzero.any(axis=-1), idx.shape[-1] - np.argmax(nonzero[:, ::-1], axis=-1), 0)
+    valid = np.arange(idx.shape[-1]) < counts[:, np.newaxis]
+    if np.any(idx[valid] < 0):
+        raise ValueError("negative spike times cannot be encoded")
+    idx = np.sort(np.where(valid, idx, np.iinfo(np.int64).max), axis=-1)
+    deltas = np.diff(np.where(valid, idx, 0), axis=-1, prepend=0)[valid]
+    counts = counts.astype(np.min_scalar_type(max(int(counts.max(initial=0)), 1)))
+    deltas = deltas.astype(np.min_scalar_type(max(int(deltas.max(initial=0)), 1)))
+    header = json.dumps({
+        "shape": list(spikes.shape),
+        "dtype": spikes.dtype.str,
+        "fs": fs,
+        "compression": compression,
+        "counts_dtype": counts.dtype.str,
+        "deltas_dtype": deltas.dtype.str,
+    }).encode()
+    compress, _ = SPIKE_CODEC_COMPRESSORS[compression]
+    payload = compress(counts.tobytes() + deltas.tobytes())
+    return SPIKE_CODEC_MAGIC + struct.pack("<I", len(header)) + header + payload
+
+
+def decode_spikes(data, layout="padded", index=False):
+    # Decode `encode_spikes` output into the zero-padded array ("padded") or into ragged
+    # (spike times, fiber offsets) with the spikes of fiber k in times[offsets[k]:offsets[k + 1]];
+    # spike times are integer sample indexes if index, else in the dtype of the encoded array
+    assert data[:4] == SPIKE_CODEC_MAGIC, "not an encoded spike file"
+    (header_len,) = struct.unpack("<I", data[4:8])
+    header = json.loads(data[8:8 + header_len].decode())
+    _, decompress = SPIKE_CODEC_COMPRESSORS[header["compression"]]
+    payload = decompress(data[8 + header_len:])
+    shape = header["shape"]
+    num_fibers = int(np.prod(shape[:-1]))
+    counts_dtype = np.dtype(header["counts_dtype"])
+    counts = np.frombuffer(payload, dtype=counts_dtype, count=num_fibers).astype(np.int64)
+    deltas = np.frombuffer(payload, dtype=np.dtype(header["deltas_dtype"]), offset=num_fibers * counts_dtype.itemsize)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    # Cumulative sum of the deltas restarted at the first spike of every fiber
+    idx = np.cumsum(deltas, dtype=np.int64)
+    starts = offsets[:-1][counts > 0]
+    if len(starts) > 1:
+        idx -= np.repeat(np.concatenate([[0], idx[starts[1:] - 1]]), counts[counts > 0])
+    if index or header["fs"] is None:
+        times = idx.astype(np.dtype(header["dtype"]) if header["fs"] is None else np.min_scalar_type(idx.max(initial=1)))
+    else:
+        times = (idx / header["fs"]).astype(np.dtype(header["dtype"]))
+    if layout == "ragged":
+        return times, offsets
+    assert layout == "padded", "layout must be 'padded' or 'ragged'"
+    spikes = np.zeros([num_fibers, shape[-1]], dtype=times.dtype)
+    spikes[np.arange(shape[-1]) < counts[:, np.newaxis]] = times
+    return spikes.reshape(shape)
+
+
+def save_spikes_file(path, spikes, fs=SPIKE_CODEC_FS, compression="zlib"):
+    # Atomically write spike times in the `encode_spikes` format (.spk)
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    data = encode_spikes(spikes, fs=fs, compression=compression)
+    fd, tmp_path = tempfile.mkstemp(dir=directory or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_spikes_file(path, layout="padded", index=False):
+    with open(path, "rb") as f:
+        return decode_spikes(f.read(), layout=layout, index=index)
+
+
+def save_spikes_array(path, spikes, codec=True):
+    # Save spike times to `path` (without extension) as the compact `path` + ".spk" if codec, else
+    # (or if the codec cannot represent them exactly) as `path` + ".npy"; returns the file path
+    if codec:
+        try:
+            save_spikes_file(path + ".spk", spikes)
+            return path + ".spk"
+        except ValueError:
+            pass
+    save(path + ".npy", spikes)
+    return path + ".npy"
+
+
+def spike_layout(spikes, layout="padded", index=False, fs=SPIKE_CODEC_FS):
+    # Zero-padded spike times [..., spikes] in the layouts of `decode_spikes` (integer sample
+    # indexes at fs if index; ragged times and offsets keep each fiber up to its last nonzero spike)
+    spikes = np.asarray(spikes)
+    if index and not np.issubdtype(spikes.dtype, np.integer):
+        spikes = np.round(spikes.astype(np.float64) * fs).astype(np.int64)
+        spikes = spikes.astype(np.min_scalar_type(int(spikes.max(initial=1))))
+    if layout == "ragged":
+        fibers = spikes.reshape([-1, spikes.shape[-1]])
+        nonzero = fibers != 0
+        counts = np.where(nonzero.any(axis=-1), fibers.shape[-1] - np.argmax(nonzero[:, ::-1], axis=-1), 0)
+        return fibers[np.arange(fibers.shape[-1]) < counts[:, np.newaxis]], np.concatenate([[0], np.cumsum(counts)])
+    assert layout == "padded", "layout must be 'padded' or 'ragged'"
+    return spikes
+
+
+def load_spikes(path, mmap=False, layout="padded", index=False):
+    # Load the spike file `path` (without extension): `path` + ".spk" if it exists, else
+    # `path` + ".npy" (lazy `SpikeSet` if mmap), in the `decode_spikes` layout asked for
+    ext = ".spk" if os.path.exists(path + ".spk") else ".npy"
+    if mmap:
+        assert layout == "padded" and not index, "SpikeSet views hold padded spike times"
+        return SpikeSet(path + ext)
+    if ext == ".spk":
+        return load_spikes_file(path + ext, layout=layout, index=index)
+    return spike_layout(np.load(path + ext), layout=layout, index=index)
+
+
+def _spike_file_names(directory, prefix):
+    # Names (without extension) of the .spk and .npy spike files in `directory`
+    return sorted({
+        os.path.splitext(filename)[0]
+        for filename in os.listdir(directory)
+        if filename.startswith(prefix) and os.path.splitext(filename)[1] in [".spk", ".npy"]
+    })
+
+
+def get_spikes(note, mode="regular", instrument="piano", mmap=False, seed=None, layout="padded", index=False):
+    # If mmap, spikes are returned as lazy `SpikeSet` views (nothing is read until sliced and used;
+    # .spk files are compressed and are decoded into memory on first use instead)
+    # If seed is not None ("rng" and "corpus" modes), only the spikes of that seed are returned
+    # Spikes are returned in the `decode_spikes` layout and format asked for (layout, index)
+    if mmap:
+        assert layout == "padded" and not index, "SpikeSet views hold padded spike times"
+    if seed is not None and mode == "rng":
+        return load_spikes(os.path.join(SPIKES_DIR, instrument, "rng", note, f"{note}_{seed}"), mmap=mmap,
+                           layout=layout, index=index)
+    if seed is not None and mode == "corpus":
+        if mmap:
+            return SpikeSet(SPIKE_CORPUS_PATH, corpus_key=(instrument, note, seed))
+        with SpikeCorpus(SPIKE_CORPUS_PATH, mode="r") as corpus:
+            return spike_layout(corpus.read(note, seeds=seed, instrument=instrument), layout=layout, index=index)
     if mode == "regular":
         if note[1] == "#":
             note = sharp_to_flat(note[:2]) + note[2:]
-        return np.load(os.path.join(os.path.join(SPIKES_DIR, instrument), f"{note}.npy"))
+        return load_spikes(os.path.join(os.path.join(SPIKES_DIR, instrument), note), mmap=mmap,
+                           layout=layout, index=index)
     elif mode == "rng":
         rng_path = os.path.join(SPIKES_DIR, instrument, "rng", note)
-        return [
-            np.load(os.path.join(rng_path, filename))
-            for filename in os.listdir(rng_path)
-            if filename.startswith(note)
-        ]
+        return [load_spikes(os.path.join(rng_path, name), mmap=mmap, layout=layout, index=index)
+                for name in _spike_file_names(rng_path, note)]
+    elif mode == "corpus":
+        if mmap:
+            with SpikeCorpus(SPIKE_CORPUS_PATH, mode="r") as corpus:
+                seeds = corpus.seeds(note, instrument=instrument).tolist()
+            return [SpikeSet(SPIKE_CORPUS_PATH, corpus_key=(instrument, note, seed)) for seed in seeds]
+        # Iterator over the seeds of the note (one (cf, fiber, spike) array in memory at a time)
+        return _iter_corpus_spikes(note, instrument, layout=layout, index=index)
+
+
+def get_seeds(note, mode="rng", instrument="piano"):
+    # Seeds of the stored spikes of a note (sorted)
+    if mode == "rng":
+        rng_path = os.path.join(SPIKES_DIR, instrument, "rng", note)
+        return sorted(int(name[len(note) + 1:]) for name in _spike_file_names(rng_path, f"{note}_"))
+    elif mode == "corpus":
+        with SpikeCorpus(SPIKE_CORPUS_PATH, mode="r") as corpus:
+            return sorted(corpus.seeds(note, instrument=instrument).tolist())
+    return [None]
+
+
+def _iter_corpus_spikes(note, instrument, layout="padded", index=False):
+    with SpikeCorpus(SPIKE_CORPUS_PATH, mode="r") as corpus:
+        for _, spikes in corpus.iter_spikes(note, instrument=instrument):
+            yield spike_layout(spikes, layout=layout, index=index)
 
 
 def load_note_sound(note, instrument="piano"):
@@ -64,3 +268,442 @@ def load_note_sound(note, instrument="piano"):
         note = sharp_to_flat(note[:2]) + note[2:]
 
     return wavfile.read(os.path.join(NOTES_DIR, instrument, f"{note}.wav"))
+
+
+def _canonical(value):
+    # JSON-serializable form of a parameter value used in cache keys
+    # (numbers are compared by value, so 1 and 1.0 give the same key)
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items())}
+    if isinstance(value, np.ndarray):
+        return {"dtype": value.dtype.str, "shape": list(value.shape),
+                "sha256": hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return repr(float(value))
+    if value is None or isinstance(value, str):
+        return value
+    raise TypeError(f"cannot build a cache key from {type(value).__name__}")
+
+
+class LRUDirectoryStore:
+    """
+    Directory of files addressed by hex keys (in subdirectories named after the first
+    two characters of the key) whose total size is bounded by `max_bytes`: least
+    recently used entries are evicted first (file modification times are updated on
+    every hit). Writes are atomic. Subclasses define the file extensions `exts` (new
+    entries use the first one unless `put` is given another), how entries are read
+    back (`_read`) and written (`_write`), and their own keys.
+    """
+
+    exts = (".npy",)
+    read_errors = (FileNotFoundError, ValueError)
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    def __getstate__(self):
+        # Worker processes re-scan the cache directory instead of copying the size estimate
+        return {name: value for name, value in self.__dict__.items() if name != "_size"}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._size = sum(size for _, _, size in self._entries())
+
+    def path(self, key, ext=None):
+        return os.path.join(self.cache_dir, key[:2], key + (ext or self.exts[0]))
+
+    def get(self, key):
+        # Returns the cached value or None if `key` is not cached
+        for ext in self.exts:
+            path = self.path(key, ext)
+            try:
+                value = self._read(path)
+                os.utime(path)  # Mark as recently used
+            except self.read_errors:
+                continue
+            return value
+        return None
+
+    def put(self, key, value, ext=None):
+        # Store `value` under `key` (atomic write) and evict old entries if the store is full
+        path = self.path(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                self._write(f, value)
+            try:
+                old_size = os.path.getsize(path)  # Overwriting an entry does not grow the store
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self._size += os.path.getsize(path) - old_size
+        if self._size > self.max_bytes:
+            self.evict(keep=path)
+
+    def evict(self, keep=None):
+        # Delete least recently used entries (except `keep`) until the store is below `max_bytes`
+        entries = sorted(self._entries())
+        self._size = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self._size <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Already evicted by another process
+            self._size -= size
+
+    def _entries(self):
+        # Yields (modification time, path, size in bytes) of all stored files
+        for subdir in os.scandir(self.cache_dir):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith(self.exts):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield stat.st_mtime, entry.path, stat.st_size
+
+    def _read(self, path):
+        return np.load(path)
+
+    def _write(self, f, value):
+        np.save(f, np.asarray(value))
+
+
+class SpikeCache(LRUDirectoryStore):
+    """
+    Content-addressed on-disk store of model outputs (e.g. spike times). Entries are
+    keyed by a hash of the input audio, its sampling rate, the full `nervegram` kwargs
+    and the random seed, so changing any model parameter gives a new entry instead of
+    reusing stale spikes. If `codec`, spike times are stored in the compact
+    `encode_spikes` format (.spk); outputs the codec cannot represent exactly (and all
+    outputs if not `codec`) are stored as .npy files.
+    """
+
+    read_errors = (FileNotFoundError, ValueError, EOFError, AssertionError, zlib.error, lzma.LZMAError)
+
+    def __init__(self, cache_dir=SPIKE_CACHE_DIR, max_bytes=64 * 2**30, codec=True):
+        self.codec = codec
+        self.exts = (".spk", ".npy") if codec else (".npy",)
+        super().__init__(cache_dir, max_bytes)
+
+    @staticmethod
+    def key(signal, signal_fs, kwargs, seed=None):
+        signal = np.ascontiguousarray(signal)
+        h = hashlib.sha256()
+        h.update(json.dumps({
+            "version": SPIKE_CACHE_VERSION,
+            "signal": _canonical(signal),
+            "signal_fs": _canonical(signal_fs),
+            "kwargs": _canonical(kwargs),
+            "seed": _canonical(seed),
+        }, sort_keys=True).encode())
+        return h.hexdigest()
+
+    def put(self, key, array):
+        array = np.asarray(array)
+        if self.codec:
+            try:
+                data = encode_spikes(array)
+            except ValueError:
+                pass  # Not spike times on the codec grid: stored losslessly as .npy below
+            else:
+                return super().put(key, data, ext=".spk")
+        super().put(key, array, ext=".npy")
+
+    def get_or_compute(self, compute, signal, signal_fs, kwargs, seed=None):
+        # Returns the cached output of `compute()` for these inputs (computed and stored on a miss)
+        key = self.key(signal, signal_fs, kwargs, seed=seed)
+        array = self.get(key)
+        if array is None:
+            array = np.asarray(compute())
+            self.put(key, array)
+        return array
+
+    def _read(self, path):
+        return load_spikes_file(path) if path.endswith(".spk") else np.load(path)
+
+    def _write(self, f, value):
+        if isinstance(value, bytes):
+            f.write(value)
+        else:
+            np.save(f, value)
+
+
+class SpikeCorpus:
+    """
+    Single HDF5 container of the seed x note spike corpus. The spike times of each
+    (instrument, note) are one dataset of shape (seed, cf, fiber, spike) that is
+    chunked along the CF axis (one seed and `cf_chunk` CFs per chunk), so a single
+    seed, CF band or fiber subset is read without loading whole seeds. The seeds of
+    each note are stored alongside the spikes.
+    """
+
+    def __init__(self, path=SPIKE_CORPUS_PATH, mode="a", cf_chunk=64):
+        directory = os.path.dirname(path)
+        if mode != "r" and directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.cf_chunk = cf_chunk
+        import h5py  # Optional dependency, only needed for the HDF5 corpus
+        self.f = h5py.File(path, mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.f.close()
+
+    @staticmethod
+    def _group_name(instrument, note):
+        if note[1] == "#":
+            note = sharp_to_flat(note[:2]) + note[2:]
+        return f"{instrument}/{note}"
+
+    def notes(self, instrument="piano"):
+        if instrument not in self.f:
+            return []
+        return list(self.f[instrument].keys())
+
+    def seeds(self, note, instrument="piano"):
+        name = self._group_name(instrument, note)
+        if name not in self.f:
+            return np.zeros([0], dtype=np.int64)
+        return self.f[name]["seeds"][:]
+
+    def add(self, note, seed, spikes, instrument="piano"):
+        # Store the spikes of one seed (replaces the spikes of `seed` if already stored)
+        spikes = np.asarray(spikes)
+        name = self._group_name(instrument, note)
+        if name not in self.f:
+            group = self.f.create_group(name)
+            group.create_dataset(
+                "spikes",
+                shape=(0,) + spikes.shape,
+                maxshape=(None,) + spikes.shape,
+                dtype=spikes.dtype,
+                chunks=(1, min(self.cf_chunk, spikes.shape[0])) + spikes.shape[1:])
+            group.create_dataset("seeds", shape=(0,), maxshape=(None,), dtype=np.int64)
+        group = self.f[name]
+        msg = f"spikes of {name} have shape {group['spikes'].shape[1:]}, got {spikes.shape}"
+        assert group["spikes"].shape[1:] == spikes.shape, msg
+        idx = np.flatnonzero(group["seeds"][:] == seed)
+        if len(idx) > 0:
+            idx = idx[0]
+        else:
+            idx = group["seeds"].shape[0]
+            group["spikes"].resize(idx + 1, axis=0)
+            group["seeds"].resize(idx + 1, axis=0)
+            group["seeds"][idx] = seed
+        group["spikes"][idx] = spikes
+
+    def read(self, note, seeds=None, cf=slice(None), fibers=slice(None), instrument="piano"):
+        # Spikes with shape (seed, cf, fiber, spike); only the requested chunks are read
+        group = self.f[self._group_name(instrument, note)]
+        all_seeds = group["seeds"][:]
+        if seeds is None:
+            seed_idx = np.arange(len(all_seeds))
+        else:
+            lookup = {seed: idx for idx, seed in enumerate(all_seeds.tolist())}
+            seed_idx = np.array([lookup[seed] for seed in np.atleast_1d(seeds).tolist()], dtype=int)
+        spikes = np.stack([self._read_seed(group, idx, cf, fibers) for idx in seed_idx], axis=0)
+        if seeds is not None and np.ndim(seeds) == 0:
+            return spikes[0]
+        return spikes
+
+    def iter_spikes(self, note, cf=slice(None), fibers=slice(None), instrument="piano"):
+        # Yields (seed, spikes with shape (cf, fiber, spike)) one seed at a time
+        group = self.f[self._group_name(instrument, note)]
+        for idx, seed in enumerate(group["seeds"][:].tolist()):
+            yield seed, self._read_seed(group, idx, cf, fibers)
+
+    @staticmethod
+    def _read_seed(group, idx, cf, fibers):
+        # h5py only supports increasing index lists: read sorted and restore the requested order
+        dataset = group["spikes"]
+        selection = []
+        restore = []
+        for index in [cf, fibers]:
+            if isinstance(index, slice):
+                selection.append(index)
+                restore.append(slice(None))
+            else:
+                index = np.atleast_1d(index)
+                unique, inverse = np.unique(index, return_inverse=True)
+                selection.append(unique.tolist())
+                restore.append(inverse)
+        if isinstance(selection[0], list) and isinstance(selection[1], list):
+            spikes = dataset[idx, selection[0]][:, selection[1]]
+        else:
+            spikes = dataset[idx, selection[0], selection[1]]
+        return spikes[restore[0]][:, restore[1]]
+
+    def import_rng_dir(self, note, rng_path=None, instrument="piano"):
+        # Add the `{note}_{seed}` .spk / .npy files of the per-file layout (see `get_spikes(mode="rng")`)
+        if rng_path is None:
+            rng_path = os.path.join(SPIKES_DIR, instrument, "rng", note)
+        stored = set(self.seeds(note, instrument=instrument).tolist())
+        for name in _spike_file_names(rng_path, f"{note}_"):
+            seed = int(name[len(note) + 1:])
+            if seed not in stored:
+                self.add(note, seed, load_spikes(os.path.join(rng_path, name)), instrument=instrument)
+
+
+def _as_index(idx):
+    # Contiguous index arrays are read as slices (views of the memory map / one hyperslab)
+    if len(idx) > 0 and np.all(np.diff(idx) == 1):
+        return slice(int(idx[0]), int(idx[-1]) + 1)
+    return idx
+
+
+class SpikeSet:
+    """
+    Lazy (cf, fiber, spike) view of the spike times of one note (and seed), backed
+    by a memory-mapped .npy file (`np.load(mmap_mode="r")`), by a .spk file or by
+    one seed of the `SpikeCorpus`. Indexing with CF and fiber selections returns a
+    new view; data is read only by `load` / `np.asarray`, and only the selected CFs
+    and fibers are read (.spk files are compressed, so the whole file is decoded
+    the first time a view of it is used, and shared with the views taken from it).
+    Pickled views hold the path only, so parallel workers map the same file and
+    share the page cache.
+    """
+
+    def __init__(self, path, corpus_key=None, cf=None, fibers=None):
+        self.path = path
+        self.corpus_key = corpus_key  # (instrument, note, seed) if backed by a SpikeCorpus
+        self._source = None
+        self._shape = None
+        self._cf = cf
+        self._fibers = fibers
+
+    def __getstate__(self):
+        return {"path": self.path, "corpus_key": self.corpus_key, "cf": self._cf, "fibers": self._fibers}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], corpus_key=state["corpus_key"], cf=state["cf"], fibers=state["fibers"])
+
+    def _base_shape(self):
+        if self._shape is None:
+            if self.corpus_key is None:
+                if self.path.endswith(".spk"):
+                    self._source = load_spikes_file(self.path)
+                else:
+                    self._source = np.load(self.path, mmap_mode="r")
+                self._shape = self._source.shape
+            else:
+                instrument, note, _ = self.corpus_key
+                import h5py  # Optional dependency, only needed for the HDF5 corpus
+                with h5py.File(self.path, "r") as f:
+                    self._shape = f[SpikeCorpus._group_name(instrument, note)]["spikes"].shape[1:]
+        return self._shape
+
+    @property
+    def cf_indices(self):
+        if self._cf is None:
+            return np.arange(self._base_shape()[0])
+        return self._cf
+
+    @property
+    def fiber_indices(self):
+        if self._fibers is None:
+            return np.arange(self._base_shape()[1])
+        return self._fibers
+
+    @property
+    def shape(self):
+        return (len(self.cf_indices), len(self.fiber_indices)) + tuple(self._base_shape()[2:])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        # Select CFs and fibers, e.g. spike_set[100:200], spike_set[:, [0, 5]]
+        if not isinstance(key, tuple):
+            key = (key,)
+        msg = "SpikeSet supports indexing of the cf and fiber axes only"
+        assert len(key) <= 2, msg
+        key = key + (slice(None),) * (2 - len(key))
+        cf = np.atleast_1d(self.cf_indices[key[0]])
+        fibers = np.atleast_1d(self.fiber_indices[key[1]])
+        spike_set = SpikeSet(self.path, corpus_key=self.corpus_key, cf=cf, fibers=fibers)
+        spike_set._source, spike_set._shape = self._source, self._shape
+        return spike_set
+
+    def load(self):
+        # Read the selected CFs and fibers into memory
+        self._base_shape()
+        cf = _as_index(self.cf_indices)
+        fibers = _as_index(self.fiber_indices)
+        if self.corpus_key is None:
+            return np.array(self._source[cf][:, fibers])
+        instrument, note, seed = self.corpus_key
+        with SpikeCorpus(self.path, mode="r") as corpus:
+            return corpus.read(note, seeds=seed, cf=cf, fibers=fibers, instrument=instrument)
+
+    def __array__(self, dtype=None, copy=None):
+        spikes = self.load()
+        return spikes if dtype is None else spikes.astype(dtype)
+
+
+class MemoryCache:
+    """
+    In-process LRU memoization of arrays (e.g. spike tensors) with a memory budget.
+    Cached arrays are returned read-only and shared between callers. `stats` counts
+    hits, misses and evictions.
+    """
+
+    def __init__(self, max_bytes=4 * 2**30):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get_or_compute(self, key, compute):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return self._entries[key]
+        self.stats["misses"] += 1
+        value = np.asarray(compute())
+        value.setflags(write=False)
+        if value.nbytes <= self.max_bytes:
+            self._entries[key] = value
+            self.nbytes += value.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.stats["evictions"] += 1
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+# Spike tensors of the notes used by the analyses (see `analysis.spike_tensor.get_spike_tensor`)
+SPIKE_TENSOR_CACHE = MemoryCache()
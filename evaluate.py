@@ -1,12 +1,10 @@
 from analysis.musical import consonance_ordered_notes, empirical_probabilities
 from analysis.pulse import TAU
-from analysis.spike_tensor import generate_spike_tensor
+from analysis.spike_tensor import get_spike_tensor
 from scipy.spatial.distance import jensenshannon
 
 import numpy as np
 
-from cache import get_spikes
-
 
 def predicted_consonance_scores(probability_tensor, consonance_ordered_tensors, root_tensor):
     scores = np.array([])
@@ -46,10 +44,9 @@ def js_divergence(P_predicted):
 
 def evaluate_single(probability_tensor, tau=TAU, root_note="C4", debug=False):
     notes = consonance_ordered_notes(root_note)
-    notes_spikes = [get_spikes(note) for note in notes]
-    consonance_ordered_tensors = [generate_spike_tensor(spikes, tau=tau) for spikes in notes_spikes]
+    consonance_ordered_tensors = [get_spike_tensor(note, tau=tau) for note in notes]
 
-    root_tensor = generate_spike_tensor(get_spikes(root_note), tau=tau)
+    root_tensor = get_spike_tensor(root_note, tau=tau)
 
     scores = predicted_consonance_scores(probability_tensor, consonance_ordered_tensors, root_tensor)
 
@@ -1,8 +1,9 @@
+import inspect
 import os
 from .bez2018model import nervegram
 from scipy.io import wavfile
 import numpy as np
-from cache import NOTES_DIR, RNG_SPIKES_DIR, SPIKES_DIR, load_note_sound, save, sharp_to_flat
+from cache import NOTES_DIR, RNG_SPIKES_DIR, SPIKES_DIR, load_note_sound, save_spikes_array, sharp_to_flat
 
 MAX_VAL = 2**15
 
@@ -32,7 +33,10 @@ def normalize_absolute(array):
     return array / MAX_VAL
 
 
-def generate_spikes_sync(sound_data, duration=0.25, seed=711):
+def generate_spikes_sync(sound_data, duration=0.25, seed=711, n_workers=None, vihc_cache=None,
+                         spike_cache=None):
+    # vihc_cache: optional long-lived `VihcCache` of IHC potentials (reused across seeds of a note)
+    # spike_cache: optional long-lived `SpikeCache` the spike times are read from / written to
     # get data
     input_signal_fs, input_signal = sound_data
     input_signal = input_signal[:int(duration*input_signal_fs)]
@@ -41,10 +45,7 @@ def generate_spikes_sync(sound_data, duration=0.25, seed=711):
     # input_signal = normalize_to_range(input_signal)
     input_signal = normalize_absolute(input_signal)
 
-    result = nervegram(
-        input_signal,
-        input_signal_fs,
-
+    kwargs = dict(
         # Params worth changing
         max_spikes_per_train=100,
         nervegram_fs=20e3,
@@ -56,7 +57,6 @@ def generate_spikes_sync(sound_data, duration=0.25, seed=711):
         spont_list=sponts,
         implnt=1,  # 0 = approximate, 1 = actual Power Law
         num_spike_trains=1,
-        random_seed=seed,
 
         # What is returned
         return_vihcs=False,
@@ -65,10 +65,32 @@ def generate_spikes_sync(sound_data, duration=0.25, seed=711):
         return_spike_tensor_sparse=False,
         return_spike_tensor_dense=False,
     )
-    return np.array(result["nervegram_spike_times"])
-
 
-def save_spikes(note, instrument="piano"):
+    def compute():
+        result = nervegram(
+            input_signal,
+            input_signal_fs,
+            random_seed=seed,
+            n_workers=n_workers,
+            vihc_cache=vihc_cache,  # IHC stage is deterministic: reused across seeds
+            **kwargs,
+        )
+        return np.array(result["nervegram_spike_times"])
+
+    if spike_cache is None:
+        return compute()
+    # Key on the full nervegram kwargs (defaults included) so parameter changes never hit stale spikes
+    params = {
+        name: param.default
+        for name, param in inspect.signature(nervegram).parameters.items()
+        if param.default is not inspect.Parameter.empty
+        and name not in ["random_seed", "n_workers", "backend", "vihc_cache", "profile", "pin", "anmodel_outputs"]
+    }
+    params.update(kwargs)
+    return spike_cache.get_or_compute(compute, input_signal, input_signal_fs, params, seed=seed)
+
+
+def save_spikes(note, instrument="piano", codec=True):
     notes_dir = f"../notes/{instrument}"
     spikes_dir = f"./spikes/{instrument}"
 
@@ -78,8 +100,7 @@ def save_spikes(note, instrument="piano"):
     if spike_times.shape != (3500, 18, 100):
         print(f"ERROR: {note} has shape {spike_times.shape}")
 
-    path = os.path.join(spikes_dir, f"{note}.npy")
-    save(path, spike_times)
+    save_spikes_array(os.path.join(spikes_dir, note), spike_times, codec=codec)
 
 
 def first_n_primes(n):
@@ -93,21 +114,21 @@ def first_n_primes(n):
     return primes
 
 
-def save_spikes_rng(note, seed):
+def save_spikes_rng(note, seed, codec=True, vihc_cache=None):
     sound_data = load_note_sound(note)
 
-    file_location = os.path.join(RNG_SPIKES_DIR, note, f"{note}_{seed}.npy")
-    if os.path.exists(file_location):
+    file_location = os.path.join(RNG_SPIKES_DIR, note, f"{note}_{seed}")
+    if os.path.exists(file_location + ".npy") or os.path.exists(file_location + ".spk"):
         return False
 
     print(f"Processing {note} {seed}")
 
-    spike_times = generate_spikes_sync(sound_data, seed=seed)
+    spike_times = generate_spikes_sync(sound_data, seed=seed, vihc_cache=vihc_cache)
     spike_times = spike_times[0]
     if spike_times.shape != (3500, 18, 100):
         print(f"ERROR: {note} {seed} has shape {spike_times.shape}")
 
-    save(file_location, spike_times)
+    save_spikes_array(file_location, spike_times, codec=codec)
     return True
 
 
@@ -124,7 +145,7 @@ def generate_scale(scale):
     processed = [
         filename.split(".")[0]
         for filename in os.listdir(SPIKES_DIR)
-        if filename.endswith(".npy")
+        if filename.endswith(".npy") or filename.endswith(".spk")
     ]
 
     for filename in os.listdir(NOTES_DIR):
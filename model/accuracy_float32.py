@@ -0,0 +1,170 @@
+import argparse
+import concurrent.futures
+import multiprocessing
+import resource
+
+import numpy as np
+
+from model.bez2018model import nervegram
+from model.tone import generate_pure_tone
+
+
+def spike_statistics(spike_times, dur, freq=None):
+    '''
+    Summary statistics of zero-padded spike times with shape [spike_trains, cf, n_spikes].
+
+    Args
+    ----
+    spike_times (np.ndarray): spike times in seconds (0 = no spike)
+    dur (float): stimulus duration in seconds
+    freq (float or None): if not None, frequency (Hz) used to measure phase locking
+
+    Returns
+    -------
+    stats (dict): per-CF firing rate (spikes/s), mean ISI (s), and vector strength
+    '''
+    num_cf = spike_times.shape[1]
+    stats = {'rate': np.zeros(num_cf), 'isi': np.full(num_cf, np.nan), 'vs': np.full(num_cf, np.nan)}
+    for itr_cf in range(num_cf):
+        trains = [st[st > 0] for st in spike_times[:, itr_cf]]
+        stats['rate'][itr_cf] = np.mean([len(st) for st in trains]) / dur
+        isi = np.concatenate([np.diff(st) for st in trains])
+        if len(isi) > 0:
+            stats['isi'][itr_cf] = np.mean(isi)
+        if freq is not None:
+            phase = 2 * np.pi * freq * np.concatenate(trains)
+            if len(phase) > 0:
+                stats['vs'][itr_cf] = np.abs(np.mean(np.exp(1j * phase)))
+    return stats
+
+
+def accuracy_float32(stimuli=None,
+                     fs=44100,
+                     dur=0.25,
+                     num_cf=20,
+                     num_spike_trains=20,
+                     random_seed=0,
+                     **kwargs):
+    '''
+    Compare spike statistics of the single-precision compute path
+    (`compute_dtype='float32'`) against the double-precision path on the
+    pure tone and white noise test stimuli. Both paths use the same random
+    streams, so all differences are due to running the synapse model and
+    spike generator (and storing the IHC potentials) in single precision.
+
+    Args
+    ----
+    stimuli (dict or None): maps stimulus name to (waveform, frequency or None);
+        defaults to pure tones (`model.tone`) and white noise at the same level
+    fs (int): sampling rate of the stimuli in Hz
+    dur (float): duration of the default stimuli in seconds
+    num_cf (int): number of ERB-spaced CFs
+    num_spike_trains (int): number of spike trains per CF
+    random_seed (int): random seed shared by both paths
+    kwargs (dict): additional keyword arguments passed to `nervegram`
+
+    Returns
+    -------
+    results (list): one dict per stimulus with the maximum absolute deltas of
+        firing rate (spikes/s), mean ISI (s), and vector strength across CFs
+    '''
+    if stimuli is None:
+        rng = np.random.default_rng(random_seed)
+        stimuli = {
+            'tone_{}Hz'.format(freq): (0.02 * generate_pure_tone(freq, duration=dur, sample_rate=fs), freq)
+            for freq in [220, 440, 1000, 4000]
+        }
+        stimuli['white_noise'] = (0.02 * rng.standard_normal(int(dur * fs)) / np.sqrt(2), None)
+    results = []
+    for name, (signal, freq) in stimuli.items():
+        stats = {}
+        for compute_dtype in ['float64', 'float32']:
+            out = nervegram(
+                signal,
+                fs,
+                num_cf=num_cf,
+                num_spike_trains=num_spike_trains,
+                random_seed=random_seed,
+                compute_dtype=compute_dtype,
+                return_vihcs=False,
+                return_meanrates=False,
+                return_spike_tensor_sparse=False,
+                **kwargs)
+            stats[compute_dtype] = spike_statistics(
+                out['nervegram_spike_times'], len(signal) / fs, freq=freq)
+        delta = {
+            key: np.nanmax(np.abs(stats['float32'][key] - stats['float64'][key]), initial=0.0)
+            for key in ['rate', 'isi', 'vs']
+        }
+        results.append({
+            'stimulus': name,
+            'mean_rate': np.mean(stats['float64']['rate']),
+            'max_delta_rate': delta['rate'],
+            'max_delta_isi': delta['isi'],
+            'max_delta_vs': delta['vs'],
+        })
+    return results
+
+
+def _peak_rss_increase(signal, fs, kwargs):
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    nervegram(signal, fs, **kwargs)
+    return 1024 * (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) # ru_maxrss is in KiB
+
+
+def peak_memory_float32(dur=10.0,
+                        fs=44100,
+                        num_cf=20,
+                        num_spike_trains=20,
+                        random_seed=0,
+                        **kwargs):
+    '''
+    Peak memory of `nervegram` with both compute dtypes on a long white noise
+    stimulus. Each run is measured in a fresh process as the increase of the
+    peak resident set size (the C model allocates its buffers with malloc, so
+    they are not seen by tracemalloc).
+
+    Args
+    ----
+    dur (float): duration of the white noise stimulus in seconds
+    All other arguments are as defined in `accuracy_float32`
+
+    Returns
+    -------
+    peak_memory (dict): increase of the peak resident set size in bytes for
+        'float64' and 'float32'
+    '''
+    signal = 0.02 * np.random.default_rng(random_seed).standard_normal(int(dur * fs)) / np.sqrt(2)
+    peak_memory = {}
+    for compute_dtype in ['float64', 'float32']:
+        kwargs_dtype = dict(
+            kwargs,
+            num_cf=num_cf,
+            num_spike_trains=num_spike_trains,
+            random_seed=random_seed,
+            compute_dtype=compute_dtype,
+            ragged_spike_times=True,
+            return_vihcs=False,
+            return_meanrates=False,
+            return_spike_tensor_sparse=False)
+        ctx = multiprocessing.get_context('spawn')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+            peak_memory[compute_dtype] = executor.submit(_peak_rss_increase, signal, fs, kwargs_dtype).result()
+    return peak_memory
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="accuracy of the float32 compute path")
+    parser.add_argument('-c', '--num_cf', type=int, default=20)
+    parser.add_argument('-n', '--num_spike_trains', type=int, default=20)
+    parser.add_argument('-i', '--implnt', type=int, default=0)
+    parser.add_argument('-d', '--memory_dur', type=float, default=10.0)
+    args = parser.parse_args()
+    print('stimulus    | mean rate (sp/s) | max d rate (sp/s) | max d ISI (s) | max d VS')
+    for r in accuracy_float32(num_cf=args.num_cf, num_spike_trains=args.num_spike_trains, implnt=args.implnt):
+        print('{:11s} | {:16.2f} | {:17.3f} | {:13.2e} | {:.2e}'.format(
+            r['stimulus'], r['mean_rate'], r['max_delta_rate'], r['max_delta_isi'], r['max_delta_vs']))
+    peak_memory = peak_memory_float32(dur=args.memory_dur, num_cf=args.num_cf,
+                                      num_spike_trains=args.num_spike_trains, implnt=args.implnt)
+    print('peak memory ({:.0f} s white noise): float64 {:.1f} MiB | float32 {:.1f} MiB'.format(
+        args.memory_dur, peak_memory['float64'] / 2**20, peak_memory['float32'] / 2**20))
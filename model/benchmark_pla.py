@@ -0,0 +1,62 @@
+import argparse
+import time
+
+import numpy as np
+
+from model.cython_bez2018 import run_ihc, run_synapse
+
+
+def benchmark_pla(durations=[0.05, 0.1, 0.25, 0.5, 1.0],
+                  fs=100e3,
+                  cf=1000.0,
+                  spont=70.0,
+                  pla_tol=1e-6,
+                  random_seed=0):
+    '''
+    Compare the speed and accuracy of the "fast actual" power-law adaptation
+    (implnt=2, sum-of-exponentials kernels) against the exact O(N^2) loop (implnt=1).
+    Both implementations are run on the same IHC potential and fGn realization.
+
+    Args
+    ----
+    durations (list): stimulus durations in seconds
+    fs (float): sampling rate in Hz
+    cf (float): characteristic frequency in Hz
+    spont (float): spontaneous firing rate in spikes per second
+    pla_tol (float): relative error tolerance of the power-law kernels (implnt=2)
+    random_seed (int): random seed of the fGn
+
+    Returns
+    -------
+    results (list): one dict per duration with run times (s) and relative synout error
+    '''
+    results = []
+    for dur in durations:
+        t = np.arange(int(dur * fs)) / fs
+        signal = 0.02 * np.sin(2 * np.pi * cf * t) # ~57 dB SPL tone at CF
+        vihc = run_ihc(signal, fs, cf, species=2)
+        kwargs = dict(spont=spont, noiseType=1., random_seed=random_seed)
+        t0 = time.perf_counter()
+        synout_exact = run_synapse(vihc, fs, cf, implnt=1., **kwargs)['synout']
+        t1 = time.perf_counter()
+        synout_fast = run_synapse(vihc, fs, cf, implnt=2., pla_tol=pla_tol, **kwargs)['synout']
+        t2 = time.perf_counter()
+        results.append({
+            'dur': dur,
+            'time_exact': t1 - t0,
+            'time_fast': t2 - t1,
+            'max_rel_error': np.max(np.abs(synout_fast - synout_exact)) / np.max(np.abs(synout_exact)),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark power-law adaptation implementations")
+    parser.add_argument('-d', '--durations', type=float, nargs='+', default=[0.05, 0.1, 0.25, 0.5, 1.0])
+    parser.add_argument('-t', '--pla_tol', type=float, default=1e-6)
+    parser.add_argument('-c', '--cf', type=float, default=1000.0)
+    args = parser.parse_args()
+    print('dur (s) | exact (s) | fast (s) | speedup | max rel. error')
+    for r in benchmark_pla(durations=args.durations, cf=args.cf, pla_tol=args.pla_tol):
+        print('{:7.3f} | {:9.4f} | {:8.4f} | {:7.1f} | {:.2e}'.format(
+            r['dur'], r['time_exact'], r['time_fast'], r['time_exact'] / r['time_fast'], r['max_rel_error']))
@@ -1,6 +1,13 @@
-from model.cython_bez2018 import run_ihc, run_anf # Package must be installed in-place: `python setup.py build_ext --inplace`
+from model.cython_bez2018 import run_ihc, run_ihc_bank, run_anf, run_meanrate, run_decimate, profile_start, profile_stop, IHCBankStream, ANFStream # Package must be installed in-place: `python setup.py build_ext --inplace`
+from model.cache_bez2018 import VihcCache
+from model.profile_bez2018 import Profile
+from model.util_bez2018 import ResamplePolyStream
+import concurrent.futures
+import inspect
+import time
 import numpy as np
 import scipy.signal
+import scipy.sparse
 from tqdm import tqdm
 
 def get_ERB_cf_list(num_cf, min_cf=125.0, max_cf=8e3):
@@ -46,6 +53,17 @@ def get_min_idx_dtype(shape):
         raise ValueError("Requested shape too large to store indexes as integers")
 
 
+def get_min_uint_dtype(max_value):
+    '''
+    Helper function returns minimum numpy unsigned integer datatype for storing
+    integers between 0 and `max_value` (e.g. spike times as sample indexes).
+    '''
+    for dtype in [np.uint8, np.uint16, np.uint32, np.uint64]:
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    raise ValueError("Requested value too large to store as unsigned integer")
+
+
 def sparse_to_dense_nervegram_spike_tensor(dense_shape,
                                            index_arg,
                                            index_keypart='nervegram_spike_tensor_sparse'):
@@ -80,11 +98,174 @@ def sparse_to_dense_nervegram_spike_tensor(dense_shape,
     return nervegram_spike_tensor_dense
 
 
+def get_nervegram_spike_tensor_sparse(nervegram_spike_idx, time_axis=2):
+    '''
+    Helper function for converting binned spike times to a sparse nervegram
+    spike tensor (list of spike indexes) in one vectorized pass.
+    
+    Args
+    ----
+    nervegram_spike_idx (np.ndarray): spike time bin indexes (0 = no spike) with the
+        spike axis last (e.g. [spike_trains, cf, (spont), (channel), n_spikes])
+    time_axis (int): position of the time axis in the dense spike tensor
+    
+    Returns
+    -------
+    nervegram_spike_tensor_sparse (np.ndarray): spike indexes with shape [ndims, N]
+        (dense tensor dimensions are those of `nervegram_spike_idx` with the spike
+        axis replaced by the time axis at `time_axis`)
+    '''
+    spike_idx_args = np.nonzero(nervegram_spike_idx)
+    t_idx = nervegram_spike_idx[spike_idx_args]
+    nervegram_spike_tensor_sparse = list(spike_idx_args[:-1])
+    nervegram_spike_tensor_sparse.insert(time_axis, t_idx)
+    return np.stack(nervegram_spike_tensor_sparse, axis=0).astype(int)
+
+
+def get_ragged_nervegram_spike_tensor_sparse(spike_idx,
+                                             spike_offsets,
+                                             fiber_shape,
+                                             num_time_bins,
+                                             channel_dim=False,
+                                             time_axis=2):
+    '''
+    Helper function for converting binned ragged spike times to a sparse nervegram
+    spike tensor with the same dense dimensions as the zero-padded spike times
+    (see `get_nervegram_spike_tensor_sparse`).
+    
+    Args
+    ----
+    spike_idx (np.ndarray): spike time bin indexes of all fibers (0 = no spike)
+    spike_offsets (np.ndarray): spike offsets with shape [num_fibers + 1]
+    fiber_shape (list): fiber dimensions [(channel), cf, (spont), spike_trains]
+    num_time_bins (int): number of time bins of the dense spike tensor
+    channel_dim (bool): if True, the first fiber dimension is the channel dimension
+    time_axis (int): position of the time axis in the dense spike tensor
+    
+    Returns
+    -------
+    dense_shape (list): dimensions of the dense spike tensor [spike_trains, cf, time, (spont), (channel)]
+    nervegram_spike_tensor_sparse (np.ndarray): spike indexes with shape [ndims, N]
+    '''
+    fiber_idx = np.repeat(np.arange(np.prod(fiber_shape)), np.diff(spike_offsets))
+    fiber_idx = np.unravel_index(fiber_idx, fiber_shape)
+    # Order of the fiber dimensions in the padded spike times [spike_trains, cf, (spont), (channel)]
+    order = list(range(len(fiber_shape)))
+    if channel_dim:
+        order.append(order.pop(0))
+    order.insert(0, order.pop(-2 if channel_dim else -1))
+    keep = spike_idx != 0
+    nervegram_spike_tensor_sparse = [fiber_idx[itr][keep] for itr in order]
+    nervegram_spike_tensor_sparse.insert(time_axis, spike_idx[keep])
+    dense_shape = [fiber_shape[itr] for itr in order]
+    dense_shape.insert(time_axis, num_time_bins)
+    return dense_shape, np.stack(nervegram_spike_tensor_sparse, axis=0).astype(int)
+
+
+def sparse_to_scipy_nervegram_spike_tensor(dense_shape,
+                                           nervegram_spike_tensor_sparse,
+                                           time_axis=2,
+                                           format='csr'):
+    '''
+    Helper function for converting sparse nervegram spike tensor to a 2D
+    `scipy.sparse` matrix with shape [fibers, time], where rows index all
+    non-time dimensions of the dense tensor in C order.
+    
+    Args
+    ----
+    dense_shape (tuple): dimensions of `nervegram_spike_tensor_dense`
+    nervegram_spike_tensor_sparse (np.ndarray): spike indexes with shape [ndims, N]
+    time_axis (int): position of the time axis in `dense_shape`
+    format (str): 'coo' or 'csr'
+    
+    Returns
+    -------
+    nervegram_spike_tensor_scipy (scipy.sparse matrix): binary spike matrix (dtype bool)
+    '''
+    assert format in ['coo', 'csr'], "format must be 'coo' or 'csr'"
+    fiber_shape = [d for itr, d in enumerate(dense_shape) if itr != time_axis]
+    fiber_idx = np.delete(np.asarray(nervegram_spike_tensor_sparse), time_axis, axis=0)
+    row = np.ravel_multi_index(tuple(fiber_idx), fiber_shape)
+    col = np.asarray(nervegram_spike_tensor_sparse)[time_axis]
+    nervegram_spike_tensor_scipy = scipy.sparse.coo_matrix(
+        (np.ones(row.shape[0], dtype=bool), (row, col)),
+        shape=(int(np.prod(fiber_shape)), int(dense_shape[time_axis])))
+    # Duplicate indexes (several spikes in one time bin) are merged into a single spike
+    nervegram_spike_tensor_scipy.sum_duplicates()
+    if format == 'csr':
+        return nervegram_spike_tensor_scipy.tocsr()
+    return nervegram_spike_tensor_scipy
+
+
+def concatenate_ragged_spike_times(list_ragged):
+    '''
+    Helper function for concatenating ragged spike times of consecutive fibers.
+    
+    Args
+    ----
+    list_ragged (list): (spike_times, spike_offsets) tuples (see `ragged_to_padded_spike_times`)
+    
+    Returns
+    -------
+    spike_times (np.ndarray): concatenated spike times
+    spike_offsets (np.ndarray): concatenated spike offsets
+    '''
+    spike_times = np.concatenate([times for times, _ in list_ragged])
+    spike_offsets = [np.zeros(1, dtype=np.int64)]
+    for _, offsets in list_ragged:
+        spike_offsets.append(offsets[1:] + spike_offsets[-1][-1])
+    return spike_times, np.concatenate(spike_offsets)
+
+
+def clip_ragged_spike_times(spike_times, spike_offsets, t0, t1):
+    '''
+    Helper function for clipping ragged spike times (equivalent of `clip_time_axis`
+    with `sr='timestamps'`): spike times outside of the range (t0, t1) are removed
+    and t=0 is reset to t0.
+    
+    Returns
+    -------
+    spike_times (np.ndarray): clipped spike times
+    spike_offsets (np.ndarray): spike offsets of the clipped spike times
+    '''
+    spike_times = spike_times - t0
+    keep = (spike_times > 0) & (spike_times < t1 - t0)
+    count_keep = np.concatenate([[0], np.cumsum(keep)])
+    return spike_times[keep], count_keep[spike_offsets]
+
+
+def ragged_to_padded_spike_times(spike_times, spike_offsets, max_spikes=None):
+    '''
+    Helper function for converting ragged spike times to a zero-padded array.
+    
+    Args
+    ----
+    spike_times (np.ndarray): spike times of all fibers (fiber k is
+        spike_times[spike_offsets[k]:spike_offsets[k+1]])
+    spike_offsets (np.ndarray): spike offsets with shape [num_fibers + 1]
+    max_spikes (int or None): size of the padded axis (defaults to the largest spike count)
+    
+    Returns
+    -------
+    spike_times_padded (np.ndarray): zero-padded spike times with shape [num_fibers, max_spikes]
+    '''
+    counts = np.diff(spike_offsets)
+    if max_spikes is None:
+        max_spikes = np.max(counts, initial=0)
+    assert np.max(counts, initial=0) <= max_spikes, "max_spikes is smaller than the largest spike count"
+    fiber_idx = np.repeat(np.arange(counts.shape[0]), counts)
+    spike_idx = np.arange(spike_times.shape[0]) - spike_offsets[fiber_idx]
+    spike_times_padded = np.zeros([counts.shape[0], max_spikes], dtype=spike_times.dtype)
+    spike_times_padded[fiber_idx, spike_idx] = spike_times
+    return spike_times_padded
+
+
 def clip_time_axis(y, t0, t1, sr=100e3, axis=0):
     '''
     Helper function for clipping time axis of waveforms and nervegram arrays.
     If `sr` is a string containing "time" and axis is None, then this function
-    will clip timestamps outside of the range [t0, t1] and reset t=0 to t0.
+    will clip timestamps outside of the range [t0, t1] and reset t=0 to t0
+    (zero-padded timestamps on the last axis, with arbitrary leading dimensions).
     
     Args
     ----
@@ -103,16 +284,9 @@ def clip_time_axis(y, t0, t1, sr=100e3, axis=0):
         y[y >= t1] = 0
         y = y - t0
         y[y < 0] = 0
-        msg = "timestamps must have shape [spike_trains, cf, spont, channel, time]"
-        assert len(y.shape) == 5, msg
-        for itr_st in range(y.shape[0]):
-            for itr_cf in range(y.shape[1]):
-                for itr_sp in range(y.shape[2]):
-                    for itr_ch in range(y.shape[3]):
-                        timestamps = y[itr_st, itr_cf, itr_sp, itr_ch, :]
-                        timestamps = timestamps[timestamps > 0]
-                        y[itr_st, itr_cf, itr_sp, itr_ch, :] = 0
-                        y[itr_st, itr_cf, itr_sp, itr_ch, 0:timestamps.shape[0]] = timestamps
+        # Move the remaining timestamps to the start of the last axis (stable, keeps their order)
+        order = np.argsort(y <= 0, axis=-1, kind='stable')
+        y = np.take_along_axis(y, order, axis=-1)
     else:
         tmp_slice = [slice(None)] * len(y.shape)
         tmp_slice[axis] = slice(int(t0*sr), int(t1*sr))
@@ -120,6 +294,491 @@ def clip_time_axis(y, t0, t1, sr=100e3, axis=0):
     return y
 
 
+def get_decimate_factor(pin_fs, nervegram_fs):
+    '''
+    Helper function returns the integer factor from `pin_fs` down to `nervegram_fs`
+    (None if `pin_fs` is not an integer multiple of `nervegram_fs`).
+    '''
+    q = pin_fs / nervegram_fs
+    if (q >= 1) and (q == int(q)):
+        return int(q)
+    return None
+
+
+def resample_nervegram(y, pin_fs, nervegram_fs):
+    '''
+    Helper function resamples model outputs from `pin_fs` to `nervegram_fs` along axis 0.
+    Integer factors use the native zero-phase decimator (`run_decimate`), other ratios
+    use `scipy.signal.resample_poly`.
+    
+    Args
+    ----
+    y (np.ndarray): model output with time on axis 0 (e.g. [time] or [time, spont])
+    pin_fs (int): sampling rate of `y` (Hz)
+    nervegram_fs (int): sampling rate of the output (Hz)
+    
+    Returns
+    -------
+    y (np.ndarray): resampled model output (np.float64)
+    '''
+    q = get_decimate_factor(pin_fs, nervegram_fs)
+    if q == 1:
+        return np.asarray(y, dtype=np.float64)
+    if (q is None) or (y.shape[0] <= 3 * (q + 1)):
+        return scipy.signal.resample_poly(y, int(nervegram_fs), int(pin_fs), axis=0)
+    y_2d = np.asarray(y, dtype=np.float64).reshape([y.shape[0], -1])
+    y_resampled = np.stack([
+        run_decimate(np.ascontiguousarray(y_2d[:, itr]), q) for itr in range(y_2d.shape[1])
+    ], axis=1)
+    return y_resampled.reshape([-1] + list(y.shape[1:]))
+
+
+def get_anf_random_seed(random_seed, random_seed_key=()):
+    '''
+    Helper function derives the 64-bit seed of the random number generators used by the
+    synapse model (fGn) and spike generator. Each fiber draws from its own streams addressed
+    by (cf_idx, spont_idx, train_idx), so one seed is shared by all CFs of a run and the model
+    output does not depend on the order or the process in which CFs are run.
+    
+    Args
+    ----
+    random_seed (int): base random seed (`random_seed` argument of `nervegram`)
+    random_seed_key (tuple): additional integers identifying the run (e.g. channel index)
+    
+    Returns
+    -------
+    anf_random_seed (np.uint64): seed for the fGn and spike generator random streams
+    '''
+    seed_seq = np.random.SeedSequence(random_seed, spawn_key=tuple(random_seed_key))
+    return seed_seq.generate_state(1, dtype=np.uint64)[0]
+
+
+def run_ANmodel_cf(pin,
+                   cf_idx,
+                   pin_fs=100e3,
+                   nervegram_fs=10e3,
+                   cf_list=[],
+                   species=2,
+                   bandwidth_scale_factor=[],
+                   cohc=[],
+                   cihc=[],
+                   IhcLowPass_cutoff=3e3,
+                   IhcLowPass_order=7,
+                   noiseType=1,
+                   implnt=0,
+                   pla_tol=1e-6,
+                   list_spont=None,
+                   spont_list=None,
+                   tabs=6e-4,
+                   trel=6e-4,
+                   synapseMode=0,
+                   max_spikes_per_train=1000,
+                   num_spike_trains=40,
+                   num_spike_trains_list=None,
+                   random_seed=None,
+                   random_seed_key=(),
+                   rate_only=False,
+                   return_vihcs=False,
+                   return_meanrates=False,
+                   return_spikes=True,
+                   ragged_spike_times=False,
+                   compute_dtype='float64',
+                   profile=False,
+                   vihc=None):
+    '''
+    Helper function to run auditory nerve model for a single CF channel.
+    
+    Args
+    ----
+    pin (np.ndarray): input pressure waveform sampled at `pin_fs` (units Pa)
+    cf_idx (int): index of the CF channel in `cf_list`
+    list_spont (np.ndarray): spontaneous rates (overridden by `spont_list[cf_idx]` if specified)
+    random_seed (int): base random seed used to derive the model random streams
+    random_seed_key (tuple): additional integers identifying the run (e.g. channel index)
+    rate_only (bool): if True, only the mean rate is computed (`run_meanrate`: no spike generator)
+    return_vihcs (bool): if True, the IHC potential resampled to `nervegram_fs` is returned
+    return_meanrates (bool): if True, the mean rate resampled to `nervegram_fs` is returned
+    return_spikes (bool): if True, spike times are returned
+    ragged_spike_times (bool): if True, spike times are returned as (spike_times, spike_offsets)
+    compute_dtype (str): precision of the IHC output, synapse model and spike generator ('float64' or 'float32')
+    profile (bool): if True, stage timings and counters are returned (see `Profile`)
+    vihc (np.ndarray or None): precomputed IHC potential of this CF (e.g. from `run_ihc_bank`)
+    All other arguments are as defined in `nervegram` function
+    
+    Returns
+    -------
+    vihc (np.ndarray or None): IHC potential with shape [time] (None if not `return_vihcs`)
+    meanrate (np.ndarray or None): instantaneous mean firing rate with shape [time, spont]
+        (None if neither `return_meanrates` nor `rate_only`)
+    spike_times (np.ndarray or None): spike time array with shape [spike_trains, spont, n_spikes]
+        (or ragged spike times and offsets of the fibers [spont, spike_trains]; None if not `return_spikes`)
+    profile (dict or None): stage timings and counters of this CF (None if not `profile`)
+    '''
+    cf = cf_list[cf_idx]
+    prof = Profile()
+    # Run IHC model
+    if vihc is None:
+        t0 = time.perf_counter()
+        vihc = run_ihc(
+            pin,
+            pin_fs,
+            cf,
+            species=species,
+            bandwidth_scale_factor=bandwidth_scale_factor[cf_idx],
+            cohc=cohc[cf_idx],
+            cihc=cihc[cf_idx],
+            IhcLowPass_cutoff=IhcLowPass_cutoff,
+            IhcLowPass_order=IhcLowPass_order).astype(compute_dtype)
+        prof.add('ihc', time.perf_counter() - t0)
+    
+    # Diverged code from forked repo here
+    if num_spike_trains_list is not None:
+        num_spike_trains = num_spike_trains_list[cf_idx]
+    if spont_list is not None:
+        list_spont = spont_list[cf_idx]
+
+    out_vihc, out_meanrate, out_spike_times = None, None, None
+    if return_vihcs:
+        with prof.timer('resample_outputs'):
+            out_vihc = resample_nervegram(vihc, pin_fs, nervegram_fs)
+    if profile:
+        profile_start()
+    if rate_only:
+        # Run IHC-ANF synapse model only (mean rate is decimated in C for integer factors)
+        q = get_decimate_factor(pin_fs, nervegram_fs)
+        out_meanrate = run_meanrate(
+            vihc,
+            pin_fs,
+            cf,
+            noiseType=noiseType,
+            implnt=implnt,
+            pla_tol=pla_tol,
+            list_spont=list_spont,
+            tabs=tabs,
+            trel=trel,
+            random_seed=get_anf_random_seed(random_seed, random_seed_key=random_seed_key),
+            cf_idx=cf_idx,
+            decimate=1 if q is None else q)
+        if profile:
+            prof.update(profile_stop())
+        if q is None:
+            out_meanrate = resample_nervegram(out_meanrate, pin_fs, nervegram_fs)
+            out_meanrate[out_meanrate < 0] = 0
+        return out_vihc, out_meanrate, out_spike_times, prof.to_dict() if profile else None
+    
+    # Run IHC-ANF synapse model
+    synapse_out = run_anf(
+        vihc,
+        pin_fs,
+        cf,
+        noiseType=noiseType,
+        implnt=implnt,
+        pla_tol=pla_tol,
+        list_spont=list_spont,
+        tabs=tabs,
+        trel=trel,
+        synapseMode=synapseMode,
+        max_spikes_per_train=max_spikes_per_train,
+        num_spike_trains=num_spike_trains,
+        random_seed=get_anf_random_seed(random_seed, random_seed_key=random_seed_key),
+        cf_idx=cf_idx,
+        ragged=ragged_spike_times)
+    if profile:
+        prof.update(profile_stop())
+    if return_meanrates:
+        with prof.timer('resample_outputs'):
+            out_meanrate = resample_nervegram(synapse_out['list_meanrate'], pin_fs, nervegram_fs)
+        out_meanrate[out_meanrate < 0] = 0
+    if return_spikes and ragged_spike_times:
+        out_spike_times = (synapse_out['list_spike_times'], synapse_out['list_spike_offsets'])
+    elif return_spikes:
+        out_spike_times = synapse_out['list_spike_times']
+    return out_vihc, out_meanrate, out_spike_times, prof.to_dict() if profile else None
+
+
+def run_ANmodel_block(pin, cf_indices, vihc_cache=None, **kwargs):
+    '''
+    Run auditory nerve model for a block of CF channels: the IHC filterbank
+    (`run_ihc_bank`) is run once for the whole block before the per-CF synapse
+    and spike generator models.
+    
+    Args
+    ----
+    pin (np.ndarray): input pressure waveform sampled at `kwargs['pin_fs']` (units Pa)
+    cf_indices (np.ndarray): indexes of the CF channels in this block
+    vihc_cache (VihcCache or None): if not None, IHC potentials are read from / written to this cache
+        (the IHC filterbank is only run for CFs that are not cached)
+    kwargs (dict): keyword arguments of `run_ANmodel_cf`
+    
+    Returns
+    -------
+    list_out (list): `run_ANmodel_cf` outputs ordered as `cf_indices`
+    '''
+    cf_indices = np.asarray(cf_indices, dtype=int)
+    if len(cf_indices) == 0:
+        return []
+    ihc_kwargs = [{
+        'cf': kwargs['cf_list'][cf_idx],
+        'species': kwargs['species'],
+        'bandwidth_scale_factor': kwargs['bandwidth_scale_factor'][cf_idx],
+        'cohc': kwargs['cohc'][cf_idx],
+        'cihc': kwargs['cihc'][cf_idx],
+        'IhcLowPass_cutoff': kwargs['IhcLowPass_cutoff'],
+        'IhcLowPass_order': kwargs['IhcLowPass_order'],
+    } for cf_idx in cf_indices]
+    block_vihc = [None] * len(cf_indices)
+    if vihc_cache is not None:
+        signal_key = vihc_cache.signal_key(pin, kwargs['pin_fs'])
+        keys = [vihc_cache.key(signal_key, dtype=kwargs['compute_dtype'], **kw) for kw in ihc_kwargs]
+        block_vihc = [vihc_cache.get(key) for key in keys]
+    # Run the IHC filterbank for all CFs that are not cached
+    miss = [itr for itr, vihc in enumerate(block_vihc) if vihc is None]
+    block_prof = Profile()
+    if vihc_cache is not None:
+        block_prof.count('vihc_cache_hits', len(cf_indices) - len(miss))
+        block_prof.count('vihc_cache_misses', len(miss))
+    t0 = time.perf_counter()
+    if miss:
+        miss_vihc = run_ihc_bank(
+            pin,
+            kwargs['pin_fs'],
+            [ihc_kwargs[itr]['cf'] for itr in miss],
+            species=kwargs['species'],
+            bandwidth_scale_factor=[ihc_kwargs[itr]['bandwidth_scale_factor'] for itr in miss],
+            cohc=[ihc_kwargs[itr]['cohc'] for itr in miss],
+            cihc=[ihc_kwargs[itr]['cihc'] for itr in miss],
+            IhcLowPass_cutoff=kwargs['IhcLowPass_cutoff'],
+            IhcLowPass_order=kwargs['IhcLowPass_order'],
+            dtype=kwargs['compute_dtype'])
+        for itr, vihc in zip(miss, miss_vihc):
+            block_vihc[itr] = vihc
+            if vihc_cache is not None:
+                vihc_cache.put(keys[itr], vihc)
+        block_prof.add('ihc', time.perf_counter() - t0)
+    list_out = [
+        run_ANmodel_cf(pin, cf_idx, vihc=vihc, **kwargs)
+        for cf_idx, vihc in zip(cf_indices, block_vihc)
+    ]
+    if kwargs.get('profile', False):
+        # IHC filterbank (block) timings are reported with the first CF of the block
+        list_out[0] = list_out[0][:3] + (block_prof.update(list_out[0][3]).to_dict(),)
+    return list_out
+
+
+# Per-process state of the CF-parallel worker pool (set once by `init_ANmodel_worker`)
+_worker_pins = None
+_worker_kwargs = None
+
+
+def init_ANmodel_worker(pins, list_kwargs):
+    '''
+    Initializer for CF-parallel worker processes: stores the resampled input waveforms
+    and the (CF-independent) model arguments of all waveforms once per process.
+    '''
+    global _worker_pins, _worker_kwargs
+    _worker_pins = pins
+    _worker_kwargs = list_kwargs
+
+
+def run_ANmodel_shard(pin_idx, cf_indices):
+    '''
+    Run auditory nerve model for a shard of CF channels inside a worker process.
+    
+    Args
+    ----
+    pin_idx (int): index of the input waveform (and its model arguments)
+    cf_indices (np.ndarray): indexes of the CF channels in this shard
+    
+    Returns
+    -------
+    list_out (list): `run_ANmodel_cf` outputs ordered as `cf_indices`
+    '''
+    return run_ANmodel_block(_worker_pins[pin_idx], cf_indices, **_worker_kwargs[pin_idx])
+
+
+def run_ANmodel_grid(pins,
+                     list_kwargs,
+                     n_workers=None,
+                     backend='processes',
+                     shards_per_worker=8,
+                     cf_block_size=16,
+                     vihc_cache=None,
+                     cf_indices=None):
+    '''
+    Run auditory nerve model for all (or selected) CF channels of one or several input waveforms.
+    The waveform x CF grid is scheduled as one job (CF shards of all waveforms share
+    one worker pool).
+    
+    Args
+    ----
+    pins (list): input waveforms sampled at `pin_fs`
+    list_kwargs (list): keyword arguments of `run_ANmodel_cf` for each waveform
+    cf_indices (np.ndarray or None): if not None, only these CF channels are run
+    All other arguments are as defined in `run_ANmodel`
+    
+    Returns
+    -------
+    list_cf_out (list): for each waveform, the `run_ANmodel_cf` outputs in CF order (or `cf_indices` order)
+    '''
+    if cf_indices is None:
+        cf_indices = np.arange(len(list_kwargs[0]['cf_list']))
+    cf_indices = np.asarray(cf_indices, dtype=int).reshape([-1])
+    num_cf = len(cf_indices)
+    if (n_workers is None) or (n_workers <= 1):
+        list_cf_out = [[] for _ in pins]
+        with tqdm(total=num_cf * len(pins)) as pbar:
+            for pin_idx, (pin, kwargs_cf) in enumerate(zip(pins, list_kwargs)):
+                for cf_start in range(0, num_cf, max(1, cf_block_size)):
+                    block = cf_indices[cf_start:cf_start + max(1, cf_block_size)]
+                    list_cf_out[pin_idx].extend(
+                        run_ANmodel_block(pin, block, vihc_cache=vihc_cache, **kwargs_cf))
+                    pbar.update(len(block))
+        return list_cf_out
+    # Every waveform is split into enough CF shards to load balance the whole grid
+    num_shards = max(1, min(num_cf, -(-n_workers * shards_per_worker // len(pins))))
+    shards = np.array_split(cf_indices, num_shards)
+    list_shard_out = [[None] * len(shards) for _ in pins]
+    if backend == 'threads':
+        # The C model kernels release the GIL: threads share `pins` and outputs without pickling
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=n_workers)
+        def run_shard(pin_idx, cf_indices):
+            return run_ANmodel_block(pins[pin_idx], cf_indices, vihc_cache=vihc_cache, **list_kwargs[pin_idx])
+    else:
+        # Shard the CF lists across a process pool (`pins` are sent to each worker only once)
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=init_ANmodel_worker,
+            initargs=(pins, [dict(kwargs_cf, vihc_cache=vihc_cache) for kwargs_cf in list_kwargs]))
+        run_shard = run_ANmodel_shard
+    with executor:
+        futures = {
+            executor.submit(run_shard, pin_idx, shard): (pin_idx, shard_idx)
+            for pin_idx in range(len(pins))
+            for shard_idx, shard in enumerate(shards)
+        }
+        with tqdm(total=num_cf * len(pins)) as pbar:
+            for future in concurrent.futures.as_completed(futures):
+                pin_idx, shard_idx = futures[future]
+                list_shard_out[pin_idx][shard_idx] = future.result()
+                pbar.update(len(shards[shard_idx]))
+    # Reassemble outputs in CF order
+    return [[cf_out for shard_out in shard_outs for cf_out in shard_out] for shard_outs in list_shard_out]
+
+
+def get_ANmodel_cf_kwargs(pin_fs=100e3,
+                          nervegram_fs=10e3,
+                          cf_list=[],
+                          species=2,
+                          bandwidth_scale_factor=[],
+                          cohc=[],
+                          cihc=[],
+                          IhcLowPass_cutoff=3e3,
+                          IhcLowPass_order=7,
+                          noiseType=1,
+                          implnt=0,
+                          pla_tol=1e-6,
+                          spont=70.0,
+                          spont_list=None,
+                          tabs=6e-4,
+                          trel=6e-4,
+                          synapseMode=0,
+                          max_spikes_per_train=1000,
+                          num_spike_trains=40,
+                          num_spike_trains_list=None,
+                          compute_dtype='float64',
+                          ragged_spike_times=False,
+                          rate_only=False,
+                          return_vihcs=True,
+                          return_meanrates=True,
+                          return_spike_times=True,
+                          return_spike_tensor_sparse=True,
+                          return_spike_tensor_dense=False,
+                          profile=False):
+    '''
+    Helper function converts `run_ANmodel` arguments to the (seed-independent)
+    keyword arguments of `run_ANmodel_cf`. Arguments are as defined in `run_ANmodel`.
+    
+    Returns
+    -------
+    kwargs_cf (dict): keyword arguments of `run_ANmodel_cf` (without `random_seed`)
+    '''
+    return_spikes = any([return_spike_times, return_spike_tensor_sparse, return_spike_tensor_dense])
+    if rate_only:
+        return_meanrates = True
+        return_spikes = False
+    assert compute_dtype in ['float64', 'float32'], "compute_dtype must be 'float64' or 'float32'"
+    # Check num_spike_trains argument
+    num_spike_trains = max(1, num_spike_trains) # num_spike_trains must be >= 1 to run AN model
+    if not return_spikes:
+        # It is needlessly inefficient to set num_spike_trains > 1 if spikes are not being returned
+        # (analytical estimates of instantaneous firing rates are computed on first AN model run)
+        num_spike_trains = 1
+    kwargs_cf = {
+        'pin_fs': pin_fs,
+        'nervegram_fs': nervegram_fs,
+        'cf_list': cf_list,
+        'species': species,
+        'bandwidth_scale_factor': bandwidth_scale_factor,
+        'cohc': cohc,
+        'cihc': cihc,
+        'IhcLowPass_cutoff': IhcLowPass_cutoff,
+        'IhcLowPass_order': IhcLowPass_order,
+        'noiseType': noiseType,
+        'implnt': implnt,
+        'pla_tol': pla_tol,
+        # Convert `spont` (float or list) to one-dimensional np.ndarray
+        'list_spont': np.array(spont, dtype=np.float64).reshape([-1]),
+        'spont_list': spont_list,
+        'tabs': tabs,
+        'trel': trel,
+        'synapseMode': synapseMode,
+        'max_spikes_per_train': max_spikes_per_train,
+        'num_spike_trains': num_spike_trains,
+        'num_spike_trains_list': num_spike_trains_list,
+        'rate_only': rate_only,
+        'return_vihcs': return_vihcs,
+        'return_meanrates': return_meanrates,
+        'return_spikes': return_spikes,
+        'ragged_spike_times': ragged_spike_times,
+        'compute_dtype': compute_dtype,
+        'profile': bool(profile),
+    }
+    return kwargs_cf
+
+
+def stack_ANmodel_outputs(cf_out,
+                          return_vihcs=True,
+                          return_meanrates=True,
+                          return_spikes=True,
+                          ragged_spike_times=False,
+                          **kwargs):
+    '''
+    Helper function combines the `run_ANmodel_cf` outputs of all CFs of one waveform
+    (flags are as defined in `run_ANmodel_cf`; other `kwargs_cf` entries are ignored).
+    
+    Returns
+    -------
+    (nervegram_vihcs, nervegram_meanrates, nervegram_spike_times) as returned by `run_ANmodel`
+    '''
+    # Initialize output array lists
+    nervegram_vihcs = []
+    nervegram_meanrates = []
+    nervegram_spike_times = []
+    if return_spikes:
+        nervegram_spike_times = [out[2] for out in cf_out]
+    # Combine output arrays across CFs
+    if return_vihcs:
+        nervegram_vihcs = np.stack([out[0] for out in cf_out], axis=0).astype(np.float32)
+    if return_meanrates:
+        nervegram_meanrates = np.stack([out[1] for out in cf_out], axis=0).astype(np.float32)
+    if return_spikes and ragged_spike_times:
+        spike_times, spike_offsets = concatenate_ragged_spike_times(nervegram_spike_times)
+        nervegram_spike_times = (spike_times.astype(np.float32), spike_offsets)
+    elif return_spikes:
+        nervegram_spike_times = np.stack(nervegram_spike_times, axis=1).astype(np.float32)
+    return nervegram_vihcs, nervegram_meanrates, nervegram_spike_times
+
+
 def run_ANmodel(pin,
                 pin_fs=100e3,
                 nervegram_fs=10e3,
@@ -132,6 +791,7 @@ def run_ANmodel(pin,
                 IhcLowPass_order=7,
                 noiseType=1,
                 implnt=0,
+                pla_tol=1e-6,
                 spont=70.0,
                 spont_list=None,
                 tabs=6e-4,
@@ -140,91 +800,208 @@ def run_ANmodel(pin,
                 max_spikes_per_train=1000,
                 num_spike_trains=40,
                 num_spike_trains_list=None,
+                random_seed=None,
+                random_seed_key=(),
+                n_workers=None,
+                backend='processes',
+                shards_per_worker=8,
+                cf_block_size=16,
+                vihc_cache=None,
+                compute_dtype='float64',
+                ragged_spike_times=False,
+                rate_only=False,
+                cf_indices=None,
+                profile=None,
                 return_vihcs=True,
                 return_meanrates=True,
                 return_spike_times=True,
                 return_spike_tensor_sparse=True,
                 return_spike_tensor_dense=False):
     '''
-    Helper function to run auditory nerve model on a single sound waveform.
+    Helper function to run auditory nerve model on a single sound waveform (or on a
+    list of waveforms, whose CF channels are then run as one job by `run_ANmodel_grid`).
     
     Args
     ----
-    Arguments are as defined in `nervegram` function
+    pin (np.ndarray or list): input waveform sampled at `pin_fs` or list of input waveforms
+    random_seed (int, None, or list): base random seed (one per waveform if `pin` is a list)
+    random_seed_key (tuple or list): additional integers used to derive the model random streams
+        (one tuple per waveform if `pin` is a list)
+    backend (str): 'processes' or 'threads' (see `nervegram`)
+    shards_per_worker (int): number of CF shards submitted per worker (load balancing)
+    cf_block_size (int): number of CF channels whose IHC filterbank is run together (serial mode)
+    vihc_cache (VihcCache or None): if not None, on-disk cache of IHC potentials (see `nervegram`)
+    compute_dtype (str): precision of the synapse model and spike generator (see `nervegram`)
+    rate_only (bool): if True, the spike generator is not run and only mean rates are returned
+    cf_indices (np.ndarray or None): if not None, only these CF channels are run (outputs are
+        identical to the same CFs of a run over all CFs)
+    profile (Profile, list, or None): if not None, stage timings and counters of all CFs are added
+        to this `Profile` (or to one `Profile` per waveform if `pin` is a list)
+    All other arguments are as defined in `nervegram` function
     
     Returns
     -------
     nervegram_vihcs (np.ndarray): inner hair cell potential array with shape [cf, time]
-    nervegram_meanrates (np.ndarray): firing rate array with shape [cf, time]
+    nervegram_meanrates (np.ndarray): firing rate array with shape [cf, time, spont]
     nervegram_spike_times (np.ndarray): spike time array with shape [spike_trains, cf, n_spikes]
+        (or, if ragged_spike_times, a (spike_times, spike_offsets) tuple over fibers [cf, spont, spike_trains])
+    If `pin` is a list, a list of (nervegram_vihcs, nervegram_meanrates, nervegram_spike_times) is returned
     '''
-    # Initialize output array lists
-    nervegram_vihcs = []
-    nervegram_meanrates = []
-    nervegram_spike_times = []
-    # Convert `spont` (float or list) to one-dimensional np.ndarray
-    list_spont = np.array(spont, dtype=np.float64).reshape([-1])
-    # Check num_spike_trains argument
-    num_spike_trains = max(1, num_spike_trains) # num_spike_trains must be >= 1 to run AN model
-    if not any([return_spike_times, return_spike_tensor_sparse, return_spike_tensor_dense]):
-        # It is needlessly inefficient to set num_spike_trains > 1 if spikes are not being returned
-        # (analytical estimates of instantaneous firing rates are computed on first AN model run)
-        num_spike_trains = 1
+    return_list = isinstance(pin, list)
+    pins = pin if return_list else [pin]
+    list_random_seed = random_seed if isinstance(random_seed, list) else [random_seed] * len(pins)
+    list_random_seed_key = random_seed_key if isinstance(random_seed_key, list) else [random_seed_key] * len(pins)
+    # Model random streams are derived from `random_seed` (drawn from np.random if not specified)
+    list_random_seed = [
+        np.random.randint(np.iinfo(np.int32).max) if seed is None else seed
+        for seed in list_random_seed
+    ]
+    assert backend in ['processes', 'threads'], "backend must be 'processes' or 'threads'"
+    kwargs_cf = get_ANmodel_cf_kwargs(
+        pin_fs=pin_fs,
+        nervegram_fs=nervegram_fs,
+        cf_list=cf_list,
+        species=species,
+        bandwidth_scale_factor=bandwidth_scale_factor,
+        cohc=cohc,
+        cihc=cihc,
+        IhcLowPass_cutoff=IhcLowPass_cutoff,
+        IhcLowPass_order=IhcLowPass_order,
+        noiseType=noiseType,
+        implnt=implnt,
+        pla_tol=pla_tol,
+        spont=spont,
+        spont_list=spont_list,
+        tabs=tabs,
+        trel=trel,
+        synapseMode=synapseMode,
+        max_spikes_per_train=max_spikes_per_train,
+        num_spike_trains=num_spike_trains,
+        num_spike_trains_list=num_spike_trains_list,
+        compute_dtype=compute_dtype,
+        ragged_spike_times=ragged_spike_times,
+        rate_only=rate_only,
+        return_vihcs=return_vihcs,
+        return_meanrates=return_meanrates,
+        return_spike_times=return_spike_times,
+        return_spike_tensor_sparse=return_spike_tensor_sparse,
+        return_spike_tensor_dense=return_spike_tensor_dense,
+        profile=profile is not None)
+    list_kwargs = [
+        dict(kwargs_cf, random_seed=seed, random_seed_key=tuple(seed_key))
+        for seed, seed_key in zip(list_random_seed, list_random_seed_key)
+    ]
     
-    # Iterate over all CFs and run the auditory nerve model components
-    # for cf_idx, cf in enumerate(cf_list):
-    for cf_idx in tqdm(range(len(cf_list))):
-        cf = cf_list[cf_idx]
-        # Run IHC model
-        vihc = run_ihc(
-            pin,
-            pin_fs,
-            cf,
-            species=species,
-            bandwidth_scale_factor=bandwidth_scale_factor[cf_idx],
-            cohc=cohc[cf_idx],
-            cihc=cihc[cf_idx],
-            IhcLowPass_cutoff=IhcLowPass_cutoff,
-            IhcLowPass_order=IhcLowPass_order)
-        
-        # Diverged code from forked repo here
-        if num_spike_trains_list is not None:
-            num_spike_trains = num_spike_trains_list[cf_idx]
-        if spont_list is not None:
-            list_spont = spont_list[cf_idx]
-
-        # Run IHC-ANF synapse model
-        synapse_out = run_anf(
-            vihc,
-            pin_fs,
-            cf,
-            noiseType=noiseType,
-            implnt=implnt,
-            list_spont=list_spont,
-            tabs=tabs,
-            trel=trel,
-            synapseMode=synapseMode,
-            max_spikes_per_train=max_spikes_per_train,
-            num_spike_trains=num_spike_trains)
-        # Not used so commented out for now
-        # if return_vihcs:
-        #     tmp_vihc = scipy.signal.resample_poly(vihc, int(nervegram_fs), int(pin_fs))
-        #     nervegram_vihcs.append(tmp_vihc)
-        # if return_meanrates:
-        #     tmp_meanrate = scipy.signal.resample_poly(synapse_out['list_meanrate'], int(nervegram_fs), int(pin_fs))
-        #     tmp_meanrate[tmp_meanrate < 0] = 0
-        #     nervegram_meanrates.append(tmp_meanrate)
-        if any([return_spike_times, return_spike_tensor_sparse, return_spike_tensor_dense]):
-            tmp_spike_times = synapse_out['list_spike_times']
-            nervegram_spike_times.append(tmp_spike_times)
-    # Combine output arrays across CFs
-    if return_vihcs:
-        nervegram_vihcs = np.stack(nervegram_vihcs, axis=0).astype(np.float32)
-    if return_meanrates:
-        nervegram_meanrates = np.stack(nervegram_meanrates, axis=0).astype(np.float32)
-    if any([return_spike_times, return_spike_tensor_sparse, return_spike_tensor_dense]):
-        nervegram_spike_times = np.stack(nervegram_spike_times, axis=1).astype(np.float32)
-    return nervegram_vihcs, nervegram_meanrates, nervegram_spike_times
+    # Iterate over all CFs (of all waveforms) and run the auditory nerve model components
+    list_cf_out = run_ANmodel_grid(
+        pins,
+        list_kwargs,
+        n_workers=n_workers,
+        backend=backend,
+        shards_per_worker=shards_per_worker,
+        cf_block_size=cf_block_size,
+        vihc_cache=vihc_cache,
+        cf_indices=cf_indices)
+    if profile is not None:
+        list_profile = profile if isinstance(profile, list) else [profile] * len(pins)
+        for prof, cf_out in zip(list_profile, list_cf_out):
+            for out in cf_out:
+                prof.update(out[3])
+    list_out = [stack_ANmodel_outputs(cf_out, **kwargs_cf) for cf_out in list_cf_out]
+    if return_list:
+        return list_out
+    return list_out[0]
+
+
+def get_nervegram_cf_params(cf_list=None,
+                            num_cf=50,
+                            min_cf=125.0,
+                            max_cf=8e3,
+                            bandwidth_scale_factor=1.0,
+                            cohc=1.0,
+                            cihc=1.0):
+    '''
+    Helper function builds the CF list and broadcasts the per-CF parameters to lists of
+    the same length (arguments are as defined in `nervegram` function).
+    
+    Returns
+    -------
+    cf_list (list): characteristic frequencies in Hz
+    bandwidth_scale_factor (list): cochlear filter bandwidth scaling factor of each CF
+    cohc (list): OHC scaling factor of each CF
+    cihc (list): IHC scaling factor of each CF
+    '''
+    # If `cf_list` is not provided, build list from `num_cf`, `min_cf`, and `max_cf`
+    if cf_list is None:
+        cf_list = get_ERB_cf_list(num_cf, min_cf=min_cf, max_cf=max_cf)
+    # Convert `bandwidth_scale_factor` to list of same length as `cf_list` if needed
+    bandwidth_scale_factor = np.array(bandwidth_scale_factor).reshape([-1]).tolist()
+    if len(bandwidth_scale_factor) == 1:
+        bandwidth_scale_factor = len(cf_list) * bandwidth_scale_factor
+    msg = "cf_list and bandwidth_scale_factor must have the same length"
+    assert len(cf_list) == len(bandwidth_scale_factor), msg
+    # Convert `cohc` to list of same length as `cf_list` if needed
+    cohc = np.array(cohc).reshape([-1]).tolist()
+    if len(cohc) == 1:
+        cohc = len(cf_list) * cohc
+    msg = "cf_list and cohc must have the same length"
+    assert len(cf_list) == len(cohc), msg
+    # Convert `cihc` to list of same length as `cf_list` if needed
+    cihc = np.array(cihc).reshape([-1]).tolist()
+    if len(cihc) == 1:
+        cihc = len(cf_list) * cihc
+    msg = "cf_list and cihc must have the same length"
+    assert len(cf_list) == len(cihc), msg
+    return cf_list, bandwidth_scale_factor, cohc, cihc
+
+
+def get_resample_poly_window(up, down, window=('kaiser', 5.0)):
+    '''
+    Helper function designs the lowpass filter of `scipy.signal.resample_poly(x, up, down)`
+    once, so it can be passed as `window` to resample many signals (identical output).
+    '''
+    g = np.gcd(int(up), int(down))
+    max_rate = max(int(up) // g, int(down) // g)
+    if max_rate == 1:
+        return window
+    half_len = 10 * max_rate
+    return scipy.signal.firwin(2 * half_len + 1, 1. / max_rate, window=window)
+
+
+def get_nervegram_pin(signal,
+                      signal_fs,
+                      pin_fs=100e3,
+                      pin_dBSPL_flag=0,
+                      pin_dBSPL=None,
+                      window=('kaiser', 5.0)):
+    '''
+    Helper function resamples the input signal to `pin_fs` and, if `pin_dBSPL_flag`,
+    rescales it to `pin_dBSPL` (arguments are as defined in `nervegram` function).
+    
+    Args
+    ----
+    window (tuple or np.ndarray): resampling filter window (see `get_resample_poly_window`)
+    
+    Returns
+    -------
+    pin (np.ndarray): input pressure waveform passed to ANmodel (units Pa)
+    pin_dBSPL (float): sound pressure level of pin (dB SPL)
+    '''
+    # Resample the input signal to pin_fs (at least 100kHz) for ANmodel
+    pin = scipy.signal.resample_poly(signal, int(pin_fs), int(signal_fs), window=window)
+    # If pin_dBSPL_flag, scale pin to desired dB SPL (otherwise compute dB SPL)
+    if pin_dBSPL_flag:
+        pin = pin - np.mean(pin)
+        pin_rms = np.sqrt(np.mean(np.square(pin)))
+        desired_rms = 2e-5 * np.power(10, pin_dBSPL / 20)
+        if pin_rms > 0:
+            pin = desired_rms * (pin / pin_rms)
+        else:
+            pin_dBSPL = -np.inf
+            print('>>> [WARNING] rms(pin) = 0 (silent input signal)')
+    else:
+        pin_dBSPL = 20 * np.log10(np.sqrt(np.mean(np.square(pin))) / 2e-5)
+    return pin, pin_dBSPL
 
 
 def nervegram(signal,
@@ -243,6 +1020,7 @@ def nervegram(signal,
               num_cf=50,
               min_cf=125.0,
               max_cf=8e3,
+              cf_indices=None,
               synapseMode=0,
               max_spikes_per_train=1000,
               num_spike_trains=40,
@@ -255,17 +1033,31 @@ def nervegram(signal,
               spont_list=None,
               noiseType=1,
               implnt=0,
+              pla_tol=1e-6,
               tabs=6e-4,
               trel=6e-4,
               random_seed=None,
+              random_seed_key=(),
+              n_workers=None,
+              backend='processes',
+              vihc_cache=None,
+              compute_dtype='float64',
+              ragged_spike_times=False,
+              spike_time_format='seconds',
+              rate_only=False,
               return_vihcs=True,
               return_meanrates=True,
               return_spike_times=True,
               return_spike_tensor_sparse=True,
               return_spike_tensor_dense=False,
+              return_spike_tensor_scipy=False,
               nervegram_spike_tensor_fs=100e3,
+              nervegram_spike_tensor_scipy_format='csr',
               squeeze_spont_dim=True,
-              squeeze_channel_dim=True):
+              squeeze_channel_dim=True,
+              profile=False,
+              pin=None,
+              anmodel_outputs=None):
     '''
     Main function for generating an auditory nervegram.
 
@@ -287,6 +1079,8 @@ def nervegram(signal,
     num_cf (int): if cf_list is None, specifies number of ERB-spaced CFs
     min_cf (float): if cf_list is None, specifies minimum CF (Hz)
     max_cf (float): if cf_list is None, specifies maximum CF (Hz)
+    cf_indices (None or list): if not None, only these CF channels (indexes into the CF list) are
+        run and returned; outputs are bit-identical to the same CFs of a run over all CFs
     synapseMode (float): set to 1 to re-run synapse model for each spike train (0 to re-use synout)
     max_spikes_per_train (int): max array size for spike times output
     num_spike_trains (int): number of spike trains to sample from spike generator
@@ -297,82 +1091,126 @@ def nervegram(signal,
     IhcLowPass_order (int): order for IHC lowpass filter
     spont (float or list): spontaneous firing rate(s) in spikes per second
     noiseType (int): set to 0 for noiseless and 1 for variable fGn
-    implnt (int): set to 0 for "approx" and 1 for "actual" power-law function implementation
+    implnt (int): set to 0 for "approx", 1 for "actual", and 2 for "fast actual" power-law function
+        implementation ("fast actual" approximates the power-law kernels with sums of exponentials)
+    pla_tol (float): relative error tolerance of the power-law kernels if implnt=2
     tabs (float): absolute refractory period in seconds
     trel (float): baseline mean relative refractory period in seconds
-    random_seed (int or None): if not None, used to specify np.random.seed
+    random_seed (int or None): if not None, used to specify np.random.seed; model random streams of
+        each fiber are derived from (random_seed, random_seed_key, channel, cf_idx, spont_idx, train_idx)
+        and do not depend on the other fibers that are run (the first n spike trains of a fiber are
+        the same for any num_spike_trains >= n)
+    random_seed_key (tuple): additional integers addressing the random streams (e.g. stimulus index)
+    n_workers (int or None): if > 1, CFs are sharded across a pool of `n_workers` processes
+        (output is identical to the serial path for a given `random_seed`)
+    backend (str): if n_workers > 1, run CF shards in a pool of 'processes' or 'threads'
+        (the C model kernels release the GIL, so threads share memory and avoid pickling)
+    vihc_cache (VihcCache, str, or None): if not None, inner hair cell potentials are stored in and
+        reused from this content-addressed on-disk cache (a str is opened as a new cache directory,
+        which is rescanned on every call: pass one `VihcCache` to reuse it across calls); only the
+        stochastic synapse and spike generator stages are re-run for new random seeds
+    compute_dtype (str): 'float64' or 'float32'; with 'float32' the IHC potentials are stored and
+        the synapse model and spike generator are run in single precision (the BM and IHC filters
+        are always run in double precision), which halves the per-sample working set of each CF
+        (see `model/accuracy_float32.py` for the effect on spike statistics and peak memory)
+    ragged_spike_times (bool): if True, spike times are returned without zero padding and without
+        the `max_spikes_per_train` cap: `nervegram_spike_times` holds the spike times of all fibers
+        and fiber k is nervegram_spike_times[nervegram_spike_offsets[k]:nervegram_spike_offsets[k+1]],
+        with fibers ordered as `nervegram_spike_fiber_shape` = [(channel), cf, (spont), spike_trains]
+    spike_time_format (str): 'seconds' returns spike times in seconds (`nervegram_dtype`), 'index'
+        returns spike times as integer sample indexes at `pin_fs` with the smallest unsigned dtype
+        that fits the nervegram duration (uint16 up to 0.65 s at 100 kHz); 0 marks padding in both
+    rate_only (bool): if True, the spike generator is not run and only `nervegram_meanrates` (float32
+        [cf, time, (spont), (channel)]) are returned; the mean redocking time used by the analytical
+        rate estimate is replaced by its expected value and rates are decimated to `nervegram_fs` in C
     return_vihcs (bool): if True, output_dict will contain inner hair cell potentials
     return_meanrates (bool): if True, output_dict will contain instantaneous firing rates
     return_spike_times (bool): if True, output_dict will contain spike times
     return_spike_tensor_sparse (bool): if True, output_dict will contain sparse binary spike tensor
     return_spike_tensor_dense (bool): if True, output_dict will contain dense binary spike tensor
+    return_spike_tensor_scipy (bool): if True, output_dict will contain the binary spike tensor as
+        a `scipy.sparse` matrix with shape [fibers, time] (see `sparse_to_scipy_nervegram_spike_tensor`)
     nervegram_spike_tensor_fs (int): sampling rate of nervegram binary spike tensor (Hz)
+    nervegram_spike_tensor_scipy_format (str): 'coo' or 'csr' format of the `scipy.sparse` matrix
     squeeze_spont_dim (bool): if True, spont rate dimension is removed when `spont` is a float
     squeeze_channel_dim (bool): if True, channel dimension is removed when `signal` is 1D array 
+    profile (bool or Profile): if True (or a `Profile` to add to), output_dict['profile'] contains the
+        wall time and number of calls of each model stage and the number of spikes and random numbers
+        generated (combine profiles of many nervegrams with `profile_bez2018.aggregate_profiles`)
+    pin (np.ndarray or None): if not None, resampled (and rescaled) `signal` whose level is
+        `pin_dBSPL` (the resampling step is skipped; used by `nervegram_batch`)
+    anmodel_outputs (list or None): if not None, `run_ANmodel` outputs of each channel of `pin`
+        (the auditory nerve model is not run; used by `nervegram_batch`)
 
     Returns
     -------
     output_dict (dict): contains nervegram(s), stimulus, and all parameters
     '''
     # ============ PARSE ARGUMENTS ============ #
+    t_start = time.perf_counter()
+    if not isinstance(profile, Profile):
+        profile = Profile() if profile else None
+    msg = "spike_time_format must be 'seconds' or 'index'"
+    assert spike_time_format in ['seconds', 'index'], msg
+    assert 0 < pla_tol < 1, "pla_tol must be in the open interval (0, 1)"
+    if rate_only:
+        return_meanrates = True
+        return_spike_times = False
+        return_spike_tensor_sparse = False
+        return_spike_tensor_dense = False
+        return_spike_tensor_scipy = False
+    return_spikes = any([return_spike_times,
+                         return_spike_tensor_sparse,
+                         return_spike_tensor_dense,
+                         return_spike_tensor_scipy])
     # If specified, set random seed (eliminates stochasticity in ANmodel noise)
     if not (random_seed == None):
         np.random.seed(random_seed)
     # BEZ2018 ANmodel requires dtype np.float64
     signal = signal.astype(np.float64)
+    if isinstance(vihc_cache, str):
+        vihc_cache = VihcCache(vihc_cache)
     signal_dur = signal.shape[0] / signal_fs
-    # If `cf_list` is not provided, build list from `num_cf`, `min_cf`, and `max_cf`
-    if cf_list is None:
-        cf_list = get_ERB_cf_list(num_cf, min_cf=min_cf, max_cf=max_cf)
-    # Convert `bandwidth_scale_factor` to list of same length as `cf_list` if needed
-    bandwidth_scale_factor = np.array(bandwidth_scale_factor).reshape([-1]).tolist()
-    if len(bandwidth_scale_factor) == 1:
-        bandwidth_scale_factor = len(cf_list) * bandwidth_scale_factor
-    msg = "cf_list and bandwidth_scale_factor must have the same length"
-    assert len(cf_list) == len(bandwidth_scale_factor), msg
-    # Convert `cohc` to list of same length as `cf_list` if needed
-    cohc = np.array(cohc).reshape([-1]).tolist()
-    if len(cohc) == 1:
-        cohc = len(cf_list) * cohc
-    msg = "cf_list and cohc must have the same length"
-    assert len(cf_list) == len(cohc), msg
-    # Convert `cihc` to list of same length as `cf_list` if needed
-    cihc = np.array(cihc).reshape([-1]).tolist()
-    if len(cihc) == 1:
-        cihc = len(cf_list) * cihc
-    msg = "cf_list and cihc must have the same length"
-    assert len(cf_list) == len(cihc), msg
+    cf_list, bandwidth_scale_factor, cohc, cihc = get_nervegram_cf_params(
+        cf_list=cf_list,
+        num_cf=num_cf,
+        min_cf=min_cf,
+        max_cf=max_cf,
+        bandwidth_scale_factor=bandwidth_scale_factor,
+        cohc=cohc,
+        cihc=cihc)
 
     # Variable Num Spike Trains
     msg = "num_spike_trains_list and cf_list must have the same length"
     assert num_spike_trains_list is None or len(num_spike_trains_list) == len(cf_list)
+    msg = "ragged_spike_times requires the same number of spike trains for all CFs"
+    assert not (ragged_spike_times and num_spike_trains_list is not None), msg
+    if cf_indices is not None:
+        cf_indices = np.asarray(cf_indices, dtype=int).reshape([-1])
+        msg = "cf_indices out of range"
+        assert np.all((cf_indices >= 0) & (cf_indices < len(cf_list))), msg
 
 
     # ============ RESAMPLE AND RESCALE INPUT SIGNAL ============ #
-    # Resample the input signal to pin_fs (at least 100kHz) for ANmodel
-    pin = scipy.signal.resample_poly(signal, int(pin_fs), int(signal_fs))
-    # If pin_dBSPL_flag, scale pin to desired dB SPL (otherwise compute dB SPL)
-    if pin_dBSPL_flag:
-        pin = pin - np.mean(pin)
-        pin_rms = np.sqrt(np.mean(np.square(pin)))
-        desired_rms = 2e-5 * np.power(10, pin_dBSPL / 20)
-        if pin_rms > 0:
-            pin = desired_rms * (pin / pin_rms)
-        else:
-            pin_dBSPL = -np.inf
-            print('>>> [WARNING] rms(pin) = 0 (silent input signal)')
-    else:
-        pin_dBSPL = 20 * np.log10(np.sqrt(np.mean(np.square(pin))) / 2e-5)
+    if pin is None:
+        t0 = time.perf_counter()
+        pin, pin_dBSPL = get_nervegram_pin(
+            signal,
+            signal_fs,
+            pin_fs=pin_fs,
+            pin_dBSPL_flag=pin_dBSPL_flag,
+            pin_dBSPL=pin_dBSPL)
+        if profile:
+            profile.add('resample', time.perf_counter() - t0)
 
     # ============ RUN AUDITORY NERVE MODEL ============ #
-    list_nervegram_vihcs = []
-    list_nervegram_meanrates = []
-    list_nervegram_spike_times = []
     if len(pin.shape) < 2:
         pin = pin[:, np.newaxis]
-    for itr_channel in range(pin.shape[1]):
-        nervegram_vihcs, nervegram_meanrates, nervegram_spike_times = run_ANmodel(
-            pin[:, itr_channel],
+    if anmodel_outputs is None:
+        # Channels are run as one job (see `run_ANmodel_grid`)
+        t0 = time.perf_counter()
+        anmodel_outputs = run_ANmodel(
+            [pin[:, itr_channel] for itr_channel in range(pin.shape[1])],
             pin_fs=pin_fs,
             nervegram_fs=nervegram_fs,
             cf_list=cf_list,
@@ -384,6 +1222,7 @@ def nervegram(signal,
             IhcLowPass_order=IhcLowPass_order,
             noiseType=noiseType,
             implnt=implnt,
+            pla_tol=pla_tol,
             spont=spont,
             spont_list=spont_list,
             tabs=tabs,
@@ -392,17 +1231,39 @@ def nervegram(signal,
             max_spikes_per_train=max_spikes_per_train,
             num_spike_trains=num_spike_trains,
             num_spike_trains_list=num_spike_trains_list,
+            random_seed=random_seed,
+            random_seed_key=[tuple(random_seed_key) + (itr_channel,) for itr_channel in range(pin.shape[1])],
+            n_workers=n_workers,
+            backend=backend,
+            vihc_cache=vihc_cache,
+            compute_dtype=compute_dtype,
+            ragged_spike_times=ragged_spike_times,
+            rate_only=rate_only,
+            cf_indices=cf_indices,
+            profile=profile if profile else None,
             return_vihcs=return_vihcs,
             return_meanrates=return_meanrates,
             return_spike_times=return_spike_times,
             return_spike_tensor_sparse=return_spike_tensor_sparse,
-            return_spike_tensor_dense=return_spike_tensor_dense)
-        list_nervegram_vihcs.append(nervegram_vihcs)
-        list_nervegram_meanrates.append(nervegram_meanrates)
-        list_nervegram_spike_times.append(nervegram_spike_times)
+            return_spike_tensor_dense=return_spike_tensor_dense or return_spike_tensor_scipy)
+        if profile:
+            profile.add('anmodel', time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    list_nervegram_vihcs, list_nervegram_meanrates, list_nervegram_spike_times = zip(*anmodel_outputs)
     nervegram_vihcs = np.stack(list_nervegram_vihcs, axis=-1)
     nervegram_meanrates = np.stack(list_nervegram_meanrates, axis=-1)
-    nervegram_spike_times = np.stack(list_nervegram_spike_times, axis=-2)
+    if return_spikes and ragged_spike_times:
+        # Ragged spike times of the fibers [channel, cf, spont, spike_trains]
+        nervegram_spike_times, nervegram_spike_offsets = concatenate_ragged_spike_times(
+            list_nervegram_spike_times)
+        nervegram_spike_fiber_shape = [
+            pin.shape[1],
+            len(cf_list) if cf_indices is None else len(cf_indices),
+            np.size(spont) if spont_list is None else len(spont_list[0]),
+            max(1, num_spike_trains),
+        ]
+    else:
+        nervegram_spike_times = np.stack(list_nervegram_spike_times, axis=-2)
 
     # ============ APPLY TRANSFORMATIONS ============ #
     if (nervegram_dur is None) or (nervegram_dur == signal_dur):
@@ -446,10 +1307,13 @@ def nervegram(signal,
                 sr=nervegram_fs,
                 axis=1)
         # Adjust spike times (set t=0 to `clip_t0` and eliminate negative times)
-        if any([return_spike_times,
-                return_spike_tensor_sparse,
-                return_spike_tensor_sparse,
-                return_spike_tensor_dense]):
+        if return_spikes and ragged_spike_times:
+            nervegram_spike_times, nervegram_spike_offsets = clip_ragged_spike_times(
+                nervegram_spike_times,
+                nervegram_spike_offsets,
+                t0=clip_t0,
+                t1=clip_t1)
+        elif return_spikes:
             nervegram_spike_times = clip_time_axis(
                 nervegram_spike_times,
                 t0=clip_t0,
@@ -457,15 +1321,15 @@ def nervegram(signal,
                 sr='timestamps',
                 axis=None)
     if squeeze_spont_dim and np.ndim(spont) == 0:
-        try:
-            nervegram_meanrates = np.squeeze(nervegram_meanrates, axis=-2)
-        except ValueError:
-            print("nervegram_meanrates cannot be squeezed")
-            print(nervegram_meanrates)
-        if any([return_spike_times,
-                return_spike_tensor_sparse,
-                return_spike_tensor_sparse,
-                return_spike_tensor_dense]):
+        if return_meanrates:
+            try:
+                nervegram_meanrates = np.squeeze(nervegram_meanrates, axis=-2)
+            except ValueError:
+                print("nervegram_meanrates cannot be squeezed")
+                print(nervegram_meanrates)
+        if return_spikes and ragged_spike_times:
+            nervegram_spike_fiber_shape.pop(2)
+        elif return_spikes:
             try:
                 nervegram_spike_times = np.squeeze(nervegram_spike_times, axis=-3)
             except ValueError:
@@ -477,36 +1341,58 @@ def nervegram(signal,
             nervegram_meanrates = np.squeeze(nervegram_meanrates, axis=-1)
         except ValueError:
             print("nervegram_spike_times cannot be squeezed")
-        if any([return_spike_times,
-                return_spike_tensor_sparse,
-                return_spike_tensor_sparse,
-                return_spike_tensor_dense]):
+        if return_spikes and ragged_spike_times:
+            nervegram_spike_fiber_shape.pop(0)
+        elif return_spikes:
             try:
                 nervegram_spike_times = np.squeeze(nervegram_spike_times, axis=-2)
             except ValueError:
                 print("nervegram_spike_times cannot be squeezed")
 
+    if profile:
+        profile.add('postprocess', time.perf_counter() - t0)
+
     # Generate sparse representation of binary spike tensor from spike times
-    if any([return_spike_tensor_sparse, return_spike_tensor_dense]):
+    t0 = time.perf_counter()
+    if any([return_spike_tensor_sparse, return_spike_tensor_dense, return_spike_tensor_scipy]):
         if nervegram_spike_tensor_fs is None:
             nervegram_spike_tensor_fs = nervegram_fs
         # Bin spike times with sampling rate `nervegram_spike_tensor_fs`
         nervegram_spike_idx = (nervegram_spike_times * nervegram_spike_tensor_fs).astype(int)
-        # Binary spike tensor has dense shape [spike_trains, cf, time, (channel)]
-        dense_shape = list(nervegram_spike_idx.shape)[:-1]
-        dense_shape.insert(2, np.ceil(nervegram_dur * nervegram_spike_tensor_fs).astype(int))
-        nervegram_spike_tensor_sparse = []
-        for spike_idx_arg in np.argwhere(nervegram_spike_idx):
-            t_idx = nervegram_spike_idx[tuple(spike_idx_arg)]
-            sparse_idx = spike_idx_arg.tolist()[:-1]
-            sparse_idx.insert(2, t_idx)
-            nervegram_spike_tensor_sparse.append(sparse_idx)
-        nervegram_spike_tensor_sparse = np.stack(nervegram_spike_tensor_sparse, axis=1)
+        # Binary spike tensor has dense shape [spike_trains, cf, time, (spont), (channel)]
+        num_time_bins = np.ceil(nervegram_dur * nervegram_spike_tensor_fs).astype(int)
+        if ragged_spike_times:
+            dense_shape, nervegram_spike_tensor_sparse = get_ragged_nervegram_spike_tensor_sparse(
+                nervegram_spike_idx,
+                nervegram_spike_offsets,
+                nervegram_spike_fiber_shape,
+                num_time_bins,
+                channel_dim=len(pin.shape) > 1)
+        else:
+            dense_shape = list(nervegram_spike_idx.shape)[:-1]
+            dense_shape.insert(2, num_time_bins)
+            nervegram_spike_tensor_sparse = get_nervegram_spike_tensor_sparse(nervegram_spike_idx)
         if return_spike_tensor_dense:
             nervegram_spike_tensor_dense = sparse_to_dense_nervegram_spike_tensor(
                 dense_shape, nervegram_spike_tensor_sparse)
+        if return_spike_tensor_scipy:
+            nervegram_spike_tensor_scipy = sparse_to_scipy_nervegram_spike_tensor(
+                dense_shape, nervegram_spike_tensor_sparse, format=nervegram_spike_tensor_scipy_format)
+
+    # Convert spike times to integer sample indexes at `pin_fs` (exact binning downstream)
+    if return_spike_times and spike_time_format == 'index':
+        spike_idx_dtype = get_min_uint_dtype(np.ceil(nervegram_dur * pin_fs))
+        nervegram_spike_times = np.round(
+            nervegram_spike_times.astype(np.float64) * pin_fs).astype(spike_idx_dtype)
+    if profile:
+        profile.add('sparse', time.perf_counter() - t0)
 
     # ============ RETURN OUTPUT AS DICTIONARY ============ #
+    if cf_indices is not None:
+        cf_list = [cf_list[idx] for idx in cf_indices]
+        bandwidth_scale_factor = [bandwidth_scale_factor[idx] for idx in cf_indices]
+        cohc = [cohc[idx] for idx in cf_indices]
+        cihc = [cihc[idx] for idx in cf_indices]
     output_dict = {
         'signal': signal.astype(np.float32),
         'signal_fs': signal_fs,
@@ -532,15 +1418,28 @@ def nervegram(signal,
         'IhcLowPass_order': IhcLowPass_order,
         'noiseType': noiseType,
         'implnt': implnt,
+        'pla_tol': pla_tol,
+        'compute_dtype': compute_dtype,
+        'spike_time_format': spike_time_format,
+        'rate_only': rate_only,
+        'random_seed_key': tuple(random_seed_key),
         'tabs': tabs,
         'trel': trel,
     }
+    if cf_indices is not None:
+        output_dict['cf_indices'] = cf_indices
     if return_vihcs:
         output_dict['nervegram_vihcs'] = nervegram_vihcs.astype(nervegram_dtype)
     if return_meanrates:
         output_dict['nervegram_meanrates'] = nervegram_meanrates.astype(nervegram_dtype)
     if return_spike_times:
-        output_dict['nervegram_spike_times'] = nervegram_spike_times.astype(nervegram_dtype)
+        if spike_time_format == 'index':
+            output_dict['nervegram_spike_times'] = nervegram_spike_times
+        else:
+            output_dict['nervegram_spike_times'] = nervegram_spike_times.astype(nervegram_dtype)
+    if return_spike_times and ragged_spike_times:
+        output_dict['nervegram_spike_offsets'] = nervegram_spike_offsets
+        output_dict['nervegram_spike_fiber_shape'] = np.array(nervegram_spike_fiber_shape, dtype=int)
     if return_spike_tensor_sparse:
         output_dict['nervegram_spike_tensor_dense_shape'] = np.array(dense_shape, dtype=int)
         output_dict['nervegram_spike_tensor_n'] = nervegram_spike_tensor_sparse.shape[1]
@@ -549,4 +1448,255 @@ def nervegram(signal,
             output_dict[k] = nervegram_spike_tensor_sparse[idx].astype(get_min_idx_dtype(dense_shape[idx]))
     if return_spike_tensor_dense:
         output_dict['nervegram_spike_tensor_dense'] = nervegram_spike_tensor_dense
+    if return_spike_tensor_scipy:
+        output_dict['nervegram_spike_tensor_scipy'] = nervegram_spike_tensor_scipy
+    if profile:
+        profile.add('nervegram', time.perf_counter() - t_start)
+        output_dict['profile'] = profile.to_dict()
+    return output_dict
+
+
+def nervegram_batch(signals,
+                    signal_fs,
+                    random_seed=None,
+                    n_workers=None,
+                    backend='processes',
+                    return_iterator=False,
+                    **kwargs):
+    '''
+    Generate nervegrams of many stimuli. The CF list and per-CF parameters are built
+    and the resampling filter is designed once, and the auditory nerve model is run
+    on the stimulus x channel x CF grid as one job (CF shards of all stimuli share one
+    worker pool). The output for stimulus i is identical to
+    `nervegram(signals[i], signal_fs, random_seed=random_seeds[i], **kwargs)`.
+    
+    Args
+    ----
+    signals (list or np.ndarray): input pressure waveforms (list of arrays with time on axis 0,
+        or array with stimuli on axis 0 and time on axis 1)
+    signal_fs (int): sampling rate of the input signals (Hz)
+    random_seed (int, list, or None): random seed of each stimulus (an int is used as the seed of
+        the first stimulus and incremented for each following stimulus)
+    n_workers (int or None): if > 1, the stimulus x CF grid is sharded across `n_workers` workers
+    backend (str): 'processes' or 'threads' (see `nervegram`)
+    return_iterator (bool): if True, an iterator of per-stimulus output dicts is returned
+        (the model is run on all stimuli before the first dict is returned)
+    kwargs (dict): all other keyword arguments are passed to `nervegram`
+    
+    Returns
+    -------
+    output_dict (dict or iterator): outputs of all stimuli stacked on axis 0 (fields whose
+        values are not arrays of the same shape for all stimuli are returned as lists)
+    '''
+    params = {
+        name: param.default
+        for name, param in inspect.signature(nervegram).parameters.items()
+        if param.default is not inspect.Parameter.empty
+    }
+    params.update(kwargs, n_workers=n_workers, backend=backend)
+    num_signals = len(signals)
+    if random_seed is None:
+        random_seed = np.random.randint(np.iinfo(np.int32).max, size=num_signals).tolist()
+    elif np.ndim(random_seed) == 0:
+        random_seed = [random_seed + itr for itr in range(num_signals)]
+    msg = "random_seed and signals must have the same length"
+    assert len(random_seed) == num_signals, msg
+    assert 0 < params['pla_tol'] < 1, "pla_tol must be in the open interval (0, 1)"
+    # CF-dependent constants and the resampling filter are shared by all stimuli
+    cf_list, bandwidth_scale_factor, cohc, cihc = get_nervegram_cf_params(
+        cf_list=params['cf_list'],
+        num_cf=params['num_cf'],
+        min_cf=params['min_cf'],
+        max_cf=params['max_cf'],
+        bandwidth_scale_factor=params['bandwidth_scale_factor'],
+        cohc=params['cohc'],
+        cihc=params['cihc'])
+    params.update(cf_list=cf_list, bandwidth_scale_factor=bandwidth_scale_factor, cohc=cohc, cihc=cihc)
+    if isinstance(params['vihc_cache'], str):
+        params['vihc_cache'] = VihcCache(params['vihc_cache'])
+    window = get_resample_poly_window(int(params['pin_fs']), int(signal_fs))
+    list_profile = [Profile() if params['profile'] else None for _ in signals]
+    list_pin = []
+    list_pin_dBSPL = []
+    for signal, profile in zip(signals, list_profile):
+        t0 = time.perf_counter()
+        pin, pin_dBSPL = get_nervegram_pin(
+            np.asarray(signal, dtype=np.float64),
+            signal_fs,
+            pin_fs=params['pin_fs'],
+            pin_dBSPL_flag=params['pin_dBSPL_flag'],
+            pin_dBSPL=params['pin_dBSPL'],
+            window=window)
+        if profile:
+            profile.add('resample', time.perf_counter() - t0)
+        list_pin.append(pin)
+        list_pin_dBSPL.append(pin_dBSPL)
+    
+    # Run the auditory nerve model on all channels of all stimuli as one job
+    pins = []
+    list_random_seed = []
+    list_random_seed_key = []
+    list_signal_idx = []
+    for signal_idx, pin in enumerate(list_pin):
+        pin = pin.reshape([pin.shape[0], -1])
+        for itr_channel in range(pin.shape[1]):
+            pins.append(pin[:, itr_channel])
+            list_random_seed.append(random_seed[signal_idx])
+            list_random_seed_key.append(tuple(params['random_seed_key']) + (itr_channel,))
+            list_signal_idx.append(signal_idx)
+    anmodel_kwargs = {
+        name: params[name]
+        for name in inspect.signature(run_ANmodel).parameters
+        if (name in params) and (name not in ['pin', 'random_seed', 'random_seed_key', 'profile'])
+    }
+    anmodel_kwargs['return_spike_tensor_dense'] = any([
+        params['return_spike_tensor_dense'],
+        params['return_spike_tensor_scipy'],
+    ])
+    list_anmodel_out = run_ANmodel(
+        pins,
+        random_seed=list_random_seed,
+        random_seed_key=list_random_seed_key,
+        profile=[list_profile[idx] for idx in list_signal_idx] if params['profile'] else None,
+        **anmodel_kwargs)
+    list_anmodel_outputs = [[] for _ in signals]
+    for signal_idx, anmodel_out in zip(list_signal_idx, list_anmodel_out):
+        list_anmodel_outputs[signal_idx].append(anmodel_out)
+
+    def iterate_outputs():
+        for signal_idx, signal in enumerate(signals):
+            yield nervegram(
+                np.asarray(signal),
+                signal_fs,
+                **dict(params,
+                       random_seed=random_seed[signal_idx],
+                       profile=list_profile[signal_idx] or False,
+                       pin=list_pin[signal_idx],
+                       pin_dBSPL=list_pin_dBSPL[signal_idx],
+                       anmodel_outputs=list_anmodel_outputs[signal_idx]))
+
+    if return_iterator:
+        return iterate_outputs()
+    list_output_dict = list(iterate_outputs())
+    output_dict = {}
+    for key in list_output_dict[0].keys():
+        values = [d[key] for d in list_output_dict]
+        if all(isinstance(v, np.ndarray) and (v.shape == values[0].shape) for v in values):
+            output_dict[key] = np.stack(values, axis=0)
+        else:
+            output_dict[key] = values
     return output_dict
+
+
+def nervegram_stream(chunks,
+                     signal_fs,
+                     pin_fs=100e3,
+                     species=2,
+                     bandwidth_scale_factor=1.0,
+                     cf_list=None,
+                     num_cf=50,
+                     min_cf=125.0,
+                     max_cf=8e3,
+                     synapseMode=0,
+                     max_spikes_per_train=1000,
+                     num_spike_trains=40,
+                     cohc=1.0,
+                     cihc=1.0,
+                     IhcLowPass_cutoff=3e3,
+                     IhcLowPass_order=7,
+                     spont=70.0,
+                     noiseType=1,
+                     implnt=0,
+                     pla_tol=1e-6,
+                     tabs=6e-4,
+                     trel=6e-4,
+                     random_seed=None,
+                     spike_time_format='seconds',
+                     squeeze_spont_dim=True):
+    '''
+    Generator version of `nervegram` for long (single-channel) stimuli: the input is
+    passed as consecutive blocks and the resampling filter, IHC filterbank, synapse
+    and spike generator states are carried across block boundaries, so memory use
+    does not grow with the stimulus duration. Spike times of each block are yielded
+    as soon as their synapse output is complete (the output lags the input by a few
+    ms; a final block is yielded when `chunks` is exhausted). The output does not
+    depend on how the stimulus is split into blocks. Differences to `nervegram`: the
+    decimation filter of the synapse model is causal, the fGn is drawn in 1 s
+    segments, `implnt=1` is not supported, and there is no level normalization
+    (`pin_dBSPL_flag`) or clipping.
+    
+    Args
+    ----
+    chunks (iterable): consecutive blocks of the input pressure waveform (1D np.ndarray, units Pa)
+    signal_fs (int): sampling rate of input signal (Hz)
+    max_spikes_per_train (int): max array size for spike times output of one block
+    spike_time_format (str): 'seconds' yields spike times in float64 seconds (float32 would not
+        resolve the model sampling period after a few minutes), 'index' yields uint64 sample
+        indexes at `pin_fs`; 0 marks padding in both
+    All other arguments are as defined in `nervegram` function
+    
+    Yields
+    ------
+    output_dict (dict): spike times of one block
+        't0', 't1': all spikes in [t0, t1) (seconds from stimulus onset) are in this block
+        'nervegram_spike_times': spike times from stimulus onset (zero-padded, `spike_time_format`)
+            with shape [spike_trains, cf, (spont), n_spikes]
+    '''
+    if random_seed is None:
+        random_seed = np.random.randint(np.iinfo(np.int32).max)
+    assert 0 < pla_tol < 1, "pla_tol must be in the open interval (0, 1)"
+    msg = "spike_time_format must be 'seconds' or 'index'"
+    assert spike_time_format in ['seconds', 'index'], msg
+    if cf_list is None:
+        cf_list = get_ERB_cf_list(num_cf, min_cf=min_cf, max_cf=max_cf)
+    list_spont = np.array(spont, dtype=np.float64).reshape([-1])
+    resampler = ResamplePolyStream(int(pin_fs), int(signal_fs))
+    ihc_bank = IHCBankStream(
+        pin_fs,
+        cf_list,
+        species=species,
+        bandwidth_scale_factor=bandwidth_scale_factor,
+        cohc=cohc,
+        cihc=cihc,
+        IhcLowPass_cutoff=IhcLowPass_cutoff,
+        IhcLowPass_order=IhcLowPass_order)
+    # Same random streams as the first channel of `nervegram` (the fGn segments differ)
+    anf_random_seed = get_anf_random_seed(random_seed, random_seed_key=(0,))
+    anf_streams = [
+        ANFStream(
+            pin_fs,
+            cf,
+            noiseType=noiseType,
+            implnt=implnt,
+            pla_tol=pla_tol,
+            list_spont=list_spont,
+            tabs=tabs,
+            trel=trel,
+            synapseMode=synapseMode,
+            max_spikes_per_train=max_spikes_per_train,
+            num_spike_trains=max(1, num_spike_trains),
+            random_seed=anf_random_seed,
+            cf_idx=cf_idx)
+        for cf_idx, cf in enumerate(cf_list)
+    ]
+
+    def run_block(pin, flush):
+        t0 = min(anf.num_samples for anf in anf_streams) / pin_fs
+        nervegram_vihcs = ihc_bank.run(np.ascontiguousarray(pin, dtype=np.float64))
+        nervegram_spike_times = np.stack([
+            anf.run(vihc, flush=flush)['list_spike_times']
+            for anf, vihc in zip(anf_streams, nervegram_vihcs)
+        ], axis=1).astype(np.float64)
+        if spike_time_format == 'index':
+            nervegram_spike_times = np.round(nervegram_spike_times * pin_fs).astype(np.uint64)
+        if squeeze_spont_dim and np.ndim(spont) == 0:
+            nervegram_spike_times = np.squeeze(nervegram_spike_times, axis=-2)
+        return {
+            't0': t0,
+            't1': min(anf.num_samples for anf in anf_streams) / pin_fs,
+            'nervegram_spike_times': nervegram_spike_times,
+        }
+
+    for signal in chunks:
+        yield run_block(resampler.process(signal), flush=False)
+    yield run_block(resampler.flush(), flush=True)
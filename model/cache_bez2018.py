@@ -0,0 +1,69 @@
+import hashlib
+
+import numpy as np
+
+from cache import LRUDirectoryStore
+
+
+# Bump if the output of the IHC model changes (invalidates all cached entries)
+VIHC_CACHE_VERSION = 1
+
+
+class VihcCache(LRUDirectoryStore):
+    '''
+    Content-addressed on-disk cache of inner hair cell potentials (`run_ihc` outputs).
+    The IHC stage is deterministic, so entries are keyed by a hash of the input
+    waveform and the IHC parameters only (not the random seed). Each entry is one
+    .npy file read back with memory mapping. The total size of the cache directory
+    is bounded by `max_bytes`; least recently used entries are evicted first
+    (see `LRUDirectoryStore` for storage, atomic writes and eviction).
+    '''
+
+    def __init__(self, cache_dir, max_bytes=16 * 2**30):
+        '''
+        Args
+        ----
+        cache_dir (str): directory holding the cached .npy files (created if needed)
+        max_bytes (int): maximum total size of the cached files in bytes
+        '''
+        super().__init__(cache_dir, max_bytes)
+
+    @staticmethod
+    def signal_key(pin, pin_fs):
+        '''
+        Hash of the waveform passed to the IHC model (computed once per block of CFs).
+        '''
+        pin = np.ascontiguousarray(pin, dtype=np.float64)
+        h = hashlib.sha256()
+        h.update(np.array([VIHC_CACHE_VERSION, pin.shape[0]], dtype=np.int64).tobytes())
+        h.update(np.float64(pin_fs).tobytes())
+        h.update(pin.tobytes())
+        return h.hexdigest()
+
+    @staticmethod
+    def key(signal_key,
+            cf,
+            species=2,
+            bandwidth_scale_factor=1.0,
+            cohc=1.0,
+            cihc=1.0,
+            IhcLowPass_cutoff=3e3,
+            IhcLowPass_order=7,
+            dtype='float64'):
+        '''
+        Cache key of a single IHC channel (arguments are as defined in `run_ihc_bank`).
+        '''
+        params = np.array([cf,
+                           species,
+                           bandwidth_scale_factor,
+                           cohc,
+                           cihc,
+                           IhcLowPass_cutoff,
+                           IhcLowPass_order], dtype=np.float64)
+        h = hashlib.sha256(signal_key.encode())
+        h.update(params.tobytes())
+        h.update(np.dtype(dtype).str.encode())
+        return h.hexdigest()
+
+    def _read(self, path):
+        return np.load(path, mmap_mode='r') # Read-only memory map
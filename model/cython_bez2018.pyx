@@ -1,27 +1,14 @@
+import threading
+import time
+
 import numpy as np
 from model import util_bez2018
-import scipy.signal
 
 from libc.stdlib cimport malloc, free
 cimport numpy as np
 np.import_array()
 
 
-cdef extern from "stdlib.h":
-    void *memcpy(void *str1, void *str2, size_t n)
-
-cdef extern from "Python.h":
-    ctypedef int Py_intptr_t
-
-cdef extern from "numpy/arrayobject.h":
-    ctypedef Py_intptr_t npy_intp
-    object PyArray_SimpleNewFromData(
-        int nd,
-        npy_intp* dims,
-        int typenum,
-        void* data
-    )
-
 cdef extern from "model_IHC_BEZ2018.h":
     void IHCAN(
         double *px,
@@ -36,7 +23,43 @@ cdef extern from "model_IHC_BEZ2018.h":
         double IhcLowPass_cutoff,
         double IhcLowPass_order,
         double *ihcout
-    )
+    ) nogil
+    void IHCANBank(
+        double *px,
+        int ncf,
+        const double *cf,
+        double tdres,
+        int totalstim,
+        const double *cohc,
+        const double *cihc,
+        int species,
+        const double *bandwidth_scale_factor,
+        double IhcLowPass_cutoff,
+        double IhcLowPass_order,
+        double *ihcout,
+        float *ihcoutf
+    ) nogil
+    ctypedef struct IHCBANK:
+        pass
+    IHCBANK *IHCANBankInit(
+        int ncf,
+        const double *cf,
+        double tdres,
+        const double *cohc,
+        const double *cihc,
+        int species,
+        const double *bandwidth_scale_factor,
+        double IhcLowPass_cutoff,
+        double IhcLowPass_order
+    ) nogil
+    void IHCANBankRun(
+        IHCBANK *bank,
+        const double *px,
+        int nsamp,
+        double *ihcout,
+        float *ihcoutf
+    ) nogil
+    void IHCANBankFree(IHCBANK *bank) nogil
 
 cdef extern from "model_Synapse_BEZ2018.h":
     void SingleAN(
@@ -47,20 +70,27 @@ cdef extern from "model_Synapse_BEZ2018.h":
         int totalstim,
         double noiseType,
         double implnt,
+        double plaTol,
         double spont,
         double tabs,
         double trel,
+        unsigned long long seed,
+        int cf_idx,
+        int spont_idx,
+        const double *decimTaps,
+        const double *randNums,
         double *meanrate,
         double *varrate,
         double *psth,
         double *synout,
         double *trd_vector,
         double *trel_vector
-    )
+    ) nogil
 
 cdef extern from "model_Synapse_BEZ2018.h":
     double Synapse(
         double *ihcout,
+        const float *ihcoutf,
         double tdres,
         double cf,
         int totalstim,
@@ -68,9 +98,72 @@ cdef extern from "model_Synapse_BEZ2018.h":
         double spont,
         double noiseType,
         double implnt,
+        double plaTol,
         double sampFreq,
+        const double *decimTaps,
+        const double *randNums,
         double *synout
-    )
+    ) nogil
+
+cdef extern from "model_Synapse_BEZ2018.h":
+    int SpikeTrains(
+        double *px,
+        const float *pxf,
+        double cf,
+        int nrep,
+        double tdres,
+        int totalstim,
+        double noiseType,
+        double implnt,
+        double plaTol,
+        double spont,
+        double tabs,
+        double trel,
+        double synapseMode,
+        int numTrains,
+        long maxSpikes,
+        long spikeStride,
+        unsigned long long seed,
+        int cf_idx,
+        int spont_idx,
+        const double *decimTaps,
+        const double *randNums,
+        int noiseLen,
+        double *synout,
+        float *synoutf,
+        double *meanrate,
+        float *meanratef,
+        double *spikeTimes
+    ) nogil
+
+cdef extern from "model_Synapse_BEZ2018.h":
+    int MeanRates(
+        double *px,
+        const float *pxf,
+        double cf,
+        double tdres,
+        int totalstim,
+        double noiseType,
+        double implnt,
+        double plaTol,
+        double spont,
+        double tabs,
+        double trel,
+        const double *decimTaps,
+        const double *randNums,
+        int q,
+        const double *outTaps,
+        float *meanrate
+    ) nogil
+
+cdef extern from "model_Synapse_BEZ2018.h":
+    int SynapseNoiseLength(
+        double tdres,
+        double cf,
+        int totalstim,
+        int nrep,
+        double sampFreq
+    ) nogil
 
 cdef extern from "model_Synapse_BEZ2018.h":
     int SpikeGenerator(
@@ -89,8 +182,291 @@ cdef extern from "model_Synapse_BEZ2018.h":
         double total_mean_rate,
         long MaxArraySizeSpikes,
         double *sptime,
-        double *trd_vector
-    )
+        double *trd_vector,
+        unsigned long long seed,
+        int cf_idx,
+        int spont_idx,
+        int train_idx
+    ) nogil
+
+cdef extern from "model_Synapse_BEZ2018.h":
+    ctypedef struct SPIKETRAINSTREAM:
+        pass
+    SPIKETRAINSTREAM *SpikeTrainsStreamNew(
+        double cf,
+        double tdres,
+        double implnt,
+        double plaTol,
+        double spont,
+        double tabs,
+        double trel,
+        double synapseMode,
+        int numTrains,
+        unsigned long long seed,
+        int cf_idx,
+        int spont_idx,
+        const double *decimTaps
+    ) nogil
+    int SpikeTrainsStreamNoiseLength(SPIKETRAINSTREAM *st, int nsamp, int flush) nogil
+    long SpikeTrainsStreamRun(
+        SPIKETRAINSTREAM *st,
+        double *px,
+        const float *pxf,
+        int nsamp,
+        int flush,
+        long maxSpikes,
+        long spikeStride,
+        const double *randNums,
+        int noiseLen,
+        double *spikeTimes
+    ) nogil
+    void SpikeTrainsStreamFree(SPIKETRAINSTREAM *st) nogil
+
+cdef extern from "model_Synapse_BEZ2018.h":
+    ctypedef struct ANPROFILE:
+        double t_synapse, t_decimate, t_pla, t_spikegen
+        long n_synapse, n_decimate, n_pla, n_spikegen
+        long n_spikes, n_rand
+    void ANProfileStart() nogil
+    void ANProfileStop(ANPROFILE *prof) nogil
+
+cdef extern from "philox.h":
+    int PHILOX_STREAM_FFGN
+    void philox_normal_fill(
+        unsigned long long seed,
+        unsigned int stream,
+        unsigned int cf_idx,
+        unsigned int spont_idx,
+        unsigned int train_idx,
+        unsigned long long start,
+        long n,
+        double *out
+    ) nogil
+
+cdef extern from "decimate.h":
+    int ResampFactor(double tdres, double sampFreq) nogil
+    void DecimateTaps(int q, double *b) nogil
+    int DecimateLength(int k, int q) nogil
+    double *Decimate(int k, const double *signal, int q, const double *b) nogil
+
+
+# Lowpass FIR taps used by the synapse decimator (computed once per decimation factor)
+_decimate_taps = {}
+
+# Per-thread fGn timing and counters (see `profile_start`)
+_profile_local = threading.local()
+
+
+def profile_start():
+    """
+    Reset and enable the stage timing and counters of the calling thread: the
+    fGn generation (`synapse_noise`), the synapse model (with its decimation and
+    power-law adaptation steps) and the spike generator. Model calls made by
+    other threads are not counted.
+    """
+    _profile_local.ffgn = [0.0, 0, 0]
+    ANProfileStart()
+
+
+def profile_stop():
+    """
+    Disable the stage timing and counters of the calling thread (see `profile_start`).
+
+    Returns
+    -------
+    profile (dict): 'time' (wall time in s) and 'calls' of the stages 'synapse_ffgn',
+        'synapse' (the C synapse model), 'synapse_decimate', 'synapse_pla' and
+        'spike_generator', and 'counters' of 'spikes', 'random_numbers_ffgn' (normal
+        samples) and 'random_numbers_spikes' (uniform samples)
+    """
+    cdef ANPROFILE prof
+    ANProfileStop(&prof)
+    ffgn = getattr(_profile_local, 'ffgn', None) or [0.0, 0, 0]
+    _profile_local.ffgn = None
+    return {
+        'time': {
+            'synapse_ffgn': ffgn[0],
+            'synapse': prof.t_synapse,
+            'synapse_decimate': prof.t_decimate,
+            'synapse_pla': prof.t_pla,
+            'spike_generator': prof.t_spikegen,
+        },
+        'calls': {
+            'synapse_ffgn': ffgn[1],
+            'synapse': prof.n_synapse,
+            'synapse_decimate': prof.n_decimate,
+            'synapse_pla': prof.n_pla,
+            'spike_generator': prof.n_spikegen,
+        },
+        'counters': {
+            'spikes': prof.n_spikes,
+            'random_numbers_ffgn': ffgn[2],
+            'random_numbers_spikes': prof.n_rand,
+        },
+    }
+
+
+def check_pla_tol(double pla_tol):
+    """
+    Raise ValueError unless 0 < pla_tol < 1 (the kernel fit of the "fast actual"
+    power-law implementation does not terminate for pla_tol <= 0).
+    """
+    if not (0 < pla_tol < 1):
+        raise ValueError("pla_tol must be in the open interval (0, 1), got {}".format(pla_tol))
+
+
+def get_decimate_taps(int q):
+    """
+    Return the (cached) lowpass FIR taps used to decimate by a factor of q.
+    Equivalent to scipy.signal.firwin(q+1, 1./q, window='hamming').
+
+    Args
+    ----
+    q (int): decimation factor
+
+    Returns
+    -------
+    b (np.float64 array): q+1 filter taps (do not modify in place)
+    """
+    if q not in _decimate_taps:
+        assert q > 1, "decimation factor must be greater than 1"
+        b = np.zeros(q + 1)
+        DecimateTaps(q, <double *>np.PyArray_DATA(b))
+        _decimate_taps[q] = b
+    return _decimate_taps[q]
+
+
+def run_decimate(np.ndarray[np.float64_t, ndim=1] signal, int q):
+    """
+    Zero-phase lowpass filter and downsample a signal by a factor of q using
+    the native decimator of the synapse model. Equivalent to:
+    scipy.signal.filtfilt(scipy.signal.firwin(q+1, 1./q, window='hamming'), [1.], signal)[::q]
+
+    Args
+    ----
+    signal (np.float64 array): input signal
+    q (int): decimation factor
+
+    Returns
+    -------
+    resampled (np.float64 array): decimated signal
+    """
+    cdef np.ndarray[np.float64_t, ndim=1] b = get_decimate_taps(q)
+    if not signal.flags['C_CONTIGUOUS']:
+        signal = signal.copy(order='C')
+    cdef int k = len(signal)
+    if k <= 3 * (q + 1):
+        raise ValueError("`run_decimate` requires more than 3*(q+1) input samples")
+    cdef double *signal_data = <double *>np.PyArray_DATA(signal)
+    cdef double *b_data = <double *>np.PyArray_DATA(b)
+    cdef double *out_ptr
+    with nogil:
+        out_ptr = Decimate(k, signal_data, q, b_data)
+    resampled = np.array(<double[:DecimateLength(k, q)]>out_ptr)
+    free(out_ptr)
+    return resampled
+
+
+cdef class PhiloxNormals:
+    """
+    Standard normal samples of the fGn realizations of one CF, drawn natively from the
+    counter-based Philox streams addressed by (random_seed, cf_idx, spont_idx, run_idx).
+    Used in place of a list of per-realization generators by `util_bez2018.ffGn_batch`
+    (`standard_normal((K, n))` returns the next n samples of each of the K streams).
+    """
+    cdef unsigned long long random_seed
+    cdef unsigned long long offset
+    cdef int cf_idx
+    cdef object rows
+
+    def __init__(self, unsigned long long random_seed, int cf_idx, list_spont_idx, int num_runs,
+                 unsigned long long offset=0):
+        self.random_seed = random_seed
+        self.cf_idx = cf_idx
+        self.offset = offset
+        self.rows = [(spont_idx, run_idx) for spont_idx in list_spont_idx for run_idx in range(num_runs)]
+
+    def standard_normal(self, size):
+        K, n = size
+        assert K == len(self.rows), "one row per realization is required"
+        cdef np.ndarray[np.float64_t, ndim=2] out = np.empty([K, n], dtype=np.float64)
+        cdef double *out_data = <double *>np.PyArray_DATA(out)
+        cdef long num = n
+        cdef int num_rows = K
+        cdef int k
+        cdef np.ndarray[np.uint32_t, ndim=2] rows = np.array(self.rows, dtype=np.uint32).reshape([K, 2])
+        with nogil:
+            for k in range(num_rows):
+                philox_normal_fill(
+                    self.random_seed,
+                    PHILOX_STREAM_FFGN,
+                    self.cf_idx,
+                    rows[k, 0],
+                    rows[k, 1],
+                    self.offset,
+                    num,
+                    out_data + k * num)
+        self.offset += n
+        return out
+
+
+def synapse_noise(double fs,
+                  double cf,
+                  int totalstim,
+                  double noiseType,
+                  list_spont,
+                  int num_runs=1,
+                  unsigned long long random_seed=0,
+                  int cf_idx=0,
+                  list_spont_idx=None):
+    """
+    Generate the fractional Gaussian noise (fGn) added to the synapse model input
+    for every spontaneous rate and synapse model run of one CF (single batched FFT).
+    Each realization is drawn from its own native Philox stream addressed by
+    (random_seed, cf_idx, spont_idx, run_idx), so it does not depend on the other
+    realizations requested alongside it.
+
+    Args
+    ----
+    fs (float): sampling rate of the IHC potential in Hz
+    cf (float): characteristic frequency in Hz
+    totalstim (int): number of samples in the IHC potential
+    noiseType (float): set to 0 for noiseless and 1 for variable fGn
+    list_spont (np.float64 array): list of spontaneous firing rates in spikes per second
+    num_runs (int): number of synapse model runs per spontaneous rate
+    random_seed (int): 64-bit seed shared by all fGn realizations of a run
+    cf_idx (int): CF index used to address the random streams
+    list_spont_idx (list or None): spont indexes used to address the random streams
+        (defaults to the position in list_spont)
+
+    Returns
+    -------
+    noise (np.float64 array): fGn array with shape [spont, num_runs, samples]
+    """
+    cdef double sampFreq = 10e3 # sampling frequency used in the synapse
+    cdef int N = SynapseNoiseLength(1.0/fs, cf, totalstim, 1, sampFreq)
+    list_spont = np.array(list_spont, dtype=np.float64).reshape([-1])
+    if list_spont_idx is None:
+        list_spont_idx = range(len(list_spont))
+    K = len(list_spont) * num_runs
+    if noiseType == 0:
+        return np.zeros([len(list_spont), num_runs, N])
+    ffgn = getattr(_profile_local, 'ffgn', None)
+    if ffgn is not None:
+        t0 = time.perf_counter()
+    noise = util_bez2018.ffGn_batch(
+        K,
+        N,
+        1/sampFreq,
+        0.9, # Hurst index
+        noiseType,
+        np.repeat(list_spont, num_runs),
+        rng=PhiloxNormals(random_seed, cf_idx, list_spont_idx, num_runs))
+    if ffgn is not None:
+        ffgn[0] += time.perf_counter() - t0
+        ffgn[1] += 1
+        ffgn[2] += K * util_bez2018.ffGn_num_randn(N, 1/sampFreq, 0.9, noiseType)
+    return np.ascontiguousarray(noise.reshape([len(list_spont), num_runs, N]))
 
 
 def run_ihc(np.ndarray[np.float64_t, ndim=1] signal,
@@ -142,25 +518,131 @@ def run_ihc(np.ndarray[np.float64_t, ndim=1] signal,
         signal = signal.copy(order='C')
     cdef double *signal_data = <double *>np.PyArray_DATA(signal)
     
+    cdef int totalstim = len(signal)
+    cdef double lowpass_cutoff = IhcLowPass_cutoff
+    cdef double lowpass_order = IhcLowPass_order
+    
     # Initialize output array and data pointer for IHC voltage
     ihcout = np.zeros( len(signal) )
     cdef double *ihcout_data = <double *>np.PyArray_DATA(ihcout)
     
-    # Run model_IHC_BEZ2018.IHCAN (modifies ihcout_data in place)
-    IHCAN(
-        signal_data,            #double *px,
-        cf,                     #double cf,
-        1,                      #int nrep,
-        1.0/fs,                 #double tdres,
-        len(signal),            #int totalstim,
-        cohc,                   #double cohc,
-        cihc,                   #double cihc,
-        species,                #int species,
-        bandwidth_scale_factor, #double bandwidth_scale_factor
-        IhcLowPass_cutoff,      #double IhcLowPass_cutoff
-        IhcLowPass_order,       #int IhcLowPass_order
-        ihcout_data             #double *ihcout
-    )
+    # Run model_IHC_BEZ2018.IHCAN (modifies ihcout_data in place, GIL released)
+    with nogil:
+        IHCAN(
+            signal_data,            #double *px,
+            cf,                     #double cf,
+            1,                      #int nrep,
+            1.0/fs,                 #double tdres,
+            totalstim,              #int totalstim,
+            cohc,                   #double cohc,
+            cihc,                   #double cihc,
+            species,                #int species,
+            bandwidth_scale_factor, #double bandwidth_scale_factor
+            lowpass_cutoff,         #double IhcLowPass_cutoff
+            lowpass_order,          #int IhcLowPass_order
+            ihcout_data             #double *ihcout
+        )
+    return ihcout
+
+
+def run_ihc_bank(np.ndarray[np.float64_t, ndim=1] signal,
+                 double fs,
+                 cf_list,
+                 int species=1,
+                 bandwidth_scale_factor=1.,
+                 cohc=1.,
+                 cihc=1.,
+                 IhcLowPass_cutoff=3000.,
+                 IhcLowPass_order=7,
+                 dtype=np.float64):
+    """
+    Run middle ear filter, BM filters, and IHC model for a bank of CFs.
+    The middle ear filter is run once and all CF channels are advanced
+    together in a single time loop (output is identical to `run_ihc`).
+    
+    Args
+    ----
+    signal (np.float64 array): input acoustic waveform in units of Pa
+    fs (float): sampling rate in Hz
+    cf_list (list or np.ndarray): characteristic frequencies in Hz
+    species (int): sets filter parameters: 1=cat, 2=human, 3=G&M1990, 4=custom
+    bandwidth_scale_factor (float or np.ndarray): scales cochlear filter bandwidth (scalar or per CF)
+    cohc (float or np.ndarray): OHC scaling factor (scalar or per CF)
+    cihc (float or np.ndarray): IHC scaling factor (scalar or per CF)
+    IhcLowPass_cutoff (float): cutoff frequency for IHC lowpass filter (Hz)
+    IhcLowPass_order (int): order for IHC lowpass filter
+    dtype (np.dtype): storage type of the output (np.float64 or np.float32); filters
+        are always run in double precision
+    
+    Returns
+    -------
+    ihcout (np.ndarray): IHC membrane potentials (in volts) with shape [num_cf, time]
+    """
+    # Check arguments and broadcast per-CF parameters
+    cf_list = np.ascontiguousarray(cf_list, dtype=np.float64).reshape([-1])
+    num_cf = cf_list.shape[0]
+    bandwidth_scale_factor = np.ascontiguousarray(
+        np.broadcast_to(np.asarray(bandwidth_scale_factor, dtype=np.float64), [num_cf]))
+    cohc = np.ascontiguousarray(np.broadcast_to(np.asarray(cohc, dtype=np.float64), [num_cf]))
+    cihc = np.ascontiguousarray(np.broadcast_to(np.asarray(cihc, dtype=np.float64), [num_cf]))
+    assert species in [1, 2, 3, 4], ("species must be in [1, 2, 3]:\n"
+                                     "\t1 = cat,\n"
+                                     "\t2 = human: Shera et al. (PNAS 2002)\n"
+                                     "\t3 = human: Glasberg & Moore (Hear. Res. 1990)\n"
+                                     "\t4 = custom: bw = bandwidth_scale_factor")
+    if species == 1:
+        assert np.all((cf_list > 124.9) & (cf_list < 40e3)), "CF out of range for cat (125Hz to 40kHz)"
+    else:
+        assert np.all((cf_list > 124.9) & (cf_list < 20001.)), "CF out of range for human (125Hz to 20kHz)"
+    assert np.all(bandwidth_scale_factor > 0), "bandwidth_scale_factor must be positive"
+    assert (fs >= 100e3) and (fs <= 500e3), "Sampling rate out of range (100kHz to 500kHz)"
+    assert np.all((cohc >= 0) & (cohc <= 1)), "cohc out of range ([0, 1])"
+    assert np.all((cihc >= 0) & (cihc <= 1)), "cihc out of range ([0, 1])"
+    
+    # Ensure input array (input sound) is C contiguous and initialize pointer
+    if not signal.flags['C_CONTIGUOUS']:
+        signal = signal.copy(order='C')
+    
+    dtype = np.dtype(dtype)
+    assert dtype in [np.float64, np.float32], "dtype must be np.float64 or np.float32"
+    
+    # Initialize output array for IHC voltages (one row per CF)
+    ihcout = np.zeros([num_cf, len(signal)], dtype=dtype)
+    if num_cf == 0:
+        return ihcout
+    cdef int ncf = num_cf
+    cdef int totalstim = len(signal)
+    cdef double lowpass_cutoff = IhcLowPass_cutoff
+    cdef double lowpass_order = IhcLowPass_order
+    cdef double *signal_data = <double *>np.PyArray_DATA(signal)
+    cdef double *cf_data = <double *>np.PyArray_DATA(cf_list)
+    cdef double *cohc_data = <double *>np.PyArray_DATA(cohc)
+    cdef double *cihc_data = <double *>np.PyArray_DATA(cihc)
+    cdef double *bandwidth_data = <double *>np.PyArray_DATA(bandwidth_scale_factor)
+    cdef double *ihcout_data = NULL
+    cdef float *ihcoutf_data = NULL
+    if dtype == np.float32:
+        ihcoutf_data = <float *>np.PyArray_DATA(ihcout)
+    else:
+        ihcout_data = <double *>np.PyArray_DATA(ihcout)
+    
+    # Run model_IHC_BEZ2018.IHCANBank (modifies ihcout in place, GIL released)
+    with nogil:
+        IHCANBank(
+            signal_data,
+            ncf,
+            cf_data,
+            1.0/fs,
+            totalstim,
+            cohc_data,
+            cihc_data,
+            species,
+            bandwidth_data,
+            lowpass_cutoff,
+            lowpass_order,
+            ihcout_data,
+            ihcoutf_data
+        )
     return ihcout
 
 
@@ -169,9 +651,13 @@ def run_synapse(np.ndarray[np.float64_t, ndim=1] vihc,
                 double cf,
                 double noiseType=1.,
                 double implnt=0.,
+                double pla_tol=1e-6,
                 double spont=70.,
                 double tabs=0.6e-3,
-                double trel=0.6e-3):
+                double trel=0.6e-3,
+                random_seed=None,
+                int cf_idx=0,
+                int spont_idx=0):
     """
     Run IHC-ANF synapse model.
     (based on https://github.com/mrkrd/cochlea/blob/master/cochlea/zilany2014)
@@ -182,10 +668,14 @@ def run_synapse(np.ndarray[np.float64_t, ndim=1] vihc,
     fs (float): sampling rate in Hz
     cf (float): characteristic frequency in Hz
     noiseType (float): set to 0 for noiseless and 1 for variable fGn
-    implnt (float): set to 0 for "approx" and 1 for "actual" power-law function implementation
+    implnt (float): set to 0 for "approx", 1 for "actual", and 2 for "fast actual" power-law function implementation
+    pla_tol (float): relative error tolerance of the power-law kernels in the "fast actual" implementation
     spont (float): spontaneous firing rate in spikes per second
     tabs (float): absolute refractory period in seconds
     trel (float): baseline mean relative refractory period in seconds
+    random_seed (int or None): 64-bit seed of the fGn and spike generator RNGs (drawn from np.random if None)
+    cf_idx (int): CF index used to address the fGn and spike generator random streams
+    spont_idx (int): spont index used to address the fGn and spike generator random streams
 
     Returns
     -------
@@ -197,10 +687,17 @@ def run_synapse(np.ndarray[np.float64_t, ndim=1] vihc,
         'trd_vector': vector of the mean redocking time in seconds
         'trel_vector': vector of the mean relative refractory period in seconds
     """
+    check_pla_tol(pla_tol)
     # Ensure input array (IHC voltage) is C contiguous and initialize pointer
     if not vihc.flags['C_CONTIGUOUS']:
         vihc = vihc.copy(order='C')
     cdef double *vihc_data = <double *>np.PyArray_DATA(vihc)
+    if random_seed is None:
+        random_seed = np.random.randint(np.iinfo(np.int64).max, dtype=np.int64)
+    cdef np.ndarray[np.float64_t, ndim=1] decim_taps = get_decimate_taps(ResampFactor(1.0/fs, 10e3))
+    cdef np.ndarray[np.float64_t, ndim=3] noise = synapse_noise(
+        fs, cf, len(vihc), noiseType, [spont],
+        random_seed=random_seed, cf_idx=cf_idx, list_spont_idx=[spont_idx])
     
     # Initialize output arrays and data pointers
     synout = np.zeros_like(vihc) # (spiking probabilities)
@@ -215,26 +712,37 @@ def run_synapse(np.ndarray[np.float64_t, ndim=1] vihc,
     cdef double *trd_vector_data = <double *>np.PyArray_DATA(trd_vector)
     trel_vector = np.zeros_like(vihc) # (mean relative refractory periods)
     cdef double *trel_vector_data = <double *>np.PyArray_DATA(trel_vector)
+    cdef int totalstim = len(vihc)
+    cdef unsigned long long seed = random_seed
+    cdef double *decim_taps_data = <double *>np.PyArray_DATA(decim_taps)
+    cdef double *noise_data = <double *>np.PyArray_DATA(noise)
     
-    # Run model_Synapse_BEZ2018.SingleAN (modifies output arrays in place)
-    SingleAN(
-        vihc_data,          #double *px,
-        cf,                 #double cf,
-        1,                  #int nrep,
-        1.0/fs,             #double tdres,
-        len(vihc),          #int totalstim,
-        noiseType,          #double noiseType,
-        implnt,             #double implnt,
-        spont,              #double spont,
-        tabs,               #double tabs,
-        trel,               #double trel,
-        meanrate_data,      #double *meanrate,
-        varrate_data,       #double *varrate,
-        psth_data,          #double *psth,
-        synout_data,        #double *synout,
-        trd_vector_data,    #double *trd_vector,
-        trel_vector_data    #double *trel_vector
-    )
+    # Run model_Synapse_BEZ2018.SingleAN (modifies output arrays in place, GIL released)
+    with nogil:
+        SingleAN(
+            vihc_data,          #double *px,
+            cf,                 #double cf,
+            1,                  #int nrep,
+            1.0/fs,             #double tdres,
+            totalstim,          #int totalstim,
+            noiseType,          #double noiseType,
+            implnt,             #double implnt,
+            pla_tol,            #double plaTol,
+            spont,              #double spont,
+            tabs,               #double tabs,
+            trel,               #double trel,
+            seed,               #unsigned long long seed,
+            cf_idx,             #int cf_idx,
+            spont_idx,          #int spont_idx,
+            decim_taps_data,    #const double *decimTaps,
+            noise_data,         #const double *randNums,
+            meanrate_data,      #double *meanrate,
+            varrate_data,       #double *varrate,
+            psth_data,          #double *psth,
+            synout_data,        #double *synout,
+            trd_vector_data,    #double *trd_vector,
+            trel_vector_data    #double *trel_vector
+        )
     output_dict = {
         'synout': synout,
         'meanrate': meanrate,
@@ -247,17 +755,21 @@ def run_synapse(np.ndarray[np.float64_t, ndim=1] vihc,
 
 
 def run_anf(
-        np.ndarray[np.float64_t, ndim=1] vihc,
+        np.ndarray vihc,
         double fs,
         double cf,
         double noiseType=1.,
         double implnt=0.,
+        double pla_tol=1e-6,
         np.ndarray[np.float64_t, ndim=1] list_spont=np.array([70.]),
         double tabs=0.6e-3,
         double trel=0.6e-3,
         double synapseMode=0.,
         int max_spikes_per_train=1000,
-        int num_spike_trains=1):
+        int num_spike_trains=1,
+        unsigned long long random_seed=0,
+        int cf_idx=0,
+        bint ragged=False):
     """
     Run IHC-ANF synapse model and spike generator. Additional arguments
     allow for efficient sampling of multiple ANF spike trains.
@@ -265,167 +777,493 @@ def run_anf(
 
     Args
     ----
-    vihc (np.float64 array): IHC membrane potential (in volts)
+    vihc (np.float64 or np.float32 array): IHC membrane potential (in volts); float32 input
+        runs the synapse model and spike generator in single precision and returns the
+        mean rate as float32 (spike times are always float64)
     fs (float): sampling rate in Hz
     cf (float): characteristic frequency in Hz
     noiseType (float): set to 0 for noiseless and 1 for variable fGn
-    implnt (float): set to 0 for "approx" and 1 for "actual" power-law function implementation
+    implnt (float): set to 0 for "approx", 1 for "actual", and 2 for "fast actual" power-law function implementation
+    pla_tol (float): relative error tolerance of the power-law kernels in the "fast actual" implementation
     list_spont (np.float64 array): list of spontaneous firing rates in spikes per second
     tabs (float): absolute refractory period in seconds
     trel (float): baseline mean relative refractory period in seconds
     synapseMode (float): set to 1 to re-run synapse model for each spike train (0 to re-use synout)
-    max_spikes_per_train (int): max array size for spike times output
+    max_spikes_per_train (int): max array size for spike times output (initial size if ragged)
     num_spike_trains (int): number of spike trains to sample from spike generator
+    random_seed (int): 64-bit seed of the fGn and counter-based spike generator RNGs
+    cf_idx (int): CF index used (with spont and train indexes) to address random streams
+    ragged (bool): if True, spike times are returned without padding and without a cap on the
+        number of spikes (the model is re-run with a larger spike array if it overflows)
 
     Returns
     -------
-    output_dict (dict): dictionary of all output variables (lists of np.float64 arrays)
-        'list_meanrate': analytical estimate of the instantaneous mean firing rate in /s
-        'list_spike_times': num_spike_trains by max_spikes_per_train array of spike times in s
+    output_dict (dict): dictionary of all output variables
+        'list_meanrate': analytical estimate of the instantaneous mean firing rate in /s [time, spont]
+        'list_spike_times': spike times in s (zero-padded) [num_spike_trains, spont, max_spikes_per_train]
+            or, if ragged, all spike times in s ordered by (spont, train, time)
+        'list_spike_offsets': (only if ragged) spike times of spont i and train j are
+            list_spike_times[offsets[k]:offsets[k+1]] with k = i * num_spike_trains + j
     """
+    check_pla_tol(pla_tol)
     # Ensure input array (IHC voltage) is C contiguous and initialize pointer
+    assert vihc.ndim == 1, "vihc must be a one-dimensional array"
+    if vihc.dtype != np.float32:
+        vihc = vihc.astype(np.float64, copy=False)
     if not vihc.flags['C_CONTIGUOUS']:
         vihc = vihc.copy(order='C')
-    # Initialize output arrays and data pointers
-    cdef double *vihc_data = <double *>np.PyArray_DATA(vihc)
-    synout = np.zeros_like(vihc) # spiking probabilities
-    cdef double *synout_data = <double *>np.PyArray_DATA(synout)
-    cdef double *sptime_data = <double *>malloc(max_spikes_per_train*sizeof(double))
-    cdef double *trd_vector_data = <double *>malloc(len(vihc)*sizeof(double))
-    # Run synapse model for each spontaneous rate
-    list_meanrate = []
-    list_spike_times = []
-    for spont in list_spont:
-        # Fixed parameters for Synapse and SpikeGenerator functions
-        tdres = 1/fs
-        totalstim = len(vihc)
-        nrep = 1
-        sampFreq = 10e3
-        nSites = 4 # number of synpatic release sites
-        t_rd_rest = 14.0e-3 # resting value of the mean redocking time
-        t_rd_jump = 0.4e-3 # size of jump in mean redocking time when a redocking event occurs
-        t_rd_init = t_rd_rest + 0.02e-3 * spont - t_rd_jump # initial value of the mean redocking time
-        tau = 60.0e-3 # time constant for short-term adaptation (in mean redocking time)
-        # Call the SpikeGenerator function once for each spike train
-        spike_times = np.zeros([num_spike_trains, max_spikes_per_train], dtype=vihc.dtype)
-        for itr_n in range(num_spike_trains):
-            # If synapseMode is 1, re-run the synapse model for each new spike train
-            if (itr_n == 0) or (synapseMode == 1):
-                I = Synapse(
+    cdef double *vihc_data = NULL
+    cdef float *vihcf_data = NULL
+    if vihc.dtype == np.float32:
+        vihcf_data = <float *>np.PyArray_DATA(vihc)
+    else:
+        vihc_data = <double *>np.PyArray_DATA(vihc)
+    cdef int totalstim = len(vihc)
+    cdef int num_spont = len(list_spont)
+    cdef np.ndarray[np.float64_t, ndim=1] decim_taps = get_decimate_taps(ResampFactor(1.0/fs, 10e3))
+    # Generate the fGn for every spont and synapse model run at once
+    cdef int num_runs = num_spike_trains if synapseMode == 1 else 1
+    cdef np.ndarray[np.float64_t, ndim=3] noise = synapse_noise(
+        fs, cf, totalstim, noiseType, list_spont,
+        num_runs=num_runs, random_seed=random_seed, cf_idx=cf_idx)
+    cdef int noise_len = noise.shape[2]
+    # Initialize output arrays (spike times are written in place by SpikeTrains)
+    cdef np.ndarray synout = np.zeros(totalstim, dtype=vihc.dtype) # spiking probabilities
+    cdef np.ndarray meanrate = np.zeros([num_spont, totalstim], dtype=vihc.dtype)
+    cdef np.ndarray[np.float64_t, ndim=3] spike_times = np.zeros(
+        [num_spike_trains, num_spont, max_spikes_per_train]) # last axis reserved for timestamps
+    list_spont = np.ascontiguousarray(list_spont)
+    cdef double *spont_data = <double *>np.PyArray_DATA(list_spont)
+    cdef double *decim_taps_data = <double *>np.PyArray_DATA(decim_taps)
+    cdef double *noise_data = <double *>np.PyArray_DATA(noise)
+    cdef double *synout_data = NULL
+    cdef float *synoutf_data = NULL
+    cdef double *meanrate_data = NULL
+    cdef float *meanratef_data = NULL
+    if vihc.dtype == np.float32:
+        synoutf_data = <float *>np.PyArray_DATA(synout)
+        meanratef_data = <float *>np.PyArray_DATA(meanrate)
+    else:
+        synout_data = <double *>np.PyArray_DATA(synout)
+        meanrate_data = <double *>np.PyArray_DATA(meanrate)
+    cdef double *spike_times_data = <double *>np.PyArray_DATA(spike_times)
+    cdef int spont_idx
+    cdef int status = -1
+    while status < 0:
+        status = 0
+        # Run synapse model and spike generator for each spontaneous rate (GIL released)
+        with nogil:
+            for spont_idx in range(num_spont):
+                status = SpikeTrains(
                     vihc_data,
-                    tdres,
+                    vihcf_data,
                     cf,
+                    1,
+                    1.0/fs,
                     totalstim,
-                    nrep,
-                    spont,
                     noiseType,
                     implnt,
-                    sampFreq,
-                    synout_data)
-            total_mean_rate = np.sum(synout) / I # calculate the overall mean synaptic rate
-            # Reset sptime_data for each call to SpikeGenerator
-            for itr_c in range(max_spikes_per_train):
-                sptime_data[itr_c] = 0
-            # Reset trd_vector_data for each call to SpikeGenerator
-            for itr_c in range(len(vihc)):
-                trd_vector_data[itr_c] = 0
-            nspikes = SpikeGenerator(
-                synout_data,
-                tdres,
-                t_rd_rest,
-                t_rd_init,
-                tau,
-                t_rd_jump,
-                nSites,
-                tabs,
-                trel,
-                spont,
-                totalstim,
-                nrep,
-                total_mean_rate,
-                max_spikes_per_train,
-                sptime_data,
-                trd_vector_data)
-            if nspikes < 0:
+                    pla_tol,
+                    spont_data[spont_idx],
+                    tabs,
+                    trel,
+                    synapseMode,
+                    num_spike_trains,
+                    max_spikes_per_train,
+                    num_spont * max_spikes_per_train,
+                    random_seed,
+                    cf_idx,
+                    spont_idx,
+                    decim_taps_data,
+                    noise_data + <long>spont_idx * num_runs * noise_len,
+                    noise_len,
+                    synout_data,
+                    synoutf_data,
+                    meanrate_data + <long>spont_idx * totalstim if meanrate_data != NULL else NULL,
+                    meanratef_data + <long>spont_idx * totalstim if meanratef_data != NULL else NULL,
+                    spike_times_data + <long>spont_idx * max_spikes_per_train)
+                if status < 0:
+                    break
+        if status < 0:
+            if not ragged:
                 raise ValueError("`run_anf` failed due to insufficient max_spikes_per_train")
-            # Convert C-arrays to np.ndarrays
-            spike_times[itr_n] = [t for t in sptime_data[:max_spikes_per_train]]
-            trd_vector = np.array([t for t in trd_vector_data[:len(vihc)]])
-            if itr_n == 0:
-                # Estimate instantaneous mean firing rate on first iteration
-                IDX = synout > 0
-                meanrate = np.zeros_like(vihc)
-                trel_vector = np.ones_like(vihc) * trel
-                trel_vector[IDX] = trel * 100 / synout[IDX]
-                trel_vector[trel_vector > trel] = trel
-                meanrate[IDX] = synout[IDX] / (synout[IDX] * (tabs + trd_vector[IDX] / nSites + trel_vector[IDX]) + 1)
-        list_meanrate.append(meanrate)
-        list_spike_times.append(spike_times)
-    # Free allocated memory and stack outputs from different spontaneous rates
-    free(sptime_data)
-    free(trd_vector_data)
+            # Random streams are addressed by counters, so the re-run reproduces all spikes
+            max_spikes_per_train *= 2
+            spike_times = np.zeros([num_spike_trains, num_spont, max_spikes_per_train])
+            spike_times_data = <double *>np.PyArray_DATA(spike_times)
     output_dict = {
-        'list_meanrate': np.stack(list_meanrate, axis=-1),
-        'list_spike_times': np.stack(list_spike_times, axis=-2), # last axis reserved for timestamps
+        'list_meanrate': meanrate.T,
+        'list_spike_times': spike_times,
     }
+    if ragged:
+        spike_times = spike_times.transpose(1, 0, 2) # [spont, train, spikes]
+        spike_mask = spike_times > 0
+        output_dict['list_spike_times'] = spike_times[spike_mask]
+        output_dict['list_spike_offsets'] = np.concatenate(
+            [[0], np.cumsum(spike_mask.sum(axis=-1).reshape([-1]))]).astype(np.int64)
     return output_dict
 
 
-cdef public double* generate_random_numbers(long length):
+
+def run_meanrate(
+        np.ndarray vihc,
+        double fs,
+        double cf,
+        double noiseType=1.,
+        double implnt=0.,
+        double pla_tol=1e-6,
+        np.ndarray[np.float64_t, ndim=1] list_spont=np.array([70.]),
+        double tabs=0.6e-3,
+        double trel=0.6e-3,
+        unsigned long long random_seed=0,
+        int cf_idx=0,
+        int decimate=1):
     """
-    Wrapper for np.random.rand
+    Rate-only version of `run_anf`: run the IHC-ANF synapse model and return the
+    analytical estimate of the instantaneous mean firing rate without running the
+    spike generator. The adaptive mean redocking time (a by-product of the spike
+    generator in `run_anf`) is replaced by its expected value, so rates differ
+    slightly from `run_anf` rates after strong onsets. The synapse model uses the
+    same fGn as the first synapse run of `run_anf` with the same random seed.
+
+    Args
+    ----
+    vihc (np.float64 or np.float32 array): IHC membrane potential (in volts); float32
+        input runs the synapse model in single precision
+    decimate (int): the mean rate is lowpass filtered and downsampled by this factor
+        in C (see `run_decimate`; 1 returns the mean rate at `fs`)
+    All other arguments are as defined in `run_anf`
+
+    Returns
+    -------
+    meanrate (np.float32 array): analytical estimate of the instantaneous mean firing
+        rate in /s with shape [time, spont] (sampled at fs / decimate)
     """
-    arr = np.random.rand(length)
-    # Ensure array is C contiguous
-    if not arr.flags['C_CONTIGUOUS']:
-        arr = arr.copy(order='C')
-    # Copy data to output array
-    cdef double *data_ptr = <double *>np.PyArray_DATA(arr)
-    cdef double *out_ptr = <double *>malloc(length * sizeof(double))
-    memcpy(out_ptr, data_ptr, length*sizeof(double))
-    return out_ptr
-
-
-cdef public double* decimate(int k, double *signal, int q):
+    check_pla_tol(pla_tol)
+    assert vihc.ndim == 1, "vihc must be a one-dimensional array"
+    assert decimate >= 1, "decimate must be >= 1"
+    if vihc.dtype != np.float32:
+        vihc = vihc.astype(np.float64, copy=False)
+    if not vihc.flags['C_CONTIGUOUS']:
+        vihc = vihc.copy(order='C')
+    cdef double *vihc_data = NULL
+    cdef float *vihcf_data = NULL
+    if vihc.dtype == np.float32:
+        vihcf_data = <float *>np.PyArray_DATA(vihc)
+    else:
+        vihc_data = <double *>np.PyArray_DATA(vihc)
+    cdef int totalstim = len(vihc)
+    cdef int num_spont = len(list_spont)
+    if (decimate > 1) and (totalstim <= 3 * (decimate + 1)):
+        raise ValueError("`run_meanrate` requires more than 3*(decimate+1) input samples")
+    cdef int nout = DecimateLength(totalstim, decimate) if decimate > 1 else totalstim
+    cdef np.ndarray[np.float64_t, ndim=1] decim_taps = get_decimate_taps(ResampFactor(1.0/fs, 10e3))
+    cdef np.ndarray[np.float64_t, ndim=1] out_taps = get_decimate_taps(decimate) if decimate > 1 else decim_taps
+    cdef np.ndarray[np.float64_t, ndim=3] noise = synapse_noise(
+        fs, cf, totalstim, noiseType, list_spont, random_seed=random_seed, cf_idx=cf_idx)
+    cdef int noise_len = noise.shape[2]
+    cdef np.ndarray[np.float32_t, ndim=2] meanrate = np.zeros([num_spont, nout], dtype=np.float32)
+    list_spont = np.ascontiguousarray(list_spont)
+    cdef double *spont_data = <double *>np.PyArray_DATA(list_spont)
+    cdef double *decim_taps_data = <double *>np.PyArray_DATA(decim_taps)
+    cdef double *out_taps_data = <double *>np.PyArray_DATA(out_taps)
+    cdef double *noise_data = <double *>np.PyArray_DATA(noise)
+    cdef float *meanrate_data = <float *>np.PyArray_DATA(meanrate)
+    cdef int spont_idx
+    # Run synapse model and mean rate estimate for each spontaneous rate (GIL released)
+    with nogil:
+        for spont_idx in range(num_spont):
+            MeanRates(
+                vihc_data,
+                vihcf_data,
+                cf,
+                1.0/fs,
+                totalstim,
+                noiseType,
+                implnt,
+                pla_tol,
+                spont_data[spont_idx],
+                tabs,
+                trel,
+                decim_taps_data,
+                noise_data + <long>spont_idx * noise_len,
+                decimate,
+                out_taps_data,
+                meanrate_data + <long>spont_idx * nout)
+    return meanrate.T
+
+cdef class IHCBankStream:
     """
-    Decimate a signal
-    k: number of samples in signal
-    signal: pointer to the signal
-    q: decimation factor
-    This implementation was inspired by scipy.signal.decimate.
+    Streaming version of `run_ihc_bank`: the IHC model of a bank of CFs is run on
+    consecutive blocks of the input waveform, carrying the middle ear, BM filter,
+    and IHC lowpass filter states (and the path delay) across block boundaries.
+    The concatenated outputs are identical to `run_ihc_bank` on the whole input.
     """
-    # signal_arr will not own the data, signal's array has to be freed
-    # after return from this function
-    signal_arr = PyArray_SimpleNewFromData(
-        1,                      # nd
-        [k],                    # dims
-        np.NPY_DOUBLE,          # typenum
-        <void *>signal          # data
-    )
-    b = scipy.signal.firwin(q+1, 1./q, window='hamming')
-    a = [1.]
-    filtered = scipy.signal.filtfilt(b=b, a=a, x=signal_arr)
-    resampled = filtered[::q]
-    # Ensure array is C contiguous
-    if not resampled.flags['C_CONTIGUOUS']:
-        resampled = resampled.copy(order='C')
-    # Copy data to output array
-    cdef double *resampled_ptr = <double *>np.PyArray_DATA(resampled)
-    cdef double *out_ptr = <double *>malloc(len(resampled)*sizeof(double))
-    memcpy(out_ptr, resampled_ptr, len(resampled)*sizeof(double))
-    return out_ptr
-
-
-cdef public double* ffGn(int N, double tdres, double Hinput, double noiseType, double mu):
+    cdef IHCBANK *bank
+    cdef readonly int num_cf
+    cdef readonly object dtype
+
+    def __cinit__(self,
+                  double fs,
+                  cf_list,
+                  int species=1,
+                  bandwidth_scale_factor=1.,
+                  cohc=1.,
+                  cihc=1.,
+                  IhcLowPass_cutoff=3000.,
+                  IhcLowPass_order=7,
+                  dtype=np.float64):
+        """
+        Args
+        ----
+        fs (float): sampling rate in Hz
+        All other arguments are as defined in `run_ihc_bank`
+        """
+        cf_list = np.ascontiguousarray(cf_list, dtype=np.float64).reshape([-1])
+        num_cf = cf_list.shape[0]
+        bandwidth_scale_factor = np.ascontiguousarray(
+            np.broadcast_to(np.asarray(bandwidth_scale_factor, dtype=np.float64), [num_cf]))
+        cohc = np.ascontiguousarray(np.broadcast_to(np.asarray(cohc, dtype=np.float64), [num_cf]))
+        cihc = np.ascontiguousarray(np.broadcast_to(np.asarray(cihc, dtype=np.float64), [num_cf]))
+        assert species in [1, 2, 3, 4], "species must be in [1, 2, 3, 4] (see `run_ihc_bank`)"
+        if species == 1:
+            assert np.all((cf_list > 124.9) & (cf_list < 40e3)), "CF out of range for cat (125Hz to 40kHz)"
+        else:
+            assert np.all((cf_list > 124.9) & (cf_list < 20001.)), "CF out of range for human (125Hz to 20kHz)"
+        assert np.all(bandwidth_scale_factor > 0), "bandwidth_scale_factor must be positive"
+        assert (fs >= 100e3) and (fs <= 500e3), "Sampling rate out of range (100kHz to 500kHz)"
+        assert np.all((cohc >= 0) & (cohc <= 1)), "cohc out of range ([0, 1])"
+        assert np.all((cihc >= 0) & (cihc <= 1)), "cihc out of range ([0, 1])"
+        self.dtype = np.dtype(dtype)
+        assert self.dtype in [np.float64, np.float32], "dtype must be np.float64 or np.float32"
+        self.num_cf = num_cf
+        self.bank = IHCANBankInit(
+            num_cf,
+            <double *>np.PyArray_DATA(cf_list),
+            1.0/fs,
+            <double *>np.PyArray_DATA(cohc),
+            <double *>np.PyArray_DATA(cihc),
+            species,
+            <double *>np.PyArray_DATA(bandwidth_scale_factor),
+            IhcLowPass_cutoff,
+            IhcLowPass_order)
+
+    def __dealloc__(self):
+        if self.bank != NULL:
+            IHCANBankFree(self.bank)
+
+    def run(self, np.ndarray[np.float64_t, ndim=1] signal):
+        """
+        Advance the IHC model by one block of the input waveform.
+
+        Args
+        ----
+        signal (np.float64 array): next block of the input acoustic waveform in units of Pa
+
+        Returns
+        -------
+        ihcout (np.ndarray): IHC membrane potentials (in volts) of the block with shape [num_cf, time]
+        """
+        if not signal.flags['C_CONTIGUOUS']:
+            signal = signal.copy(order='C')
+        ihcout = np.zeros([self.num_cf, len(signal)], dtype=self.dtype)
+        cdef int nsamp = len(signal)
+        cdef double *signal_data = <double *>np.PyArray_DATA(signal)
+        cdef double *ihcout_data = NULL
+        cdef float *ihcoutf_data = NULL
+        if self.dtype == np.float32:
+            ihcoutf_data = <float *>np.PyArray_DATA(ihcout)
+        else:
+            ihcout_data = <double *>np.PyArray_DATA(ihcout)
+        with nogil:
+            IHCANBankRun(self.bank, signal_data, nsamp, ihcout_data, ihcoutf_data)
+        return ihcout
+
+
+# fGn of the streaming synapse model is generated in independent segments of this
+# many samples (1 s at the 10 kHz sampling rate of the synapse)
+STREAM_NOISE_SEGMENT = 10000
+# Spacing of the fGn segments in the normal streams (a segment draws 2 * 32 normals per stream)
+STREAM_NOISE_STRIDE = 2**10
+
+
+cdef class ANFStream:
     """
-    Wrapper for util_bez2018.ffGn
+    Streaming version of `run_anf` for one CF: the synapse models and spike generators
+    of all spontaneous rates and spike trains are run on consecutive blocks of the IHC
+    potential, carrying the power-law adaptation and redocking/refractory states across
+    block boundaries. Unlike `run_anf`, the decimation filter of the synapse model is
+    causal (identical to the batch model away from the stimulus edges), the fGn is drawn
+    in independent segments of `STREAM_NOISE_SEGMENT` samples, and the "actual" power-law
+    implementation (implnt=1, which needs the whole history) is not supported. The output
+    does not depend on how the input is split into blocks.
     """
-    a = util_bez2018.ffGn(N, tdres, Hinput, noiseType, mu)
-    # Ensure array is C contiguous
-    if not a.flags['C_CONTIGUOUS']:
-        a = a.copy(order='C')
-    # Copy data to output array
-    cdef double *ptr = <double *>np.PyArray_DATA(a)
-    cdef double *out_ptr = <double *>malloc(len(a)*sizeof(double))
-    memcpy(out_ptr, ptr, len(a)*sizeof(double))
-    return out_ptr
+    cdef SPIKETRAINSTREAM **streams
+    cdef readonly int num_spont, num_runs, num_spike_trains, max_spikes_per_train, cf_idx
+    cdef readonly double fs, cf, noiseType
+    cdef readonly unsigned long long random_seed
+    cdef readonly long num_samples
+    cdef readonly bint flushed
+    cdef object list_spont, noise
+    cdef int noise_segment
+
+    def __cinit__(self,
+                  double fs,
+                  double cf,
+                  double noiseType=1.,
+                  double implnt=0.,
+                  double pla_tol=1e-6,
+                  list_spont=np.array([70.]),
+                  double tabs=0.6e-3,
+                  double trel=0.6e-3,
+                  double synapseMode=0.,
+                  int max_spikes_per_train=1000,
+                  int num_spike_trains=1,
+                  unsigned long long random_seed=0,
+                  int cf_idx=0):
+        """
+        Args
+        ----
+        implnt (float): set to 0 for "approx" or 2 for "fast actual" power-law function implementation
+        max_spikes_per_train (int): max array size for the spike times of one block
+        All other arguments are as defined in `run_anf`
+        """
+        check_pla_tol(pla_tol)
+        if implnt not in [0, 2]:
+            raise ValueError("streaming synapse model requires implnt=0 or implnt=2")
+        self.list_spont = np.ascontiguousarray(list_spont, dtype=np.float64).reshape([-1])
+        self.num_spont = self.list_spont.shape[0]
+        self.num_runs = num_spike_trains if synapseMode == 1 else 1
+        self.num_spike_trains = num_spike_trains
+        self.max_spikes_per_train = max_spikes_per_train
+        self.fs = fs
+        self.cf = cf
+        self.noiseType = noiseType
+        self.random_seed = random_seed
+        self.cf_idx = cf_idx
+        self.noise = np.zeros([self.num_spont * self.num_runs, 0])
+        self.noise_segment = 0
+        cdef np.ndarray[np.float64_t, ndim=1] decim_taps = get_decimate_taps(ResampFactor(1.0/fs, 10e3))
+        self.streams = <SPIKETRAINSTREAM **>malloc(self.num_spont * sizeof(SPIKETRAINSTREAM *))
+        cdef int spont_idx
+        for spont_idx in range(self.num_spont):
+            self.streams[spont_idx] = SpikeTrainsStreamNew(
+                cf,
+                1.0/fs,
+                implnt,
+                pla_tol,
+                self.list_spont[spont_idx],
+                tabs,
+                trel,
+                synapseMode,
+                num_spike_trains,
+                random_seed,
+                cf_idx,
+                spont_idx,
+                <double *>np.PyArray_DATA(decim_taps))
+
+    def __dealloc__(self):
+        cdef int spont_idx
+        if self.streams != NULL:
+            for spont_idx in range(self.num_spont):
+                SpikeTrainsStreamFree(self.streams[spont_idx])
+            free(self.streams)
+
+    def _next_noise(self, int noise_len):
+        """
+        Return the next `noise_len` fGn samples of every synapse model run [spont * runs, noise_len].
+        """
+        cdef double sampFreq = 10e3 # sampling frequency used in the synapse
+        K = self.num_spont * self.num_runs
+        while self.noise.shape[1] < noise_len:
+            if self.noiseType == 0:
+                segment = np.zeros([K, STREAM_NOISE_SEGMENT])
+            else:
+                # Segment s draws the normals from s * STREAM_NOISE_STRIDE on of every stream
+                rng = PhiloxNormals(
+                    self.random_seed,
+                    self.cf_idx,
+                    range(self.num_spont),
+                    self.num_runs,
+                    offset=self.noise_segment * STREAM_NOISE_STRIDE)
+                segment = util_bez2018.ffGn_batch(
+                    K,
+                    STREAM_NOISE_SEGMENT,
+                    1/sampFreq,
+                    0.9, # Hurst index
+                    self.noiseType,
+                    np.repeat(self.list_spont, self.num_runs),
+                    rng=rng)
+            self.noise = np.concatenate([self.noise, segment], axis=1)
+            self.noise_segment += 1
+        noise = np.ascontiguousarray(self.noise[:, :noise_len])
+        self.noise = self.noise[:, noise_len:]
+        return noise
+
+    def run(self, np.ndarray vihc, bint flush=False):
+        """
+        Advance the synapse models and spike generators by one block of the IHC potential.
+
+        Args
+        ----
+        vihc (np.float64 or np.float32 array): next block of the IHC membrane potential (in volts);
+            the streaming synapse model always runs in double precision (its buffers only
+            span one block)
+        flush (bool): if True, the input ends with this block and all pending output is processed
+
+        Returns
+        -------
+        output_dict (dict): dictionary of all output variables
+            'list_spike_times': spike times in s from the stimulus onset (zero-padded) of the
+                block [num_spike_trains, spont, max_spikes_per_train]
+            'num_samples': number of synapse output samples processed in this block (lags
+                the input by a few samples until the stream is flushed)
+        """
+        assert not self.flushed, "stream has already been flushed"
+        assert vihc.ndim == 1, "vihc must be a one-dimensional array"
+        if vihc.dtype != np.float32:
+            vihc = vihc.astype(np.float64, copy=False)
+        if not vihc.flags['C_CONTIGUOUS']:
+            vihc = vihc.copy(order='C')
+        cdef double *vihc_data = NULL
+        cdef float *vihcf_data = NULL
+        if vihc.dtype == np.float32:
+            vihcf_data = <float *>np.PyArray_DATA(vihc)
+        else:
+            vihc_data = <double *>np.PyArray_DATA(vihc)
+        cdef int nsamp = len(vihc)
+        cdef int noise_len = SpikeTrainsStreamNoiseLength(self.streams[0], nsamp, flush)
+        cdef np.ndarray[np.float64_t, ndim=2] noise = self._next_noise(noise_len)
+        cdef np.ndarray[np.float64_t, ndim=3] spike_times = np.zeros(
+            [self.num_spike_trains, self.num_spont, self.max_spikes_per_train])
+        cdef double *noise_data = <double *>np.PyArray_DATA(noise)
+        cdef double *spike_times_data = <double *>np.PyArray_DATA(spike_times)
+        cdef int num_spont = self.num_spont, num_runs = self.num_runs
+        cdef long max_spikes = self.max_spikes_per_train
+        cdef int spont_idx
+        cdef long status = 0
+        with nogil:
+            for spont_idx in range(num_spont):
+                status = SpikeTrainsStreamRun(
+                    self.streams[spont_idx],
+                    vihc_data,
+                    vihcf_data,
+                    nsamp,
+                    flush,
+                    max_spikes,
+                    num_spont * max_spikes,
+                    noise_data + <long>spont_idx * num_runs * noise_len,
+                    noise_len,
+                    spike_times_data + <long>spont_idx * max_spikes)
+                if status < 0:
+                    break
+        if status < 0:
+            raise ValueError("`ANFStream.run` failed due to insufficient max_spikes_per_train")
+        self.num_samples += status
+        self.flushed = flush
+        output_dict = {
+            'list_spike_times': spike_times,
+            'num_samples': status,
+        }
+        return output_dict
+
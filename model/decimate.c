@@ -0,0 +1,71 @@
+/* Zero-phase FIR decimator used to downsample the input to the power-law adaptation.
+ *
+ * NOTE: added to replace the `scipy.signal.filtfilt` callback in the synapse model
+ */
+
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+
+#include "decimate.h"
+
+#define DECIMATE_PI 3.14159265358979323846
+
+#ifndef __min
+#define __min(a,b) (((a) < (b))? (a): (b))
+#endif
+
+
+
+/* Decimation factor from the model sampling rate (1/tdres) down to sampFreq */
+int ResampFactor(double tdres, double sampFreq)
+{
+    return (int) ceil(1/(tdres*sampFreq));
+}
+
+
+
+/* Lowpass FIR taps (q+1 Hamming-windowed sinc, cutoff at 1/q of Nyquist, unit DC gain):
+ * same as scipy.signal.firwin(q+1, 1./q, window='hamming') */
+void DecimateTaps(int q, double *b)
+{
+    int    n, ntaps = q+1;
+    double alpha = 0.5*(ntaps-1);
+    double cutoff = 1.0/q;
+    double m, x, sum;
+
+    sum = 0;
+    for (n=0; n<ntaps; n++)
+    {
+        m = n-alpha;
+        x = DECIMATE_PI*cutoff*m;
+        b[n] = (m==0) ? cutoff : cutoff*sin(x)/x;
+        b[n] = b[n]*(0.54 + 0.46*cos(-DECIMATE_PI + n*(2*DECIMATE_PI/(ntaps-1))));
+        sum = sum + b[n];
+    }
+    for (n=0; n<ntaps; n++)
+        b[n] = b[n]/sum;
+}
+
+
+
+/* Number of samples returned by Decimate for an input of k samples */
+int DecimateLength(int k, int q)
+{
+    return (k+q-1)/q;
+}
+
+
+
+/* Decimate (double) and DecimateF (single precision) */
+#define REAL double
+#define REAL_FN(name) name
+#include "decimate_real.h"
+#undef REAL
+#undef REAL_FN
+
+#define REAL float
+#define REAL_FN(name) name##F
+#include "decimate_real.h"
+#undef REAL
+#undef REAL_FN
@@ -0,0 +1,16 @@
+/* Zero-phase FIR decimator used to downsample the input to the power-law adaptation.
+ *
+ * Equivalent to scipy.signal.filtfilt(scipy.signal.firwin(q+1, 1/q, window='hamming'), [1], x)[::q]
+ * (odd extension of 3*(q+1) samples at each end, steady-state initial conditions).
+ * Taps only depend on the decimation factor and are computed once by the caller.
+ */
+
+int ResampFactor(double tdres, double sampFreq);
+
+void DecimateTaps(int q, double *b);
+
+int DecimateLength(int k, int q);
+
+double *Decimate(int k, const double *signal, int q, const double *b);
+
+float *DecimateF(int k, const float *signal, int q, const double *b);
@@ -0,0 +1,69 @@
+/* Type-generic part of the decimator (see decimate.c).
+ *
+ * Included by decimate.c once with REAL defined as double and once as float; REAL_FN(name) gives the
+ * name of the function for that type (Decimate and DecimateF). The filter delays and accumulators are
+ * double in both cases, the signal buffers have type REAL.
+ */
+
+
+
+/* Forward-backward filter signal (k samples) with the q+1 taps in b and keep every q-th sample.
+ * Returns a malloc'd array of DecimateLength(k, q) samples (NULL if k <= 3*(q+1)). */
+REAL *REAL_FN(Decimate)(int k, const REAL *signal, int q, const double *b)
+{
+    int    padlen = 3*(q+1); /* scipy.signal.filtfilt default for an FIR filter */
+    int    n = k+2*padlen;
+    int    nout = DecimateLength(k, q);
+    int    i, j, t, jmax;
+    double acc;
+    double *zi;
+    REAL   *ext, *fwd, *out;
+
+    if (k<=padlen) return NULL;
+
+    ext = (REAL*)malloc(n*sizeof(REAL));
+    fwd = (REAL*)malloc(n*sizeof(REAL));
+    zi = (double*)malloc(q*sizeof(double));
+    out = (REAL*)malloc(nout*sizeof(REAL));
+
+    /* Odd extension of the signal at both ends */
+    for (i=0; i<padlen; i++)
+    {
+        ext[i] = 2*signal[0]-signal[padlen-i];
+        ext[padlen+k+i] = 2*signal[k-1]-signal[k-2-i];
+    }
+    memcpy(ext+padlen, signal, k*sizeof(REAL));
+
+    /* Steady-state filter delays for a unit step input (scipy.signal.lfilter_zi) */
+    zi[q-1] = b[q];
+    for (i=q-2; i>=0; i--)
+        zi[i] = b[i+1]+zi[i+1];
+
+    /* Forward pass over the full extended signal */
+    for (i=0; i<n; i++)
+    {
+        acc = 0;
+        jmax = __min(i, q);
+        for (j=0; j<=jmax; j++)
+            acc += b[j]*ext[i-j];
+        if (i<q) acc += zi[i]*ext[0];
+        fwd[i] = acc;
+    }
+
+    /* Backward pass, only evaluated at the retained (decimated) samples */
+    for (i=0; i<nout; i++)
+    {
+        t = padlen+i*q;
+        acc = 0;
+        jmax = __min(n-1-t, q);
+        for (j=0; j<=jmax; j++)
+            acc += b[j]*fwd[t+j];
+        if (n-1-t<q) acc += zi[n-1-t]*fwd[n-1];
+        out[i] = acc;
+    }
+
+    free(ext);
+    free(fwd);
+    free(zi);
+    return out;
+}
@@ -19,8 +19,6 @@
  * (based on https://github.com/mrkrd/cochlea/blob/master/cochlea/zilany2014)
  */
 
-#include "Python.h"
-
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
@@ -42,6 +40,50 @@
 #define __min(a,b) (((a) < (b))? (a): (b))
 #endif
 
+/* Filter histories (previously static variables, now owned by the caller so that
+ * several channels can be run concurrently in one process) */
+typedef struct {
+    double gain_norm, initphase;
+    double input[12][4], output[12][4];
+} CHIRPSTATE;
+
+typedef struct {
+    double phase;
+    COMPLEX gtf[4], gtfl[4];
+} WBSTATE;
+
+typedef struct {
+    double y[8], yl[8];
+} LOWPASSSTATE;
+
+/* Middle-ear filter state (three second-order sections), carried across calls to MiddleEarRun */
+typedef struct {
+    int    species;
+    long   n; /* number of samples filtered so far */
+    double m11, m12, m13, m14, m15, m16, m21, m22, m23, m24, m25, m26, m31, m32, m33, m34, m35, m36, megainmax;
+    double px[2], mey1[2], mey2[2], mey3[2]; /* previous inputs/outputs: [0] = n-1, [1] = n-2 */
+} MESTATE;
+
+/* State of the IHC filterbank between calls to IHCANBankRun. Per-channel parameters and filter
+ * states are stored as structure-of-arrays (state[tap*ncf + channel]) in a single allocation. */
+typedef struct IHCBANK {
+    int    ncf, species, ihcorder, ringlen, delaylen;
+    long   n; /* number of samples processed so far */
+    double tdres, ohc_c1LP, ohc_c2LP, ihc_c1LP, ihc_c2LP;
+    double *mem;
+    double *cf, *cohc, *cihc;
+    double *centerfreq, *bmTaumin, *bmTaumax, *ratiobm, *TauWBMax, *TauWBMin, *tauwb, *wbgain, *lasttmpgain;
+    double *wbphase, *wbdelta, *wbr, *wbi, *wblr, *wbli;
+    double *ohc, *ohcl, *ihc, *ihcl;
+    double *c1sigma0, *c1ipw, *c1ipb, *c1rpa, *c1fs, *c1CF, *c1initphase, *c1norm_gain, *c1in, *c1out;
+    double *c2k1, *c2k2, *c2k3, *c2B, *c2D, *c2temp, *c2norm_gain, *c2in, *c2out;
+    double *rsigma, *c1filterout, *c2filterout;
+    double *tmpgain;   /* ring buffer of the delayed wideband filter gains (ringlen per channel) */
+    double *delayline; /* ring buffer applying the total path delay to the IHC output (delaylen per channel) */
+    int    *delaypoint;
+    MESTATE me;
+} IHCBANK;
+
 
 
 void IHCAN(double *px,
@@ -58,9 +100,7 @@ void IHCAN(double *px,
            double *ihcout)
 {
     /* Variables for middle-ear model */
-    double megainmax;
-    double *mey1, *mey2, *mey3, meout, c1filterouttmp, c2filterouttmp, c1vihctmp, c2vihctmp;
-    double fp, C, m11, m12, m13, m14, m15, m16, m21, m22, m23, m24, m25, m26, m31, m32, m33, m34, m35, m36;
+    double *meoutbuf, meout, c1filterouttmp, c2filterouttmp, c1vihctmp, c2vihctmp;
 
     /* Variables for the signal-path, control-path and onward */
     double *ihcouttmp, *tmpgain;
@@ -70,10 +110,15 @@ void IHCAN(double *px,
     int    i, n, delaypoint, grdelay[1], bmorder, wborder;
     double wbout1, wbout, ohcnonlinout, ohcout, tmptauc1, tauc1, rsigma, wb_gain;
 
+    /* Filter states (initialized by the filters at n==0) */
+    CHIRPSTATE c1state, c2state;
+    WBSTATE wbstate;
+    LOWPASSSTATE ohcstate, ihcstate;
+
     /* Declarations of the functions used in the program */
-    double C1ChirpFilt(double, double,double, int, double, double);
-    double C2ChirpFilt(double, double,double, int, double, double);
-    double WbGammaTone(double, double, double, int, double, double, int);
+    double C1ChirpFilt(double, double,double, int, double, double, CHIRPSTATE *);
+    double C2ChirpFilt(double, double,double, int, double, double, CHIRPSTATE *);
+    double WbGammaTone(double, double, double, int, double, double, int, WBSTATE *);
 
     double Get_tauwb(double, int, double, int, double *, double *);
     double Get_taubm(double, int, double, double *, double *, double *);
@@ -81,19 +126,19 @@ void IHCAN(double *px,
     double delay_cat(double cf);
     double delay_human(double cf);
 
-    double OhcLowPass(double, double, double, int, double, int);
-    double IhcLowPass(double, double, double, int, double, int);
+    double OhcLowPass(double, double, double, int, double, int, LOWPASSSTATE *);
+    double IhcLowPass(double, double, double, int, double, int, LOWPASSSTATE *);
     double Boltzman(double, double, double, double, double);
     double NLafterohc(double, double, double, double);
     double ControlSignal(double, double, double, double, double);
 
     double NLogarithm(double, double, double, double);
 
+    void MiddleEar(double *, double, int, int, double *);
+
     /* Allocate dynamic memory for the temporary variables */
     ihcouttmp = (double*)calloc(totalstim*nrep, sizeof(double));
-    mey1 = (double*)calloc(totalstim, sizeof(double));
-    mey2 = (double*)calloc(totalstim, sizeof(double));
-    mey3 = (double*)calloc(totalstim, sizeof(double));
+    meoutbuf = (double*)calloc(totalstim, sizeof(double));
     tmpgain = (double*)calloc(totalstim, sizeof(double));
 
     /* Calculate the center frequency for the control-path wideband filter
@@ -138,90 +183,20 @@ void IHCAN(double *px,
     ohcasym = 7.0;
     ihcasym = 3.0;
 
-    /* Prewarping and related constants for the middle ear */
-    fp = 1e3; /* Prewarping frequency 1 kHz */
-    C = TWOPI*fp/tan(TWOPI/2*fp*tdres);
-    if (species==1) /* for cat */
-    {
-        /* Cat middle-ear filter - simplified version from Bruce et al. (JASA 2003) */
-        m11 = C/(C + 693.48);
-        m12 = (693.48 - C)/C;
-        m13 = 0.0;
-        m14 = 1.0;
-        m15 = -1.0;
-        m16 = 0.0;
-        m21 = 1/(pow(C,2) + 11053*C + 1.163e8);
-        m22 = -2*pow(C,2) + 2.326e8;
-        m23 = pow(C,2) - 11053*C + 1.163e8;
-        m24 = pow(C,2) + 1356.3*C + 7.4417e8;
-        m25 = -2*pow(C,2) + 14.8834e8;
-        m26 = pow(C,2) - 1356.3*C + 7.4417e8;
-        m31 = 1/(pow(C,2) + 4620*C + 909059944);
-        m32 = -2*pow(C,2) + 2*909059944;
-        m33 = pow(C,2) - 4620*C + 909059944;
-        m34 = 5.7585e5*C + 7.1665e7;
-        m35 = 14.333e7;
-        m36 = 7.1665e7 - 5.7585e5*C;
-        megainmax=41.1405;
-    };
-    if (species>1) /* for human */
-    {
-        /* Human middle-ear filter - based on Pascal et al. (JASA 1998) */
-        m11 = 1/(pow(C,2)+5.9761e+003*C+2.5255e+007);
-        m12 = (-2*pow(C,2)+2*2.5255e+007);
-        m13 = (pow(C,2)-5.9761e+003*C+2.5255e+007);
-        m14 = (pow(C,2)+5.6665e+003*C);
-        m15 = -2*pow(C,2);
-        m16 = (pow(C,2)-5.6665e+003*C);
-        m21 = 1/(pow(C,2)+6.4255e+003*C+1.3975e+008);
-        m22 = (-2*pow(C,2)+2*1.3975e+008);
-        m23 = (pow(C,2)-6.4255e+003*C+1.3975e+008);
-        m24 = (pow(C,2)+5.8934e+003*C+1.7926e+008);
-        m25 = (-2*pow(C,2)+2*1.7926e+008);
-        m26 = (pow(C,2)-5.8934e+003*C+1.7926e+008);
-        m31 = 1/(pow(C,2)+2.4891e+004*C+1.2700e+009);
-        m32 = (-2*pow(C,2)+2*1.2700e+009);
-        m33 = (pow(C,2)-2.4891e+004*C+1.2700e+009);
-        m34 = (3.1137e+003*C+6.9768e+008);
-        m35 = 2*6.9768e+008;
-        m36 = (-3.1137e+003*C+6.9768e+008);
-        megainmax = 2;
-    };
+    /* ====== Middle-ear filter (independent of CF) ====== */
+    MiddleEar(px, tdres, totalstim, species, meoutbuf);
 
     for (n=0; n<totalstim; n++) /* Start of the loop */
     {
-        if (n==0) /* Start of the middle-ear filtering section */
-        {
-            mey1[0] = m11*px[0];
-            if (species>1) mey1[0] = m11*m14*px[0];
-            mey2[0] = mey1[0]*m24*m21;
-            mey3[0] = mey2[0]*m34*m31;
-            meout = mey3[0]/megainmax;
-        }
-        else if (n==1)
-        {
-            mey1[1] = m11*(-m12*mey1[0] + px[1] - px[0]);
-            if (species>1) mey1[1] = m11*(-m12*mey1[0]+m14*px[1]+m15*px[0]);
-            mey2[1] = m21*(-m22*mey2[0] + m24*mey1[1] + m25*mey1[0]);
-            mey3[1] = m31*(-m32*mey3[0] + m34*mey2[1] + m35*mey2[0]);
-            meout = mey3[1]/megainmax;
-        }
-        else
-        {
-            mey1[n] = m11*(-m12*mey1[n-1] + px[n] - px[n-1]);
-            if (species>1) mey1[n]= m11*(-m12*mey1[n-1]-m13*mey1[n-2]+m14*px[n]+m15*px[n-1]+m16*px[n-2]);
-            mey2[n] = m21*(-m22*mey2[n-1] - m23*mey2[n-2] + m24*mey1[n] + m25*mey1[n-1] + m26*mey1[n-2]);
-            mey3[n] = m31*(-m32*mey3[n-1] - m33*mey3[n-2] + m34*mey2[n] + m35*mey2[n-1] + m36*mey2[n-2]);
-            meout = mey3[n]/megainmax;
-        }; /* End of the middle-ear filtering section */
+        meout = meoutbuf[n];
 
         /* ====== Control-path filter ====== */
 
-        wbout1 = WbGammaTone(meout,tdres,centerfreq,n,tauwb,wbgain,wborder);
+        wbout1 = WbGammaTone(meout,tdres,centerfreq,n,tauwb,wbgain,wborder,&wbstate);
         wbout = pow((tauwb/TauWBMax),wborder)*wbout1*10e3*__max(1,cf/5e3);
 
         ohcnonlinout = Boltzman(wbout,ohcasym,12.0,5.0,5.0); /* pass the control signal through OHC Nonlinear Function */
-        ohcout = OhcLowPass(ohcnonlinout,tdres,600,n,1.0,2);/* lowpass filtering after the OHC nonlinearity */
+        ohcout = OhcLowPass(ohcnonlinout,tdres,600,n,1.0,2,&ohcstate);/* lowpass filtering after the OHC nonlinearity */
 
         tmptauc1 = NLafterohc(ohcout,bmTaumin[0],bmTaumax[0],ohcasym); /* nonlinear function after OHC low-pass filter */
         tauc1 = cohc*(tmptauc1-bmTaumin[0])+bmTaumin[0]; /* time-constant for the signal-path C1 filter */
@@ -245,15 +220,15 @@ void IHCAN(double *px,
         lasttmpgain = wbgain;
 
         /* ====== Signal-path C1 filter ====== */
-         c1filterouttmp = C1ChirpFilt(meout, tdres, cf, n, bmTaumax[0], rsigma); /* C1 filter output */
+         c1filterouttmp = C1ChirpFilt(meout, tdres, cf, n, bmTaumax[0], rsigma, &c1state); /* C1 filter output */
 
         /*====== Parallel-path C2 filter ======*/
-         c2filterouttmp = C2ChirpFilt(meout, tdres, cf, n, bmTaumax[0], 1/ratiobm[0]); /* parallel-filter output*/
+         c2filterouttmp = C2ChirpFilt(meout, tdres, cf, n, bmTaumax[0], 1/ratiobm[0], &c2state); /* parallel-filter output*/
 
         /*=== Run the inner hair cell (IHC) section: NL function and then lowpass filtering ===*/
         c1vihctmp = NLogarithm(cihc*c1filterouttmp,0.1,ihcasym,cf);
         c2vihctmp = -NLogarithm(c2filterouttmp*fabs(c2filterouttmp)*cf/10*cf/2e3,0.2,1.0,cf); /* C2 transduction output */
-        ihcouttmp[n] = IhcLowPass(c1vihctmp+c2vihctmp,tdres,IhcLowPass_cutoff,n,1.0,IhcLowPass_order);
+        ihcouttmp[n] = IhcLowPass(c1vihctmp+c2vihctmp,tdres,IhcLowPass_cutoff,n,1.0,IhcLowPass_order,&ihcstate);
     }; /* End of the loop */
 
     /* Stretched out the IHC output according to nrep (number of repetitions) */
@@ -280,12 +255,531 @@ void IHCAN(double *px,
 
     /* Freeing dynamic memory allocated earlier */
     free(ihcouttmp);
-    free(mey1); free(mey2); free(mey3);
+    free(meoutbuf);
     free(tmpgain);
 } /* End of the IHCAN function */
 
 
 
+/* Run the IHC model for a bank of ncf CF channels on the same input (nrep = 1).
+ * The middle-ear filter is run once and all channels are advanced together in a single time loop.
+ * Per-channel filter states are stored as structure-of-arrays (state[tap*ncf + channel]) so the inner
+ * loops over channels access contiguous memory (the linear filter sections vectorize). The output is
+ * identical to calling IHCAN once per channel; ihcout is a zero-initialized [ncf, totalstim] array.
+ * If ihcoutf is not NULL, the output is stored in single precision in ihcoutf instead of ihcout
+ * (the filters are always run in double precision). */
+void IHCANBank(double *px,
+               int ncf,
+               const double *cf,
+               double tdres,
+               int totalstim,
+               const double *cohc,
+               const double *cihc,
+               int species,
+               const double *bandwidth_scale_factor,
+               double IhcLowPass_cutoff,
+               double IhcLowPass_order,
+               double *ihcout,
+               float *ihcoutf)
+{
+    IHCBANK *bank;
+
+    IHCBANK *IHCANBankInit(int, const double *, double, const double *, const double *, int, const double *, double, double);
+    void IHCANBankRun(IHCBANK *, const double *, int, double *, float *);
+    void IHCANBankFree(IHCBANK *);
+
+    bank = IHCANBankInit(ncf, cf, tdres, cohc, cihc, species, bandwidth_scale_factor,
+                         IhcLowPass_cutoff, IhcLowPass_order);
+    IHCANBankRun(bank, px, totalstim, ihcout, ihcoutf);
+    IHCANBankFree(bank);
+} /* End of the IHCANBank function */
+
+
+
+/* Allocate and initialize the state of an IHC filterbank (see IHCANBank). The model is then run
+ * on consecutive blocks of the input with IHCANBankRun; the output of a sequence of blocks is
+ * identical to running IHCANBank on the concatenated input. */
+IHCBANK *IHCANBankInit(int ncf,
+                       const double *cf,
+                       double tdres,
+                       const double *cohc,
+                       const double *cihc,
+                       int species,
+                       const double *bandwidth_scale_factor,
+                       double IhcLowPass_cutoff,
+                       double IhcLowPass_order)
+{
+    IHCBANK *b;
+    double *mem;
+    double *centerfreq, *bmTaumin, *bmTaumax, *ratiobm, *TauWBMax, *TauWBMin, *tauwb, *wbgain;
+    double *c1sigma0, *c1ipw, *c1ipb, *c1rpa, *c1fs, *c1CF, *c1initphase, *c1norm_gain;
+    double *c2k1, *c2k2, *c2k3, *c2B, *c2D, *c2temp, *c2norm_gain;
+    int    *delaypoint;
+    int    nstate, maxdelaypoint;
+
+    double bmplace, Taumin[1], Taumax[1], bmTaumaxc[1], bmTauminc[1], ratiobmc[1], bmTaubm;
+    double sigma0, ipw, ipb, rpa, pzero, rzero, fs_bilinear, CF, initphase, gain_norm, phase, preal, pimg;
+    double pr[6], pi[6], theta, maxdelay, dtmp;
+    int    c, i, j, r, grdelay[1];
+    int    pole[6] = {0, 1, 3, 5, 1, 5}; /* pole used by each of the 5 sections (p7 = p1, p9 = p5) */
+
+    double Get_tauwb(double, int, double, int, double *, double *);
+    double Get_taubm(double, int, double, double *, double *, double *);
+    double gain_groupdelay(double, double, double, double, int *);
+    double delay_cat(double cf);
+    void MiddleEarInit(MESTATE *, double, int);
+
+    b = (IHCBANK*)calloc(1, sizeof(IHCBANK));
+    b->ncf = ncf;
+    b->species = species;
+    b->tdres = tdres;
+    b->ihcorder = (int) IhcLowPass_order;
+    MiddleEarInit(&b->me, tdres, species);
+
+    /* ====== Allocate per-channel parameters and states ====== */
+    nstate = 3 + 9 + 2 + 4*4 + 2*3 + 2*8 + 8 + 2*7*3 + 2*6*2 + 6*6 + 1 + 3;
+    mem = b->mem = (double*)calloc((long)nstate*ncf, sizeof(double));
+    b->cf = mem; b->cohc = b->cf+ncf; b->cihc = b->cohc+ncf;
+    centerfreq = b->centerfreq = b->cihc+ncf; bmTaumin = b->bmTaumin = centerfreq+ncf;
+    bmTaumax = b->bmTaumax = bmTaumin+ncf; ratiobm = b->ratiobm = bmTaumax+ncf;
+    TauWBMax = b->TauWBMax = ratiobm+ncf; TauWBMin = b->TauWBMin = TauWBMax+ncf;
+    tauwb = b->tauwb = TauWBMin+ncf; wbgain = b->wbgain = tauwb+ncf; b->lasttmpgain = wbgain+ncf;
+    b->wbphase = b->lasttmpgain+ncf; b->wbdelta = b->wbphase+ncf;
+    b->wbr = b->wbdelta+ncf; b->wbi = b->wbr+4*ncf; b->wblr = b->wbi+4*ncf; b->wbli = b->wblr+4*ncf;
+    b->ohc = b->wbli+4*ncf; b->ohcl = b->ohc+3*ncf; b->ihc = b->ohcl+3*ncf; b->ihcl = b->ihc+8*ncf;
+    c1sigma0 = b->c1sigma0 = b->ihcl+8*ncf; c1ipw = b->c1ipw = c1sigma0+ncf;
+    c1ipb = b->c1ipb = c1ipw+ncf; c1rpa = b->c1rpa = c1ipb+ncf;
+    c1fs = b->c1fs = c1rpa+ncf; c1CF = b->c1CF = c1fs+ncf;
+    c1initphase = b->c1initphase = c1CF+ncf; c1norm_gain = b->c1norm_gain = c1initphase+ncf;
+    b->c1in = c1norm_gain+ncf; b->c2in = b->c1in+7*3*ncf; b->c1out = b->c2in+7*3*ncf; b->c2out = b->c1out+6*2*ncf;
+    c2k1 = b->c2k1 = b->c2out+6*2*ncf; c2k2 = b->c2k2 = c2k1+6*ncf; c2k3 = b->c2k3 = c2k2+6*ncf;
+    c2B = b->c2B = c2k3+6*ncf; c2D = b->c2D = c2B+6*ncf;
+    c2temp = b->c2temp = c2D+6*ncf; c2norm_gain = b->c2norm_gain = c2temp+6*ncf;
+    b->rsigma = c2norm_gain+ncf; b->c1filterout = b->rsigma+ncf; b->c2filterout = b->c1filterout+ncf;
+    delaypoint = b->delaypoint = (int*)calloc(ncf, sizeof(int));
+
+    /* ====== Per-channel parameters (as in IHCAN and the n==0 sections of the filters) ====== */
+    maxdelay = 0;
+    maxdelaypoint = 0;
+    for (c=0; c<ncf; c++)
+    {
+        b->cf[c] = cf[c]; b->cohc[c] = cohc[c]; b->cihc[c] = cihc[c];
+        if (species==1) /* for cat */
+        {
+            bmplace = 11.9 * log10(0.80 + cf[c] / 456.0);
+            centerfreq[c] = 456.0*(pow(10,(bmplace+1.2)/11.9)-0.80);
+        }
+        if (species>1) /* for human */
+        {
+            bmplace = (35/2.1) * log10(1.0 + cf[c] / 165.4);
+            centerfreq[c] = 165.4*(pow(10,(bmplace+1.2)/(35/2.1))-1.0);
+        }
+        Get_tauwb(cf[c], species, bandwidth_scale_factor[c], 3, Taumax, Taumin);
+        Get_taubm(cf[c], species, Taumax[0], bmTaumaxc, bmTauminc, ratiobmc);
+        bmTaumax[c] = bmTaumaxc[0]; bmTaumin[c] = bmTauminc[0]; ratiobm[c] = ratiobmc[0];
+        bmTaubm = cohc[c]*(bmTaumax[c]-bmTaumin[c])+bmTaumin[c];
+        TauWBMax[c] = Taumin[0]+0.2*(Taumax[0]-Taumin[0]);
+        TauWBMin[c] = TauWBMax[c]/Taumax[0]*Taumin[0];
+        tauwb[c] = TauWBMax[c]+(bmTaubm-bmTaumax[c])*(TauWBMax[c]-TauWBMin[c])/(bmTaumax[c]-bmTaumin[c]);
+        wbgain[c] = gain_groupdelay(tdres, centerfreq[c], cf[c], tauwb[c], grdelay);
+        b->lasttmpgain[c] = wbgain[c];
+        b->wbdelta[c] = -TWOPI*centerfreq[c]*tdres;
+        delaypoint[c] = __max(0,(int) ceil(delay_cat(cf[c])/tdres));
+        maxdelaypoint = __max(maxdelaypoint, delaypoint[c]);
+
+        /* The group delay (in samples) of the one-pole wideband filter sections is bounded by
+         * 0.5 + 1/|sin(theta)|, theta = 2*pi*(centerfreq-cf)*tdres, and by its value at DC,
+         * TauWBMax/tdres (used to size the gain ring buffer) */
+        theta = fabs(sin(TWOPI*(centerfreq[c]-cf[c])*tdres));
+        dtmp = TauWBMax[c]/tdres;
+        maxdelay = __max(maxdelay, (theta > 0) ? __min(dtmp, 0.5 + 1/theta) : dtmp);
+
+        /* Signal-path C1 and parallel-path C2 filter poles/zeros (C1ChirpFilt, C2ChirpFilt) */
+        sigma0 = 1/bmTaumax[c];
+        ipw = 1.01*cf[c]*TWOPI-50;
+        ipb = 0.2343*TWOPI*cf[c]-1104;
+        rpa = pow(10, log10(cf[c])*0.9 + 0.55)+ 2000;
+        pzero = pow(10,log10(cf[c])*0.7+1.6)+500;
+        fs_bilinear = TWOPI*cf[c]/tan(TWOPI*cf[c]*tdres/2);
+        rzero = -pzero;
+        CF = TWOPI*cf[c];
+        c1sigma0[c] = sigma0; c1ipw[c] = ipw; c1ipb[c] = ipb; c1rpa[c] = rpa; c1fs[c] = fs_bilinear; c1CF[c] = CF;
+
+        pr[1] = -sigma0; pi[1] = ipw;
+        pr[5] = pr[1] - rpa; pi[5] = pi[1] - ipb;
+        pr[3] = (pr[1] + pr[5]) * 0.5; pi[3] = (pi[1] + pi[5]) * 0.5;
+        initphase = 0.0;
+        for (i=1; i<=5; i++)
+            initphase = initphase + atan(CF/(-rzero))-atan((CF-pi[pole[i]])/(-pr[pole[i]]))-atan((CF+pi[pole[i]])/(-pr[pole[i]]));
+        /* p[1..10] = {p1, conj(p1), p3, conj(p3), p5, conj(p5), p1, conj(p1), p5, conj(p5)} */
+        gain_norm = 1.0;
+        for (r=1; r<=10; r++)
+        {
+            j = pole[(r+1)/2];
+            gain_norm = gain_norm*(pow((CF - ((r%2) ? pi[j] : -pi[j])),2) + pr[j]*pr[j]);
+        }
+        c1initphase[c] = initphase; /* identical for C2 */
+        c1norm_gain[c] = sqrt(gain_norm)/pow(sqrt(CF*CF+rzero*rzero),5);
+        c2norm_gain[c] = c1norm_gain[c];
+
+        /* C2 is linear time-invariant: its poles and zero are fixed by fcohc = 1/ratiobm */
+        pr[1] = -sigma0*(1/ratiobm[c]);
+        if (pr[1]>0.0){ printf("The system becomes unstable.\n"); exit(-1); }
+        pi[1] = ipw;
+        pr[5] = pr[1] - rpa; pi[5] = pi[1] - ipb;
+        pr[3] = (pr[1] + pr[5]) * 0.5; pi[3] = (pi[1] + pi[5]) * 0.5;
+        phase = 0.0;
+        for (i=1; i<=5; i++)
+            phase = phase-atan((CF-pi[pole[i]])/(-pr[pole[i]]))-atan((CF+pi[pole[i]])/(-pr[pole[i]]));
+        rzero = -CF/tan((initphase-phase)/5);
+        if (rzero>0.0){ printf("The zeros are in the right-half plane.\n"); exit(-1); }
+        for (i=1; i<=5; i++)
+        {
+            preal = pr[pole[i]];
+            pimg = pi[pole[i]];
+            c2temp[i*ncf+c] = pow((fs_bilinear-preal),2)+ pow(pimg,2);
+            c2k1[i*ncf+c] = fs_bilinear-rzero;
+            c2k2[i*ncf+c] = 2*rzero;
+            c2k3[i*ncf+c] = fs_bilinear+rzero;
+            c2B[i*ncf+c] = fs_bilinear*fs_bilinear-preal*preal-pimg*pimg;
+            c2D[i*ncf+c] = (fs_bilinear+preal)*(fs_bilinear+preal)+pimg*pimg;
+        }
+    }
+    b->ringlen = (int) ceil(maxdelay)+2;
+    b->tmpgain = (double*)calloc((long)b->ringlen*ncf, sizeof(double));
+    for (c=0; c<ncf; c++) b->tmpgain[c] = wbgain[c];
+    b->delaylen = maxdelaypoint+1;
+    b->delayline = (double*)calloc((long)b->delaylen*ncf, sizeof(double));
+
+    dtmp = 2.0/tdres; /* OhcLowPass and IhcLowPass coefficients */
+    b->ohc_c1LP = ( dtmp - TWOPI*600 ) / ( dtmp + TWOPI*600 );
+    b->ohc_c2LP = TWOPI*600 / (TWOPI*600 + dtmp);
+    b->ihc_c1LP = ( dtmp - TWOPI*IhcLowPass_cutoff ) / ( dtmp + TWOPI*IhcLowPass_cutoff );
+    b->ihc_c2LP = TWOPI*IhcLowPass_cutoff / (TWOPI*IhcLowPass_cutoff + dtmp);
+    return b;
+} /* End of the IHCANBankInit function */
+
+
+
+/* Advance the IHC filterbank by nsamp samples of px. The delayed IHC output of the block is
+ * written to ihcout[c*nsamp + i] (or to ihcoutf in single precision if it is not NULL). */
+void IHCANBankRun(IHCBANK *b, const double *px, int nsamp, double *ihcout, float *ihcoutf)
+{
+    int    ncf = b->ncf, ringlen = b->ringlen, delaylen = b->delaylen, ihcorder = b->ihcorder;
+    double tdres = b->tdres;
+    double *cf = b->cf, *cohc = b->cohc, *cihc = b->cihc;
+    double *centerfreq = b->centerfreq, *bmTaumin = b->bmTaumin, *bmTaumax = b->bmTaumax;
+    double *TauWBMax = b->TauWBMax, *TauWBMin = b->TauWBMin, *tauwb = b->tauwb;
+    double *wbgain = b->wbgain, *lasttmpgain = b->lasttmpgain;
+    double *wbphase = b->wbphase, *wbdelta = b->wbdelta, *wbr = b->wbr, *wbi = b->wbi, *wblr = b->wblr, *wbli = b->wbli;
+    double *ohc = b->ohc, *ohcl = b->ohcl, *ihc = b->ihc, *ihcl = b->ihcl;
+    double *c1sigma0 = b->c1sigma0, *c1ipw = b->c1ipw, *c1ipb = b->c1ipb, *c1rpa = b->c1rpa, *c1fs = b->c1fs;
+    double *c1CF = b->c1CF, *c1initphase = b->c1initphase, *c1norm_gain = b->c1norm_gain, *c1in = b->c1in, *c1out = b->c1out;
+    double *c2k1 = b->c2k1, *c2k2 = b->c2k2, *c2k3 = b->c2k3, *c2B = b->c2B, *c2D = b->c2D, *c2temp = b->c2temp;
+    double *c2norm_gain = b->c2norm_gain, *c2in = b->c2in, *c2out = b->c2out;
+    double *rsigma = b->rsigma, *c1filterout = b->c1filterout, *c2filterout = b->c2filterout;
+    double *tmpgain = b->tmpgain, *delayline = b->delayline;
+    int    *delaypoint = b->delaypoint;
+    double ohc_c1LP = b->ohc_c1LP, ohc_c2LP = b->ohc_c2LP, ihc_c1LP = b->ihc_c1LP, ihc_c2LP = b->ihc_c2LP;
+
+    double *meout, me, ohcasym, ihcasym;
+    double rzero, fs_bilinear, CF, phase, preal, pimg, temp, dy, pr[6], pi[6];
+    double dtmp, c1LP, c2LP, wbout1, wbout, ohcnonlinout, ohcout;
+    double tmptauc1, tauc1, wb_gain, c1vihctmp, c2vihctmp;
+    long   n;
+    int    c, i, j, k, grd, grdelay[1], slot;
+    int    pole[6] = {0, 1, 3, 5, 1, 5}; /* pole used by each of the 5 sections (p7 = p1, p9 = p5) */
+
+    double gain_groupdelay(double, double, double, double, int *);
+    double Boltzman(double, double, double, double, double);
+    double NLafterohc(double, double, double, double);
+    double NLogarithm(double, double, double, double);
+    void MiddleEarRun(MESTATE *, const double *, int, double *);
+
+    ohcasym = 7.0; /* Nonlinear asymmetry of OHC function */
+    ihcasym = 3.0; /* Nonlinear asymmetry of IHC C1 transduction function */
+
+    /* ====== Middle-ear filter (run once for all CFs) ====== */
+    meout = (double*)calloc(__max(nsamp,1), sizeof(double));
+    MiddleEarRun(&b->me, px, nsamp, meout);
+
+    for (k=0; k<nsamp; k++) /* Start of the loop */
+    {
+        n = b->n + k;
+        me = meout[k];
+        slot = (int)(n%ringlen)*ncf;
+
+        /* ====== Control path (wideband filter, OHC nonlinearity and lowpass) ====== */
+        for (c=0; c<ncf; c++)
+        {
+            /* WbGammaTone */
+            wbphase[c] += wbdelta[c];
+            dtmp = tauwb[c]*2.0/tdres;
+            c1LP = (dtmp-1)/(dtmp+1);
+            c2LP = 1.0/(dtmp+1);
+            wbr[c] = me*cos(wbphase[c]);
+            wbi[c] = me*sin(wbphase[c]);
+            for (j=1; j<=3; j++)
+            {
+                wbr[j*ncf+c] = c2LP*wbgain[c]*(wbr[(j-1)*ncf+c]+wblr[(j-1)*ncf+c]) + c1LP*wblr[j*ncf+c];
+                wbi[j*ncf+c] = c2LP*wbgain[c]*(wbi[(j-1)*ncf+c]+wbli[(j-1)*ncf+c]) + c1LP*wbli[j*ncf+c];
+            }
+            wbout1 = (cos(-wbphase[c]) * wbr[3*ncf+c]) - (sin(-wbphase[c]) * wbi[3*ncf+c]);
+            for (j=0; j<=3; j++)
+            {
+                wblr[j*ncf+c] = wbr[j*ncf+c];
+                wbli[j*ncf+c] = wbi[j*ncf+c];
+            }
+            wbout = pow((tauwb[c]/TauWBMax[c]),3)*wbout1*10e3*__max(1,cf[c]/5e3);
+
+            ohcnonlinout = Boltzman(wbout,ohcasym,12.0,5.0,5.0);
+            /* OhcLowPass (order 2) */
+            ohc[c] = ohcnonlinout*1.0;
+            for (i=0; i<2; i++)
+                ohc[(i+1)*ncf+c] = ohc_c1LP*ohcl[(i+1)*ncf+c] + ohc_c2LP*(ohc[i*ncf+c]+ohcl[i*ncf+c]);
+            for (j=0; j<=2; j++)
+                ohcl[j*ncf+c] = ohc[j*ncf+c];
+            ohcout = ohc[2*ncf+c];
+
+            tmptauc1 = NLafterohc(ohcout,bmTaumin[c],bmTaumax[c],ohcasym);
+            tauc1 = cohc[c]*(tmptauc1-bmTaumin[c])+bmTaumin[c];
+            rsigma[c] = 1/tauc1-1/bmTaumax[c];
+            if (1/tauc1<0.0){ printf("The poles are in the right-half plane; system is unstable.\n"); exit(-1); }
+            tauwb[c] = TauWBMax[c]+(tauc1-bmTaumax[c])*(TauWBMax[c]-TauWBMin[c])/(bmTaumax[c]-bmTaumin[c]);
+            wb_gain = gain_groupdelay(tdres,centerfreq[c],cf[c],tauwb[c],grdelay);
+            grd = grdelay[0];
+            /* Negative delays refer to gains that have already been used (no effect) */
+            if (grd>=0)
+                tmpgain[((n+grd)%ringlen)*ncf+c] = wb_gain;
+            if (tmpgain[slot+c] == 0)
+                tmpgain[slot+c] = lasttmpgain[c];
+            wbgain[c] = tmpgain[slot+c];
+            lasttmpgain[c] = wbgain[c];
+            tmpgain[slot+c] = 0; /* free the slot for sample n+ringlen */
+        }
+
+        /* ====== Signal-path C1 filter (poles and zero move with rsigma) ====== */
+        for (c=0; c<ncf; c++)
+        {
+            CF = c1CF[c];
+            fs_bilinear = c1fs[c];
+            pr[1] = -c1sigma0[c] - rsigma[c];
+            if (pr[1]>0.0){ printf("The system becomes unstable.\n"); exit(-1); }
+            pi[1] = c1ipw[c];
+            pr[5] = pr[1] - c1rpa[c]; pi[5] = pi[1] - c1ipb[c];
+            pr[3] = (pr[1] + pr[5]) * 0.5; pi[3] = (pi[1] + pi[5]) * 0.5;
+            phase = 0.0;
+            for (i=1; i<=5; i++)
+                phase = phase-atan((CF-pi[pole[i]])/(-pr[pole[i]]))-atan((CF+pi[pole[i]])/(-pr[pole[i]]));
+            rzero = -CF/tan((c1initphase[c]-phase)/5);
+            if (rzero>0.0){ printf("The zeros are in the right-half plane.\n"); exit(-1); }
+
+            c1in[(1*3+2)*ncf+c] = c1in[(1*3+1)*ncf+c];
+            c1in[(1*3+1)*ncf+c] = c1in[(1*3+0)*ncf+c];
+            c1in[(1*3+0)*ncf+c] = me;
+            for (i=1; i<=5; i++)
+            {
+                preal = pr[pole[i]];
+                pimg = pi[pole[i]];
+                temp = pow((fs_bilinear-preal),2)+ pow(pimg,2);
+                dy = c1in[(i*3+0)*ncf+c]*(fs_bilinear-rzero) - 2*rzero*c1in[(i*3+1)*ncf+c] - (fs_bilinear+rzero)*c1in[(i*3+2)*ncf+c]
+                     + 2*c1out[(i*2+0)*ncf+c]*(fs_bilinear*fs_bilinear-preal*preal-pimg*pimg)
+                     - c1out[(i*2+1)*ncf+c]*((fs_bilinear+preal)*(fs_bilinear+preal)+pimg*pimg);
+                dy = dy/temp;
+                c1in[((i+1)*3+2)*ncf+c] = c1out[(i*2+1)*ncf+c];
+                c1in[((i+1)*3+1)*ncf+c] = c1out[(i*2+0)*ncf+c];
+                c1in[((i+1)*3+0)*ncf+c] = dy;
+                c1out[(i*2+1)*ncf+c] = c1out[(i*2+0)*ncf+c];
+                c1out[(i*2+0)*ncf+c] = dy;
+            }
+            c1filterout[c] = c1out[(5*2+0)*ncf+c]*c1norm_gain[c]/4.0;
+        }
+
+        /* ====== Parallel-path C2 filter (fixed coefficients, vectorizable over channels) ====== */
+        for (c=0; c<ncf; c++)
+        {
+            c2in[(1*3+2)*ncf+c] = c2in[(1*3+1)*ncf+c];
+            c2in[(1*3+1)*ncf+c] = c2in[(1*3+0)*ncf+c];
+            c2in[(1*3+0)*ncf+c] = me;
+        }
+        for (i=1; i<=5; i++)
+        {
+            for (c=0; c<ncf; c++)
+            {
+                dy = c2in[(i*3+0)*ncf+c]*c2k1[i*ncf+c] - c2k2[i*ncf+c]*c2in[(i*3+1)*ncf+c] - c2k3[i*ncf+c]*c2in[(i*3+2)*ncf+c]
+                     + 2*c2out[(i*2+0)*ncf+c]*c2B[i*ncf+c]
+                     - c2out[(i*2+1)*ncf+c]*c2D[i*ncf+c];
+                dy = dy/c2temp[i*ncf+c];
+                c2in[((i+1)*3+2)*ncf+c] = c2out[(i*2+1)*ncf+c];
+                c2in[((i+1)*3+1)*ncf+c] = c2out[(i*2+0)*ncf+c];
+                c2in[((i+1)*3+0)*ncf+c] = dy;
+                c2out[(i*2+1)*ncf+c] = c2out[(i*2+0)*ncf+c];
+                c2out[(i*2+0)*ncf+c] = dy;
+            }
+        }
+        for (c=0; c<ncf; c++)
+            c2filterout[c] = c2out[(5*2+0)*ncf+c]*c2norm_gain[c]/4.0;
+
+        /* ====== IHC transduction and lowpass filter ====== */
+        for (c=0; c<ncf; c++)
+        {
+            c1vihctmp = NLogarithm(cihc[c]*c1filterout[c],0.1,ihcasym,cf[c]);
+            c2vihctmp = -NLogarithm(c2filterout[c]*fabs(c2filterout[c])*cf[c]/10*cf[c]/2e3,0.2,1.0,cf[c]);
+            ihc[c] = (c1vihctmp+c2vihctmp)*1.0;
+        }
+        for (i=0; i<ihcorder; i++)
+            for (c=0; c<ncf; c++)
+                ihc[(i+1)*ncf+c] = ihc_c1LP*ihcl[(i+1)*ncf+c] + ihc_c2LP*(ihc[i*ncf+c]+ihcl[i*ncf+c]);
+        for (c=0; c<ncf; c++)
+        {
+            for (j=0; j<=ihcorder; j++)
+                ihcl[j*ncf+c] = ihc[j*ncf+c];
+            /* Adjust total path delay to IHC output signal: the output of sample n is read back
+             * delaypoint samples later (slots not yet written hold the initial zeros) */
+            delayline[(long)c*delaylen+(n+delaypoint[c])%delaylen] = ihc[ihcorder*ncf+c];
+            dtmp = delayline[(long)c*delaylen+n%delaylen];
+            delayline[(long)c*delaylen+n%delaylen] = 0;
+            if (ihcoutf) ihcoutf[(long)c*nsamp+k] = (float) dtmp;
+            else ihcout[(long)c*nsamp+k] = dtmp;
+        }
+    } /* End of the loop */
+    b->n += nsamp;
+
+    free(meout);
+} /* End of the IHCANBankRun function */
+
+
+
+void IHCANBankFree(IHCBANK *b)
+{
+    free(b->mem);
+    free(b->delaypoint);
+    free(b->tmpgain);
+    free(b->delayline);
+    free(b);
+} /* End of the IHCANBankFree function */
+
+
+
+/* Run the species-dependent middle-ear filter (shared by all CFs) on px (totalstim samples) */
+void MiddleEar(double *px, double tdres, int totalstim, int species, double *meout)
+{
+    MESTATE me;
+
+    void MiddleEarInit(MESTATE *, double, int);
+    void MiddleEarRun(MESTATE *, const double *, int, double *);
+
+    MiddleEarInit(&me, tdres, species);
+    MiddleEarRun(&me, px, totalstim, meout);
+} /* End of the MiddleEar function */
+
+
+
+/* Initialize the coefficients and (zero) histories of the middle-ear filter */
+void MiddleEarInit(MESTATE *me, double tdres, int species)
+{
+    double fp, C;
+
+    memset(me, 0, sizeof(MESTATE));
+    me->species = species;
+
+    /* Prewarping and related constants for the middle ear */
+    fp = 1e3; /* Prewarping frequency 1 kHz */
+    C = TWOPI*fp/tan(TWOPI/2*fp*tdres);
+    if (species==1) /* for cat */
+    {
+        /* Cat middle-ear filter - simplified version from Bruce et al. (JASA 2003) */
+        me->m11 = C/(C + 693.48);
+        me->m12 = (693.48 - C)/C;
+        me->m13 = 0.0;
+        me->m14 = 1.0;
+        me->m15 = -1.0;
+        me->m16 = 0.0;
+        me->m21 = 1/(pow(C,2) + 11053*C + 1.163e8);
+        me->m22 = -2*pow(C,2) + 2.326e8;
+        me->m23 = pow(C,2) - 11053*C + 1.163e8;
+        me->m24 = pow(C,2) + 1356.3*C + 7.4417e8;
+        me->m25 = -2*pow(C,2) + 14.8834e8;
+        me->m26 = pow(C,2) - 1356.3*C + 7.4417e8;
+        me->m31 = 1/(pow(C,2) + 4620*C + 909059944);
+        me->m32 = -2*pow(C,2) + 2*909059944;
+        me->m33 = pow(C,2) - 4620*C + 909059944;
+        me->m34 = 5.7585e5*C + 7.1665e7;
+        me->m35 = 14.333e7;
+        me->m36 = 7.1665e7 - 5.7585e5*C;
+        me->megainmax=41.1405;
+    };
+    if (species>1) /* for human */
+    {
+        /* Human middle-ear filter - based on Pascal et al. (JASA 1998) */
+        me->m11 = 1/(pow(C,2)+5.9761e+003*C+2.5255e+007);
+        me->m12 = (-2*pow(C,2)+2*2.5255e+007);
+        me->m13 = (pow(C,2)-5.9761e+003*C+2.5255e+007);
+        me->m14 = (pow(C,2)+5.6665e+003*C);
+        me->m15 = -2*pow(C,2);
+        me->m16 = (pow(C,2)-5.6665e+003*C);
+        me->m21 = 1/(pow(C,2)+6.4255e+003*C+1.3975e+008);
+        me->m22 = (-2*pow(C,2)+2*1.3975e+008);
+        me->m23 = (pow(C,2)-6.4255e+003*C+1.3975e+008);
+        me->m24 = (pow(C,2)+5.8934e+003*C+1.7926e+008);
+        me->m25 = (-2*pow(C,2)+2*1.7926e+008);
+        me->m26 = (pow(C,2)-5.8934e+003*C+1.7926e+008);
+        me->m31 = 1/(pow(C,2)+2.4891e+004*C+1.2700e+009);
+        me->m32 = (-2*pow(C,2)+2*1.2700e+009);
+        me->m33 = (pow(C,2)-2.4891e+004*C+1.2700e+009);
+        me->m34 = (3.1137e+003*C+6.9768e+008);
+        me->m35 = 2*6.9768e+008;
+        me->m36 = (-3.1137e+003*C+6.9768e+008);
+        me->megainmax = 2;
+    };
+} /* End of the MiddleEarInit function */
+
+
+
+/* Advance the middle-ear filter by nsamp samples of px (histories are carried across calls) */
+void MiddleEarRun(MESTATE *me, const double *px, int nsamp, double *meout)
+{
+    double m11 = me->m11, m12 = me->m12, m13 = me->m13, m14 = me->m14, m15 = me->m15, m16 = me->m16;
+    double m21 = me->m21, m22 = me->m22, m23 = me->m23, m24 = me->m24, m25 = me->m25, m26 = me->m26;
+    double m31 = me->m31, m32 = me->m32, m33 = me->m33, m34 = me->m34, m35 = me->m35, m36 = me->m36;
+    double mey1, mey2, mey3;
+    int    k;
+
+    for (k=0; k<nsamp; k++)
+    {
+        if (me->n==0) /* Start of the middle-ear filtering section */
+        {
+            mey1 = m11*px[k];
+            if (me->species>1) mey1 = m11*m14*px[k];
+            mey2 = mey1*m24*m21;
+            mey3 = mey2*m34*m31;
+        }
+        else if (me->n==1)
+        {
+            mey1 = m11*(-m12*me->mey1[0] + px[k] - me->px[0]);
+            if (me->species>1) mey1 = m11*(-m12*me->mey1[0]+m14*px[k]+m15*me->px[0]);
+            mey2 = m21*(-m22*me->mey2[0] + m24*mey1 + m25*me->mey1[0]);
+            mey3 = m31*(-m32*me->mey3[0] + m34*mey2 + m35*me->mey2[0]);
+        }
+        else
+        {
+            mey1 = m11*(-m12*me->mey1[0] + px[k] - me->px[0]);
+            if (me->species>1) mey1= m11*(-m12*me->mey1[0]-m13*me->mey1[1]+m14*px[k]+m15*me->px[0]+m16*me->px[1]);
+            mey2 = m21*(-m22*me->mey2[0] - m23*me->mey2[1] + m24*mey1 + m25*me->mey1[0] + m26*me->mey1[1]);
+            mey3 = m31*(-m32*me->mey3[0] - m33*me->mey3[1] + m34*mey2 + m35*me->mey2[0] + m36*me->mey2[1]);
+        }; /* End of the middle-ear filtering section */
+        meout[k] = mey3/me->megainmax;
+
+        me->px[1] = me->px[0]; me->px[0] = px[k];
+        me->mey1[1] = me->mey1[0]; me->mey1[0] = mey1;
+        me->mey2[1] = me->mey2[0]; me->mey2[0] = mey2;
+        me->mey3[1] = me->mey3[0]; me->mey3[0] = mey3;
+        me->n++;
+    }
+} /* End of the MiddleEarRun function */
+
+
+
 /* Get TauMax, TauMin for the tuning filter. The TauMax is determined by the bandwidth/Q10
    of the tuning filter at low level. The TauMin is determined by the gain change between high
    and low level */
@@ -347,10 +841,8 @@ double Get_taubm(double cf, int species, double taumax, double *bmTaumax, double
 
 
 /* Pass the signal through the signal-path C1 Tenth Order Nonlinear Chirp-Gammatone Filter */
-double C1ChirpFilt(double x, double tdres, double cf, int n, double taumax, double rsigma)
+double C1ChirpFilt(double x, double tdres, double cf, int n, double taumax, double rsigma, CHIRPSTATE *st)
 {
-    static double C1gain_norm, C1initphase;
-    static double C1input[12][4], C1output[12][4];
 
     double ipw, ipb, rpa, pzero, rzero;
     double sigma0, fs_bilinear, CF, norm_gain,phase, c1filterout;
@@ -392,34 +884,34 @@ double C1ChirpFilt(double x, double tdres, double cf, int n, double taumax, doub
         p[9] = p[5];
         p[10]= p[6];
 
-        C1initphase = 0.0;
+        st->initphase = 0.0;
         for (i=1;i<=half_order_pole;i++)
         {
             preal = p[i*2-1].x;
             pimg = p[i*2-1].y;
-            C1initphase = C1initphase + atan(CF/(-rzero))-atan((CF-pimg)/(-preal))-atan((CF+pimg)/(-preal));
+            st->initphase = st->initphase + atan(CF/(-rzero))-atan((CF-pimg)/(-preal))-atan((CF+pimg)/(-preal));
         };
 
-        /* ====== Initialize C1input & C1output ====== */
+        /* ====== Initialize the filter input & output histories ====== */
         for (i=1;i<=(half_order_pole+1);i++)
         {
-            C1input[i][3] = 0;
-            C1input[i][2] = 0;
-            C1input[i][1] = 0;
-            C1output[i][3] = 0;
-            C1output[i][2] = 0;
-            C1output[i][1] = 0;
+            st->input[i][3] = 0;
+            st->input[i][2] = 0;
+            st->input[i][1] = 0;
+            st->output[i][3] = 0;
+            st->output[i][2] = 0;
+            st->output[i][1] = 0;
         }
 
         /* ====== Normalize the gain ====== */
-        C1gain_norm = 1.0;
+        st->gain_norm = 1.0;
         for (r=1; r<=order_of_pole; r++)
         {
-            C1gain_norm = C1gain_norm*(pow((CF - p[r].y),2) + p[r].x*p[r].x);
+            st->gain_norm = st->gain_norm*(pow((CF - p[r].y),2) + p[r].x*p[r].x);
         }
     };
 
-    norm_gain = sqrt(C1gain_norm)/pow(sqrt(CF*CF+rzero*rzero),order_of_zero);
+    norm_gain = sqrt(st->gain_norm)/pow(sqrt(CF*CF+rzero*rzero),order_of_zero);
     p[1].x = -sigma0 - rsigma;
     if (p[1].x>0.0){ printf("The system becomes unstable.\n"); exit(-1); }
     p[1].y = ipw;
@@ -443,7 +935,7 @@ double C1ChirpFilt(double x, double tdres, double cf, int n, double taumax, doub
           phase = phase-atan((CF-pimg)/(-preal))-atan((CF+pimg)/(-preal));
     };
 
-    rzero = -CF/tan((C1initphase-phase)/order_of_zero);
+    rzero = -CF/tan((st->initphase-phase)/order_of_zero);
     if (rzero>0.0){ printf("The zeros are in the right-half plane.\n"); exit(-1); }
 
     /* =================================================== */
@@ -451,9 +943,9 @@ double C1ChirpFilt(double x, double tdres, double cf, int n, double taumax, doub
     /*                Time loop begins here                */
     /* =================================================== */
 
-    C1input[1][3] = C1input[1][2];
-    C1input[1][2] = C1input[1][1];
-    C1input[1][1] = x;
+    st->input[1][3] = st->input[1][2];
+    st->input[1][2] = st->input[1][1];
+    st->input[1][1] = x;
 
     for (i=1; i<=half_order_pole; i++)
     {
@@ -461,19 +953,19 @@ double C1ChirpFilt(double x, double tdres, double cf, int n, double taumax, doub
         pimg = p[i*2-1].y;
         temp = pow((fs_bilinear-preal),2)+ pow(pimg,2);
 
-        dy = C1input[i][1]*(fs_bilinear-rzero) - 2*rzero*C1input[i][2] - (fs_bilinear+rzero)*C1input[i][3]
-             + 2*C1output[i][1]*(fs_bilinear*fs_bilinear-preal*preal-pimg*pimg)
-             - C1output[i][2]*((fs_bilinear+preal)*(fs_bilinear+preal)+pimg*pimg);
+        dy = st->input[i][1]*(fs_bilinear-rzero) - 2*rzero*st->input[i][2] - (fs_bilinear+rzero)*st->input[i][3]
+             + 2*st->output[i][1]*(fs_bilinear*fs_bilinear-preal*preal-pimg*pimg)
+             - st->output[i][2]*((fs_bilinear+preal)*(fs_bilinear+preal)+pimg*pimg);
         dy = dy/temp;
 
-        C1input[i+1][3] = C1output[i][2];
-        C1input[i+1][2] = C1output[i][1];
-        C1input[i+1][1] = dy;
-        C1output[i][2] = C1output[i][1];
-        C1output[i][1] = dy;
+        st->input[i+1][3] = st->output[i][2];
+        st->input[i+1][2] = st->output[i][1];
+        st->input[i+1][1] = dy;
+        st->output[i][2] = st->output[i][1];
+        st->output[i][1] = dy;
     }
 
-    dy = C1output[half_order_pole][1]*norm_gain; /* don't forget the gain term */
+    dy = st->output[half_order_pole][1]*norm_gain; /* don't forget the gain term */
     c1filterout= dy/4.0; /* signal path output is divided by 4 to give correct C1 filter gain */
 
     return (c1filterout);
@@ -482,11 +974,8 @@ double C1ChirpFilt(double x, double tdres, double cf, int n, double taumax, doub
 
 
 /* Parallelpath C2 filter: same as the signal-path C1 filter with the OHC completely impaired */
-double C2ChirpFilt(double xx, double tdres, double cf, int n, double taumax, double fcohc)
+double C2ChirpFilt(double xx, double tdres, double cf, int n, double taumax, double fcohc, CHIRPSTATE *st)
 {
-    static double C2gain_norm, C2initphase;
-    static double C2input[12][4];
-    static double C2output[12][4];
 
     double ipw, ipb, rpa, pzero, rzero;
 
@@ -528,34 +1017,34 @@ double C2ChirpFilt(double xx, double tdres, double cf, int n, double taumax, dou
         p[9] = p[5];
         p[10]= p[6];
 
-        C2initphase = 0.0;
+        st->initphase = 0.0;
         for (i=1; i<=half_order_pole; i++)
         {
             preal = p[i*2-1].x;
             pimg = p[i*2-1].y;
-            C2initphase = C2initphase + atan(CF/(-rzero))-atan((CF-pimg)/(-preal))-atan((CF+pimg)/(-preal));
+            st->initphase = st->initphase + atan(CF/(-rzero))-atan((CF-pimg)/(-preal))-atan((CF+pimg)/(-preal));
         };
 
-        /* ====== Initialize C2input & C2output ====== */
+        /* ====== Initialize the filter input & output histories ====== */
         for (i=1;i<=(half_order_pole+1);i++)
         {
-            C2input[i][3] = 0;
-            C2input[i][2] = 0;
-            C2input[i][1] = 0;
-            C2output[i][3] = 0;
-            C2output[i][2] = 0;
-            C2output[i][1] = 0;
+            st->input[i][3] = 0;
+            st->input[i][2] = 0;
+            st->input[i][1] = 0;
+            st->output[i][3] = 0;
+            st->output[i][2] = 0;
+            st->output[i][1] = 0;
         }
 
         /* ====== Normalize the gain ====== */
-        C2gain_norm = 1.0;
+        st->gain_norm = 1.0;
         for (r=1; r<=order_of_pole; r++)
         {
-            C2gain_norm = C2gain_norm*(pow((CF - p[r].y),2) + p[r].x*p[r].x);
+            st->gain_norm = st->gain_norm*(pow((CF - p[r].y),2) + p[r].x*p[r].x);
         }
     };
 
-    norm_gain= sqrt(C2gain_norm)/pow(sqrt(CF*CF+rzero*rzero),order_of_zero);
+    norm_gain= sqrt(st->gain_norm)/pow(sqrt(CF*CF+rzero*rzero),order_of_zero);
 
     p[1].x = -sigma0*fcohc;
     if (p[1].x>0.0){ printf("The system becomes unstable.\n"); exit(-1); }
@@ -580,7 +1069,7 @@ double C2ChirpFilt(double xx, double tdres, double cf, int n, double taumax, dou
         phase = phase-atan((CF-pimg)/(-preal))-atan((CF+pimg)/(-preal));
     };
 
-    rzero = -CF/tan((C2initphase-phase)/order_of_zero);
+    rzero = -CF/tan((st->initphase-phase)/order_of_zero);
     if (rzero>0.0){ printf("The zeros are in the right-half plane.\n"); exit(-1); }
 
     /* =================================================== */
@@ -588,9 +1077,9 @@ double C2ChirpFilt(double xx, double tdres, double cf, int n, double taumax, dou
     /*                Time loop begins here                */
     /* =================================================== */
 
-    C2input[1][3]=C2input[1][2];
-    C2input[1][2]=C2input[1][1];
-    C2input[1][1]= xx;
+    st->input[1][3]=st->input[1][2];
+    st->input[1][2]=st->input[1][1];
+    st->input[1][1]= xx;
 
     for (i=1;i<=half_order_pole;i++)
     {
@@ -598,19 +1087,19 @@ double C2ChirpFilt(double xx, double tdres, double cf, int n, double taumax, dou
         pimg = p[i*2-1].y;
         temp = pow((fs_bilinear-preal),2)+ pow(pimg,2);
 
-        dy = C2input[i][1]*(fs_bilinear-rzero) - 2*rzero*C2input[i][2] - (fs_bilinear+rzero)*C2input[i][3]
-            + 2*C2output[i][1]*(fs_bilinear*fs_bilinear-preal*preal-pimg*pimg)
-            - C2output[i][2]*((fs_bilinear+preal)*(fs_bilinear+preal)+pimg*pimg);
+        dy = st->input[i][1]*(fs_bilinear-rzero) - 2*rzero*st->input[i][2] - (fs_bilinear+rzero)*st->input[i][3]
+            + 2*st->output[i][1]*(fs_bilinear*fs_bilinear-preal*preal-pimg*pimg)
+            - st->output[i][2]*((fs_bilinear+preal)*(fs_bilinear+preal)+pimg*pimg);
         dy = dy/temp;
 
-        C2input[i+1][3] = C2output[i][2];
-        C2input[i+1][2] = C2output[i][1];
-        C2input[i+1][1] = dy;
-        C2output[i][2] = C2output[i][1];
-        C2output[i][1] = dy;
+        st->input[i+1][3] = st->output[i][2];
+        st->input[i+1][2] = st->output[i][1];
+        st->input[i+1][1] = dy;
+        st->output[i][2] = st->output[i][1];
+        st->output[i][1] = dy;
     };
 
-    dy = C2output[half_order_pole][1]*norm_gain;
+    dy = st->output[half_order_pole][1]*norm_gain;
     c2filterout= dy/4.0;
 
     return (c2filterout);
@@ -619,40 +1108,38 @@ double C2ChirpFilt(double xx, double tdres, double cf, int n, double taumax, dou
 
 
 /* Pass the signal through the Control path Third Order Nonlinear Gammatone Filter */
-double WbGammaTone(double x, double tdres, double centerfreq, int n, double tau, double gain, int order)
+double WbGammaTone(double x, double tdres, double centerfreq, int n, double tau, double gain, int order, WBSTATE *st)
 {
-    static double wbphase;
-    static COMPLEX wbgtf[4], wbgtfl[4];
 
     double delta_phase, dtmp, c1LP, c2LP,out;
     int i, j;
 
     if (n==0)
     {
-        wbphase = 0;
+        st->phase = 0;
         for(i=0; i<=order;i++)
         {
-            wbgtfl[i] = compmult(0,compexp(0));
-            wbgtf[i] = compmult(0,compexp(0));
+            st->gtfl[i] = compmult(0,compexp(0));
+            st->gtf[i] = compmult(0,compexp(0));
         }
     }
 
     delta_phase = -TWOPI*centerfreq*tdres;
-    wbphase += delta_phase;
+    st->phase += delta_phase;
 
     dtmp = tau*2.0/tdres;
     c1LP = (dtmp-1)/(dtmp+1);
     c2LP = 1.0/(dtmp+1);
-    wbgtf[0] = compmult(x,compexp(wbphase)); /* FREQUENCY SHIFT */
+    st->gtf[0] = compmult(x,compexp(st->phase)); /* FREQUENCY SHIFT */
 
     for(j = 1; j <= order; j++) /* IIR Bilinear transformation LPF */
     {
-        wbgtf[j] = comp2sum(compmult(c2LP*gain,comp2sum(wbgtf[j-1],wbgtfl[j-1])),compmult(c1LP,wbgtfl[j]));
+        st->gtf[j] = comp2sum(compmult(c2LP*gain,comp2sum(st->gtf[j-1],st->gtfl[j-1])),compmult(c1LP,st->gtfl[j]));
     }
 
-    out = REAL(compprod(compexp(-wbphase), wbgtf[order])); /* FREQ SHIFT BACK UP */
+    out = REAL(compprod(compexp(-st->phase), st->gtf[order])); /* FREQ SHIFT BACK UP */
 
-    for(i=0; i<=order; i++) wbgtfl[i] = wbgtf[i];
+    for(i=0; i<=order; i++) st->gtfl[i] = st->gtf[i];
     return(out);
 }
 
@@ -726,9 +1213,8 @@ double Boltzman(double x, double asym, double s0, double s1, double x1)
 
 
 /* Get the output of the OHC Low Pass Filter in the Control path */
-double OhcLowPass(double x, double tdres, double Fc, int n, double gain, int order)
+double OhcLowPass(double x, double tdres, double Fc, int n, double gain, int order, LOWPASSSTATE *st)
 {
-    static double ohc[4],ohcl[4];
 
     double c,c1LP,c2LP;
     int i,j;
@@ -737,8 +1223,8 @@ double OhcLowPass(double x, double tdres, double Fc, int n, double gain, int ord
     {
         for(i=0; i<(order+1);i++)
         {
-            ohc[i] = 0;
-            ohcl[i] = 0;
+            st->y[i] = 0;
+            st->yl[i] = 0;
         }
     }
 
@@ -746,24 +1232,23 @@ double OhcLowPass(double x, double tdres, double Fc, int n, double gain, int ord
     c1LP = ( c - TWOPI*Fc ) / ( c + TWOPI*Fc );
     c2LP = TWOPI*Fc / (TWOPI*Fc + c);
 
-    ohc[0] = x*gain;
+    st->y[0] = x*gain;
     for(i=0; i<order;i++)
     {
-        ohc[i+1] = c1LP*ohcl[i+1] + c2LP*(ohc[i]+ohcl[i]);
+        st->y[i+1] = c1LP*st->yl[i+1] + c2LP*(st->y[i]+st->yl[i]);
     }
     for(j=0; j<=order;j++)
     {
-        ohcl[j] = ohc[j];
+        st->yl[j] = st->y[j];
     }
-    return(ohc[order]);
+    return(st->y[order]);
 }
 
 
 
 /* Get the output of the IHC Low Pass Filter */
-double IhcLowPass(double x, double tdres, double Fc, int n, double gain, int order)
+double IhcLowPass(double x, double tdres, double Fc, int n, double gain, int order, LOWPASSSTATE *st)
 {
-    static double ihc[8],ihcl[8];
 
     double C,c1LP,c2LP;
     int i,j;
@@ -772,8 +1257,8 @@ double IhcLowPass(double x, double tdres, double Fc, int n, double gain, int ord
     {
         for(i=0; i<(order+1);i++)
         {
-            ihc[i] = 0;
-            ihcl[i] = 0;
+            st->y[i] = 0;
+            st->yl[i] = 0;
         }
     }
 
@@ -781,16 +1266,16 @@ double IhcLowPass(double x, double tdres, double Fc, int n, double gain, int ord
     c1LP = ( C - TWOPI*Fc ) / ( C + TWOPI*Fc );
     c2LP = TWOPI*Fc / (TWOPI*Fc + C);
 
-    ihc[0] = x*gain;
+    st->y[0] = x*gain;
     for(i=0; i<order;i++)
     {
-        ihc[i+1] = c1LP*ihcl[i+1] + c2LP*(ihc[i]+ihcl[i]);
+        st->y[i+1] = c1LP*st->yl[i+1] + c2LP*(st->y[i]+st->yl[i]);
     }
     for(j=0; j<=order;j++)
     {
-        ihcl[j] = ihc[j];
+        st->yl[j] = st->y[j];
     }
-    return(ihc[order]);
+    return(st->y[order]);
 }
 
 
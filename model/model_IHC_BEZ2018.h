@@ -10,3 +10,38 @@ void IHCAN(double *px,
            double IhcLowPass_cutoff,
            double IhcLowPass_order,
            double *ihcout);
+
+void IHCANBank(double *px,
+               int ncf,
+               const double *cf,
+               double tdres,
+               int totalstim,
+               const double *cohc,
+               const double *cihc,
+               int species,
+               const double *bandwidth_scale_factor,
+               double IhcLowPass_cutoff,
+               double IhcLowPass_order,
+               double *ihcout,
+               float *ihcoutf);
+
+/* Stateful IHC filterbank for processing an input in consecutive blocks */
+typedef struct IHCBANK IHCBANK;
+
+IHCBANK *IHCANBankInit(int ncf,
+                       const double *cf,
+                       double tdres,
+                       const double *cohc,
+                       const double *cihc,
+                       int species,
+                       const double *bandwidth_scale_factor,
+                       double IhcLowPass_cutoff,
+                       double IhcLowPass_order);
+
+void IHCANBankRun(IHCBANK *bank,
+                  const double *px,
+                  int nsamp,
+                  double *ihcout,
+                  float *ihcoutf);
+
+void IHCANBankFree(IHCBANK *bank);
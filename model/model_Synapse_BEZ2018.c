@@ -19,9 +19,6 @@
  * (based on https://github.com/mrkrd/cochlea/blob/master/cochlea/zilany2014)
  */
 
-#include "Python.h"
-#include "cython_bez2018.h"
-
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
@@ -29,12 +26,16 @@
 #include <time.h>
 
 #include "complex.hpp"
+#include "philox.h"
+#include "decimate.h"
+#include "model_Synapse_BEZ2018.h"
 
 #define MAXSPIKES 1000000
 #ifndef TWOPI
 #define TWOPI 6.28318530717959
 #endif
 
+
 #ifndef __max
 #define __max(a,b) (((a) > (b))? (a): (b))
 #endif
@@ -43,6 +44,52 @@
 #define __min(a,b) (((a) < (b))? (a): (b))
 #endif
 
+/* Per-thread timing and counters (only updated between ANProfileStart and ANProfileStop, so each
+ * thread of a CF-parallel run measures the model calls it made itself) */
+static _Thread_local ANPROFILE anprof;
+static _Thread_local int anprof_on = 0;
+
+/* State of the spike generator of one spike train between calls to SpikeGeneratorRun */
+typedef struct SPKGEN {
+    int     nSites, started;
+    double  tdres, t_rd_rest, t_rd_init, tau, t_rd_jump, tabs, trel;
+    long    kMin, k; /* Lower bound of the starting time step, next time step */
+    PHILOX  rng; /* Counter-based random number stream of this spike train (replaces mexCallMATLAB) */
+    double  *preReleaseTimeBinsSorted, *elapsed_time, *previous_release_times, *current_release_times;
+    double  *oneSiteRedock, *Xsum;
+    int     *unitRateInterval;
+    double  Tref, current_refractory_period, previous_redocking_period, current_redocking_period;
+    int     t_rd_decay, rd_first;
+} SPKGEN;
+
+/* Power-law kernels of the streaming synapse (FAST ACTUAL implementation) are accurate up to
+ * this lag (in seconds); the spike generator of a stream starts at most STREAM_ONSET_MAX seconds
+ * before the onset */
+#define STREAM_PLA_HORIZON 3600.0
+#define STREAM_ONSET_MAX 1.0
+
+/* State of the synapse model between calls to SynapseStreamRun */
+typedef struct SYNSTREAM {
+    double tdres, cf, spont, implnt, cf_factor, multFac;
+    int    resamp, delaypoint, ntaps;
+    double *g, *hist; /* Decimation filter taps and the last ntaps samples of the input to the PLA */
+    long   nin, np, nd, nout; /* Number of IHC, power-law input, low-rate and output samples */
+    double last, synSampOut; /* Last input to the PLA and last low-rate output */
+    double binwidth, alpha1, beta1, alpha2, beta2, I1, I2;
+    double sout1[2], sout2[2], m[10], n[6];
+    int    nexp1, nexp2;
+    double *decay1, *weight1, *decay2, *weight2, *y1, *y2;
+} SYNSTREAM;
+
+/* Synapse models and spike generators of the spike trains of one fiber type */
+typedef struct SPIKETRAINSTREAM {
+    int    numTrains, numSyn, synoutLen;
+    long   nout; /* Number of synapse output samples processed */
+    SYNSTREAM **syn;
+    SPKGEN **gen;
+    double *synout;
+} SPIKETRAINSTREAM;
+
 
 
 void SingleAN(double *px,
@@ -52,9 +99,15 @@ void SingleAN(double *px,
               int totalstim,
               double noiseType,
               double implnt,
+              double plaTol,
               double spont,
               double tabs,
               double trel,
+              unsigned long long seed,
+              int cf_idx,
+              int spont_idx,
+              const double *decimTaps,
+              const double *randNums,
               double *meanrate,
               double *varrate,
               double *psth,
@@ -74,7 +127,7 @@ void SingleAN(double *px,
     double sampFreq = 10e3; /* Sampling frequency used in the synapse */
     double total_mean_rate;
     /* Declarations of the functions used in the program */
-    double Synapse(double *,
+    double Synapse(const double *,
                    double,
                    double,
                    int,
@@ -83,6 +136,9 @@ void SingleAN(double *px,
                    double,
                    double,
                    double,
+                   double,
+                   const double *,
+                   const double *,
                    double *);
     int SpikeGenerator(double *,
                        double,
@@ -99,10 +155,15 @@ void SingleAN(double *px,
                        double,
                        long,
                        double *,
-                       double *);
+                       double *,
+                       unsigned long long,
+                       int,
+                       int,
+                       int);
+    void RedockingParams(double, int *, double *, double *, double *, double *);
 
     /* ====== Run the synapse model ====== */
-    I = Synapse(px, tdres, cf, totalstim, nrep, spont, noiseType, implnt, sampFreq, synout);
+    I = Synapse(px, tdres, cf, totalstim, nrep, spont, noiseType, implnt, plaTol, sampFreq, decimTaps, randNums, synout);
 
     /* Calculate the overall mean synaptic rate */
     total_mean_rate = 0;
@@ -112,11 +173,7 @@ void SingleAN(double *px,
     };
 
     /* ====== Synaptic Release/Spike Generation Parameters ====== */
-    nSites = 4; /* Number of synpatic release sites */
-    t_rd_rest = 14.0e-3; /* Resting value of the mean redocking time */
-    t_rd_jump = 0.4e-3; /* Size of jump in mean redocking time when a redocking event occurs */
-    t_rd_init = t_rd_rest+0.02e-3*spont-t_rd_jump; /* Initial value of the mean redocking time */
-    tau = 60.0e-3; /* Time constant for short-term adaptation (in mean redocking time) */
+    RedockingParams(spont, &nSites, &t_rd_rest, &t_rd_init, &tau, &t_rd_jump);
 
     /* We register only the spikes at times after zero, the sufficient array size
      * (more than 99.7% of cases) to register spike times after zero is: */
@@ -148,7 +205,11 @@ void SingleAN(double *px,
                                  total_mean_rate,
                                  MaxArraySizeSpikes,
                                  sptime,
-                                 trd_vector) ;
+                                 trd_vector,
+                                 seed,
+                                 cf_idx,
+                                 spont_idx,
+                                 0) ;
     } while (nspikes<0);  /* Repeat if spike time array was not long enough */
 
     /* Calculate the analytical estimates of meanrate and varrate and wrapping them up based on no. of repetitions */
@@ -178,192 +239,553 @@ void SingleAN(double *px,
 
 
 
-double Synapse(double *ihcout,
-               double tdres,
-               double cf,
-               int totalstim,
-               int nrep,
-               double spont,
-               double noiseType,
-               double implnt,
-               double sampFreq,
-               double *synout)
+/* Synapse, SpikeGeneratorRun, SpikeGenerator, RunSpikeTrains and RunMeanRates in double precision
+ * and SynapseF, ..., RunMeanRatesF in single precision */
+#define REAL double
+#define REAL_FN(name) name
+#include "model_Synapse_BEZ2018_real.h"
+#undef REAL
+#undef REAL_FN
+
+#define REAL float
+#define REAL_FN(name) name##F
+#include "model_Synapse_BEZ2018_real.h"
+#undef REAL
+#undef REAL_FN
+
+
+
+/* Run the synapse model and spike generator for numTrains spike trains of one (CF, spont) fiber type.
+ * Spike times of train n are written to spikeTimes[n*spikeStride ...] (maxSpikes entries per train,
+ * zero-initialized by the caller) and the analytical estimate of the instantaneous mean rate (first
+ * synapse run) to meanrate. If synapseMode is 1, the synapse model is re-run for each train with the
+ * fGn realization randNums[n*noiseLen ...] (otherwise only randNums[0 ... noiseLen-1] is used).
+ * If pxf is not NULL, the model is run in single precision: the IHC input pxf, the synapse output buffer
+ * synoutf and the mean rate meanratef are used (and px, synout and meanrate are not).
+ * Returns 0, or -1 if maxSpikes was not large enough for one of the trains. */
+int SpikeTrains(double *px,
+                const float *pxf,
+                double cf,
+                int nrep,
+                double tdres,
+                int totalstim,
+                double noiseType,
+                double implnt,
+                double plaTol,
+                double spont,
+                double tabs,
+                double trel,
+                double synapseMode,
+                int numTrains,
+                long maxSpikes,
+                long spikeStride,
+                unsigned long long seed,
+                int cf_idx,
+                int spont_idx,
+                const double *decimTaps,
+                const double *randNums,
+                int noiseLen,
+                double *synout,
+                float *synoutf,
+                double *meanrate,
+                float *meanratef,
+                double *spikeTimes)
+{
+    if (pxf)
+        return RunSpikeTrainsF(pxf, cf, nrep, tdres, totalstim, noiseType, implnt, plaTol, spont, tabs, trel,
+                               synapseMode, numTrains, maxSpikes, spikeStride, seed, cf_idx, spont_idx,
+                               decimTaps, randNums, noiseLen, synoutf, meanratef, spikeTimes);
+    return RunSpikeTrains(px, cf, nrep, tdres, totalstim, noiseType, implnt, plaTol, spont, tabs, trel,
+                          synapseMode, numTrains, maxSpikes, spikeStride, seed, cf_idx, spont_idx,
+                          decimTaps, randNums, noiseLen, synout, meanrate, spikeTimes);
+} /* End of the SpikeTrains function */
+
+
+
+/* Rate-only version of SpikeTrains: run the synapse model of one (CF, spont) fiber type and write the
+ * analytical estimate of the instantaneous mean rate, decimated by a factor of q (zero-phase FIR with the
+ * q+1 taps in outTaps; not used if q is 1), to meanrate (DecimateLength(totalstim, q) samples).
+ * The spike generator is not run: the adaptive mean redocking time is replaced by its expected value.
+ * A fraction pdock of the nSites release sites is docked; docked sites release at rate synout/nSites and
+ * the others redock at rate 1/trd. trd jumps by t_rd_jump on every redocking event and decays towards
+ * t_rd_rest with time constant tau. Both start from their steady state for synout[0] (the spike generator
+ * is also started before the stimulus onset).
+ * If pxf is not NULL, the model is run in single precision on pxf (px is not used).
+ * Returns the number of output samples, or -1 if the input is too short to be decimated. */
+int MeanRates(double *px,
+              const float *pxf,
+              double cf,
+              double tdres,
+              int totalstim,
+              double noiseType,
+              double implnt,
+              double plaTol,
+              double spont,
+              double tabs,
+              double trel,
+              const double *decimTaps,
+              const double *randNums,
+              int q,
+              const double *outTaps,
+              float *meanrate)
+{
+    if (pxf)
+        return RunMeanRatesF(pxf, cf, tdres, totalstim, noiseType, implnt, plaTol, spont, tabs, trel,
+                             decimTaps, randNums, q, outTaps, meanrate);
+    return RunMeanRates(px, cf, tdres, totalstim, noiseType, implnt, plaTol, spont, tabs, trel,
+                        decimTaps, randNums, q, outTaps, meanrate);
+} /* End of the MeanRates function */
+
+
+
+/* Sum-of-exponentials approximation of the power-law kernel binwidth/(d*binwidth + beta), d = 0..nmax
+ * (used by the FAST ACTUAL implementation of the power-law adaptation in Synapse).
+ *
+ * 1/x = integral of exp(u - x*exp(u)) du over the real line is discretized with the trapezoidal rule
+ * in u (nodes s = exp(u)). The step h and the limits of u are chosen so that the discretization error
+ * (2*|Gamma(1 + 2*pi*i/h)|) and the two truncation errors are each below tol/3 relative to 1/x for
+ * all x in [beta, beta + nmax*binwidth]. The kernel is then sum_m weight[m]*decay[m]^d.
+ * Allocates decay and weight (free after use) and returns the number of terms
+ * (-1 without allocating if tol is not in (0, 1)). */
+int PowerLawExpSum(double beta,
+                   double binwidth,
+                   int nmax,
+                   double tol,
+                   double **decay,
+                   double **weight)
+{
+    double xmin = beta, xmax = beta+nmax*binwidth;
+    double y, h, umin, umax, s;
+    int    m, nterms;
+
+    *decay = NULL; *weight = NULL;
+    if (!(tol > 0 && tol < 1)) return -1;
+
+    /* |Gamma(1+iy)|^2 = pi*y/sinh(pi*y) */
+    y = 1.0;
+    while (2*sqrt(TWOPI/2*y/sinh(TWOPI/2*y)) > tol/3) y = y+0.05;
+    h = TWOPI/y;
+    umin = log(tol/(3*xmax));
+    umax = log(log(3/tol)/xmin);
+    nterms = (int) ceil((umax-umin)/h)+1;
+
+    *decay = (double*)malloc(nterms*sizeof(double));
+    *weight = (double*)malloc(nterms*sizeof(double));
+    for (m=0; m<nterms; m++)
+    {
+        s = exp(umin+m*h);
+        (*decay)[m] = exp(-s*binwidth);
+        (*weight)[m] = binwidth*h*s*exp(-s*beta);
+    }
+    return nterms;
+}
+
+
+
+/* Number of fGn samples (at sampFreq) required by one call to Synapse */
+int SynapseNoiseLength(double tdres,
+                       double cf,
+                       int totalstim,
+                       int nrep,
+                       double sampFreq)
+{
+    int delaypoint = (int) floor(7500/(cf/1e3));
+    return (int) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq);
+}
+
+
+
+/* Synaptic release/spike generation parameters (shared by SingleAN, SpikeTrains and SpikeTrainsStreamNew) */
+void RedockingParams(double spont, int *nSites, double *t_rd_rest, double *t_rd_init, double *tau, double *t_rd_jump)
+{
+    *nSites = 4; /* Number of synpatic release sites */
+    *t_rd_rest = 14.0e-3; /* Resting value of the mean redocking time */
+    *t_rd_jump = 0.4e-3; /* Size of jump in mean redocking time when a redocking event occurs */
+    *t_rd_init = *t_rd_rest+0.02e-3*spont-*t_rd_jump; /* Initial value of the mean redocking time */
+    *tau = 60.0e-3; /* Time constant for short-term adaptation (in mean redocking time) */
+}
+
+
+
+/* Allocate the state of a synapse model that is run on consecutive blocks of the IHC output.
+ * The streaming synapse differs from Synapse only where the batch model looks at the whole signal:
+ * the zero-phase decimation filter (filtfilt) is applied as the equivalent causal FIR with a delay
+ * of resamp samples at the low rate (the input before the onset is the constant value used by
+ * Synapse to pad the start), and the power-law kernels of the FAST ACTUAL implementation are
+ * approximated up to a lag of STREAM_PLA_HORIZON seconds. The ACTUAL implementation (implnt==1)
+ * needs the whole history and is not supported. */
+SYNSTREAM *SynapseStreamNew(double tdres,
+                            double cf,
+                            double spont,
+                            double implnt,
+                            double plaTol,
+                            double sampFreq,
+                            const double *decimTaps)
 {
-    /* Initalize Variables */
-    int    z, b;
-    int    resamp = (int) ceil(1/(tdres*sampFreq));
-    double incr = 0.0; int delaypoint = (int) floor(7500/(cf/1e3));
-
-    double alpha1, beta1, I1, alpha2, beta2, I2, binwidth;
-    int    k,j,indx,i;
-
-    double cf_factor,cfslope,cfsat,cfconst,multFac;
-
-    double *sout1, *sout2, *synSampOut, *powerLawIn, *mappingOut, *TmpSyn;
-    double *m1, *m2, *m3, *m4, *m5;
-    double *n1, *n2, *n3;
-
-    double *randNums;
-    double *sampIHC;
-
-    mappingOut = (double*)calloc((long) ceil(totalstim*nrep),sizeof(double));
-    powerLawIn = (double*)calloc((long) ceil(totalstim*nrep+3*delaypoint),sizeof(double));
-    sout1 = (double*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(double));
-    sout2 = (double*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(double));
-    synSampOut = (double*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(double));
-    TmpSyn = (double*)calloc((long) ceil(totalstim*nrep+2*delaypoint),sizeof(double));
-
-    m1 = (double*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(double));
-    m2 = (double*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(double));
-    m3 = (double*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(double));
-    m4 = (double*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(double));
-    m5 = (double*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(double));
-
-    n1 = (double*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(double));
-    n2 = (double*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(double));
-    n3 = (double*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(double));
-
-    /* ================================================== */
-    /* ====== Parameters of the power-law function ====== */
-    /* ================================================== */
-    binwidth = 1/sampFreq;
-    alpha1 = 1.5e-6*100e3; beta1 = 5e-4; I1 = 0;
-    alpha2 = 1e-2*100e3; beta2 = 1e-1; I2 = 0;
-    /* ========================================== */
-    /* ====== Generating a random sequence ====== */
-    /* ========================================== */
-    randNums = ffGn((int)ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),
-                    1/sampFreq,
-                    0.9,
-                    noiseType,
-                    spont);
-    /* ============================================================== */
-    /* ====== Mapping function from IHCOUT to input to the PLA ====== */
-    /* ============================================================== */
+    SYNSTREAM *s;
+    double cfslope, cfsat, cfconst;
+    int    i, j, q;
+
+    int PowerLawExpSum(double, double, int, double, double **, double **);
+
+    s = (SYNSTREAM*)calloc(1, sizeof(SYNSTREAM));
+    s->tdres = tdres; s->cf = cf; s->spont = spont; s->implnt = implnt;
+    q = s->resamp = ResampFactor(tdres, sampFreq);
+    s->delaypoint = (int) floor(7500/(cf/1e3));
+    s->ntaps = 2*q+1;
+
+    /* filtfilt with the q+1 taps b equals (in the interior) a single FIR with taps b*b centered at q */
+    s->g = (double*)calloc(s->ntaps, sizeof(double));
+    for (i=0; i<=q; i++)
+        for (j=0; j<=q; j++)
+            s->g[i+j] += decimTaps[i]*decimTaps[j];
+    s->hist = (double*)calloc(s->ntaps, sizeof(double));
+
+    /* ====== Parameters of the power-law function (as in Synapse) ====== */
+    s->binwidth = 1/sampFreq;
+    s->alpha1 = 1.5e-6*100e3; s->beta1 = 5e-4;
+    s->alpha2 = 1e-2*100e3; s->beta2 = 1e-1;
+    if (implnt==2)
+    {
+        s->nexp1 = PowerLawExpSum(s->beta1, s->binwidth, (int) ceil(STREAM_PLA_HORIZON*sampFreq), plaTol, &s->decay1, &s->weight1);
+        s->nexp2 = PowerLawExpSum(s->beta2, s->binwidth, (int) ceil(STREAM_PLA_HORIZON*sampFreq), plaTol, &s->decay2, &s->weight2);
+        s->y1 = (double*)calloc(s->nexp1, sizeof(double));
+        s->y2 = (double*)calloc(s->nexp2, sizeof(double));
+    }
+
+    /* ====== Mapping function from IHCOUT to input to the PLA (as in Synapse) ====== */
     cfslope = pow(spont,0.19)*pow(10,-0.87);
     cfconst = 0.1*pow(log10(spont),2)+0.56*log10(spont)-0.84;
     cfsat = pow(10,(cfslope*8965.5/1e3 + cfconst));
-    cf_factor = __min(cfsat,pow(10,cfslope*cf/1e3 + cfconst))*2.0;
-    multFac = __max(2.95*__max(1.0,1.5-spont/100),4.3-0.2*cf/1e3);
-    k = 0;
-    for (indx=0; indx<totalstim*nrep; ++indx)
+    s->cf_factor = __min(cfsat,pow(10,cfslope*cf/1e3 + cfconst))*2.0;
+    s->multFac = __max(2.95*__max(1.0,1.5-spont/100),4.3-0.2*cf/1e3);
+    return s;
+} /* End of the SynapseStreamNew function */
+
+
+
+/* Number of power-law input samples added by the next call to SynapseStreamRun
+ * (nsamp input samples, the delay padding before the first sample and the ramp added on flush) */
+static long SynapseStreamPushCount(SYNSTREAM *s, int nsamp, int flush)
+{
+    long n = nsamp;
+    if ((s->np==0) && (nsamp>0)) n += s->delaypoint;
+    if (flush && (s->np+n>0)) n += 2*s->delaypoint + 3*s->resamp;
+    return n;
+}
+
+
+
+/* Number of fGn samples (at sampFreq) consumed by the next call to SynapseStreamRun */
+int SynapseStreamNoiseLength(SYNSTREAM *s, int nsamp, int flush)
+{
+    long np = s->np + SynapseStreamPushCount(s, nsamp, flush);
+    /* Low-rate sample j is computed when power-law input sample (j+1)*resamp is added */
+    return (int) (((np>0) ? (np-1)/s->resamp : 0) - ((s->np>0) ? (s->np-1)/s->resamp : 0));
+}
+
+
+
+/* Number of IHC samples that were consumed but whose synapse output is still pending
+ * (SynapseStreamRun writes at most nsamp plus this number of samples) */
+int SynapseStreamPending(SYNSTREAM *s)
+{
+    return (int) (s->nin - s->nout);
+}
+
+
+
+/* Add sample plin to the input of the PLA (after the mapping function and delay). Every resamp
+ * samples, the next low-rate sample is computed (decimation filter, power-law adaptation with
+ * the fGn sample randNums[*nrand]) and the interpolated output up to the previous low-rate
+ * sample is written to synout (output samples nout ... nend-1 only). Returns the number of
+ * samples written. */
+static int SynapseStreamPush(SYNSTREAM *s, double plin, const double *randNums, int *nrand, double *synout, long nend)
+{
+    int    q = s->resamp, ntaps = s->ntaps;
+    long   p, t, i;
+    int    m, b, nwritten;
+    double sampIHC, noise, sout1, sout2, synSampOut, incr;
+    double m1, m2, m3, m4, m5, n1, n2, n3;
+    double *sm = s->m, *sn = s->n;
+
+    p = s->np++;
+    s->hist[p % ntaps] = plin;
+    s->last = plin;
+    /* ====== Decimation: low-rate sample nd is centered at p-q (zero-phase FIR b*b) ====== */
+    if ((p<q) || (p%q != 0)) return 0;
+    sampIHC = 0;
+    for (m=0; m<ntaps; m++)
+        sampIHC += s->g[m]*s->hist[(p-m+ntaps) % ntaps];
+
+    /* ====== Running power-law adaptation (as in Synapse) ====== */
+    noise = randNums[(*nrand)++]; /* Not inside __max (a macro evaluates its arguments twice) */
+    sout1 = __max( 0, sampIHC + noise - s->alpha1*s->I1);
+    sout2 = __max( 0, sampIHC - s->alpha2*s->I2);
+
+    if (s->implnt==2) /* FAST ACTUAL implementation */
     {
-        mappingOut[k] = pow(10,(0.9*log10(fabs(ihcout[indx])*cf_factor))+ multFac);
-        if (ihcout[indx]<0) mappingOut[k] = - mappingOut[k];
-        k=k+1;
-    }
-    for (k=0; k<delaypoint; k++)
-        powerLawIn[k] = mappingOut[0]+3.0*spont;
-    for (k=delaypoint; k<totalstim*nrep+delaypoint; k++)
-        powerLawIn[k] = mappingOut[k-delaypoint]+3.0*spont;
-    for (k=totalstim*nrep+delaypoint; k<totalstim*nrep+3*delaypoint; k++)
-        powerLawIn[k] = powerLawIn[k-1]+3.0*spont;
-    /* ========================================================== */
-    /* ====== Downsampling to sampFreq (low) sampling rate ====== */
-    /* ========================================================== */
-    sampIHC = decimate(k, powerLawIn, resamp);
-    free(powerLawIn); free(mappingOut);
-    /* ========================================== */
-    /* ====== Running power-law adaptation ====== */
-    /* ========================================== */
-    k = 0;
-    for (indx=0; indx<floor((totalstim*nrep+2*delaypoint)*tdres*sampFreq); indx++)
+        s->I1 = 0; s->I2 = 0;
+        for (m=0; m<s->nexp1; ++m)
+        {
+            s->y1[m] = s->decay1[m]*s->y1[m] + sout1;
+            s->I1 += s->weight1[m]*s->y1[m];
+        }
+        for (m=0; m<s->nexp2; ++m)
+        {
+            s->y2[m] = s->decay2[m]*s->y2[m] + sout2;
+            s->I2 += s->weight2[m]*s->y2[m];
+        }
+    } /* End of FAST ACTUAL implementation */
+
+    if (s->implnt==0) /* APPROXIMATE implementation (sn, sm hold the filter outputs at k-1 and k-2) */
     {
-        sout1[k] = __max( 0, sampIHC[indx] + randNums[indx]- alpha1*I1);
-        sout2[k] = __max( 0, sampIHC[indx] - alpha2*I2);
+        if (s->nd==0)
+        {
+            n1 = 1.0e-3*sout2;
+            n2 = n1; n3 = n2;
+        }
+        else if (s->nd==1)
+        {
+            n1 = 1.992127932802320*sn[0] + 1.0e-3*(sout2 - 0.994466986569624*s->sout2[0]);
+            n2 = 1.999195329360981*sn[2] + n1 - 1.997855276593802*sn[0];
+            n3 = -0.798261718183851*sn[4] + n2 + 0.798261718184977*sn[2];
+        }
+        else
+        {
+            n1 = 1.992127932802320*sn[0] - 0.992140616993846*sn[1] + 1.0e-3*(sout2 - 0.994466986569624*s->sout2[0] + 0.000000000002347*s->sout2[1]);
+            n2 = 1.999195329360981*sn[2] - 0.999195402928777*sn[3]+n1 - 1.997855276593802*sn[0] + 0.997855827934345*sn[1];
+            n3 =-0.798261718183851*sn[4] - 0.199131619873480*sn[5]+n2 + 0.798261718184977*sn[2] + 0.199131619874064*sn[3];
+        }
+        s->I2 = n3;
 
-        if (implnt==1) /* ACTUAL implementation */
+        if (s->nd==0)
         {
-            I1 = 0; I2 = 0;
-            for (j=0; j<k+1; ++j)
-            {
-                I1 += (sout1[j])*binwidth/((k-j)*binwidth + beta1);
-                I2 += (sout2[j])*binwidth/((k-j)*binwidth + beta2);
-            }
-        } /* End of ACTUAL implementation */
+            m1 = 0.2*sout1;
+            m2 = m1; m3 = m2; m4 = m3; m5 = m4;
+        }
+        else if (s->nd==1)
+        {
+            m1 = 0.491115852967412*sm[0] + 0.2*(sout1 - 0.173492003319319*s->sout1[0]);
+            m2 = 1.084520302502860*sm[2] + m1 - 0.803462163297112*sm[0];
+            m3 = 1.588427084535629*sm[4] + m2 - 1.416084732997016*sm[2];
+            m4 = 1.886287488516458*sm[6] + m3 - 1.830362725074550*sm[4];
+            m5 = 1.989549282714008*sm[8] + m4 - 1.983165053215032*sm[6];
+        }
+        else
+        {
+            m1 = 0.491115852967412*sm[0] - 0.055050209956838*sm[1]+ 0.2*(sout1- 0.173492003319319*s->sout1[0]+ 0.000000172983796*s->sout1[1]);
+            m2 = 1.084520302502860*sm[2] - 0.288760329320566*sm[3] + m1 - 0.803462163297112*sm[0] + 0.154962026341513*sm[1];
+            m3 = 1.588427084535629*sm[4] - 0.628138993662508*sm[5] + m2 - 1.416084732997016*sm[2] + 0.496615555008723*sm[3];
+            m4 = 1.886287488516458*sm[6] - 0.888972875389923*sm[7] + m3 - 1.830362725074550*sm[4] + 0.836399964176882*sm[5];
+            m5 = 1.989549282714008*sm[8] - 0.989558985673023*sm[9] + m4 - 1.983165053215032*sm[6] + 0.983193027347456*sm[7];
+        }
+        s->I1 = m5;
 
-        if (implnt==0) /* APPROXIMATE implementation */
+        sn[1] = sn[0]; sn[0] = n1; sn[3] = sn[2]; sn[2] = n2; sn[5] = sn[4]; sn[4] = n3;
+        sm[1] = sm[0]; sm[0] = m1; sm[3] = sm[2]; sm[2] = m2; sm[5] = sm[4]; sm[4] = m3;
+        sm[7] = sm[6]; sm[6] = m4; sm[9] = sm[8]; sm[8] = m5;
+    } /* End of APPROXIMATE implementation */
+
+    s->sout1[1] = s->sout1[0]; s->sout1[0] = sout1;
+    s->sout2[1] = s->sout2[0]; s->sout2[0] = sout2;
+    synSampOut = sout1 + sout2;
+
+    /* ====== Upsampling: linear interpolation between low-rate samples nd-1 and nd ====== */
+    nwritten = 0;
+    if (s->nd>0)
+    {
+        incr = (synSampOut-s->synSampOut)/q;
+        for (b=0; b<q; b++)
         {
-            if (k==0)
-            {
-                n1[k] = 1.0e-3*sout2[k];
-                n2[k] = n1[k]; n3[0]= n2[k];
-            }
-            else if (k==1)
+            t = (s->nd-1)*q+b;
+            i = t-s->delaypoint; /* synout[i] = TmpSyn[i+delaypoint] (as in Synapse) */
+            if ((i>=s->nout) && (i<nend))
             {
-                n1[k] = 1.992127932802320*n1[k-1] + 1.0e-3*(sout2[k] - 0.994466986569624*sout2[k-1]);
-                n2[k] = 1.999195329360981*n2[k-1] + n1[k] - 1.997855276593802*n1[k-1];
-                n3[k] = -0.798261718183851*n3[k-1] + n2[k] + 0.798261718184977*n2[k-1];
+                synout[nwritten++] = s->synSampOut+ b*incr;
+                s->nout++;
             }
-            else
-            {
-                n1[k] = 1.992127932802320*n1[k-1] - 0.992140616993846*n1[k-2] + 1.0e-3*(sout2[k] - 0.994466986569624*sout2[k-1] + 0.000000000002347*sout2[k-2]);
-                n2[k] = 1.999195329360981*n2[k-1] - 0.999195402928777*n2[k-2]+n1[k] - 1.997855276593802*n1[k-1] + 0.997855827934345*n1[k-2];
-                n3[k] =-0.798261718183851*n3[k-1] - 0.199131619873480*n3[k-2]+n2[k] + 0.798261718184977*n2[k-1] + 0.199131619874064*n2[k-2];
-            }
-            I2 = n3[k];
+        }
+    }
+    s->synSampOut = synSampOut;
+    s->nd++;
+    return nwritten;
+}
 
-            if (k==0)
-            {
-                m1[k] = 0.2*sout1[k];
-                m2[k] = m1[k];
-                m3[k] = m2[k];
-                m4[k] = m3[k];
-                m5[k] = m4[k];
-            }
-            else if (k==1)
-            {
-                m1[k] = 0.491115852967412*m1[k-1] + 0.2*(sout1[k] - 0.173492003319319*sout1[k-1]);
-                m2[k] = 1.084520302502860*m2[k-1] + m1[k] - 0.803462163297112*m1[k-1];
-                m3[k] = 1.588427084535629*m3[k-1] + m2[k] - 1.416084732997016*m2[k-1];
-                m4[k] = 1.886287488516458*m4[k-1] + m3[k] - 1.830362725074550*m3[k-1];
-                m5[k] = 1.989549282714008*m5[k-1] + m4[k] - 1.983165053215032*m4[k-1];
-            }
-            else
-            {
-                m1[k] = 0.491115852967412*m1[k-1] - 0.055050209956838*m1[k-2]+ 0.2*(sout1[k]- 0.173492003319319*sout1[k-1]+ 0.000000172983796*sout1[k-2]);
-                m2[k] = 1.084520302502860*m2[k-1] - 0.288760329320566*m2[k-2] + m1[k] - 0.803462163297112*m1[k-1] + 0.154962026341513*m1[k-2];
-                m3[k] = 1.588427084535629*m3[k-1] - 0.628138993662508*m3[k-2] + m2[k] - 1.416084732997016*m2[k-1] + 0.496615555008723*m2[k-2];
-                m4[k] = 1.886287488516458*m4[k-1] - 0.888972875389923*m4[k-2] + m3[k] - 1.830362725074550*m3[k-1] + 0.836399964176882*m3[k-2];
-                m5[k] = 1.989549282714008*m5[k-1] - 0.989558985673023*m5[k-2] + m4[k] - 1.983165053215032*m4[k-1] + 0.983193027347456*m4[k-2];
-            }
-            I1 = m5[k];
-        } /* End of APPROXIMATE implementation */
-
-        synSampOut[k] = sout1[k] + sout2[k];
-        k = k+1;
-    } /* End of all samples */
-
-    free(sout1);
-    free(sout2);
-    free(m1);
-    free(m2);
-    free(m3);
-    free(m4);
-    free(m5);
-    free(n1);
-    free(n2);
-    free(n3);
-    /* ================================================================= */
-    /* ====== Upsampling to original (high 100 kHz) sampling rate ====== */
-    /* ================================================================= */
-    for(z=0; z<k-1; ++z)
+
+
+/* Advance the synapse model by nsamp samples of the IHC output (single precision if ihcoutf is
+ * not NULL). randNums holds the SynapseStreamNoiseLength(s, nsamp, flush) fGn samples of this
+ * call. The output lags the input by a few samples (the support of the decimation and
+ * interpolation filters); if flush is nonzero, the input is ended and all pending output is
+ * written. Returns the number of samples written to synout. */
+int SynapseStreamRun(SYNSTREAM *s,
+                     const double *ihcout,
+                     const float *ihcoutf,
+                     int nsamp,
+                     int flush,
+                     const double *randNums,
+                     double *synout)
+{
+    long   nend, p;
+    int    indx, m, nwritten, nrand;
+    double vihc, plin;
+
+    nwritten = 0;
+    nrand = 0;
+    nend = s->nin+nsamp;
+    for (indx=0; indx<nsamp; indx++)
     {
-        incr = (synSampOut[z+1]-synSampOut[z])/resamp;
-        for(b=0; b<resamp; ++b)
+        /* ====== Mapping function from IHCOUT to input to the PLA (as in Synapse) ====== */
+        vihc = (ihcoutf) ? ihcoutf[indx] : ihcout[indx];
+        plin = pow(10,(0.9*log10(fabs(vihc)*s->cf_factor))+ s->multFac);
+        if (vihc<0) plin = - plin;
+        plin = plin+3.0*s->spont;
+        if (s->np==0)
         {
-            TmpSyn[z*resamp+b] = synSampOut[z]+ b*incr;
+            /* The delay padding (and the input to the decimation filter before the onset)
+             * repeats the first sample */
+            for (m=0; m<s->ntaps; m++) s->hist[m] = plin;
+            for (p=0; p<s->delaypoint; p++)
+                nwritten += SynapseStreamPush(s, plin, randNums, &nrand, synout+nwritten, nend);
         }
+        nwritten += SynapseStreamPush(s, plin, randNums, &nrand, synout+nwritten, nend);
+    }
+    s->nin = nend;
+    if (flush && (s->np>0))
+    {
+        for (p=0; p<2*s->delaypoint+3*s->resamp; p++)
+            nwritten += SynapseStreamPush(s, s->last+3.0*s->spont, randNums, &nrand, synout+nwritten, nend);
+    }
+    return nwritten;
+} /* End of the SynapseStreamRun function */
+
+
+
+void SynapseStreamFree(SYNSTREAM *s)
+{
+    free(s->g);
+    free(s->hist);
+    if (s->implnt==2)
+    {
+        free(s->decay1); free(s->weight1); free(s->y1);
+        free(s->decay2); free(s->weight2); free(s->y2);
     }
-    for (i=0; i<totalstim*nrep; ++i)
-        synout[i] = TmpSyn[i+delaypoint];
+    free(s);
+} /* End of the SynapseStreamFree function */
+
+
+
+/* Allocate the state of the synapse models and spike generators of numTrains spike trains of
+ * one (CF, spont) fiber type (see SpikeTrains) that are run on consecutive blocks of the IHC output.
+ * If synapseMode is 1, each train has its own synapse model (and fGn realization). */
+SPIKETRAINSTREAM *SpikeTrainsStreamNew(double cf,
+                                       double tdres,
+                                       double implnt,
+                                       double plaTol,
+                                       double spont,
+                                       double tabs,
+                                       double trel,
+                                       double synapseMode,
+                                       int numTrains,
+                                       unsigned long long seed,
+                                       int cf_idx,
+                                       int spont_idx,
+                                       const double *decimTaps)
+{
+    SPIKETRAINSTREAM *st;
+    double tau, t_rd_rest, t_rd_init, t_rd_jump;
+    int    nSites, itr_n;
+    double sampFreq = 10e3; /* Sampling frequency used in the synapse */
+
+    void RedockingParams(double, int *, double *, double *, double *, double *);
+    SPKGEN *SpikeGeneratorNew(double, double, double, double, double, int, double, double, long,
+                              unsigned long long, int, int, int);
+
+    if ((implnt==2) && !(plaTol>0 && plaTol<1)) return NULL; /* PowerLawExpSum needs 0 < plaTol < 1 */
+
+    RedockingParams(spont, &nSites, &t_rd_rest, &t_rd_init, &tau, &t_rd_jump);
+    st = (SPIKETRAINSTREAM*)calloc(1, sizeof(SPIKETRAINSTREAM));
+    st->numTrains = numTrains;
+    st->numSyn = (synapseMode==1) ? numTrains : 1;
+    st->syn = (SYNSTREAM**)calloc(st->numSyn, sizeof(SYNSTREAM*));
+    st->gen = (SPKGEN**)calloc(numTrains, sizeof(SPKGEN*));
+    for (itr_n=0; itr_n<st->numSyn; itr_n++)
+        st->syn[itr_n] = SynapseStreamNew(tdres, cf, spont, implnt, plaTol, sampFreq, decimTaps);
+    /* The start of the release process is bounded to STREAM_ONSET_MAX seconds before the onset */
+    for (itr_n=0; itr_n<numTrains; itr_n++)
+        st->gen[itr_n] = SpikeGeneratorNew(tdres, t_rd_rest, t_rd_init, tau, t_rd_jump, nSites, tabs, trel,
+                                           -(long) ceil(STREAM_ONSET_MAX/tdres), seed, cf_idx, spont_idx, itr_n);
+    return st;
+} /* End of the SpikeTrainsStreamNew function */
+
+
+
+/* Number of fGn samples (per synapse model run) consumed by the next call to SpikeTrainsStreamRun */
+int SpikeTrainsStreamNoiseLength(SPIKETRAINSTREAM *st, int nsamp, int flush)
+{
+    return SynapseStreamNoiseLength(st->syn[0], nsamp, flush);
+}
+
+
+
+/* Advance all spike trains by nsamp samples of the IHC output (single precision if pxf is not NULL).
+ * Synapse model n uses the fGn samples randNums[n*noiseLen ...] (noiseLen is given by
+ * SpikeTrainsStreamNoiseLength). Spike times of train n found in this block are written to
+ * spikeTimes[n*spikeStride ...] (maxSpikes entries per train, zero-initialized by the caller).
+ * Returns the number of synapse output samples processed (the output lags the input by a few
+ * samples until the stream is flushed), or -1 if maxSpikes was not large enough for one of the trains. */
+long SpikeTrainsStreamRun(SPIKETRAINSTREAM *st,
+                          double *px,
+                          const float *pxf,
+                          int nsamp,
+                          int flush,
+                          long maxSpikes,
+                          long spikeStride,
+                          const double *randNums,
+                          int noiseLen,
+                          double *spikeTimes)
+{
+    int    itr_n, nsyn;
+    long   nspikes;
+
+    long SpikeGeneratorRun(SPKGEN *, const double *, long, long, long, double *, double *);
+
+    nsyn = nsamp + SynapseStreamPending(st->syn[0]);
+    if (nsyn>st->synoutLen)
+    {
+        free(st->synout);
+        st->synout = (double*)calloc(nsyn, sizeof(double));
+        st->synoutLen = nsyn;
+    }
+    for (itr_n=0; itr_n<st->numTrains; itr_n++)
+    {
+        if (itr_n<st->numSyn)
+            nsyn = SynapseStreamRun(st->syn[itr_n], px, pxf, nsamp, flush, randNums+(long)itr_n*noiseLen, st->synout);
+        nspikes = SpikeGeneratorRun(st->gen[itr_n], st->synout, st->nout, nsyn, maxSpikes, spikeTimes+itr_n*spikeStride, NULL);
+        if (nspikes<0) return -1;
+    }
+    st->nout += nsyn;
+    return nsyn;
+} /* End of the SpikeTrainsStreamRun function */
+
 
-    free(synSampOut);
-    free(TmpSyn);
-    free(randNums);
-    free(sampIHC);
-    return((long) ceil(totalstim*nrep));
-} /* End of the Synapse function */
+
+void SpikeTrainsStreamFree(SPIKETRAINSTREAM *st)
+{
+    int    itr_n;
+
+    void SpikeGeneratorFree(SPKGEN *);
+
+    for (itr_n=0; itr_n<st->numSyn; itr_n++)
+        SynapseStreamFree(st->syn[itr_n]);
+    for (itr_n=0; itr_n<st->numTrains; itr_n++)
+        SpikeGeneratorFree(st->gen[itr_n]);
+    free(st->syn);
+    free(st->gen);
+    free(st->synout);
+    free(st);
+} /* End of the SpikeTrainsStreamFree function */
 
 
 
@@ -377,201 +799,127 @@ int CompareDouble (const void * a, const void * b)
 
 
 
-/* Pass the output of Synapse model through the Spike Generator */
-int SpikeGenerator(double *synout,
-                   double tdres,
-                   double t_rd_rest,
-                   double t_rd_init,
-                   double tau,
-                   double t_rd_jump,
-                   int nSites,
-                   double tabs,
-                   double trel,
-                   double spont,
-                   int totalstim,
-                   int nrep,
-                   double total_mean_rate,
-                   long MaxArraySizeSpikes,
-                   double *sptime,
-                   double *trd_vector)
+/* Allocate the state of the spike generator of one spike train. The generator is started on
+ * the first call to SpikeGeneratorRun (the initial release times depend on synout[0]) and can
+ * then be advanced over consecutive blocks of the synapse output. kMin (<= 0) bounds the
+ * starting time step of the process before the stimulus onset. */
+SPKGEN *SpikeGeneratorNew(double tdres,
+                          double t_rd_rest,
+                          double t_rd_init,
+                          double tau,
+                          double t_rd_jump,
+                          int nSites,
+                          double tabs,
+                          double trel,
+                          long kMin,
+                          unsigned long long seed,
+                          int cf_idx,
+                          int spont_idx,
+                          int train_idx)
 {
-    /* Initializing the variables: */
-    double* preRelease_initialGuessTimeBins;
-    int*    unitRateInterval;
-    double* elapsed_time;
-    double* previous_release_times;
-    double* current_release_times;
-    double* oneSiteRedock;
-    double* Xsum;
-
-    double  MeanInterEvents;
-    long    MaxArraySizeEvents;
-
-    /* Generating a vector of random numbers without using mexCallMATLAB */
-    double  *randNums;
-    long    randBufIndex;
-    long    randBufLen;
-
-    long    spCount; /* Total number of spikes fired */
-    long    k; /* The loop starts from kInit */
-    int     i, siteNo, kInit;
-    double  Tref, current_refractory_period, trel_k;
-    int     t_rd_decay, rd_first;
+    SPKGEN *g;
+
+    g = (SPKGEN*)calloc(1, sizeof(SPKGEN));
+    g->tdres = tdres; g->t_rd_rest = t_rd_rest; g->t_rd_init = t_rd_init; g->tau = tau; g->t_rd_jump = t_rd_jump;
+    g->nSites = nSites; g->tabs = tabs; g->trel = trel; g->kMin = kMin;
 
-    double  previous_redocking_period, current_redocking_period;
-    int     oneSiteRedock_rounded, elapsed_time_rounded ;
-    double  *preReleaseTimeBinsSorted;
-
-    preRelease_initialGuessTimeBins = (double*)calloc(nSites, sizeof(double));
-    unitRateInterval = (int*)calloc(nSites, sizeof(double));
-    elapsed_time = (double*)calloc(nSites, sizeof(double));
-    previous_release_times = (double*)calloc(nSites, sizeof(double));
-    current_release_times = (double*)calloc(nSites, sizeof(double));
-    oneSiteRedock = (double*)calloc(nSites, sizeof(double));
-    Xsum = (double*)calloc(nSites, sizeof(double));
-
-    /* Estimating Max number of spikes and events (including before zero elements) */
-    MeanInterEvents = (1/total_mean_rate)+ (t_rd_init)/nSites;
-    /* The sufficient array size (more than 99.7% of cases) to register event times after zero is: */
-    /* MaxN=signalLengthInSec/meanEvents+ 3*sqrt(signalLengthInSec/MeanEvents) */
-    MaxArraySizeEvents= ceil ((long) (totalstim*nrep*tdres/MeanInterEvents+ 3 * sqrt(totalstim*nrep*tdres/MeanInterEvents)))+nSites;
-
-    /* Max random array Size: nSites elements for oneSiteRedock initialization, nSites elements for preRelease_initialGuessTimeBins initialization
-     * 1 element for Tref initialization, MaxArraySizeSpikes elements for Tref in the loop, MaxArraySizeEvents elements one time for redocking, another time for rate intervals
-     * Also, for before zero elements, Averageley add 2nSites events (redock-and unitRate) and add nSites (Max) for Trefs:
-     * in total : 3 nSpikes */
-    randBufLen = (long) ceil( 2*nSites+ 1 + MaxArraySizeSpikes + 2*MaxArraySizeEvents + MaxArraySizeSpikes+ 3*nSites);
-    randNums = generate_random_numbers(randBufLen);
-    randBufIndex = 0;
+    g->preReleaseTimeBinsSorted = (double*)calloc(nSites, sizeof(double));
+    g->unitRateInterval = (int*)calloc(nSites, sizeof(double));
+    g->elapsed_time = (double*)calloc(nSites, sizeof(double));
+    g->previous_release_times = (double*)calloc(nSites, sizeof(double));
+    g->current_release_times = (double*)calloc(nSites, sizeof(double));
+    g->oneSiteRedock = (double*)calloc(nSites, sizeof(double));
+    g->Xsum = (double*)calloc(nSites, sizeof(double));
+
+    /* Random numbers are drawn on demand, so the stream is identical if the function is re-run */
+    philox_init(&g->rng, seed, PHILOX_STREAM_SPIKES, cf_idx, spont_idx, train_idx);
+    return g;
+} /* End of the SpikeGeneratorNew function */
+
+
+
+/* Draw the initial state of the spike generator (continued from the past) */
+void SpikeGeneratorStart(SPKGEN *g, double synout0)
+{
+    int     i, nSites = g->nSites;
+    double  *preRelease_initialGuessTimeBins = g->preReleaseTimeBinsSorted;
 
     /* Initial < redocking time associated to nSites release sites */
     for (i=0; i<nSites; i++)
     {
-        oneSiteRedock[i]=-t_rd_init*log(randNums[randBufIndex++]);
+        g->oneSiteRedock[i]=-g->t_rd_init*log(philox_uniform(&g->rng));
     }
 
     /* Initial preRelease_initialGuessTimeBins associated to nsites release sites */
     for (i=0; i<nSites; i++)
     {
-        preRelease_initialGuessTimeBins[i]= __max(-totalstim*nrep,ceil ((nSites/__max(synout[0],0.1) + t_rd_init)*log(randNums[randBufIndex++] ) / tdres));
+        preRelease_initialGuessTimeBins[i]= __max(g->kMin,ceil ((nSites/__max(synout0,0.1) + g->t_rd_init)*log(philox_uniform(&g->rng)) / g->tdres));
     }
 
     /* Now sort the four initial preRelease times and associate
      * the farthest to zero as the site which has also generated a spike */
     qsort(preRelease_initialGuessTimeBins, nSites, sizeof(double), CompareDouble);
-    preReleaseTimeBinsSorted = preRelease_initialGuessTimeBins;
 
     /* Consider the inital previous_release_times to be the preReleaseTimeBinsSorted * tdres */
     for (i=0; i<nSites; i++)
     {
-        previous_release_times[i] = ((double)preReleaseTimeBinsSorted[i])*tdres;
+        g->previous_release_times[i] = ((double)g->preReleaseTimeBinsSorted[i])*g->tdres;
     }
 
     /* The position of first spike, also where the process is started -- continued from the past */
-    kInit = (int) preReleaseTimeBinsSorted[0];
+    g->k = (int) g->preReleaseTimeBinsSorted[0];
     /* Current refractory time */
-    Tref = tabs - trel*log( randNums[ randBufIndex++ ] );
+    g->Tref = g->tabs - g->trel*log(philox_uniform(&g->rng));
     /* Initial refractory regions */
-    current_refractory_period = (double) kInit*tdres;
-    spCount = 0; /* Total number of spikes fired */
-    k = kInit;  /* The loop starts from kInit */
+    g->current_refractory_period = (double) g->k*g->tdres;
 
     /* Set dynamic mean redocking time to initial mean redocking time */
-    previous_redocking_period = t_rd_init;
-    current_redocking_period = previous_redocking_period;
-    t_rd_decay = 1; /* Logical "true" as to whether to decay the value of current_redocking_period at the end of the time step */
-    rd_first = 0; /* Logical "false" as to whether a first redocking event has occurred */
+    g->previous_redocking_period = g->t_rd_init;
+    g->current_redocking_period = g->previous_redocking_period;
+    g->t_rd_decay = 1; /* Logical "true" as to whether to decay the value of current_redocking_period at the end of the time step */
+    g->rd_first = 0; /* Logical "false" as to whether a first redocking event has occurred */
+    g->started = 1;
+} /* End of the SpikeGeneratorStart function */
 
-    /* A loop to find the spike times for all the totalstim*nrep */
-    while (k < totalstim*nrep)
-    {
-        for (siteNo = 0; siteNo<nSites; siteNo++)
-        {
-            if ( k > preReleaseTimeBinsSorted [siteNo] )
-            {
-                /* Redocking times do not necessarily occur exactly at time step value -- calculate the
-                 * number of integer steps for the elapsed time and redocking time */
-                oneSiteRedock_rounded = (int) floor(oneSiteRedock[siteNo]/tdres);
-                elapsed_time_rounded = (int) floor(elapsed_time[siteNo]/tdres);
-                if ( oneSiteRedock_rounded == elapsed_time_rounded )
-                {
-                    /* Jump trd by t_rd_jump if a redocking event has occurred */
-                    current_redocking_period = previous_redocking_period + t_rd_jump;
-                    previous_redocking_period = current_redocking_period;
-                    t_rd_decay = 0; /* Don't decay the value of current_redocking_period if a jump has occurred */
-                    rd_first = 1; /* Flag for when a jump has first occurred */
-                }
-                /* To be sure that for each site, the code start from its
-                 * associated previus release time :*/
-                elapsed_time[siteNo] = elapsed_time[siteNo] + tdres;
-            };
-            /* The elapsed time passes the one time redock (the redocking is finished),
-             * In this case the synaptic vesicle starts sensing the input
-             * for each site integration starts after the redocking is finished for the corresponding site) */
-            if ( elapsed_time[siteNo] >= oneSiteRedock [siteNo] )
-            {
-                Xsum[siteNo] = Xsum[siteNo] + synout[__max(0,k)] / nSites;
-                /* There are nSites integrals each vesicle senses 1/nosites of the whole rate */
-            }
-            if ( (Xsum[siteNo] >= unitRateInterval[siteNo]) && (k >= preReleaseTimeBinsSorted [siteNo]) )
-            {
-                /* An event -- a release happened for the siteNo */
-                oneSiteRedock[siteNo] = -current_redocking_period*log( randNums[randBufIndex++]);
-                current_release_times[siteNo] = previous_release_times[siteNo] + elapsed_time[siteNo];
-                elapsed_time[siteNo] = 0;
-                if ( (current_release_times[siteNo] >= current_refractory_period) )
-                {
-                    /* A spike occured for the current event -- release
-                     * spike_times[(int)(current_release_times[siteNo]/tdres)-kInit+1 ] = 1; */
-                    /* Register only non-negative spike times */
-                    if (current_release_times[siteNo] >= 0)
-                    {
-                        sptime[spCount] = current_release_times[siteNo]; spCount = spCount + 1;
-                    }
-                    trel_k = __min(trel*100/synout[__max(0,k)],trel);
-                    Tref = tabs-trel_k*log( randNums[randBufIndex++] ); /*Refractory periods */
-                    current_refractory_period = current_release_times[siteNo] + Tref;
-                }
-                previous_release_times[siteNo] = current_release_times[siteNo];
-                Xsum[siteNo] = 0;
-                unitRateInterval[siteNo] = (int) (-log(randNums[randBufIndex++]) / tdres);
-            };
-            /* Error Catching */
-            if ( (spCount+1)>MaxArraySizeSpikes || (randBufIndex+1)>randBufLen )
-            {
-                /* mexPrintf (" Array for spike times or random Buffer length not large enough, re-running the function."); */
-                spCount = -1;
-                k = totalstim*nrep;
-                siteNo = nSites;
-            }
-        };
 
-        /* Decay the adapative mean redocking time towards the resting value if no redocking events occurred in this time step */
-        if ( (t_rd_decay==1) && (rd_first==1) )
-        {
-            current_redocking_period = previous_redocking_period - (tdres/tau)*( previous_redocking_period-t_rd_rest );
-            previous_redocking_period = current_redocking_period;
-        }
-        else
-        {
-            t_rd_decay = 1;
-        }
 
-        /* Store the value of the adaptive mean redocking time if it is within the simulation output period */
-        if ( (k>=0) && (k<totalstim*nrep) )
-        {
-            trd_vector [k] = current_redocking_period;
-        }
-        k = k+1;
-    };
+void SpikeGeneratorFree(SPKGEN *g)
+{
+    free(g->preReleaseTimeBinsSorted);
+    free(g->unitRateInterval);
+    free(g->elapsed_time);
+    free(g->previous_release_times);
+    free(g->current_release_times);
+    free(g->oneSiteRedock);
+    free(g->Xsum);
+    free(g);
+} /* End of the SpikeGeneratorFree function */
 
-    free(preRelease_initialGuessTimeBins);
-    free(unitRateInterval);
-    free(elapsed_time);
-    free(previous_release_times);
-    free(current_release_times);
-    free(oneSiteRedock);
-    free(Xsum);
-    free(randNums);
-    return (spCount);
-} /* End of the SpikeGenerator function */
+
+
+/* Monotonic wall clock in seconds (used to time the model stages) */
+double ANProfileClock(void)
+{
+    struct timespec ts;
+
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + 1e-9*ts.tv_nsec;
+}
+
+
+
+/* Reset and enable the timing and counters of the calling thread */
+void ANProfileStart(void)
+{
+    memset(&anprof, 0, sizeof(ANPROFILE));
+    anprof_on = 1;
+}
+
+
+
+/* Disable the timing and counters of the calling thread and copy them to prof */
+void ANProfileStop(ANPROFILE *prof)
+{
+    anprof_on = 0;
+    *prof = anprof;
+}
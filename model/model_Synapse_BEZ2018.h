@@ -5,9 +5,15 @@ void SingleAN(double *px,
               int totalstim,
               double noiseType,
               double implnt,
+              double plaTol,
               double spont,
               double tabs,
               double trel,
+              unsigned long long seed,
+              int cf_idx,
+              int spont_idx,
+              const double *decimTaps,
+              const double *randNums,
               double *meanrate,
               double *varrate,
               double *psth,
@@ -30,9 +36,58 @@ int SpikeGenerator(double *synout,
                    double total_mean_rate,
                    long MaxArraySizeSpikes,
                    double *sptime,
-                   double *trd_vector);
+                   double *trd_vector,
+                   unsigned long long seed,
+                   int cf_idx,
+                   int spont_idx,
+                   int train_idx);
 
-double Synapse(double *,
+int SpikeTrains(double *px,
+                const float *pxf,
+                double cf,
+                int nrep,
+                double tdres,
+                int totalstim,
+                double noiseType,
+                double implnt,
+                double plaTol,
+                double spont,
+                double tabs,
+                double trel,
+                double synapseMode,
+                int numTrains,
+                long maxSpikes,
+                long spikeStride,
+                unsigned long long seed,
+                int cf_idx,
+                int spont_idx,
+                const double *decimTaps,
+                const double *randNums,
+                int noiseLen,
+                double *synout,
+                float *synoutf,
+                double *meanrate,
+                float *meanratef,
+                double *spikeTimes);
+
+int MeanRates(double *px,
+              const float *pxf,
+              double cf,
+              double tdres,
+              int totalstim,
+              double noiseType,
+              double implnt,
+              double plaTol,
+              double spont,
+              double tabs,
+              double trel,
+              const double *decimTaps,
+              const double *randNums,
+              int q,
+              const double *outTaps,
+              float *meanrate);
+
+double Synapse(const double *,
                double,
                double,
                int,
@@ -41,4 +96,65 @@ double Synapse(double *,
                double,
                double,
                double,
+               double,
+               const double *,
+               const double *,
                double *);
+
+int PowerLawExpSum(double beta,
+                   double binwidth,
+                   int nmax,
+                   double tol,
+                   double **decay,
+                   double **weight);
+
+int SynapseNoiseLength(double tdres,
+                       double cf,
+                       int totalstim,
+                       int nrep,
+                       double sampFreq);
+
+/* Stateful synapse models and spike generators for processing the IHC output in consecutive blocks */
+typedef struct SPIKETRAINSTREAM SPIKETRAINSTREAM;
+
+SPIKETRAINSTREAM *SpikeTrainsStreamNew(double cf,
+                                       double tdres,
+                                       double implnt,
+                                       double plaTol,
+                                       double spont,
+                                       double tabs,
+                                       double trel,
+                                       double synapseMode,
+                                       int numTrains,
+                                       unsigned long long seed,
+                                       int cf_idx,
+                                       int spont_idx,
+                                       const double *decimTaps);
+
+int SpikeTrainsStreamNoiseLength(SPIKETRAINSTREAM *st,
+                                 int nsamp,
+                                 int flush);
+
+long SpikeTrainsStreamRun(SPIKETRAINSTREAM *st,
+                          double *px,
+                          const float *pxf,
+                          int nsamp,
+                          int flush,
+                          long maxSpikes,
+                          long spikeStride,
+                          const double *randNums,
+                          int noiseLen,
+                          double *spikeTimes);
+
+void SpikeTrainsStreamFree(SPIKETRAINSTREAM *st);
+
+/* Wall time (s) and call counts of the model stages and counters of spikes and random numbers */
+typedef struct ANPROFILE {
+    double t_synapse, t_decimate, t_pla, t_spikegen;
+    long   n_synapse, n_decimate, n_pla, n_spikegen;
+    long   n_spikes, n_rand;
+} ANPROFILE;
+
+void ANProfileStart(void);
+
+void ANProfileStop(ANPROFILE *prof);
@@ -0,0 +1,600 @@
+/* Type-generic part of the BEZ2018 synapse model and spike generator (see model_Synapse_BEZ2018.c).
+ *
+ * Included by model_Synapse_BEZ2018.c once with REAL defined as double and once as float; REAL_FN(name)
+ * gives the name of the function for that type (e.g. Synapse and SynapseF). All arrays that scale with
+ * the stimulus length (IHC input, power-law adaptation buffers and states, synapse output, adaptive
+ * redocking times and mean rates) have type REAL. Scalar parameters, the power-law kernels, the fGn and
+ * the per-site state of the spike generator (release times accumulated over the whole stimulus) are
+ * double in both cases.
+ */
+
+
+
+double REAL_FN(Synapse)(const REAL *ihcout,
+                        double tdres,
+                        double cf,
+                        int totalstim,
+                        int nrep,
+                        double spont,
+                        double noiseType,
+                        double implnt,
+                        double plaTol,
+                        double sampFreq,
+                        const double *decimTaps,
+                        const double *randNums,
+                        REAL *synout)
+{
+    /* Initalize Variables */
+    int    z, b;
+    int    resamp = ResampFactor(tdres, sampFreq);
+    REAL   incr = 0.0; int delaypoint = (int) floor(7500/(cf/1e3));
+
+    double alpha1, beta1, alpha2, beta2, binwidth;
+    REAL   I1, I2;
+    int    k,j,indx,i;
+
+    double cf_factor,cfslope,cfsat,cfconst,multFac,vihc;
+
+    REAL   *sout1, *sout2, *synSampOut, *powerLawIn, *mappingOut, *TmpSyn;
+    REAL   *m1, *m2, *m3, *m4, *m5;
+    REAL   *n1, *n2, *n3;
+
+    REAL   *sampIHC;
+
+    int    m, nexp1, nexp2;
+    double *decay1, *weight1, *decay2, *weight2;
+    REAL   *y1, *y2;
+    double t0 = 0, t1 = 0;
+    double ANProfileClock(void);
+    int PowerLawExpSum(double,
+                       double,
+                       int,
+                       double,
+                       double **,
+                       double **);
+
+    if (anprof_on) t0 = ANProfileClock();
+    mappingOut = (REAL*)calloc((long) ceil(totalstim*nrep),sizeof(REAL));
+    powerLawIn = (REAL*)calloc((long) ceil(totalstim*nrep+3*delaypoint),sizeof(REAL));
+    sout1 = (REAL*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(REAL));
+    sout2 = (REAL*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(REAL));
+    synSampOut = (REAL*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(REAL));
+    TmpSyn = (REAL*)calloc((long) ceil(totalstim*nrep+2*delaypoint),sizeof(REAL));
+
+    m1 = (REAL*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(REAL));
+    m2 = (REAL*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(REAL));
+    m3 = (REAL*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(REAL));
+    m4 = (REAL*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(REAL));
+    m5 = (REAL*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(REAL));
+
+    n1 = (REAL*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(REAL));
+    n2 = (REAL*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(REAL));
+    n3 = (REAL*)calloc((long) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq),sizeof(REAL));
+
+    /* ================================================== */
+    /* ====== Parameters of the power-law function ====== */
+    /* ================================================== */
+    binwidth = 1/sampFreq;
+    alpha1 = 1.5e-6*100e3; beta1 = 5e-4; I1 = 0;
+    alpha2 = 1e-2*100e3; beta2 = 1e-1; I2 = 0;
+    if (implnt==2) /* Sum-of-exponentials kernels for the FAST ACTUAL implementation */
+    {
+        nexp1 = PowerLawExpSum(beta1, binwidth, (int) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq), plaTol, &decay1, &weight1);
+        nexp2 = PowerLawExpSum(beta2, binwidth, (int) ceil((totalstim*nrep+2*delaypoint)*tdres*sampFreq), plaTol, &decay2, &weight2);
+        y1 = (REAL*)calloc(nexp1,sizeof(REAL));
+        y2 = (REAL*)calloc(nexp2,sizeof(REAL));
+    }
+    /* The random sequence (fGn with SynapseNoiseLength samples) is passed in as randNums */
+    /* ============================================================== */
+    /* ====== Mapping function from IHCOUT to input to the PLA ====== */
+    /* ============================================================== */
+    cfslope = pow(spont,0.19)*pow(10,-0.87);
+    cfconst = 0.1*pow(log10(spont),2)+0.56*log10(spont)-0.84;
+    cfsat = pow(10,(cfslope*8965.5/1e3 + cfconst));
+    cf_factor = __min(cfsat,pow(10,cfslope*cf/1e3 + cfconst))*2.0;
+    multFac = __max(2.95*__max(1.0,1.5-spont/100),4.3-0.2*cf/1e3);
+    k = 0;
+    for (indx=0; indx<totalstim*nrep; ++indx)
+    {
+        vihc = ihcout[indx];
+        mappingOut[k] = pow(10,(0.9*log10(fabs(vihc)*cf_factor))+ multFac);
+        if (vihc<0) mappingOut[k] = - mappingOut[k];
+        k=k+1;
+    }
+    for (k=0; k<delaypoint; k++)
+        powerLawIn[k] = mappingOut[0]+3.0*spont;
+    for (k=delaypoint; k<totalstim*nrep+delaypoint; k++)
+        powerLawIn[k] = mappingOut[k-delaypoint]+3.0*spont;
+    for (k=totalstim*nrep+delaypoint; k<totalstim*nrep+3*delaypoint; k++)
+        powerLawIn[k] = powerLawIn[k-1]+3.0*spont;
+    /* ========================================================== */
+    /* ====== Downsampling to sampFreq (low) sampling rate ====== */
+    /* ========================================================== */
+    if (anprof_on) t1 = ANProfileClock();
+    sampIHC = REAL_FN(Decimate)(k, powerLawIn, resamp, decimTaps);
+    free(powerLawIn); free(mappingOut);
+    if (anprof_on)
+    {
+        anprof.t_decimate += ANProfileClock()-t1;
+        anprof.n_decimate++;
+        t1 = ANProfileClock();
+    }
+    /* ========================================== */
+    /* ====== Running power-law adaptation ====== */
+    /* ========================================== */
+    k = 0;
+    for (indx=0; indx<floor((totalstim*nrep+2*delaypoint)*tdres*sampFreq); indx++)
+    {
+        sout1[k] = __max( 0, sampIHC[indx] + randNums[indx]- alpha1*I1);
+        sout2[k] = __max( 0, sampIHC[indx] - alpha2*I2);
+
+        if (implnt==1) /* ACTUAL implementation */
+        {
+            I1 = 0; I2 = 0;
+            for (j=0; j<k+1; ++j)
+            {
+                I1 += (sout1[j])*binwidth/((k-j)*binwidth + beta1);
+                I2 += (sout2[j])*binwidth/((k-j)*binwidth + beta2);
+            }
+        } /* End of ACTUAL implementation */
+
+        if (implnt==2) /* FAST ACTUAL implementation (sum-of-exponentials kernels, linear time) */
+        {
+            I1 = 0; I2 = 0;
+            for (m=0; m<nexp1; ++m)
+            {
+                y1[m] = decay1[m]*y1[m] + sout1[k];
+                I1 += weight1[m]*y1[m];
+            }
+            for (m=0; m<nexp2; ++m)
+            {
+                y2[m] = decay2[m]*y2[m] + sout2[k];
+                I2 += weight2[m]*y2[m];
+            }
+        } /* End of FAST ACTUAL implementation */
+
+        if (implnt==0) /* APPROXIMATE implementation */
+        {
+            if (k==0)
+            {
+                n1[k] = 1.0e-3*sout2[k];
+                n2[k] = n1[k]; n3[0]= n2[k];
+            }
+            else if (k==1)
+            {
+                n1[k] = 1.992127932802320*n1[k-1] + 1.0e-3*(sout2[k] - 0.994466986569624*sout2[k-1]);
+                n2[k] = 1.999195329360981*n2[k-1] + n1[k] - 1.997855276593802*n1[k-1];
+                n3[k] = -0.798261718183851*n3[k-1] + n2[k] + 0.798261718184977*n2[k-1];
+            }
+            else
+            {
+                n1[k] = 1.992127932802320*n1[k-1] - 0.992140616993846*n1[k-2] + 1.0e-3*(sout2[k] - 0.994466986569624*sout2[k-1] + 0.000000000002347*sout2[k-2]);
+                n2[k] = 1.999195329360981*n2[k-1] - 0.999195402928777*n2[k-2]+n1[k] - 1.997855276593802*n1[k-1] + 0.997855827934345*n1[k-2];
+                n3[k] =-0.798261718183851*n3[k-1] - 0.199131619873480*n3[k-2]+n2[k] + 0.798261718184977*n2[k-1] + 0.199131619874064*n2[k-2];
+            }
+            I2 = n3[k];
+
+            if (k==0)
+            {
+                m1[k] = 0.2*sout1[k];
+                m2[k] = m1[k];
+                m3[k] = m2[k];
+                m4[k] = m3[k];
+                m5[k] = m4[k];
+            }
+            else if (k==1)
+            {
+                m1[k] = 0.491115852967412*m1[k-1] + 0.2*(sout1[k] - 0.173492003319319*sout1[k-1]);
+                m2[k] = 1.084520302502860*m2[k-1] + m1[k] - 0.803462163297112*m1[k-1];
+                m3[k] = 1.588427084535629*m3[k-1] + m2[k] - 1.416084732997016*m2[k-1];
+                m4[k] = 1.886287488516458*m4[k-1] + m3[k] - 1.830362725074550*m3[k-1];
+                m5[k] = 1.989549282714008*m5[k-1] + m4[k] - 1.983165053215032*m4[k-1];
+            }
+            else
+            {
+                m1[k] = 0.491115852967412*m1[k-1] - 0.055050209956838*m1[k-2]+ 0.2*(sout1[k]- 0.173492003319319*sout1[k-1]+ 0.000000172983796*sout1[k-2]);
+                m2[k] = 1.084520302502860*m2[k-1] - 0.288760329320566*m2[k-2] + m1[k] - 0.803462163297112*m1[k-1] + 0.154962026341513*m1[k-2];
+                m3[k] = 1.588427084535629*m3[k-1] - 0.628138993662508*m3[k-2] + m2[k] - 1.416084732997016*m2[k-1] + 0.496615555008723*m2[k-2];
+                m4[k] = 1.886287488516458*m4[k-1] - 0.888972875389923*m4[k-2] + m3[k] - 1.830362725074550*m3[k-1] + 0.836399964176882*m3[k-2];
+                m5[k] = 1.989549282714008*m5[k-1] - 0.989558985673023*m5[k-2] + m4[k] - 1.983165053215032*m4[k-1] + 0.983193027347456*m4[k-2];
+            }
+            I1 = m5[k];
+        } /* End of APPROXIMATE implementation */
+
+        synSampOut[k] = sout1[k] + sout2[k];
+        k = k+1;
+    } /* End of all samples */
+    if (anprof_on)
+    {
+        anprof.t_pla += ANProfileClock()-t1;
+        anprof.n_pla++;
+    }
+
+    free(sout1);
+    free(sout2);
+    free(m1);
+    free(m2);
+    free(m3);
+    free(m4);
+    free(m5);
+    free(n1);
+    free(n2);
+    free(n3);
+    if (implnt==2)
+    {
+        free(decay1); free(weight1); free(y1);
+        free(decay2); free(weight2); free(y2);
+    }
+    /* ================================================================= */
+    /* ====== Upsampling to original (high 100 kHz) sampling rate ====== */
+    /* ================================================================= */
+    for(z=0; z<k-1; ++z)
+    {
+        incr = (synSampOut[z+1]-synSampOut[z])/resamp;
+        for(b=0; b<resamp; ++b)
+        {
+            TmpSyn[z*resamp+b] = synSampOut[z]+ b*incr;
+        }
+    }
+    for (i=0; i<totalstim*nrep; ++i)
+        synout[i] = TmpSyn[i+delaypoint];
+
+    free(synSampOut);
+    free(TmpSyn);
+    free(sampIHC);
+    if (anprof_on)
+    {
+        anprof.t_synapse += ANProfileClock()-t0;
+        anprof.n_synapse++;
+    }
+    return((long) ceil(totalstim*nrep));
+} /* End of the Synapse function */
+
+
+
+/* Advance the spike generator over synout[0 ... nsamp-1], the synapse output of time steps
+ * n0 ... n0+nsamp-1 (the first call must start at n0 = 0). Spike times (in seconds from the
+ * stimulus onset) found in this block are written to sptime and the adaptive mean redocking
+ * time to trd_vector (if not NULL). Returns the number of spikes, or -1 if more than
+ * MaxArraySizeSpikes-1 spikes were found (the state of the generator is then invalid). */
+long REAL_FN(SpikeGeneratorRun)(SPKGEN *g,
+                                const REAL *synout,
+                                long n0,
+                                long nsamp,
+                                long MaxArraySizeSpikes,
+                                double *sptime,
+                                REAL *trd_vector)
+{
+    int     nSites = g->nSites;
+    double  tdres = g->tdres, tabs = g->tabs, trel = g->trel;
+    double  *preReleaseTimeBinsSorted = g->preReleaseTimeBinsSorted;
+    int     *unitRateInterval = g->unitRateInterval;
+    double  *elapsed_time = g->elapsed_time;
+    double  *previous_release_times = g->previous_release_times;
+    double  *current_release_times = g->current_release_times;
+    double  *oneSiteRedock = g->oneSiteRedock;
+    double  *Xsum = g->Xsum;
+
+    long    spCount; /* Number of spikes fired in this block */
+    long    k, kEnd; /* The loop continues from the time step reached by the previous block */
+    int     siteNo;
+    double  trel_k;
+    int     oneSiteRedock_rounded, elapsed_time_rounded ;
+    void    SpikeGeneratorStart(SPKGEN *, double);
+
+    if (nsamp<=0) return 0;
+    if (!g->started) SpikeGeneratorStart(g, synout[0]);
+    spCount = 0;
+    k = g->k;
+    kEnd = n0+nsamp;
+
+    /* A loop to find the spike times for all the time steps of the block */
+    while (k < kEnd)
+    {
+        for (siteNo = 0; siteNo<nSites; siteNo++)
+        {
+            if ( k > preReleaseTimeBinsSorted [siteNo] )
+            {
+                /* Redocking times do not necessarily occur exactly at time step value -- calculate the
+                 * number of integer steps for the elapsed time and redocking time */
+                oneSiteRedock_rounded = (int) floor(oneSiteRedock[siteNo]/tdres);
+                elapsed_time_rounded = (int) floor(elapsed_time[siteNo]/tdres);
+                if ( oneSiteRedock_rounded == elapsed_time_rounded )
+                {
+                    /* Jump trd by t_rd_jump if a redocking event has occurred */
+                    g->current_redocking_period = g->previous_redocking_period + g->t_rd_jump;
+                    g->previous_redocking_period = g->current_redocking_period;
+                    g->t_rd_decay = 0; /* Don't decay the value of current_redocking_period if a jump has occurred */
+                    g->rd_first = 1; /* Flag for when a jump has first occurred */
+                }
+                /* To be sure that for each site, the code start from its
+                 * associated previus release time :*/
+                elapsed_time[siteNo] = elapsed_time[siteNo] + tdres;
+            };
+            /* The elapsed time passes the one time redock (the redocking is finished),
+             * In this case the synaptic vesicle starts sensing the input
+             * for each site integration starts after the redocking is finished for the corresponding site) */
+            if ( elapsed_time[siteNo] >= oneSiteRedock [siteNo] )
+            {
+                Xsum[siteNo] = Xsum[siteNo] + synout[__max(0,k)-n0] / nSites;
+                /* There are nSites integrals each vesicle senses 1/nosites of the whole rate */
+            }
+            if ( (Xsum[siteNo] >= unitRateInterval[siteNo]) && (k >= preReleaseTimeBinsSorted [siteNo]) )
+            {
+                /* An event -- a release happened for the siteNo */
+                oneSiteRedock[siteNo] = -g->current_redocking_period*log(philox_uniform(&g->rng));
+                current_release_times[siteNo] = previous_release_times[siteNo] + elapsed_time[siteNo];
+                elapsed_time[siteNo] = 0;
+                if ( (current_release_times[siteNo] >= g->current_refractory_period) )
+                {
+                    /* A spike occured for the current event -- release
+                     * spike_times[(int)(current_release_times[siteNo]/tdres)-kInit+1 ] = 1; */
+                    /* Register only non-negative spike times */
+                    if (current_release_times[siteNo] >= 0)
+                    {
+                        sptime[spCount] = current_release_times[siteNo]; spCount = spCount + 1;
+                    }
+                    trel_k = __min(trel*100/synout[__max(0,k)-n0],trel);
+                    g->Tref = tabs-trel_k*log(philox_uniform(&g->rng)); /*Refractory periods */
+                    g->current_refractory_period = current_release_times[siteNo] + g->Tref;
+                }
+                previous_release_times[siteNo] = current_release_times[siteNo];
+                Xsum[siteNo] = 0;
+                unitRateInterval[siteNo] = (int) (-log(philox_uniform(&g->rng)) / tdres);
+            };
+            /* Error Catching */
+            if ( (spCount+1)>MaxArraySizeSpikes )
+            {
+                /* mexPrintf (" Array for spike times not large enough, re-running the function."); */
+                spCount = -1;
+                k = kEnd;
+                siteNo = nSites;
+            }
+        };
+
+        /* Decay the adapative mean redocking time towards the resting value if no redocking events occurred in this time step */
+        if ( (g->t_rd_decay==1) && (g->rd_first==1) )
+        {
+            g->current_redocking_period = g->previous_redocking_period - (tdres/g->tau)*( g->previous_redocking_period-g->t_rd_rest );
+            g->previous_redocking_period = g->current_redocking_period;
+        }
+        else
+        {
+            g->t_rd_decay = 1;
+        }
+
+        /* Store the value of the adaptive mean redocking time if it is within the simulation output period */
+        if ( (trd_vector) && (k>=0) && (k>=n0) && (k<kEnd) )
+        {
+            trd_vector [k-n0] = g->current_redocking_period;
+        }
+        k = k+1;
+    };
+    g->k = k;
+    return (spCount);
+} /* End of the SpikeGeneratorRun function */
+
+
+
+/* Pass the output of Synapse model through the Spike Generator */
+int REAL_FN(SpikeGenerator)(REAL *synout,
+                            double tdres,
+                            double t_rd_rest,
+                            double t_rd_init,
+                            double tau,
+                            double t_rd_jump,
+                            int nSites,
+                            double tabs,
+                            double trel,
+                            double spont,
+                            int totalstim,
+                            int nrep,
+                            double total_mean_rate,
+                            long MaxArraySizeSpikes,
+                            double *sptime,
+                            REAL *trd_vector,
+                            unsigned long long seed,
+                            int cf_idx,
+                            int spont_idx,
+                            int train_idx)
+{
+    SPKGEN  *gen;
+    long    spCount; /* Total number of spikes fired */
+    double  t0 = 0;
+    double  ANProfileClock(void);
+
+    SPKGEN *SpikeGeneratorNew(double, double, double, double, double, int, double, double, long,
+                              unsigned long long, int, int, int);
+    void SpikeGeneratorFree(SPKGEN *);
+
+    if (anprof_on) t0 = ANProfileClock();
+    /* The process is started at most totalstim*nrep samples before the stimulus onset */
+    gen = SpikeGeneratorNew(tdres, t_rd_rest, t_rd_init, tau, t_rd_jump, nSites, tabs, trel,
+                            -(long)totalstim*nrep, seed, cf_idx, spont_idx, train_idx);
+    spCount = REAL_FN(SpikeGeneratorRun)(gen, synout, 0, (long)totalstim*nrep, MaxArraySizeSpikes, sptime, trd_vector);
+    if (anprof_on)
+    {
+        /* Two 32-bit words per uniform, two uniforms per Philox block */
+        anprof.n_rand += 2*(long)gen->rng.ctr[0] - (gen->rng.idx==2);
+        anprof.n_spikes += __max(spCount, 0);
+        anprof.n_spikegen++;
+    }
+    SpikeGeneratorFree(gen);
+    if (anprof_on) anprof.t_spikegen += ANProfileClock()-t0;
+    return (spCount);
+} /* End of the SpikeGenerator function */
+
+
+
+/* Body of SpikeTrains with the IHC input, synapse output and mean rate of type REAL */
+int REAL_FN(RunSpikeTrains)(const REAL *px,
+                            double cf,
+                            int nrep,
+                            double tdres,
+                            int totalstim,
+                            double noiseType,
+                            double implnt,
+                            double plaTol,
+                            double spont,
+                            double tabs,
+                            double trel,
+                            double synapseMode,
+                            int numTrains,
+                            long maxSpikes,
+                            long spikeStride,
+                            unsigned long long seed,
+                            int cf_idx,
+                            int spont_idx,
+                            const double *decimTaps,
+                            const double *randNums,
+                            int noiseLen,
+                            REAL *synout,
+                            REAL *meanrate,
+                            double *spikeTimes)
+{
+    REAL   *trd_vector;
+    double tau, t_rd_rest, t_rd_init, t_rd_jump, trel_i;
+    int    nSites;
+    int    i, itr_n, nspikes;
+    double I;
+    double sampFreq = 10e3; /* Sampling frequency used in the synapse */
+    double total_mean_rate, rate;
+    void RedockingParams(double, int *, double *, double *, double *, double *);
+
+    if ((implnt==2) && !(plaTol>0 && plaTol<1)) return -1; /* PowerLawExpSum needs 0 < plaTol < 1 */
+
+    /* ====== Synaptic Release/Spike Generation Parameters ====== */
+    RedockingParams(spont, &nSites, &t_rd_rest, &t_rd_init, &tau, &t_rd_jump);
+
+    trd_vector = (REAL*)calloc(totalstim*nrep,sizeof(REAL));
+    total_mean_rate = 0;
+    I = 0;
+    for (itr_n=0; itr_n<numTrains; itr_n++)
+    {
+        /* If synapseMode is 1, re-run the synapse model for each new spike train */
+        if ((itr_n==0) || (synapseMode==1))
+        {
+            I = REAL_FN(Synapse)(px, tdres, cf, totalstim, nrep, spont, noiseType, implnt, plaTol, sampFreq, decimTaps, randNums+(long)itr_n*noiseLen*(synapseMode==1), synout);
+            total_mean_rate = 0;
+            for (i=0; i<I; i++)
+                total_mean_rate = total_mean_rate + synout[i];
+            total_mean_rate = total_mean_rate/I;
+        }
+        nspikes = REAL_FN(SpikeGenerator)(synout,
+                                          tdres,
+                                          t_rd_rest,
+                                          t_rd_init,
+                                          tau,
+                                          t_rd_jump,
+                                          nSites,
+                                          tabs,
+                                          trel,
+                                          spont,
+                                          totalstim,
+                                          nrep,
+                                          total_mean_rate,
+                                          maxSpikes,
+                                          spikeTimes+itr_n*spikeStride,
+                                          trd_vector,
+                                          seed,
+                                          cf_idx,
+                                          spont_idx,
+                                          itr_n);
+        if (nspikes<0)
+        {
+            free(trd_vector);
+            return -1;
+        }
+        /* Estimate instantaneous mean firing rate on first iteration */
+        if (itr_n==0)
+        {
+            for (i=0; i<totalstim*nrep; i++)
+            {
+                if (synout[i]>0)
+                {
+                    trel_i = __min(trel*100/synout[i],trel);
+                    rate = synout[i]/(synout[i]*(tabs + trd_vector[i]/nSites + trel_i) + 1);
+                }
+                else
+                    rate = 0;
+                meanrate[i] = rate;
+            }
+        }
+    }
+    free(trd_vector);
+    return 0;
+} /* End of the RunSpikeTrains function */
+
+
+
+/* Body of MeanRates with the IHC input and synapse output of type REAL */
+int REAL_FN(RunMeanRates)(const REAL *px,
+                          double cf,
+                          double tdres,
+                          int totalstim,
+                          double noiseType,
+                          double implnt,
+                          double plaTol,
+                          double spont,
+                          double tabs,
+                          double trel,
+                          const double *decimTaps,
+                          const double *randNums,
+                          int q,
+                          const double *outTaps,
+                          float *meanrate)
+{
+    REAL   *synout, *rate, *rate_q;
+    double tau, t_rd_rest, t_rd_init, t_rd_jump, trel_i, trd, pdock, redock, a, b, c;
+    int    nSites;
+    int    i, nout;
+    double sampFreq = 10e3; /* Sampling frequency used in the synapse */
+    void RedockingParams(double, int *, double *, double *, double *, double *);
+
+    if ((q>1) && (totalstim<=3*(q+1))) return -1;
+    if ((implnt==2) && !(plaTol>0 && plaTol<1)) return -1; /* PowerLawExpSum needs 0 < plaTol < 1 */
+
+    RedockingParams(spont, &nSites, &t_rd_rest, &t_rd_init, &tau, &t_rd_jump);
+
+    synout = (REAL*)calloc(totalstim, sizeof(REAL));
+    rate = (REAL*)calloc(totalstim, sizeof(REAL));
+    REAL_FN(Synapse)(px, tdres, cf, totalstim, 1, spont, noiseType, implnt, plaTol, sampFreq, decimTaps, randNums, synout);
+
+    /* Steady state: (trd-t_rd_rest)*(1 + synout*trd/nSites) = tau*t_rd_jump*synout */
+    a = __max(synout[0],0)/nSites;
+    b = 1-t_rd_rest*a;
+    c = -(t_rd_rest+tau*t_rd_jump*nSites*a);
+    trd = (a>0) ? (-b+sqrt(b*b-4*a*c))/(2*a) : t_rd_rest;
+    pdock = 1/(1+a*trd);
+    for (i=0; i<totalstim; i++)
+    {
+        if (synout[i]>0)
+        {
+            trel_i = __min(trel*100/synout[i],trel);
+            rate[i] = synout[i]/(synout[i]*(tabs + trd/nSites + trel_i) + 1);
+        }
+        else
+            rate[i] = 0;
+        redock = (1-pdock)/trd;
+        pdock = pdock + tdres*(redock - pdock*__max(synout[i],0)/nSites);
+        pdock = __min(__max(pdock,0),1);
+        trd = trd + tdres*(t_rd_jump*nSites*redock - (trd-t_rd_rest)/tau);
+    }
+
+    if (q>1)
+    {
+        nout = DecimateLength(totalstim, q);
+        rate_q = REAL_FN(Decimate)(totalstim, rate, q, outTaps);
+        /* The lowpass filter can ring below zero at rate onsets */
+        for (i=0; i<nout; i++) meanrate[i] = (float) __max(0, rate_q[i]);
+        free(rate_q);
+    }
+    else
+    {
+        nout = totalstim;
+        for (i=0; i<nout; i++) meanrate[i] = (float) rate[i];
+    }
+    free(synout);
+    free(rate);
+    return nout;
+} /* End of the RunMeanRates function */
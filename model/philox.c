@@ -0,0 +1,114 @@
+/* Counter-based Philox4x32-10 random number generator (Salmon et al., SC 2011).
+ *
+ * NOTE: added to replace the `np.random.rand` callback in the spike generator
+ */
+
+#include <math.h>
+#include <stdint.h>
+
+#include "philox.h"
+
+#define PHILOX_M0 0xD2511F53U
+#define PHILOX_M1 0xCD9E8D57U
+#define PHILOX_W0 0x9E3779B9U
+#define PHILOX_W1 0xBB67AE85U
+
+
+
+/* Compute one 128-bit output block from a 128-bit counter and a 64-bit key (10 rounds) */
+void philox4x32_10(const uint32_t *ctr, const uint32_t *key, uint32_t *out)
+{
+    uint32_t c0 = ctr[0], c1 = ctr[1], c2 = ctr[2], c3 = ctr[3];
+    uint32_t k0 = key[0], k1 = key[1];
+    uint64_t prod0, prod1;
+    int      round;
+
+    for (round=0; round<10; round++)
+    {
+        prod0 = (uint64_t) PHILOX_M0 * c0;
+        prod1 = (uint64_t) PHILOX_M1 * c2;
+        c0 = (uint32_t) (prod1 >> 32) ^ c1 ^ k0;
+        c2 = (uint32_t) (prod0 >> 32) ^ c3 ^ k1;
+        c1 = (uint32_t) prod1;
+        c3 = (uint32_t) prod0;
+        k0 += PHILOX_W0;
+        k1 += PHILOX_W1;
+    }
+    out[0] = c0; out[1] = c1; out[2] = c2; out[3] = c3;
+}
+
+
+
+/* Initialize the stream of a single fiber (spike train) */
+void philox_init(PHILOX *rng,
+                 uint64_t seed,
+                 uint32_t stream,
+                 uint32_t cf_idx,
+                 uint32_t spont_idx,
+                 uint32_t train_idx)
+{
+    rng->key[0] = (uint32_t) seed;
+    rng->key[1] = (uint32_t) (seed >> 32);
+    rng->ctr[0] = 0;
+    rng->ctr[1] = train_idx;
+    rng->ctr[2] = spont_idx;
+    rng->ctr[3] = (stream << 24) | (cf_idx & 0xFFFFFF);
+    rng->idx = 4; /* No block has been generated yet */
+}
+
+
+
+/* Draw a uniform random number in the open interval (0, 1) with 53-bit resolution */
+double philox_uniform(PHILOX *rng)
+{
+    uint32_t a, b;
+
+    if (rng->idx > 2)
+    {
+        philox4x32_10(rng->ctr, rng->key, rng->out);
+        rng->ctr[0]++;
+        rng->idx = 0;
+    }
+    a = rng->out[rng->idx++] >> 5;
+    b = rng->out[rng->idx++] >> 6;
+    return ((double) a * 67108864.0 + (double) b + 0.5) / 9007199254740992.0;
+}
+
+
+
+/* Fill out[0..n-1] with the standard normal samples start..start+n-1 of a stream
+ * (Box-Muller, two samples per block, so any range is drawn without the samples before it) */
+void philox_normal_fill(uint64_t seed,
+                        uint32_t stream,
+                        uint32_t cf_idx,
+                        uint32_t spont_idx,
+                        uint32_t train_idx,
+                        uint64_t start,
+                        long n,
+                        double *out)
+{
+    PHILOX   rng;
+    uint64_t idx, block;
+    uint64_t current = ~(uint64_t) 0;
+    double   u1 = 0.5, u2 = 0.5;
+    long     j;
+
+    philox_init(&rng, seed, stream, cf_idx, spont_idx, train_idx);
+    for (j=0; j<n; j++)
+    {
+        idx = start + j;
+        block = idx >> 1;
+        if (block != current)
+        {
+            rng.ctr[0] = (uint32_t) block;
+            philox4x32_10(rng.ctr, rng.key, rng.out);
+            u1 = ((double) (rng.out[0] >> 5) * 67108864.0 + (double) (rng.out[1] >> 6) + 0.5) / 9007199254740992.0;
+            u2 = ((double) (rng.out[2] >> 5) * 67108864.0 + (double) (rng.out[3] >> 6) + 0.5) / 9007199254740992.0;
+            current = block;
+        }
+        if (idx & 1)
+            out[j] = sqrt(-2.0*log(u1)) * sin(6.283185307179586*u2);
+        else
+            out[j] = sqrt(-2.0*log(u1)) * cos(6.283185307179586*u2);
+    }
+}
@@ -0,0 +1,39 @@
+/* Counter-based Philox4x32-10 random number generator (Salmon et al., SC 2011).
+ *
+ * Every stream is addressed by a 64-bit seed plus the (stream, cf_idx, spont_idx, train_idx)
+ * identifiers of the fiber it belongs to, so random numbers drawn for one spike train do not
+ * depend on how many numbers were drawn for any other train (or on the order of execution).
+ */
+
+#include <stdint.h>
+
+#define PHILOX_STREAM_SPIKES 1 /* Stream identifier for the spike generator */
+#define PHILOX_STREAM_FFGN 2   /* Stream identifier for the synapse fGn normals */
+
+typedef struct
+{
+    uint32_t key[2]; /* 64-bit seed */
+    uint32_t ctr[4]; /* {block, train_idx, spont_idx, (stream << 24) | cf_idx} */
+    uint32_t out[4]; /* Output of the most recent block */
+    int      idx;    /* Index of the next unused word in out */
+} PHILOX;
+
+void philox_init(PHILOX *rng,
+                 uint64_t seed,
+                 uint32_t stream,
+                 uint32_t cf_idx,
+                 uint32_t spont_idx,
+                 uint32_t train_idx);
+
+void philox4x32_10(const uint32_t *ctr, const uint32_t *key, uint32_t *out);
+
+double philox_uniform(PHILOX *rng);
+
+void philox_normal_fill(uint64_t seed,
+                        uint32_t stream,
+                        uint32_t cf_idx,
+                        uint32_t spont_idx,
+                        uint32_t train_idx,
+                        uint64_t start,
+                        long n,
+                        double *out);
@@ -0,0 +1,104 @@
+import collections
+import contextlib
+import time
+
+
+class Profile:
+    '''
+    Accumulator of the wall time and call counts of model stages and of event
+    counters (spikes generated, random numbers consumed). Stage times of the CF
+    channels are measured in the thread or process that ran them and summed, so
+    they add up to more than the wall time of a CF-parallel run ('nervegram' is
+    the wall time of the whole call). Profiles of many runs (e.g. a dataset) are
+    combined with `update` or `aggregate_profiles`.
+    '''
+
+    def __init__(self, profile=None):
+        '''
+        Args
+        ----
+        profile (Profile, dict, or None): initial timings and counters (see `to_dict`)
+        '''
+        self.time = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self.counters = collections.defaultdict(int)
+        if profile is not None:
+            self.update(profile)
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        '''
+        Context manager adding the wall time of the enclosed block to `stage`.
+        '''
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - t0)
+
+    def add(self, stage, seconds, calls=1):
+        self.time[stage] += seconds
+        self.calls[stage] += calls
+
+    def count(self, counter, n):
+        self.counters[counter] += n
+
+    def update(self, profile):
+        '''
+        Add the timings and counters of another profile (Profile or dict, None is ignored).
+        '''
+        if profile is None:
+            return self
+        if isinstance(profile, Profile):
+            profile = profile.to_dict()
+        for stage, seconds in profile.get('time', {}).items():
+            self.time[stage] += seconds
+        for stage, calls in profile.get('calls', {}).items():
+            self.calls[stage] += calls
+        for counter, n in profile.get('counters', {}).items():
+            self.counters[counter] += n
+        return self
+
+    def to_dict(self):
+        '''
+        Returns
+        -------
+        profile (dict): {'time': {stage: s}, 'calls': {stage: n}, 'counters': {counter: n}}
+        '''
+        return {
+            'time': dict(self.time),
+            'calls': dict(self.calls),
+            'counters': dict(self.counters),
+        }
+
+    def summary(self):
+        '''
+        Returns a table of the stages sorted by total time and the counters.
+        '''
+        lines = ['{:20s} {:>12s} {:>10s} {:>12s}'.format('stage', 'time (s)', 'calls', 'per call (s)')]
+        for stage in sorted(self.time, key=self.time.get, reverse=True):
+            calls = self.calls[stage]
+            lines.append('{:20s} {:12.4f} {:10d} {:12.6f}'.format(
+                stage, self.time[stage], calls, self.time[stage] / max(calls, 1)))
+        for counter in sorted(self.counters):
+            lines.append('{:20s} {:12d}'.format(counter, self.counters[counter]))
+        return '\n'.join(lines)
+
+
+def aggregate_profiles(profiles):
+    '''
+    Sum the timings and counters of many profiles (e.g. `output_dict['profile']`
+    of every stimulus in a dataset).
+
+    Args
+    ----
+    profiles (iterable): Profile objects or dicts (see `Profile.to_dict`)
+
+    Returns
+    -------
+    profile (dict): combined timings and counters
+    '''
+    total = Profile()
+    for profile in profiles:
+        total.update(profile)
+    return total.to_dict()
@@ -10,6 +10,8 @@ extensions = []
 extensions.append(Extension("cython_bez2018",
                             ["cython_bez2018.pyx",
                              "complex.c",
+                             "philox.c",
+                             "decimate.c",
                              "model_IHC_BEZ2018.c",
                              "model_Synapse_BEZ2018.c"]))
 
@@ -0,0 +1,288 @@
+import collections.abc
+import concurrent.futures
+import inspect
+import itertools
+
+import numpy as np
+from tqdm import tqdm
+
+from model.bez2018model import (
+    get_ANmodel_cf_kwargs,
+    get_nervegram_cf_params,
+    get_nervegram_pin,
+    nervegram,
+    run_ANmodel_cf,
+    stack_ANmodel_outputs,
+)
+from model.cython_bez2018 import run_ihc_bank
+
+
+def freeze(value):
+    '''
+    Helper function converts a parameter value (scalar, list, or np.ndarray)
+    to a hashable key (nested lists and arrays become tuples).
+    '''
+    if isinstance(value, np.ndarray):
+        return freeze(value.tolist())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def get_grid_points(grid):
+    '''
+    Helper function expands a parameter grid into a list of grid points.
+
+    Args
+    ----
+    grid (dict or list): dict mapping `nervegram` argument names to lists of values
+        (all combinations are swept) or list of dicts (explicit grid points)
+
+    Returns
+    -------
+    names (list): swept argument names
+    points (list): one dict of argument values per grid point
+    '''
+    if isinstance(grid, dict):
+        names = list(grid.keys())
+        points = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    else:
+        points = [dict(point) for point in grid]
+        names = list(points[0].keys()) if points else []
+        msg = "all grid points must specify the same arguments"
+        assert all(list(point.keys()) == names for point in points), msg
+    return names, points
+
+
+class SweepResult(collections.abc.Mapping):
+    '''
+    Outputs of `sweep` indexed by grid point. Keys are tuples of the swept argument
+    values (ordered as `names`, lists are converted to tuples); a dict of argument
+    values can also be used as key. `stats` holds the number of distinct stage
+    computations and the number of stage computations requested by the grid.
+    '''
+
+    def __init__(self, names, points, outputs, stats):
+        self.names = list(names)
+        self.points = points
+        self.stats = stats
+        self._outputs = {self.key(point): output for point, output in zip(points, outputs)}
+
+    def key(self, point):
+        if isinstance(point, dict):
+            return tuple(freeze(point[name]) for name in self.names)
+        return freeze(point)
+
+    def __getitem__(self, point):
+        return self._outputs[self.key(point)]
+
+    def __iter__(self):
+        return iter(self._outputs)
+
+    def __len__(self):
+        return len(self._outputs)
+
+
+def map_jobs(fn, jobs, n_workers=None, desc=None):
+    '''
+    Helper function runs `fn(*job)` for every job (in a thread pool if n_workers > 1;
+    the C model kernels release the GIL) and returns the outputs in job order.
+    '''
+    if (n_workers is None) or (n_workers <= 1):
+        return [fn(*job) for job in tqdm(jobs, desc=desc)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(fn, *job) for job in jobs]
+        return [future.result() for future in tqdm(futures, desc=desc)]
+
+
+def sweep(signal, signal_fs, grid, n_workers=None, cf_block_size=16, **kwargs):
+    '''
+    Generate nervegrams of one stimulus for every point of a parameter grid. The
+    model is split into a dependency graph of stages and every distinct stage input
+    is computed only once across the grid:
+        resample (pin_fs, pin_dBSPL_flag, pin_dBSPL)
+        -> IHC (cf, species, bandwidth_scale_factor, cohc, cihc, IhcLowPass_cutoff, IhcLowPass_order)
+        -> synapse and spike generator (spont, noise, refractoriness, spike trains, random seed)
+    e.g. a sweep over `spont_list` or `random_seed` runs the IHC model once per CF, and
+    a sweep over `cohc` re-uses the IHC outputs of the CFs whose `cohc` does not change.
+    The deduplicated IHC blocks and synapse jobs are run in a pool of `n_workers` threads.
+    The output of each grid point is identical to `nervegram(signal, signal_fs, **point, **kwargs)`.
+
+    Args
+    ----
+    signal (np.ndarray): input pressure waveform(s) with time on axis 0 (units Pa)
+    signal_fs (int): sampling rate of input signal (Hz)
+    grid (dict or list): swept `nervegram` arguments (see `get_grid_points`)
+    n_workers (int or None): number of threads used to run the deduplicated stages
+    cf_block_size (int): number of CF channels whose IHC filterbank is run together
+    kwargs (dict): all other keyword arguments are passed to `nervegram`; if `random_seed` is
+        None (and not swept), one random seed is drawn and shared by all grid points
+
+    Returns
+    -------
+    result (SweepResult): `nervegram` output dict of each grid point
+    '''
+    names, points = get_grid_points(grid)
+    defaults = {
+        name: param.default
+        for name, param in inspect.signature(nervegram).parameters.items()
+        if param.default is not inspect.Parameter.empty
+    }
+    if kwargs.get('random_seed', None) is None:
+        kwargs['random_seed'] = np.random.randint(np.iinfo(np.int32).max)
+    signal = np.asarray(signal, dtype=np.float64)
+    list_params = []
+    for point in points:
+        params = dict(defaults, **kwargs)
+        params.update(point)
+        cf_list, bandwidth_scale_factor, cohc, cihc = get_nervegram_cf_params(
+            cf_list=params['cf_list'],
+            num_cf=params['num_cf'],
+            min_cf=params['min_cf'],
+            max_cf=params['max_cf'],
+            bandwidth_scale_factor=params['bandwidth_scale_factor'],
+            cohc=params['cohc'],
+            cihc=params['cihc'])
+        params.update(cf_list=cf_list, bandwidth_scale_factor=bandwidth_scale_factor, cohc=cohc, cihc=cihc)
+        list_params.append(params)
+    stats = {}
+
+    # Resample stage (keyed by the arguments of `get_nervegram_pin`)
+    pin_keys = [freeze([p['pin_fs'], p['pin_dBSPL_flag'], p['pin_dBSPL']]) for p in list_params]
+    pins = {}
+    for pin_key, params in zip(pin_keys, list_params):
+        if pin_key not in pins:
+            pin, pin_dBSPL = get_nervegram_pin(
+                signal,
+                signal_fs,
+                pin_fs=params['pin_fs'],
+                pin_dBSPL_flag=params['pin_dBSPL_flag'],
+                pin_dBSPL=params['pin_dBSPL'])
+            pins[pin_key] = (pin.reshape([pin.shape[0], -1]), pin_dBSPL)
+    stats['resample'] = (len(pins), len(list_params))
+    num_channel = next(iter(pins.values()))[0].shape[1]
+
+    # IHC stage (keyed by input waveform and IHC arguments of each CF)
+    list_kwargs_cf = []
+    list_ihc_keys = []
+    list_cf_indices = []
+    ihc_groups = {}
+    for pin_key, params in zip(pin_keys, list_params):
+        kwargs_cf = get_ANmodel_cf_kwargs(**{
+            name: params[name]
+            for name in inspect.signature(get_ANmodel_cf_kwargs).parameters
+            if name in params
+        })
+        list_kwargs_cf.append(kwargs_cf)
+        cf_indices = params['cf_indices']
+        if cf_indices is None:
+            cf_indices = range(len(kwargs_cf['cf_list']))
+        list_cf_indices.append(cf_indices)
+        ihc_keys = []
+        for cf_idx in cf_indices:
+            cf = kwargs_cf['cf_list'][cf_idx]
+            group_key = freeze([
+                pin_key,
+                kwargs_cf['species'],
+                kwargs_cf['IhcLowPass_cutoff'],
+                kwargs_cf['IhcLowPass_order'],
+                kwargs_cf['compute_dtype'],
+            ])
+            cf_key = freeze([
+                cf,
+                kwargs_cf['bandwidth_scale_factor'][cf_idx],
+                kwargs_cf['cohc'][cf_idx],
+                kwargs_cf['cihc'][cf_idx],
+            ])
+            ihc_groups.setdefault(group_key, {})[cf_key] = None
+            ihc_keys.append((group_key, cf_key))
+        list_ihc_keys.append(ihc_keys)
+    ihc_jobs = []
+    for group_key, cf_keys in ihc_groups.items():
+        cf_keys = list(cf_keys)
+        for itr in range(0, len(cf_keys), max(1, cf_block_size)):
+            for itr_channel in range(num_channel):
+                ihc_jobs.append((group_key, itr_channel, cf_keys[itr:itr + max(1, cf_block_size)]))
+
+    def run_ihc_block(group_key, itr_channel, cf_keys):
+        pin_key, species, IhcLowPass_cutoff, IhcLowPass_order, compute_dtype = group_key
+        cf_list, bandwidth_scale_factor, cohc, cihc = zip(*cf_keys)
+        return run_ihc_bank(
+            np.ascontiguousarray(pins[pin_key][0][:, itr_channel]),
+            pin_key[0],
+            cf_list,
+            species=species,
+            bandwidth_scale_factor=bandwidth_scale_factor,
+            cohc=cohc,
+            cihc=cihc,
+            IhcLowPass_cutoff=IhcLowPass_cutoff,
+            IhcLowPass_order=IhcLowPass_order,
+            dtype=compute_dtype)
+
+    vihcs = {}
+    for (group_key, itr_channel, cf_keys), block_vihc in zip(
+            ihc_jobs, map_jobs(run_ihc_block, ihc_jobs, n_workers=n_workers, desc='IHC')):
+        for cf_key, vihc in zip(cf_keys, block_vihc):
+            vihcs[(group_key, cf_key, itr_channel)] = vihc
+    stats['ihc'] = (len(vihcs), sum(len(ihc_keys) for ihc_keys in list_ihc_keys) * num_channel)
+
+    # Synapse and spike generator stage (keyed by IHC output and all remaining model arguments)
+    list_syn_keys = []
+    syn_jobs = {}
+    for params, kwargs_cf, cf_indices, ihc_keys in zip(list_params, list_kwargs_cf, list_cf_indices, list_ihc_keys):
+        spont_list = kwargs_cf['spont_list']
+        num_spike_trains_list = kwargs_cf['num_spike_trains_list']
+        scalar_kwargs = freeze(sorted(
+            (name, value) for name, value in kwargs_cf.items()
+            if name not in ['cf_list', 'bandwidth_scale_factor', 'cohc', 'cihc', 'list_spont',
+                            'spont_list', 'num_spike_trains', 'num_spike_trains_list']
+        ))
+        syn_keys = []
+        for itr_channel in range(num_channel):
+            channel_keys = []
+            for cf_idx, ihc_key in zip(cf_indices, ihc_keys):
+                random_seed_key = tuple(params['random_seed_key']) + (itr_channel,)
+                syn_key = freeze([
+                    ihc_key,
+                    random_seed_key,
+                    cf_idx,
+                    params['random_seed'],
+                    kwargs_cf['list_spont'] if spont_list is None else spont_list[cf_idx],
+                    kwargs_cf['num_spike_trains'] if num_spike_trains_list is None else num_spike_trains_list[cf_idx],
+                    scalar_kwargs,
+                ])
+                if syn_key not in syn_jobs:
+                    syn_jobs[syn_key] = (ihc_key, itr_channel, cf_idx, params['random_seed'], random_seed_key, kwargs_cf)
+                channel_keys.append(syn_key)
+            syn_keys.append(channel_keys)
+        list_syn_keys.append(syn_keys)
+
+    def run_synapse_job(ihc_key, itr_channel, cf_idx, random_seed, random_seed_key, kwargs_cf):
+        return run_ANmodel_cf(
+            None,
+            cf_idx,
+            vihc=vihcs[ihc_key + (itr_channel,)],
+            random_seed=random_seed,
+            random_seed_key=random_seed_key,
+            **kwargs_cf)
+
+    syn_outs = dict(zip(
+        syn_jobs.keys(),
+        map_jobs(run_synapse_job, list(syn_jobs.values()), n_workers=n_workers, desc='ANF')))
+    stats['synapse'] = (len(syn_jobs), sum(len(ihc_keys) for ihc_keys in list_ihc_keys) * num_channel)
+
+    # Assemble the nervegram of each grid point
+    outputs = []
+    for pin_key, params, kwargs_cf, syn_keys in zip(pin_keys, list_params, list_kwargs_cf, list_syn_keys):
+        pin, pin_dBSPL = pins[pin_key]
+        anmodel_outputs = [
+            stack_ANmodel_outputs([syn_outs[syn_key] for syn_key in channel_keys], **kwargs_cf)
+            for channel_keys in syn_keys
+        ]
+        outputs.append(nervegram(
+            signal,
+            signal_fs,
+            **dict(params, pin=pin, pin_dBSPL=pin_dBSPL, anmodel_outputs=anmodel_outputs)))
+    return SweepResult(names, points, outputs, stats)
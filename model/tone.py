@@ -1,7 +1,7 @@
 from model import generate_spikes_sync
 import numpy as np
 import os
-from cache import SPIKES_DIR
+from cache import SPIKES_DIR, load_spikes, save_spikes_array
 
 TONE_SPIKES_DIR = os.path.join(SPIKES_DIR, "tone")
 
@@ -26,20 +26,20 @@ def generate_pure_tone(frequency, duration=0.25, sample_rate=44100):
     return samples
 
 
-def save_spikes_tone(freq):
+def save_spikes_tone(freq, codec=True):
     tone = generate_pure_tone(freq)
     spike_times = generate_spikes_sync((44100, tone))
     if spike_times.shape == (1, 3500,18,100):
         spike_times = spike_times[0]
     if spike_times.shape != (3500,18,100):
         print(f"ERROR: {freq} tone spikes has shape {spike_times.shape}")
-    np.save(os.path.join(TONE_SPIKES_DIR, f"{freq}.npy"), spike_times)
+    save_spikes_array(os.path.join(TONE_SPIKES_DIR, str(freq)), spike_times, codec=codec)
 
 def get_tone_spikes(freq, attempts=0):
     max_attempts = 3  # Maximum number of attempts
     
     try:
-        spikes = np.load(os.path.join(TONE_SPIKES_DIR, f"{freq}.npy"))
+        spikes = load_spikes(os.path.join(TONE_SPIKES_DIR, f"{freq}"))
         return spikes
     
     except OSError:
@@ -1,29 +1,77 @@
+import functools
 import numpy as np
 import scipy.signal
 
 
-def ffGn(N, tdres, Hinput, noiseType, mu, sigma=1):
+@functools.lru_cache(maxsize=64)
+def ffGn_spectrum(Nfft, H):
     """
-    Python ffGn implementation based on MATLAB code (ffGn.m); modified from
-    https://github.com/mrkrd/cochlea/tree/master/cochlea/zilany2014/util.py
+    Square root of the FFT of the circulant covariance of fGn with Hurst index H
+    (memoized per (Nfft, H), replacing the persistent variables of ffGn.m).
+    The returned array is shared between calls and is read-only.
+    """
+    NfftHalf = np.round(Nfft / 2)
+    k = np.concatenate( (np.arange(0,NfftHalf), np.arange(NfftHalf,0,-1)) )
+    Zmag = 0.5 * ( (k+1)**(2*H) -2*k**(2*H) + np.abs(k-1)**(2*H) )
+    Zmag = np.real(np.fft.fft(Zmag))
+    assert np.all(Zmag >= 0), 'FFT of the circulant covariance has negative values.'
+    Zmag = np.sqrt(Zmag)
+    Zmag.setflags(write=False)
+    return Zmag
+
+
+def _randn(rng, K, n):
+    """
+    Draw a [K, n] array of standard normal samples, either from a single generator
+    (np.random module or np.random.Generator) or row-by-row from a sequence of K generators.
+    """
+    if isinstance(rng, (list, tuple)):
+        assert len(rng) == K, "one generator per realization is required"
+        return np.stack([g.standard_normal(n) for g in rng], axis=0)
+    return rng.standard_normal((K, n))
+
+
+def ffGn_batch(K, N, tdres, Hinput, noiseType, mu, rng=None):
+    """
+    Generate K independent realizations of ffGn (see `ffGn`) with a single
+    (batched) FFT and resampling call.
+
+    Args
+    ----
+    K (int): number of realizations
+    N (int): number of samples per realization
+    tdres (float): sampling period in seconds
+    Hinput (float): Hurst index (fGn if <= 1, fBn if > 1)
+    noiseType (float): set to 0 for noiseless (zeros) and 1 for variable fGn
+    mu (float or np.ndarray): mean synaptic rate(s) setting the noise standard deviation
+        (scalar or one value per realization)
+    rng (None, np.random.Generator, or list): source of random numbers (np.random if None);
+        a list of K generators draws each realization from its own generator (a single object
+        with per-row streams, e.g. `cython_bez2018.PhiloxNormals`, avoids one generator per row)
+
+    Returns
+    -------
+    y (np.float64 array): noise array with shape [K, N]
     """
     # Check arguments are valid
     assert (N > 0)
     assert (tdres < 1)
     assert (Hinput >= 0) and (Hinput <= 2)
-    
+    if rng is None:
+        rng = np.random
+
     # Here we change the meaning of `noiseType`, if it's 0, then we
     # return no noise at all.  If necessary, the seed can be set
     # outside by calling np.random.seed()
     if noiseType == 0:
-        return np.zeros(N)
-    
+        return np.zeros([K, N])
+
     # Downsampling No. of points to match with those of Scott Jackson (tau 1e-1)
     resamp = int(np.ceil(1e-1 / tdres))
     nop = N
     N = int(np.ceil(N / resamp) + 1)
     if N < 10: N = 10
-    
+
     # Determine whether fGn or fBn should be produced
     if Hinput <= 1:
         H = Hinput
@@ -31,38 +79,130 @@ def ffGn(N, tdres, Hinput, noiseType, mu, sigma=1):
     else:
         H = Hinput - 1
         fBn = 1
-    
+
     # Calculate the fGn
     if H == 0.5:
         # If H=0.5, then fGn is equivalent to white Gaussian noise
-        y = np.random.randn(N)
+        y = _randn(rng, K, N)
     else:
-        # NOTE: ffGn.m uses persistent variables to speed this up
         Nfft = int(2 ** np.ceil(np.log2(2*(N-1))))
-        NfftHalf = np.round(Nfft / 2)
-        k = np.concatenate( (np.arange(0,NfftHalf), np.arange(NfftHalf,0,-1)) )
-        Zmag = 0.5 * ( (k+1)**(2*H) -2*k**(2*H) + np.abs(k-1)**(2*H) )
-        Zmag = np.real(np.fft.fft(Zmag))
-        assert np.all(Zmag >= 0), 'FFT of the circulant covariance has negative values.'
-        Zmag = np.sqrt(Zmag)
-        Z = Zmag * (np.random.randn(Nfft) + 1j*np.random.randn(Nfft))
-        y = np.real(np.fft.ifft(Z)) * np.sqrt(Nfft)
-        y = y[0:N]
-        
+        Zmag = ffGn_spectrum(Nfft, H)
+        Z = Zmag * (_randn(rng, K, Nfft) + 1j*_randn(rng, K, Nfft))
+        y = np.real(np.fft.ifft(Z, axis=-1)) * np.sqrt(Nfft)
+        y = y[:, 0:N]
+
         # Convert the fGn to fBn, if necessary
         if fBn == 1:
-            y = np.cumsum(y)
-        
+            y = np.cumsum(y, axis=-1)
+
         # Resampling to match with the AN model
-        y = scipy.signal.resample(y, resamp*len(y))
-        
+        y = scipy.signal.resample(y, resamp*N, axis=-1)
+
         # Define standard deviation (ported from BEZ2018/ffGn.m by msaddler)
-        if mu < 0.2:
-            sigma = 1
-        elif mu < 20:
-            sigma = 10
-        else:
-            sigma = mu/2
-        y = y*sigma
-    
-    return y[0:nop]
+        mu = np.broadcast_to(np.asarray(mu, dtype=np.float64), [K])
+        sigma = np.where(mu < 0.2, 1., np.where(mu < 20, 10., mu/2))
+        y = y*sigma[:, np.newaxis]
+
+    return y[:, 0:nop]
+
+
+def ffGn_num_randn(N, tdres, Hinput, noiseType):
+    """
+    Number of standard normal samples drawn by `ffGn_batch` for each realization
+    (arguments are as defined in `ffGn_batch`; used to count random numbers consumed).
+    """
+    if noiseType == 0:
+        return 0
+    N = max(10, int(np.ceil(N / int(np.ceil(1e-1 / tdres))) + 1))
+    H = Hinput if Hinput <= 1 else Hinput - 1
+    if H == 0.5:
+        return N
+    return 2 * int(2 ** np.ceil(np.log2(2*(N-1))))
+
+
+def ffGn(N, tdres, Hinput, noiseType, mu, sigma=1):
+    """
+    Python ffGn implementation based on MATLAB code (ffGn.m); modified from
+    https://github.com/mrkrd/cochlea/tree/master/cochlea/zilany2014/util.py
+    """
+    return ffGn_batch(1, N, tdres, Hinput, noiseType, mu)[0]
+
+
+class ResamplePolyStream:
+    """
+    Streaming version of `scipy.signal.resample_poly(x, up, down)` (default Kaiser
+    window, zero padding): the signal is passed in consecutive blocks and the
+    concatenated outputs of `process` and `flush` are identical to resampling
+    the concatenated blocks at once. Only the input samples still needed by the
+    polyphase filter are buffered.
+    """
+
+    def __init__(self, up, down, window=('kaiser', 5.0)):
+        """
+        Args
+        ----
+        up (int): upsampling factor
+        down (int): downsampling factor
+        window (tuple): window used to design the lowpass filter (as in `resample_poly`)
+        """
+        g = np.gcd(int(up), int(down))
+        self.up = int(up) // g
+        self.down = int(down) // g
+        self.h = None
+        self.n_pre_remove = 0
+        if not self.up == self.down == 1:
+            # Same filter and output alignment as `scipy.signal.resample_poly`
+            max_rate = max(self.up, self.down)
+            half_len = 10 * max_rate
+            h = scipy.signal.firwin(2 * half_len + 1, 1. / max_rate, window=window) * self.up
+            n_pre_pad = self.down - half_len % self.down
+            self.h = np.concatenate([np.zeros(n_pre_pad), h])
+            self.n_pre_remove = (half_len + n_pre_pad) // self.down
+        self.buffer = np.zeros(0) # Input samples k0, k0+1, ... (k0 is a multiple of `down`)
+        self.k0 = 0
+        self.n_in = 0
+        self.m = self.n_pre_remove # Index of the next output sample of the full filter output
+
+    def _run(self, m_end):
+        if self.h is None:
+            y, self.buffer = self.buffer, np.zeros(0)
+            self.k0 = self.n_in
+            return y
+        m_end = max(m_end, self.m)
+        offset = self.k0 * self.up // self.down
+        y = scipy.signal.upfirdn(self.h, self.buffer, self.up, self.down)
+        if y.shape[0] < m_end - offset:
+            y = np.pad(y, (0, m_end - offset - y.shape[0]))
+        y = y[self.m - offset:m_end - offset]
+        self.m = m_end
+        # Drop the input samples that do not contribute to the next output sample
+        k_min = max(0, -(-(self.m * self.down - self.h.shape[0] + 1) // self.up))
+        k0 = min(k_min, self.n_in) // self.down * self.down
+        self.buffer = self.buffer[k0 - self.k0:]
+        self.k0 = k0
+        return y
+
+    def process(self, x):
+        """
+        Resample the next block of the input signal.
+
+        Args
+        ----
+        x (np.ndarray): next block of the input signal (1D)
+
+        Returns
+        -------
+        y (np.ndarray): output samples whose filter support is complete (may be empty)
+        """
+        x = np.asarray(x, dtype=np.float64).reshape([-1])
+        self.buffer = np.concatenate([self.buffer, x])
+        self.n_in += x.shape[0]
+        # Output m only depends on inputs k <= m * down / up
+        return self._run(-(-self.n_in * self.up // self.down))
+
+    def flush(self):
+        """
+        End the input signal and return the remaining output samples.
+        """
+        n_out = -(-self.n_in * self.up // self.down)
+        return self._run(self.n_pre_remove + n_out)
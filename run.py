@@ -1,12 +1,13 @@
 from analysis.spike_tensor import generate_expectation, generate_snapshot, generate_spike_tensor
 from analysis.musical import consonance_ordered_notes, consonance_probabilities
-from cache import get_spikes
+from cache import VIHC_CACHE_DIR, get_spikes, load_spikes
 import matplotlib.pyplot as plt
 import os
 import numpy as np
 from tqdm import tqdm
 from analysis.spectral import decode
 from model import SPIKES_DIR, first_n_primes, save_spikes_rng, save_spikes
+from model.cache_bez2018 import VihcCache
 from analysis.temporal import create_concurrency_profile
 
 # Stereo
@@ -27,11 +28,12 @@ def generate_decoded_exp():
         os.makedirs(directory)
 
     for filename in tqdm(os.listdir(SPIKES_DIR)):
-        if not filename.endswith(".npy"):
+        name, ext = os.path.splitext(filename)
+        if ext not in [".npy", ".spk"]:
             continue
 
         # Generate
-        spikes = np.load(os.path.join(SPIKES_DIR, filename))
+        spikes = load_spikes(os.path.join(SPIKES_DIR, name))
         decoded = np.array([])
 
         for cf in spikes:
@@ -39,7 +41,6 @@ def generate_decoded_exp():
             decoded_profile = decode(conc_profile)
             decoded = np.append(decoded, decoded_profile)
 
-        name, _ = os.path.splitext(filename)
         # Save
         np.save(os.path.join(DECODED_DIR, name), decoded)
 
@@ -56,9 +57,11 @@ if __name__ == "__main__":
     notes = ["C4", "C#4", "D4", "D#4", "E4", "F4", "F#4", "G4", "G#4", "A4", "A#4", "B4", "C5"]
     seeds = first_n_primes(30)
     count = 0
+    # IHC potentials are deterministic: compute them once per note and reuse them for every seed
+    vihc_cache = VihcCache(VIHC_CACHE_DIR)
     for seed in seeds:
         for note in notes:
-            if didProcess := save_spikes_rng(note, seed):
+            if didProcess := save_spikes_rng(note, seed, vihc_cache=vihc_cache):
                 print(f"Skipped {count} notes")
             else:
                 count += 1
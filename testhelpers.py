@@ -1,5 +1,7 @@
 import numpy as np
 
+from model.bez2018model import nervegram
+
 
 def array_equal(output, expected, roundFactor=2):
     """
@@ -16,3 +18,72 @@ def array_equal(output, expected, roundFactor=2):
     """
     output = np.round(output, roundFactor)
     return np.array_equal(output, expected)
+
+
+# Sampling rate of the nervegram test stimuli
+NERVEGRAM_FS = 20000
+
+
+def noise_signal(seed, duration=0.05, fs=NERVEGRAM_FS):
+    """
+    Gaussian white noise test stimulus (rms 0.02 Pa, about 57 dB SPL).
+
+    Args:
+        seed (int): Seed of the random generator.
+        duration (float, optional): Duration in seconds. Defaults to 0.05.
+        fs (int, optional): Sampling rate in Hz. Defaults to NERVEGRAM_FS.
+
+    Returns:
+        ndarray: The stimulus waveform.
+
+    """
+    return 0.02 * np.random.default_rng(seed).standard_normal(int(duration * fs))
+
+
+def tone_signal(freq, duration=0.05, fs=NERVEGRAM_FS):
+    """
+    Pure tone test stimulus (amplitude 0.02 Pa).
+
+    Args:
+        freq (float): Frequency of the tone in Hz.
+        duration (float, optional): Duration in seconds. Defaults to 0.05.
+        fs (int, optional): Sampling rate in Hz. Defaults to NERVEGRAM_FS.
+
+    Returns:
+        ndarray: The stimulus waveform.
+
+    """
+    t = np.arange(int(duration * fs)) / fs
+    return 0.02 * np.sin(2 * np.pi * freq * t)
+
+
+def nervegram_kwargs(**kwargs):
+    """
+    Keyword arguments of a small `nervegram` run that only returns spike times.
+
+    Args:
+        **kwargs: Arguments that override or extend the defaults.
+
+    Returns:
+        dict: The keyword arguments.
+
+    """
+    params = dict(num_cf=4, num_spike_trains=2, max_spikes_per_train=100, return_vihcs=False,
+                  return_meanrates=False, return_spike_tensor_sparse=False)
+    params.update(kwargs)
+    return params
+
+
+def run_nervegram(signal, **kwargs):
+    """
+    Runs `nervegram` on a test stimulus sampled at NERVEGRAM_FS with `nervegram_kwargs(**kwargs)`.
+
+    Args:
+        signal (ndarray): The stimulus waveform.
+        **kwargs: Arguments that override or extend the defaults of `nervegram_kwargs`.
+
+    Returns:
+        dict: The output of `nervegram`.
+
+    """
+    return nervegram(signal, NERVEGRAM_FS, **nervegram_kwargs(**kwargs))
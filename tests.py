@@ -1,13 +1,30 @@
+import os
+import pickle
 from unittest import mock
 import numpy as np
+import pytest
+import scipy.signal
 from analysis.probability import cumulative_average, generate_probabilities_simple, simple_posneg
 from analysis.temporal import calc_avg_isi, get_avg_isi
 from analysis.spatial import count_spikes, count_spikes_optimized
-from analysis.spike_tensor import generate_snapshot, generate_spike_tensor, generate_expectation
+from analysis.spike_tensor import (generate_snapshot, generate_spike_tensor, generate_expectation, get_spike_tensor,
+                                    get_spike_tensors)
 from analysis.musical import note_to_semitone, semitone_to_note
+from analysis.pulse import generate_pulse_vector, generate_pulse_vector_opt
 
+from cache import (MemoryCache, SpikeCache, SpikeCorpus, SpikeSet, decode_spikes, encode_spikes, get_spikes,
+                   save_spikes_array, save_spikes_file)
 from evaluate import predicted_consonance_scores, predicted_probabilities
-from testhelpers import array_equal
+from model.bez2018model import (clip_time_axis, get_ERB_cf_list, get_nervegram_spike_tensor_sparse, nervegram,
+                                nervegram_batch, nervegram_stream, ragged_to_padded_spike_times)
+from model.cache_bez2018 import VihcCache
+from model.profile_bez2018 import aggregate_profiles
+from model.cython_bez2018 import (IHCBankStream, PhiloxNormals, get_decimate_taps, run_anf, run_decimate, run_ihc,
+                                  run_ihc_bank, run_meanrate, run_synapse)
+from model.sweep_bez2018 import sweep
+from model.util_bez2018 import ResamplePolyStream, ffGn_batch, ffGn_spectrum
+from testhelpers import (NERVEGRAM_FS, array_equal, nervegram_kwargs, noise_signal, run_nervegram,
+                         tone_signal)
 
 
 def test_cumulative_reduction():
@@ -236,5 +253,456 @@ def test_spike_tensor():
     assert array_equal(output, expected_output, roundFactor=1)
 
 
+def test_clip_timestamps():
+    rng = np.random.default_rng(0)
+    timestamps = np.sort(rng.uniform(0, 1, size=[3, 4, 2, 2, 30]), axis=-1)
+    timestamps[rng.uniform(size=timestamps.shape) < 0.3] = 0
+    expected = np.zeros_like(timestamps)
+    for idx in np.ndindex(*timestamps.shape[:-1]):
+        y = timestamps[idx]
+        y = y[(y < 0.7) & (y > 0.2)] - 0.2
+        expected[idx][:len(y)] = y
+    assert np.array_equal(clip_time_axis(timestamps.copy(), 0.2, 0.7, sr="timestamps", axis=None), expected)
+    assert np.array_equal(
+        clip_time_axis(timestamps[:, :, 0, 0].copy(), 0.2, 0.7, sr="timestamps", axis=None), expected[:, :, 0, 0])
+
+
+def test_nervegram_parallel():
+    signal = tone_signal(440, duration=0.02)
+    kwargs = dict(num_cf=6, min_cf=125, max_cf=16e3, spont=[1.0, 70.0], max_spikes_per_train=50, random_seed=7)
+    serial = run_nervegram(signal, **kwargs)["nervegram_spike_times"]
+    for n_workers in [2, 3]:
+        parallel = run_nervegram(signal, n_workers=n_workers, **kwargs)["nervegram_spike_times"]
+        assert np.array_equal(serial, parallel)
+
+
+def test_nervegram_threads():
+    signal = tone_signal(440, duration=0.02)
+    kwargs = nervegram_kwargs(num_cf=8, min_cf=125, max_cf=16e3, spont=[1.0, 70.0], synapseMode=1, implnt=1,
+                              max_spikes_per_train=50, random_seed=7)
+    serial = nervegram(signal, NERVEGRAM_FS, **kwargs)["nervegram_spike_times"]
+    threaded = nervegram(signal, NERVEGRAM_FS, n_workers=4, backend="threads", **kwargs)["nervegram_spike_times"]
+    assert np.array_equal(serial, threaded)
+
+
+def test_native_decimate():
+    rng = np.random.default_rng(0)
+    for q in [10, 11, 50]:
+        b = scipy.signal.firwin(q + 1, 1. / q, window='hamming')
+        assert np.allclose(get_decimate_taps(q), b, rtol=0, atol=1e-15)
+        for k in [3 * (q + 1) + 1, 1001, 25013]:
+            x = np.cumsum(rng.standard_normal(k))
+            expected = scipy.signal.filtfilt(b, [1.], x)[::q]
+            output = run_decimate(x, q)
+            assert output.shape == expected.shape
+            assert np.allclose(output, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_ffGn_batch():
+    N, tdres, mu = 2500, 1e-4, np.array([0.1, 5.0, 70.0])
+    batch = ffGn_batch(3, N, tdres, 0.9, 1, mu, rng=[np.random.default_rng(s) for s in range(3)])
+    assert batch.shape == (3, N)
+    for itr in range(3):
+        single = ffGn_batch(1, N, tdres, 0.9, 1, mu[itr], rng=[np.random.default_rng(itr)])[0]
+        assert np.allclose(batch[itr], single, rtol=0, atol=1e-10)
+    assert ffGn_spectrum(64, 0.9) is ffGn_spectrum(64, 0.9)
+    assert not np.any(ffGn_batch(2, N, tdres, 0.9, 0, mu[:2]))
+    # Native Philox normals: each (spont, run) stream is independent of the other rows and of the draw sizes
+    rng = PhiloxNormals(7, 2, [0, 1, 2], 2)
+    z = np.concatenate([rng.standard_normal((6, 500)), rng.standard_normal((6, 300))], axis=1)
+    assert np.array_equal(PhiloxNormals(7, 2, [1], 2).standard_normal((2, 800)), z[2:4])
+    assert abs(z.mean()) < 0.05 and abs(z.std() - 1) < 0.05
+
+
+def test_fast_power_law():
+    fs, cf = 100e3, 1000.0
+    t = np.arange(int(0.05 * fs)) / fs
+    vihc = run_ihc(0.02 * np.sin(2 * np.pi * cf * t), fs, cf, species=2)
+    exact = run_synapse(vihc, fs, cf, implnt=1., random_seed=3)['synout']
+    for pla_tol in [1e-3, 1e-6]:
+        fast = run_synapse(vihc, fs, cf, implnt=2., pla_tol=pla_tol, random_seed=3)['synout']
+        assert np.max(np.abs(fast - exact)) <= pla_tol * np.max(np.abs(exact))
+    for pla_tol in [0.0, -1e-3, 1.0]:
+        with pytest.raises(ValueError):
+            run_synapse(vihc, fs, cf, implnt=2., pla_tol=pla_tol, random_seed=3)
+        with pytest.raises(ValueError):
+            run_meanrate(vihc, fs, cf, implnt=2., pla_tol=pla_tol, random_seed=3)
+    with pytest.raises(AssertionError):
+        nervegram(np.zeros(1000), 20000, num_cf=1, pla_tol=0.0)
+
+
+def test_run_anf_spike_trains():
+    fs, cf = 100e3, 800.0
+    t = np.arange(int(0.08 * fs)) / fs
+    vihc = run_ihc(0.05 * np.sin(2 * np.pi * cf * t), fs, cf, species=2)
+    kwargs = dict(list_spont=np.array([1.0, 70.0]), synapseMode=1., num_spike_trains=3, random_seed=11)
+    out = run_anf(vihc, fs, cf, max_spikes_per_train=200, **kwargs)
+    assert out['list_spike_times'].shape == (3, 2, 200)
+    assert out['list_meanrate'].shape == (len(vihc), 2)
+    assert np.all(np.diff(out['list_spike_times'][0, 1, :np.count_nonzero(out['list_spike_times'][0, 1])]) > 0)
+    with pytest.raises(ValueError):
+        run_anf(vihc, fs, cf, max_spikes_per_train=2, **kwargs)
+
+
+def test_ihc_bank():
+    fs = 100e3
+    signal = 0.1 * np.random.default_rng(0).standard_normal(5000)
+    cf_list = [125.0, 900.0, 6000.0]
+    for species in [1, 2]:
+        ihc_bank = run_ihc_bank(signal, fs, cf_list, species=species, cohc=[1.0, 0.5, 0.0])
+        assert ihc_bank.shape == (len(cf_list), len(signal))
+        for itr_cf, (cf, cohc) in enumerate(zip(cf_list, [1.0, 0.5, 0.0])):
+            assert np.array_equal(ihc_bank[itr_cf], run_ihc(signal, fs, cf, species=species, cohc=cohc))
+
+
+def test_vihc_cache(tmp_path):
+    signal = tone_signal(440, duration=0.02)
+    cache = VihcCache(str(tmp_path / "vihcs"))
+    for seed in [3, 5]:
+        uncached = run_nervegram(signal, random_seed=seed, max_spikes_per_train=50)
+        cached = run_nervegram(signal, random_seed=seed, max_spikes_per_train=50, vihc_cache=cache)
+        assert np.array_equal(uncached["nervegram_spike_times"], cached["nervegram_spike_times"])
+    assert len(list(cache._entries())) == 4
+    pin, cf = scipy.signal.resample_poly(signal, 100000, NERVEGRAM_FS), get_ERB_cf_list(4)[0]
+    vihc = cache.get(cache.key(cache.signal_key(pin, 100e3), cf))
+    assert np.array_equal(vihc, run_ihc(pin, 100e3, cf, species=2))
+    # Least recently used entries are evicted first
+    entry_size = list(cache._entries())[0][2]
+    small_cache = VihcCache(cache.cache_dir, max_bytes=2 * entry_size)
+    small_cache.evict()
+    assert len(list(small_cache._entries())) == 2
+    # Overwriting an entry does not grow the size estimate; failed writes leave no temp files
+    key = cache.key(cache.signal_key(pin, 100e3), cf)
+    small_cache.put(key, vihc)
+    size = small_cache._size
+    small_cache.put(key, vihc)
+    assert small_cache._size == size
+    with mock.patch("model.cache_bez2018.np.save", side_effect=OSError), pytest.raises(OSError):
+        small_cache.put(key, vihc)
+    assert not any(name.endswith('.tmp') for _, _, names in os.walk(cache.cache_dir) for name in names)
+
+
+def test_spike_cache(tmp_path):
+    signal = np.random.default_rng(0).standard_normal(1000)
+    kwargs = {"num_cf": 3, "spont_list": np.ones([3, 2]), "cf_list": None}
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return np.arange(2000, dtype=np.float64)
+
+    cache = SpikeCache(str(tmp_path), max_bytes=40000, codec=False)
+    a = cache.get_or_compute(compute, signal, 20000, kwargs, seed=1)
+    b = cache.get_or_compute(compute, signal, 20000.0, dict(kwargs, num_cf=3.0), seed=1)
+    assert len(calls) == 1 and np.array_equal(a, b)
+    # Any change of the audio, kwargs or seed is a new entry
+    cache.get_or_compute(compute, signal, 20000, dict(kwargs, num_cf=4), seed=1)
+    cache.get_or_compute(compute, signal, 20000, kwargs, seed=2)
+    cache.get_or_compute(compute, signal[::-1], 20000, kwargs, seed=1)
+    assert len(calls) == 4
+    # Size cap evicts least recently used entries
+    assert cache._size <= 40000 and len(list(cache._entries())) == 2
+    assert cache.get(cache.key(signal[::-1], 20000, kwargs, seed=1)) is not None
+    # Outputs the spike codec cannot represent are stored as .npy instead of failing after compute
+    codec_cache = SpikeCache(str(tmp_path / "codec"))
+    off_grid = np.random.default_rng(1).random(50)
+    assert np.array_equal(codec_cache.get_or_compute(lambda: off_grid, signal, 20000, kwargs), off_grid)
+    spikes = np.arange(1, 51) / 100e3
+    codec_cache.get_or_compute(lambda: spikes, signal, 20000, kwargs, seed=1)
+    assert sorted(os.path.splitext(path)[1] for _, path, _ in codec_cache._entries()) == [".npy", ".spk"]
+    assert np.array_equal(codec_cache.get(codec_cache.key(signal, 20000, kwargs)), off_grid)
+    assert np.array_equal(pickle.loads(pickle.dumps(codec_cache)).get(codec_cache.key(signal, 20000, kwargs, seed=1)),
+                          spikes)
+
+
+def test_spike_codec(tmp_path):
+    rng = np.random.default_rng(3)
+    counts = rng.integers(0, 8, [6, 3])
+    idx = np.zeros([6, 3, 10], dtype=np.int64)
+    for i, j in np.ndindex(*counts.shape):
+        idx[i, j, :counts[i, j]] = np.sort(rng.choice(np.arange(1, 25000), counts[i, j], replace=False))
+    idx[0, 0] = [0, 7, 9] + [0] * 7  # Spike in the first sample
+    counts[0, 0] = 3
+    spikes = (idx / 100e3).astype(np.float32)
+    for compression in [None, "zlib", "lzma"]:
+        data = encode_spikes(spikes, compression=compression)
+        assert np.array_equal(decode_spikes(data), spikes)
+        assert len(data) < spikes.nbytes
+    times, offsets = decode_spikes(encode_spikes(spikes), layout="ragged")
+    assert np.array_equal(np.diff(offsets), counts.reshape([-1]))
+    assert np.array_equal(times, np.concatenate([x[:n] for x, n in zip(spikes.reshape([-1, 10]), counts.reshape([-1]))]))
+    assert np.array_equal(decode_spikes(encode_spikes(spikes), index=True), idx)
+    assert np.array_equal(decode_spikes(encode_spikes(idx.astype(np.uint16))), idx)
+    with pytest.raises(ValueError):
+        encode_spikes(spikes + np.float32(1e-6))
+    # float32 times of long stimuli are only resolved to a fraction of a sample
+    long_spikes = (np.sort(rng.choice(np.arange(1, 3000000), 1000, replace=False)) / 100e3).astype(np.float32)
+    assert np.array_equal(decode_spikes(encode_spikes(long_spikes)), long_spikes)
+    with pytest.raises(ValueError):
+        encode_spikes(np.float32([100.0]))
+    save_spikes_file(str(tmp_path / "piano" / "C4.spk"), spikes)
+    assert save_spikes_array(str(tmp_path / "piano" / "D4"), spikes).endswith(".spk")
+    assert save_spikes_array(str(tmp_path / "piano" / "E4"), spikes + np.float32(1e-6)).endswith(".npy")
+    with mock.patch("cache.SPIKES_DIR", str(tmp_path)):
+        assert np.array_equal(get_spikes("C4"), spikes)
+        spike_set = get_spikes("D4", mmap=True)
+        assert isinstance(spike_set, SpikeSet)
+        assert np.array_equal(spike_set[1:4].load(), spikes[1:4])
+        assert np.array_equal(get_spikes("E4"), spikes + np.float32(1e-6))
+        # Both file formats are read into the layout asked for
+        np.save(tmp_path / "piano" / "F4.npy", spikes)
+        for note in ["D4", "F4"]:
+            times, offsets = get_spikes(note, layout="ragged")
+            assert np.array_equal(np.diff(offsets), counts.reshape([-1]))
+            assert np.array_equal(times, decode_spikes(encode_spikes(spikes), layout="ragged")[0])
+            assert np.array_equal(get_spikes(note, index=True), idx)
+
+
+def test_spike_corpus(tmp_path):
+    rng = np.random.default_rng(0)
+    spikes = {seed: rng.random([10, 3, 5]).astype(np.float32) for seed in [2, 3, 5]}
+    rng_dir = tmp_path / "rng"
+    rng_dir.mkdir()
+    for seed in [2, 3]:
+        np.save(rng_dir / f"Db4_{seed}.npy", spikes[seed])
+    path = str(tmp_path / "corpus.h5")
+    with SpikeCorpus(path, cf_chunk=4) as corpus:
+        corpus.import_rng_dir("Db4", rng_path=str(rng_dir))
+        corpus.add("C#4", 5, spikes[5])
+        assert corpus.f["piano/Db4/spikes"].chunks == (1, 4, 3, 5)
+    with SpikeCorpus(path, mode="r") as corpus:
+        assert corpus.seeds("Db4").tolist() == [2, 3, 5]
+        assert np.array_equal(corpus.read("Db4", seeds=3), spikes[3])
+        assert np.array_equal(corpus.read("Db4", seeds=[5, 2], cf=slice(4, 8))[:, :, 1],
+                              np.stack([spikes[5][4:8, 1], spikes[2][4:8, 1]]))
+        assert np.array_equal(corpus.read("Db4", seeds=2, cf=[7, 1], fibers=[2, 0]), spikes[2][[7, 1]][:, [2, 0]])
+        assert [seed for seed, _ in corpus.iter_spikes("Db4", cf=[0])] == [2, 3, 5]
+
+
+def test_spike_set(tmp_path):
+    spikes = np.sort(np.random.default_rng(1).integers(1, 25000, [10, 3, 5]) / 100e3, axis=-1).astype(np.float32)
+    path = str(tmp_path / "C4.npy")
+    np.save(path, spikes)
+    save_spikes_file(str(tmp_path / "C4.spk"), spikes)
+    with SpikeCorpus(str(tmp_path / "corpus.h5")) as corpus:
+        corpus.add("C4", 7, spikes)
+    for spike_set in [SpikeSet(path),
+                      SpikeSet(str(tmp_path / "C4.spk")),
+                      SpikeSet(str(tmp_path / "corpus.h5"), corpus_key=("piano", "C4", 7))]:
+        assert spike_set.shape == spikes.shape
+        assert np.array_equal(np.asarray(spike_set), spikes)
+        view = spike_set[2:8][[4, 0], 1:]
+        assert view.shape == (2, 2, 5)
+        assert np.array_equal(view.load(), spikes[2:8][[4, 0], 1:])
+        assert np.array_equal(pickle.loads(pickle.dumps(view)).load(), view.load())
+        assert np.array_equal(generate_spike_tensor(spike_set[:4]), generate_spike_tensor(spikes[:4]))
+
+
+def test_spike_tensor_memo(tmp_path):
+    rng_dir = tmp_path / "piano" / "rng" / "C4"
+    rng_dir.mkdir(parents=True)
+    spikes = {seed: np.random.default_rng(seed).uniform(0, 0.25, [4, 3, 6]) for seed in [3, 2]}
+    for seed in spikes:
+        np.save(rng_dir / f"C4_{seed}.npy", spikes[seed])
+    cache = MemoryCache(max_bytes=60000)  # 2.5 tensors with tau=1 ms
+    with mock.patch("cache.SPIKES_DIR", str(tmp_path)):
+        tensors = get_spike_tensors("C4", cache=cache)
+        assert cache.stats == {"hits": 0, "misses": 2, "evictions": 0}
+        assert np.array_equal(tensors[0], generate_spike_tensor(spikes[2]))
+        assert get_spike_tensors("C4", cache=cache)[1] is tensors[1]
+        assert cache.stats["hits"] == 2 and not tensors[0].flags.writeable
+        get_spike_tensors("C4", tau=2e-3, cache=cache)
+        with pytest.raises(ValueError):
+            get_spike_tensor("C4", mode="rng", cache=cache)
+    assert len(cache) == 3 and cache.stats["evictions"] == 1
+    assert cache.nbytes <= cache.max_bytes
+
+
+def test_float32_compute():
+    fs = 100e3
+    signal = tone_signal(440, fs=fs)
+    vihc = run_ihc_bank(signal, fs, [440.0, 2000.0], species=2)
+    vihc32 = run_ihc_bank(signal, fs, [440.0, 2000.0], species=2, dtype=np.float32)
+    assert vihc32.dtype == np.float32 and np.array_equal(vihc.astype(np.float32), vihc32)
+    # The synapse model and spike generator run in single precision: the power-law recursions of the
+    # approximate implementation (implnt=0) drift the most
+    for implnt, tol in [(0., 2e-2), (2., 1e-5)]:
+        kwargs = dict(list_spont=np.array([70.0]), num_spike_trains=3, max_spikes_per_train=100,
+                      random_seed=2, implnt=implnt)
+        out = run_anf(vihc[0], fs, 440.0, **kwargs)
+        out32 = run_anf(vihc32[0], fs, 440.0, **kwargs)
+        assert out32["list_meanrate"].dtype == np.float32
+        assert 0 < np.max(np.abs(out32["list_meanrate"] - out["list_meanrate"])) <= tol * np.max(out["list_meanrate"])
+        assert out32["list_spike_times"].shape == out["list_spike_times"].shape
+        meanrate = run_meanrate(vihc[0], fs, 440.0, implnt=implnt)
+        meanrate32 = run_meanrate(vihc32[0], fs, 440.0, implnt=implnt)
+        assert np.max(np.abs(meanrate32 - meanrate)) <= tol * np.max(meanrate)
+    # End to end through `nervegram`
+    kwargs = nervegram_kwargs(num_cf=2, random_seed=2, return_vihcs=True, return_meanrates=True)
+    out = nervegram(signal, fs, **kwargs)
+    out32 = nervegram(signal, fs, compute_dtype="float32", **kwargs)
+    assert np.allclose(out32["nervegram_vihcs"], out["nervegram_vihcs"], rtol=0, atol=1e-8)
+    meanrates, meanrates32 = out["nervegram_meanrates"], out32["nervegram_meanrates"]
+    assert np.max(np.abs(meanrates32 - meanrates)) <= 2e-2 * np.max(meanrates)
+    assert out32["nervegram_spike_times"].shape == out["nervegram_spike_times"].shape
+
+
+def test_spike_tensor_sparse():
+    spike_idx = np.zeros([2, 3, 4, 5], dtype=int)
+    spike_idx[0, 1, 2, :3] = [4, 9, 12]
+    spike_idx[1, 2, 0, :2] = [1, 7]
+    expected = []
+    for spike_idx_arg in np.argwhere(spike_idx):
+        sparse_idx = spike_idx_arg.tolist()[:-1]
+        sparse_idx.insert(2, spike_idx[tuple(spike_idx_arg)])
+        expected.append(sparse_idx)
+    assert np.array_equal(get_nervegram_spike_tensor_sparse(spike_idx), np.stack(expected, axis=1))
+    assert get_nervegram_spike_tensor_sparse(np.zeros([2, 3, 4], dtype=int)).shape == (3, 0)
+    out = run_nervegram(tone_signal(440, duration=0.02), num_cf=3, max_spikes_per_train=50, random_seed=1,
+                        return_spike_tensor_dense=True, return_spike_tensor_scipy=True)
+    dense = out["nervegram_spike_tensor_dense"]
+    scipy_tensor = out["nervegram_spike_tensor_scipy"]
+    assert scipy_tensor.format == "csr" and scipy_tensor.shape == (6, dense.shape[2])
+    assert np.array_equal(scipy_tensor.toarray(), np.moveaxis(dense, 2, -1).reshape([6, -1]))
+
+
+def test_ragged_spike_times():
+    signal = noise_signal(0, duration=0.1)
+    kwargs = dict(num_cf=3, num_spike_trains=4, spont=[0.1, 70.0], random_seed=2, nervegram_dur=0.08,
+                  return_spike_tensor_dense=True)
+    padded = run_nervegram(signal, max_spikes_per_train=200, **kwargs)
+    # The ragged output has no spike cap (max_spikes_per_train only sets the initial array size)
+    ragged = run_nervegram(signal, max_spikes_per_train=2, ragged_spike_times=True, **kwargs)
+    assert list(ragged["nervegram_spike_fiber_shape"]) == [3, 2, 4]
+    spike_times = ragged_to_padded_spike_times(
+        ragged["nervegram_spike_times"], ragged["nervegram_spike_offsets"], max_spikes=200)
+    spike_times = np.moveaxis(spike_times.reshape([3, 2, 4, 200]), 2, 0)
+    assert np.array_equal(spike_times, padded["nervegram_spike_times"])
+    assert np.array_equal(ragged["nervegram_spike_tensor_dense"], padded["nervegram_spike_tensor_dense"])
+    assert np.max(np.diff(ragged["nervegram_spike_offsets"])) > 2
+
+
+def test_spike_index_format():
+    signal = noise_signal(3)
+    kwargs = dict(num_cf=3, num_spike_trains=4, random_seed=1)
+    seconds = run_nervegram(signal, **kwargs)["nervegram_spike_times"]
+    index = run_nervegram(signal, spike_time_format="index", **kwargs)["nervegram_spike_times"]
+    assert index.dtype == np.uint16
+    assert np.array_equal(index, np.round(seconds.astype(np.float64) * 100e3))
+    spikes = np.moveaxis(seconds, 0, 1)
+    spikes_index = np.moveaxis(index, 0, 1)
+    assert np.array_equal(generate_spike_tensor(spikes_index, tau=1e-3, duration=0.05, fs=100e3),
+                          generate_spike_tensor(spikes, tau=1e-3, duration=0.05))
+    assert np.allclose(get_avg_isi(spikes_index, fs=100e3), get_avg_isi(spikes), rtol=1e-5)
+    assert np.array_equal(generate_pulse_vector_opt(spikes_index, tau=1e-3, duration=0.05, fs=100e3),
+                          generate_pulse_vector(spikes, tau=1e-3, duration=0.05))
+
+
+def test_rate_only_nervegram():
+    signal = tone_signal(500, duration=0.1)
+    kwargs = dict(random_seed=2, spont=[1.0, 70.0], return_meanrates=True)
+    out = run_nervegram(signal, rate_only=True, **kwargs)
+    assert "nervegram_spike_times" not in out
+    assert out["nervegram_meanrates"].shape == (4, 1000, 2)
+    assert out["nervegram_meanrates"].dtype == np.float32
+    assert out["nervegram_meanrates"].min() >= 0
+    # Expected mean redocking time closely tracks the spike generator's
+    ref = run_nervegram(signal, num_spike_trains=1, **kwargs)
+    assert ref["nervegram_meanrates"].shape == (4, 1000, 2)
+    assert np.allclose(out["nervegram_meanrates"].mean(axis=1), ref["nervegram_meanrates"].mean(axis=1), rtol=0.05)
+    # Native decimation equals `run_decimate` of the full-rate mean rate
+    vihc = run_ihc(np.tile(signal, 5), 100e3, 1000.0)
+    meanrate = run_meanrate(vihc, 100e3, 1000.0, random_seed=1)
+    meanrate_q = run_meanrate(vihc, 100e3, 1000.0, random_seed=1, decimate=10)
+    assert np.allclose(meanrate_q[:, 0], np.maximum(run_decimate(meanrate[:, 0].astype(np.float64), 10), 0), atol=1e-3)
+
+
+def test_cf_indices():
+    signal = noise_signal(6)
+    kwargs = dict(num_cf=6, random_seed=3, spont=[1.0, 70.0], return_meanrates=True)
+    full = run_nervegram(signal, num_spike_trains=3, **kwargs)
+    part = run_nervegram(signal, num_spike_trains=3, cf_indices=[4, 1], **kwargs)
+    assert np.array_equal(part["nervegram_spike_times"], full["nervegram_spike_times"][:, [4, 1]])
+    assert np.array_equal(part["nervegram_meanrates"], full["nervegram_meanrates"][[4, 1]])
+    assert np.array_equal(part["cf_list"], full["cf_list"][[4, 1]])
+    # Additional spike trains extend the population without changing the existing trains
+    more = run_nervegram(signal, num_spike_trains=5, cf_indices=[4], **kwargs)
+    assert np.array_equal(more["nervegram_spike_times"][:3], full["nervegram_spike_times"][:, [4]])
+    other = run_nervegram(signal, num_spike_trains=3, random_seed_key=(1,), **kwargs)
+    assert not np.array_equal(other["nervegram_spike_times"], full["nervegram_spike_times"])
+
+
+def test_sweep():
+    signal = noise_signal(5)
+    grid = {"cohc": [1.0, [1.0, 1.0, 0.5, 0.5]], "random_seed": [1, 2]}
+    result = sweep(signal, NERVEGRAM_FS, grid, n_workers=2, **nervegram_kwargs())
+    assert len(result) == 4
+    assert result.stats["resample"] == (1, 4)
+    assert result.stats["ihc"] == (6, 16)
+    for point in result.points:
+        ref = run_nervegram(signal, **point)
+        assert np.array_equal(result[point]["nervegram_spike_times"], ref["nervegram_spike_times"])
+    assert result[(1.0, 2)] is result[{"cohc": 1.0, "random_seed": 2}]
+
+
+def test_nervegram_batch():
+    signals = [noise_signal(seed) for seed in [4, 5, 6]]
+    out = nervegram_batch(signals, NERVEGRAM_FS, random_seed=5, **nervegram_kwargs())
+    out_threads = nervegram_batch(signals, NERVEGRAM_FS, random_seed=5, n_workers=2, backend="threads",
+                                  **nervegram_kwargs())
+    assert out["nervegram_spike_times"].shape[0] == len(signals)
+    assert np.array_equal(out["nervegram_spike_times"], out_threads["nervegram_spike_times"])
+    for itr, signal in enumerate(signals):
+        ref = run_nervegram(signal, random_seed=5 + itr)
+        assert np.array_equal(out["nervegram_spike_times"][itr], ref["nervegram_spike_times"])
+        assert out["pin_dBSPL"][itr] == ref["pin_dBSPL"]
+
+
+def test_profile():
+    signal = noise_signal(2)
+    kwargs = dict(num_cf=3, num_spike_trains=4, random_seed=7, return_spike_tensor_sparse=True)
+    out = run_nervegram(signal, profile=True, **kwargs)
+    ref = run_nervegram(signal, **kwargs)
+    assert "profile" not in ref
+    assert np.array_equal(out["nervegram_spike_times"], ref["nervegram_spike_times"])
+    profile = out["profile"]
+    for stage in ["resample", "ihc", "synapse_ffgn", "synapse", "synapse_decimate", "synapse_pla",
+                  "spike_generator", "postprocess", "sparse", "nervegram"]:
+        assert profile["time"][stage] >= 0
+    assert profile["calls"]["synapse"] == 3 and profile["calls"]["spike_generator"] == 12
+    assert profile["counters"]["spikes"] == np.count_nonzero(out["nervegram_spike_times"])
+    assert profile["counters"]["random_numbers_spikes"] >= 2 * profile["counters"]["spikes"]
+    total = aggregate_profiles([profile, profile])
+    assert total["counters"]["spikes"] == 2 * profile["counters"]["spikes"]
+    assert total["calls"]["nervegram"] == 2
+
+
+def test_nervegram_stream():
+    fs = 20000
+    signal = 0.02 * np.random.default_rng(1).standard_normal(int(0.2 * fs))
+    splits = [1, 333, 1500, 2777]
+    resampler = ResamplePolyStream(100000, fs)
+    pin = np.concatenate([resampler.process(x) for x in np.array_split(signal, splits)] + [resampler.flush()])
+    assert np.allclose(pin, scipy.signal.resample_poly(signal, 100000, fs))
+    cf_list = [440.0, 2000.0]
+    bank = IHCBankStream(100e3, cf_list, species=2)
+    vihc = np.concatenate([bank.run(x) for x in np.array_split(pin, splits)], axis=1)
+    assert np.array_equal(vihc, run_ihc_bank(pin, 100e3, cf_list, species=2))
+    kwargs = dict(num_cf=3, num_spike_trains=2, max_spikes_per_train=100, random_seed=4)
+    spike_times = []
+    for chunks in [[signal], np.array_split(signal, splits)]:
+        blocks = list(nervegram_stream(chunks, fs, **kwargs))
+        assert blocks[0]["t0"] == 0 and blocks[-1]["t1"] == pytest.approx(0.2)
+        st = np.sort(np.concatenate([b["nervegram_spike_times"] for b in blocks], axis=-1))
+        assert st.shape[:2] == (2, 3)
+        spike_times.append(st[:, :, -100:])
+    assert np.array_equal(spike_times[0], spike_times[1])
+    assert np.sum(spike_times[0] > 0) > 10 and np.max(spike_times[0]) < 0.2
+    assert spike_times[0].dtype == np.float64
+    blocks = list(nervegram_stream([signal], fs, spike_time_format="index", **kwargs))
+    idx = np.sort(np.concatenate([b["nervegram_spike_times"] for b in blocks], axis=-1))[:, :, -100:]
+    assert idx.dtype == np.uint64 and np.array_equal(idx, np.round(spike_times[0] * 100e3))
+
+
 if __name__ == "__main__":
     print("Usage: pytest tests.py")